@@ -0,0 +1,108 @@
+"""
+Shared fixtures. Everything runs against the in-process chain emulator (uniswap_lp_emulator.py): no node, no network.
+"""
+import json
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import uniswap_lp_emulator as emulator # noqa: E402
+
+PRICE = 3000 # USDT per WETH
+
+
+@pytest.fixture(scope="session")
+def bot_env():
+    """(emulator account, uniswap_lp_bot module), with the bot's settings pointed at the emulator."""
+    return emulator._bot_environment()
+
+
+@pytest.fixture
+def bot_module(bot_env):
+    return bot_env[1]
+
+
+@pytest.fixture
+def account(bot_env):
+    return bot_env[0]
+
+
+@pytest.fixture
+def config(bot_module, tmp_path, monkeypatch):
+    """The default Config on a WETH/USDT 0.3% pool (USDC would sort below WETH), with its state files in tmp_path."""
+    for name, file_name in (("JOURNAL_PATH", "bot_state.db"), ("POOL_REGISTRY_PATH", "pool_registry.json"),
+                            ("HEDGE_LEDGER_PATH", "hedge_ledger.jsonl"), ("EVENT_CURSOR_PATH", "swap_cursor.json"),
+                            ("POSITION_ID_PATH", "position_id.txt")):
+        monkeypatch.setenv(name, str(tmp_path / file_name))
+    config = bot_module.Config()
+    config.TOKEN1_ADDRESS = emulator.USDT
+    config.TOKEN1_ADDRESS_SYMBOL = "USDT"
+    return config
+
+
+@pytest.fixture
+def chain(config, account):
+    """An emulated chain with the configured pool deployed at PRICE and the wallet funded."""
+    chain = emulator.EmulatedChain(seed=0)
+    emulator.deploy_for_config(chain, config, PRICE)
+    chain.fund(emulator.WETH, account.address, 10**3 * 10**18)
+    chain.fund(emulator.USDT, account.address, 10**3 * PRICE * 10**6)
+    return chain
+
+
+@pytest.fixture
+def provider(chain):
+    return emulator.EmulatorProvider(chain)
+
+
+@pytest.fixture
+def rpc_log(provider, monkeypatch):
+    """Every JSON-RPC request sent to `provider`, decoded ({"method", "params", ...}), in order."""
+    requests = []
+    request_raw = provider.request_raw
+
+    def recording_request_raw(method, request_data, decode=None):
+        requests.append(json.loads(request_data))
+        return request_raw(method, request_data, decode)
+
+    monkeypatch.setattr(provider, "request_raw", recording_request_raw)
+    return requests
+
+
+@pytest.fixture
+def client(bot_module, config, provider):
+    client = bot_module.BlockchainClient(config, provider=provider)
+    yield client
+    client.journal.close()
+
+
+@pytest.fixture
+def bot(bot_module, config, client, chain):
+    """A started single-position bot with a 1 WETH position around the pool price (as `check_resume` sets it up)."""
+    from decimal import Decimal
+
+    bot = bot_module.LiquidityManagerBot(config, client)
+    bot.startup()
+    pool_address = bot.lp_manager.get_pool_address(config.TOKEN0_ADDRESS, config.TOKEN1_ADDRESS, config.POOL_FEE)
+    _, price = bot.price_oracle.get_pool_prices(pool_address) # token0_per_token1 (WETH per USDT)
+    lower, upper = bot_module.new_range_prices(price, config.REBALANCE_RANGE_WIDTH)
+    bot.initial_setup(Decimal(1), Decimal(1) / price, lower, upper)
+    yield bot
+    bot.derivatives_manager.session.close()
+
+
+@pytest.fixture
+def move_price(chain):
+    """move_price(pool_address, at_least): mines volatile blocks until the pool's price is `at_least` (0.05 = 5%) away."""
+    def move(pool_address: str, at_least: float, max_blocks: int = 500):
+        pool = chain.contract_at(pool_address)
+        start = pool.sqrt_price_x96
+        for _ in range(max_blocks):
+            chain.mine(1, volatility=30.0)
+            if abs((pool.sqrt_price_x96 / start) ** 2 - 1) >= at_least:
+                return
+        raise AssertionError(f"The price didn't move {at_least:.0%} in {max_blocks} blocks")
+    return move
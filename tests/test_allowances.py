@@ -0,0 +1,64 @@
+"""AllowanceTracker: EIP-2612 permit signatures, and syncing external Approvals through the calling client's cycle."""
+from eth_abi import encode
+from eth_account import Account
+from web3 import Web3
+
+import uniswap_lp_emulator as emulator
+
+
+def _approve_externally(client, account, token: str, spender: str, amount: int):
+    """An approve sent outside the bot (e.g. from a wallet app): the tracker only sees it through its logs."""
+    w3 = client.w3
+    tx = client.get_contract(token, client.config.ERC20_ABI).functions.approve(spender, amount).build_transaction({
+        "from": account.address, "nonce": w3.eth.get_transaction_count(account.address), "gas": 100_000,
+        "maxFeePerGas": 10 * 10**9, "maxPriorityFeePerGas": 10**9, "chainId": w3.eth.chain_id,
+    })
+    w3.eth.send_raw_transaction(account.sign_transaction(tx).rawTransaction)
+
+
+def test_sign_permit_matches_sign_typed_data(client, config, account, chain):
+    spender, value, deadline = config.UNISWAP_NFT_POSITION_MANAGER_ADDRESS, 5 * 10**18, chain.timestamp + 600
+    v, r, s = client.allowances.sign_permit(emulator.WETH, spender, value, deadline)
+
+    # The emulated token's domain: its name ("WETH"), version "1", the chain ID and its address.
+    expected = Account.sign_typed_data(account.key, full_message={
+        "types": {
+            "EIP712Domain": [{"name": "name", "type": "string"}, {"name": "version", "type": "string"},
+                             {"name": "chainId", "type": "uint256"}, {"name": "verifyingContract", "type": "address"}],
+            "Permit": [{"name": "owner", "type": "address"}, {"name": "spender", "type": "address"},
+                       {"name": "value", "type": "uint256"}, {"name": "nonce", "type": "uint256"},
+                       {"name": "deadline", "type": "uint256"}],
+        },
+        "primaryType": "Permit",
+        "domain": {"name": "WETH", "version": "1", "chainId": chain.chain_id,
+                   "verifyingContract": Web3.to_checksum_address(emulator.WETH)},
+        "message": {"owner": account.address, "spender": spender, "value": value, "nonce": 0, "deadline": deadline},
+    })
+    assert (v, r, s) == (expected.v, expected.r.to_bytes(32, "big"), expected.s.to_bytes(32, "big"))
+
+    # The token accepts it.
+    selector = Web3.keccak(text="permit(address,address,uint256,uint256,uint8,bytes32,bytes32)")[:4]
+    chain.call(account.address, emulator.WETH, selector + encode(
+        ["address", "address", "uint256", "uint256", "uint8", "bytes32", "bytes32"],
+        [account.address, spender, value, deadline, v, r, s]))
+
+
+def test_sync_reads_up_to_the_calling_clients_cycle(client, config, account, chain):
+    config.ALLOWANCE_SYNC_INTERVAL = 0
+    tracker = client.allowances
+    spender = config.SWAP_ROUTER_ADDRESS
+    position_client = client.for_config(config)
+    position_client.begin_cycle()
+    allowance, = tracker.get([(emulator.WETH, spender)], position_client)
+    assert allowance == 0
+
+    _approve_externally(client, account, emulator.WETH, spender, 12345)
+
+    # The position's cycle is pinned before the approval: it keeps seeing its snapshot.
+    assert tracker.get([(emulator.WETH, spender)], position_client) == [0]
+    position_client.end_cycle()
+    # The next cycle pins the new head and picks the Approval log up.
+    position_client.begin_cycle()
+    assert tracker.get([(emulator.WETH, spender)], position_client) == [12345]
+    assert tracker.synced_block == position_client.cycle.block_number == chain.head
+    position_client.end_cycle()
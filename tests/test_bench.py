@@ -0,0 +1,42 @@
+"""The benchmark baselines: the regression check, and the micro benchmarks against the stored bench_baseline.json."""
+import json
+import os
+
+import pytest
+
+import uniswap_lp_bench as bench
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "bench_baseline.json")
+# Micro timings vary by ~30% from run to run on a shared machine; the suite only fails on a slowdown past 2x.
+# Tighter checks: python uniswap_lp_bench.py micro --baseline bench_baseline.json (default --threshold 0.25).
+THRESHOLD = float(os.getenv("BENCH_THRESHOLD", "1.0"))
+
+
+def test_slowdowns_past_the_threshold_are_regressions():
+    baseline = {"micro": {"tick_from_price_ns": 1000.0, "lp_greeks_ns": 500.0}}
+    results = {"micro": {"tick_from_price_ns": 1300.0, "lp_greeks_ns": 600.0}}
+
+    regressed = bench.regressions(results, baseline, 0.25, 0.05)
+
+    assert regressed == ["micro.tick_from_price_ns: 1300.0 vs baseline 1000.0 (+30%, limit 25%)"]
+    assert bench.regressions(results, baseline, 0.5, 0.05) == []
+
+
+def test_counts_use_the_count_threshold_and_new_metrics_are_skipped():
+    baseline = {"e2e": {"rebalance_rpc_requests": 100, "rebalance_ms": 1000.0}}
+    results = {"e2e": {"rebalance_rpc_requests": 106, "rebalance_ms": 1200.0, "rebalance_gas": 10**6}}
+
+    assert bench.regressions(results, baseline, 0.25, 0.05) == [
+        "e2e.rebalance_rpc_requests: 106 vs baseline 100 (+6%, limit 5%)"]
+
+
+def test_micro_benchmarks_against_the_stored_baseline():
+    with open(BASELINE_PATH, "r") as f:
+        baseline = json.load(f)
+    # The vectorized benchmarks' cost per call depends on the batch size: compare at the size the baseline used.
+    results = {"micro": bench.run_micro(bench.MICRO_N, repeats=3)}
+
+    assert set(results["micro"]) == set(baseline["micro"])
+    regressed = bench.regressions(results, baseline, THRESHOLD, 0.05)
+    if regressed:
+        pytest.fail("Micro benchmarks regressed against bench_baseline.json:\n    " + "\n    ".join(regressed))
@@ -0,0 +1,121 @@
+"""ExchangeSession and PositionCache against MockExchangeServer: fill/ack ordering, reconnect resync and rejections."""
+import asyncio
+import threading
+import time
+from decimal import Decimal
+
+import pytest
+
+from uniswap_lp_derivatives import ExchangeSession, MockExchangeServer, PositionCache, RestStreamExchange
+
+SYMBOL = "ETH-PERP"
+
+
+class FillFirstServer(MockExchangeServer):
+    """A venue whose fill event goes out before the order's HTTP response."""
+    async def _orders(self, request):
+        response = await super()._orders(request)
+        fills = [task for task in self._tasks if task.get_coro().__name__ == "_fill"]
+        await asyncio.gather(*fills)
+        return response
+
+
+def _wait_for(predicate, timeout: float = 5.0):
+    deadline = time.time() + timeout
+    while not predicate():
+        if time.time() > deadline:
+            raise AssertionError("Timed out waiting for the exchange session")
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def venue():
+    """start(server) -> (server, base URL, run), with the server on its own event loop thread; `run` runs a coroutine there."""
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    servers, sessions = [], []
+
+    def run(coroutine):
+        return asyncio.run_coroutine_threadsafe(coroutine, loop).result(timeout=5)
+
+    def start(server: MockExchangeServer):
+        port = run(server.start(port=0))
+        servers.append(server)
+        session = ExchangeSession(RestStreamExchange(f"http://127.0.0.1:{port}", "key", "secret"))
+        sessions.append(session)
+        _wait_for(lambda: session.cache.live)
+        return server, session, run
+
+    yield start
+    for session in sessions:
+        session.close()
+    for server in servers:
+        run(server.stop())
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join(timeout=5)
+
+
+# --- PositionCache ---
+def test_fill_before_ack_is_not_counted_twice():
+    cache = PositionCache()
+    cache.add_pending("a", SYMBOL, Decimal("-2"))
+    cache.apply({"type": "fill", "symbol": SYMBOL, "side": "SELL", "amount": "2", "price": "3000",
+                 "client_order_id": "a", "position": "-2"})
+    cache.acknowledge("a", accepted=True)
+    assert cache.position(SYMBOL) == Decimal("-2")
+    assert cache.pending_amount(SYMBOL) == 0 and cache.pending == {}
+
+
+def test_reset_drops_acknowledged_orders_that_are_no_longer_open_and_keeps_the_rest():
+    cache = PositionCache()
+    for client_order_id in ("filled", "open", "unacknowledged"):
+        cache.add_pending(client_order_id, SYMBOL, Decimal("-1"))
+    cache.acknowledge("filled", accepted=True)
+    cache.acknowledge("open", accepted=True)
+
+    cache.reset({"positions": {SYMBOL: Decimal("-1.5")}, "marks": {}, "open_orders": {"open": Decimal("0.5")}})
+
+    assert cache.position(SYMBOL) == Decimal("-1.5")
+    # The partly filled order keeps its remainder (with its side); the unacknowledged one may not have reached the venue.
+    assert cache.pending == {"open": [SYMBOL, Decimal("-0.5"), True], "unacknowledged": [SYMBOL, Decimal("-1"), False]}
+
+
+# --- ExchangeSession against the mock venue ---
+def test_order_filled_before_its_ack(venue):
+    server, session, _ = venue(FillFirstServer(mark_interval=60))
+    ack = session.submit_order(SYMBOL, "SELL", Decimal("1.5")).result(timeout=5)
+
+    assert ack["status"] == "accepted"
+    _wait_for(lambda: session.cache.position(SYMBOL) == Decimal("-1.5"))
+    assert session.cache.pending == {}
+    assert server.positions[SYMBOL] == Decimal("-1.5")
+
+
+def test_reconnect_resyncs_an_order_filled_while_disconnected(venue, capsys):
+    server, session, run = venue(MockExchangeServer(fill_delay=0.3, mark_interval=60))
+    session.submit_order(SYMBOL, "BUY", Decimal("2"), client_order_id="order-1").result(timeout=5)
+    assert session.cache.pending_amount(SYMBOL) == Decimal("2")
+
+    async def drop_clients():
+        for ws in list(server._clients):
+            await ws.close()
+    run(drop_clients())
+    _wait_for(lambda: not session.cache.live)
+    # The fill happens with nobody subscribed: only the snapshot taken on reconnect can report it.
+    _wait_for(lambda: server.positions.get(SYMBOL) == Decimal("2"))
+    _wait_for(lambda: session.cache.live)
+
+    assert session.cache.position(SYMBOL) == Decimal("2")
+    assert session.cache.pending == {}
+    assert "Reconnecting" in capsys.readouterr().out
+
+
+def test_rejected_order_is_dropped_from_pending(venue):
+    server, session, _ = venue(MockExchangeServer(mark_interval=60))
+    future = session.submit_order("BTC-PERP", "SELL", Decimal("1"))
+
+    with pytest.raises(Exception, match="400"):
+        future.result(timeout=5)
+    assert session.cache.pending == {}
+    assert server.orders_received[-1]["symbol"] == "BTC-PERP" and server.positions == {}
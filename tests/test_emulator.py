@@ -0,0 +1,46 @@
+"""The bot end to end on the emulator: the load test, crash recovery, and the calldata its multicalls nest."""
+from eth_abi import encode as abi_encode
+from eth_utils import function_signature_to_4byte_selector
+
+import uniswap_lp_emulator as emulator
+
+DECREASE_SIGNATURE = "decreaseLiquidity((uint256,uint128,uint256,uint256,uint256))"
+
+
+def test_encode_function_accepts_struct_arguments_as_dicts(client, config):
+    nft_manager = client.get_contract(config.UNISWAP_NFT_POSITION_MANAGER_ADDRESS, config.UNISWAP_NFT_POSITION_MANAGER_ABI)
+    params = {"tokenId": 7, "liquidity": 10**18, "amount0Min": 1, "amount1Min": 2, "deadline": 1700000000}
+
+    data = client.encode_function(nft_manager.functions.decreaseLiquidity(params))
+
+    expected = function_signature_to_4byte_selector(DECREASE_SIGNATURE) + abi_encode(
+        ["(uint256,uint128,uint256,uint256,uint256)"], [(7, 10**18, 1, 2, 1700000000)])
+    assert data == "0x" + expected.hex()
+
+
+def test_load_test_cycles_every_position_and_every_transaction_lands(config):
+    # `config` points the state files at tmp_path; the load test builds its own Config from the same environment.
+    result = emulator.run_load_test(emulator._parse_args(["--positions", "3", "--blocks", "600", "--volatility", "6"]))
+
+    assert result["cycles"] == 90
+    assert result["rebalances"] > 0
+    # None reverted, was replaced or timed out.
+    assert set(result["transactions"]) == {"mined"}
+    assert result["rpc_requests"] > 0
+
+
+def test_restarted_bot_finishes_or_aborts_interrupted_rebalances(bot_module, config, monkeypatch, capsys):
+    nested = []
+    encode_function = bot_module.BlockchainClient.encode_function
+
+    def recording_encode_function(self, contract_function):
+        nested.append(contract_function.fn_name)
+        return encode_function(self, contract_function)
+
+    monkeypatch.setattr(bot_module.BlockchainClient, "encode_function", recording_encode_function)
+    assert emulator.check_resume(emulator._parse_args(["--check-resume"])) == []
+
+    out = capsys.readouterr().out
+    assert out.count("done") == 3 and out.count("aborted") == 1
+    # The landed atomic rebalance is one position manager multicall of the withdrawal, sweep, burn and mint.
+    assert nested[-4:] == ["decreaseLiquidity", "collect", "burn", "mint"]
@@ -0,0 +1,101 @@
+"""The fixed-offset decoders of uniswap_lp_fastcall against eth_abi, and the fast path against web3 on the emulator."""
+import pytest
+from eth_abi import decode, encode
+from eth_utils import to_checksum_address
+from web3.exceptions import BadFunctionCallOutput
+
+from uniswap_lp_fastcall import (
+    FAST_CALLS, decode_latest_round_data, decode_positions, decode_slot0, decode_uint256, verify_equivalence,
+)
+from uniswap_v3_math import MAX_SQRT_RATIO, MAX_TICK, MAX_UINT128, MIN_SQRT_RATIO, MIN_TICK
+
+SLOT0_TYPES = ["uint160", "int24", "uint16", "uint16", "uint16", "uint8", "bool"]
+POSITIONS_TYPES = ["uint96", "address", "address", "address", "uint24", "int24", "int24", "uint128", "uint256",
+                   "uint256", "uint128", "uint128"]
+LATEST_ROUND_DATA_TYPES = ["uint80", "int256", "uint256", "uint256", "uint80"]
+
+# Return data of each read, ABI-encoded by eth_abi: negative ticks and answers are sign-extended to the full word.
+SLOT0_VECTORS = [
+    (1771595571142957166518320255467520, 200000, 1, 100, 100, 0, True),
+    (4339505179874779662909440, -200000, 65535, 65535, 65535, 255, False),
+    (MIN_SQRT_RATIO, MIN_TICK, 0, 1, 1, 0, True),
+    (MAX_SQRT_RATIO - 1, MAX_TICK - 1, 0, 1, 1, 0, True),
+    (2**96, -1, 0, 1, 1, 0, True),
+]
+POSITIONS_VECTORS = [
+    (0, "0x" + "00" * 20, "0xC02aaA39b223FE8D0A0e5C4F27eAD9083C756Cc2", "0xdAC17F958D2ee523a2206206994597C13D831ec7",
+     3000, -887220, 887220, 10**18, 2**255, 0, MAX_UINT128, 1),
+    (2**96 - 1, "0x" + "ab" * 20, "0x" + "0f" * 20, "0x" + "f0" * 20, 500, -200010, -199990, MAX_UINT128, 0,
+     2**256 - 1, 0, 0),
+    (7, "0x" + "11" * 20, "0x" + "22" * 20, "0x" + "33" * 20, 10000, MIN_TICK, -1, 1, 1, 1, 1, 1),
+]
+LATEST_ROUND_DATA_VECTORS = [
+    (110680464442257320247, 300000000000, 1700000000, 1700000012, 110680464442257320247),
+    (2**80 - 1, -1, 0, 0, 2**80 - 1),
+    (1, -(2**255), 2**256 - 1, 2**256 - 1, 1),
+]
+
+
+def _expected(types: list, data: bytes) -> list:
+    """eth_abi's decoding, with addresses checksummed like web3's result formatters."""
+    return [to_checksum_address(value) if abi_type == "address" else value
+            for abi_type, value in zip(types, decode(types, data))]
+
+
+@pytest.mark.parametrize("values", SLOT0_VECTORS)
+def test_decode_slot0_matches_eth_abi(values):
+    data = encode(SLOT0_TYPES, values)
+    assert decode_slot0(data) == _expected(SLOT0_TYPES, data) == list(values)
+
+
+@pytest.mark.parametrize("values", POSITIONS_VECTORS)
+def test_decode_positions_matches_eth_abi(values):
+    data = encode(POSITIONS_TYPES, values)
+    decoded = decode_positions(data)
+    assert decoded == _expected(POSITIONS_TYPES, data)
+    assert decoded[5:7] == list(values[5:7])
+
+
+@pytest.mark.parametrize("values", LATEST_ROUND_DATA_VECTORS)
+def test_decode_latest_round_data_matches_eth_abi(values):
+    data = encode(LATEST_ROUND_DATA_TYPES, values)
+    assert decode_latest_round_data(data) == _expected(LATEST_ROUND_DATA_TYPES, data) == list(values)
+
+
+def test_decode_uint256_matches_eth_abi():
+    data = encode(["uint256"], [2**256 - 1])
+    assert decode_uint256(data) == decode(["uint256"], data)[0]
+
+
+@pytest.mark.parametrize("decoder, words", [
+    (decode_slot0, 7), (decode_positions, 12), (decode_latest_round_data, 5), (decode_uint256, 1),
+])
+def test_short_return_data_raises_like_web3(decoder, words):
+    # e.g. a call to an address without code returns b"".
+    for data in (b"", bytes(words * 32 - 1)):
+        with pytest.raises(BadFunctionCallOutput):
+            decoder(data)
+
+
+def test_fast_path_signatures_match_the_bundled_abis(config):
+    # A signature that drifted from the ABI files would silently send every read back through web3.
+    signatures = set()
+    for abi in (config.UNISWAP_POOL_ABI, config.UNISWAP_NFT_POSITION_MANAGER_ABI, config.CHAINLINK_ABI, config.ERC20_ABI):
+        for entry in abi:
+            if entry.get("type") == "function":
+                signatures.add("{}({})->({})".format(entry["name"], ",".join(i["type"] for i in entry["inputs"]),
+                                                     ",".join(o["type"] for o in entry["outputs"])))
+    assert set(FAST_CALLS) <= signatures
+
+
+def test_fast_path_agrees_with_web3_on_the_emulator(client, config, chain):
+    chain.mine(3, volatility=2.0)
+    pool_address = client.get_contract(config.UNISWAP_FACTORY_ADDRESS, config.UNISWAP_FACTORY_ABI).functions.getPool(
+        config.TOKEN0_ADDRESS, config.TOKEN1_ADDRESS, config.POOL_FEE).call()
+    calls = [
+        client.get_contract(pool_address, config.UNISWAP_POOL_ABI).functions.slot0(),
+        client.get_contract(config.CHAINLINK_ETH_USD_FEED, config.CHAINLINK_ABI).functions.latestRoundData(),
+        client.get_contract(config.TOKEN0_ADDRESS, config.ERC20_ABI).functions.allowance(
+            client.account.address, config.UNISWAP_NFT_POSITION_MANAGER_ADDRESS),
+    ]
+    assert verify_equivalence(client, calls, chain.head) == []
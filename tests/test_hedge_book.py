@@ -0,0 +1,103 @@
+"""HedgeBook.flush: attribution only after accepted orders, per-symbol errors, scenarios off the order path."""
+from concurrent.futures import Future
+from decimal import Decimal
+
+import pytest
+
+
+class FakeDerivatives:
+    """DerivativesManager stand-in: venue positions per symbol, and the orders sent as unresolved Futures."""
+    def __init__(self, positions: dict = None, failing: set = ()):
+        self.positions = positions or {}
+        self.failing = set(failing)
+        self.orders = [] # (symbol, side, amount, future)
+
+    def get_position_size(self, symbol: str) -> Decimal:
+        if symbol in self.failing:
+            raise ConnectionError(f"no position for {symbol}")
+        return self.positions.get(symbol, Decimal("0"))
+
+    def _order(self, symbol, side, amount):
+        future = Future()
+        self.orders.append((symbol, side, amount, future))
+        return future
+
+    def open_short_position(self, symbol, amount):
+        return self._order(symbol, "SELL", amount)
+
+    def close_position(self, symbol, amount, current_pos=None):
+        return self._order(symbol, "BUY", amount)
+
+
+@pytest.fixture
+def make_book(bot_module, config):
+    def make(derivatives: FakeDerivatives):
+        config.RISK_SCENARIOS = []
+        return bot_module.HedgeBook(config, derivatives)
+    return make
+
+
+def test_attribution_moves_only_when_the_order_is_accepted(make_book):
+    derivatives = FakeDerivatives()
+    book = make_book(derivatives)
+    book.record("a", 1, "ETH-PERP", Decimal("2"))
+
+    futures = book.flush()
+    assert len(futures) == 1 and book.attribution("ETH-PERP") == {}
+    futures[0].set_result({"status": "accepted"})
+    assert book.attribution("ETH-PERP") == {"a": Decimal("2")}
+
+
+@pytest.mark.parametrize("outcome", ["rejected", "failed"])
+def test_attribution_stays_when_the_order_is_rejected_or_fails(make_book, outcome):
+    derivatives = FakeDerivatives()
+    book = make_book(derivatives)
+    book.record("a", 1, "ETH-PERP", Decimal("2"))
+    book.flush()[0].set_result({"status": "accepted"})
+    book.record("a", 1, "ETH-PERP", Decimal("3"))
+    derivatives.positions["ETH-PERP"] = Decimal("-2")
+
+    future, = book.flush()
+    if outcome == "rejected":
+        future.set_result({"status": "rejected"})
+    else:
+        future.set_exception(ConnectionError("venue down"))
+
+    assert book.attribution("ETH-PERP") == {"a": Decimal("2")}
+
+
+def test_attribution_stays_when_no_order_is_needed(make_book):
+    # The venue already covers the target (e.g. hedged by hand): nothing is sent, so nothing is attributed.
+    book = make_book(FakeDerivatives({"ETH-PERP": Decimal("-2")}))
+    book.record("a", 1, "ETH-PERP", Decimal("2"))
+    assert book.flush() == [] and book.attribution("ETH-PERP") == {}
+
+
+def test_a_failing_symbol_does_not_stop_the_others(make_book, capsys):
+    derivatives = FakeDerivatives(failing={"BTC-PERP"})
+    book = make_book(derivatives)
+    book.record("a", 1, "BTC-PERP", Decimal("1"))
+    book.record("b", 2, "ETH-PERP", Decimal("2"))
+
+    futures = book.flush()
+
+    assert [(symbol, side, amount) for symbol, side, amount, _ in derivatives.orders] == [("ETH-PERP", "SELL", Decimal("2"))]
+    assert len(futures) == 1
+    assert "Error adjusting the hedge of BTC-PERP: no position for BTC-PERP" in capsys.readouterr().out
+
+
+def test_scenarios_run_after_the_orders_and_cannot_stop_them(make_book, config, monkeypatch, capsys):
+    derivatives = FakeDerivatives()
+    book = make_book(derivatives)
+    config.RISK_SCENARIOS = [-0.05, 0.05]
+    book.record("a", 1, "ETH-PERP", Decimal("2"))
+    orders_at_report = []
+
+    def scenario_report(shocks=None):
+        orders_at_report.append(len(derivatives.orders))
+        raise ImportError("No module named 'numpy'")
+    monkeypatch.setattr(book, "scenario_report", scenario_report)
+
+    assert len(book.flush()) == 1
+    assert orders_at_report == [1]
+    assert "Error computing the hedge book scenarios: No module named 'numpy'" in capsys.readouterr().out
@@ -0,0 +1,96 @@
+"""The fixed-offset pool log decoder of uniswap_lp_history against eth_abi, and ingestion from the emulated chain."""
+import pytest
+from eth_abi import decode, encode
+from web3 import Web3
+
+import uniswap_lp_emulator as emulator
+from uniswap_lp_history import (
+    BURN_TOPIC, COLLECT_TOPIC, MINT_TOPIC, SWAP_TOPIC, HistoryIngester, HistoryStore, decode_log, limbs_to_int,
+)
+from uniswap_v3_math import MAX_SQRT_RATIO, MAX_TICK, MAX_UINT128, MIN_TICK
+
+OWNER = "0x" + "11" * 20
+RECIPIENT = "0x" + "22" * 20
+# (tickLower, tickUpper) pairs: both negative, straddling zero, and the ends of the tick space.
+TICK_RANGES = [(-887220, -60), (-600, 600), (MIN_TICK, MAX_TICK)]
+
+
+def _topic(abi_type: str, value) -> bytes:
+    return encode([abi_type], [value])
+
+
+def _log(topic: bytes, data: bytes, tick_lower: int = None, tick_upper: int = None) -> dict:
+    topics = [topic, _topic("address", OWNER)]
+    if tick_lower is not None:
+        topics += [_topic("int24", tick_lower), _topic("int24", tick_upper)]
+    return {"topics": topics, "data": data}
+
+
+@pytest.mark.parametrize("values", [
+    (-(10**18), 3000 * 10**6, 4339505179874779662909440, 10**20, -200000),
+    (5 * 10**6, -(10**15), MAX_SQRT_RATIO - 1, MAX_UINT128, MAX_TICK - 1),
+    (-(2**255), 2**255 - 1, 4295128739, 1, MIN_TICK),
+])
+def test_decode_swap_matches_eth_abi(values):
+    types = ["int256", "int256", "uint160", "uint128", "int24"]
+    data = encode(types, values)
+    topics = [SWAP_TOPIC, _topic("address", OWNER), _topic("address", RECIPIENT)]
+
+    event, decoded = decode_log({"topics": topics, "data": data})
+
+    amount0, amount1, sqrt_price_x96, liquidity, tick = decode(types, data)
+    assert event == "swap"
+    assert (decoded["amount0"], decoded["amount1"]) == (amount0, amount1)
+    assert limbs_to_int(decoded["sqrt_price_x96"]) == sqrt_price_x96
+    assert (decoded["liquidity"], decoded["tick"]) == (liquidity, tick)
+
+
+@pytest.mark.parametrize("tick_lower, tick_upper", TICK_RANGES)
+def test_decode_mint_burn_collect_match_eth_abi(tick_lower, tick_upper):
+    mint_types = ["address", "uint128", "uint256", "uint256"]
+    mint_data = encode(mint_types, [RECIPIENT, 10**18, 2**200, 12345])
+    burn_types = ["uint128", "uint256", "uint256"]
+    burn_data = encode(burn_types, [MAX_UINT128, 0, 2**255])
+    collect_types = ["address", "uint128", "uint128"]
+    collect_data = encode(collect_types, [RECIPIENT, MAX_UINT128, 7])
+    ticks = {"tick_lower": tick_lower, "tick_upper": tick_upper}
+
+    _, amount, amount0, amount1 = decode(mint_types, mint_data)
+    assert decode_log(_log(MINT_TOPIC, mint_data, tick_lower, tick_upper)) == (
+        "mint", dict(ticks, amount=amount, amount0=amount0, amount1=amount1))
+
+    amount, amount0, amount1 = decode(burn_types, burn_data)
+    assert decode_log(_log(BURN_TOPIC, burn_data, tick_lower, tick_upper)) == (
+        "burn", dict(ticks, amount=amount, amount0=amount0, amount1=amount1))
+
+    _, amount0, amount1 = decode(collect_types, collect_data)
+    assert decode_log(_log(COLLECT_TOPIC, collect_data, tick_lower, tick_upper)) == (
+        "collect", dict(ticks, amount0=amount0, amount1=amount1))
+
+
+def test_decode_log_skips_other_topics():
+    transfer_topic = Web3.keccak(text="Transfer(address,address,uint256)")
+    assert decode_log({"topics": [transfer_topic], "data": encode(["uint256"], [1])}) == (None, None)
+
+
+def test_ingest_from_the_emulated_chain(chain, config, tmp_path):
+    w3 = Web3(emulator.EmulatorProvider(chain))
+    factory = w3.eth.contract(address=Web3.to_checksum_address(config.UNISWAP_FACTORY_ADDRESS), abi=config.UNISWAP_FACTORY_ABI)
+    pool_address = factory.functions.getPool(config.TOKEN0_ADDRESS, config.TOKEN1_ADDRESS, config.POOL_FEE).call()
+    start_block = chain.head + 1
+    chain.mine(40, swaps_per_block=2, volatility=3.0)
+
+    store = HistoryStore(str(tmp_path / "history"))
+    ingester = HistoryIngester(w3, store, [pool_address], start_block=start_block, min_block_range=4)
+    ingested = ingester.ingest()
+
+    swaps = store.swap_series(pool_address)
+    assert ingested == len(swaps["ticks"]) == 80
+    assert list(swaps["blocks"]) == sorted(swaps["blocks"])
+    # The last swap leaves the pool where slot0 says it is.
+    pool = w3.eth.contract(address=pool_address, abi=config.UNISWAP_POOL_ABI)
+    sqrt_price_x96, tick = pool.functions.slot0().call()[:2]
+    assert swaps["ticks"][-1] == tick
+    assert limbs_to_int(store.read("swap")["sqrt_price_x96"][-1]) == sqrt_price_x96
+    # Nothing new: a second pass is a no-op.
+    assert ingester.ingest() == 0
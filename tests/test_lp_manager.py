@@ -0,0 +1,42 @@
+"""UniswapLPManager on the emulated chain: slippage minimums of the sequential withdrawal."""
+import pytest
+
+
+def _pool_address(bot, config):
+    return bot.lp_manager.get_pool_address(config.TOKEN0_ADDRESS, config.TOKEN1_ADDRESS, config.POOL_FEE)
+
+
+def test_decrease_liquidity_sets_minimums_from_the_expected_amounts(bot, bot_module, config, rpc_log):
+    token_id = bot.position_token_id
+    tick_lower, tick_upper, liquidity = bot.lp_manager.get_position_info(token_id)[5:8]
+    _, expected0, expected1 = bot.lp_manager.expected_withdrawal(tick_lower, tick_upper, liquidity)
+    assert expected0 > 0 and expected1 > 0
+    rpc_log.clear()
+
+    recovered0, recovered1 = bot.lp_manager.decrease_liquidity(token_id, liquidity, collect=True)
+
+    # The decrease's gas is estimated from its calldata, which carries the minimums.
+    estimate, = [request for request in rpc_log if request["method"] == "eth_estimateGas"]
+    function, arguments = bot.lp_manager.nft_manager.decode_function_input(estimate["params"][0]["data"])
+    params = arguments["params"]
+    assert function.fn_name == "decreaseLiquidity"
+    assert (params["amount0Min"], params["amount1Min"]) == (
+        bot_module.min_amount(expected0, config.MINT_SLIPPAGE), bot_module.min_amount(expected1, config.MINT_SLIPPAGE))
+    assert recovered0 > 0 and recovered1 > 0
+
+
+def test_decrease_liquidity_reverts_when_front_run_past_the_slippage(bot, config, client, move_price, monkeypatch):
+    token_id = bot.position_token_id
+    liquidity = bot.lp_manager.get_position_info(token_id)[7]
+    # A sandwich: the pool is pushed well past MINT_SLIPPAGE (1%) after the minimums are computed, before inclusion.
+    send_transactions = client.send_transactions
+
+    def front_run(*args, **kwargs):
+        move_price(_pool_address(bot, config), 0.05)
+        return send_transactions(*args, **kwargs)
+
+    monkeypatch.setattr(client, "send_transactions", front_run)
+    with pytest.raises(Exception):
+        bot.lp_manager.decrease_liquidity(token_id, liquidity, collect=True)
+
+    assert bot.lp_manager.get_position_info(token_id)[7] == liquidity
@@ -0,0 +1,126 @@
+"""Batched reads (Multicall3 aggregate3), the per-cycle read cache and the per-call fallback of BlockchainClient."""
+import pytest
+
+
+def _reads(client, config):
+    """slot0 and liquidity of the pool, the wallet's token0 balance, and a position that doesn't exist (reverts)."""
+    pool_address = client.get_contract(config.UNISWAP_FACTORY_ADDRESS, config.UNISWAP_FACTORY_ABI).functions.getPool(
+        config.TOKEN0_ADDRESS, config.TOKEN1_ADDRESS, config.POOL_FEE).call()
+    pool = client.get_contract(pool_address, config.UNISWAP_POOL_ABI)
+    token0 = client.get_contract(config.TOKEN0_ADDRESS, config.ERC20_ABI)
+    nft_manager = client.get_contract(config.UNISWAP_NFT_POSITION_MANAGER_ADDRESS, config.UNISWAP_NFT_POSITION_MANAGER_ABI)
+    return [pool.functions.slot0(), pool.functions.liquidity(), token0.functions.balanceOf(config.WALLET_ADDRESS),
+            nft_manager.functions.positions(999)]
+
+
+def _plain(results: list) -> list:
+    """Results with tuples as lists (a web3 call and a decoded batch may differ only in the sequence type)."""
+    return [list(result) if isinstance(result, (list, tuple)) else result for result in results]
+
+
+def _eth_calls(rpc_log) -> list:
+    return [request for request in rpc_log if request["method"] == "eth_call"]
+
+
+def test_batch_call_sends_one_aggregate3_and_allows_failures(client, config, rpc_log, bot_module):
+    calls = _reads(client, config)
+    expected = [fn.call() for fn in calls[:3]]
+    rpc_log.clear()
+
+    results = client.batch_call(calls, allow_failure=True)
+
+    eth_calls = _eth_calls(rpc_log)
+    assert len(eth_calls) == 1
+    assert eth_calls[0]["params"][0]["to"].lower() == config.MULTICALL3_ADDRESS.lower()
+    assert _plain(results[:3]) == _plain(expected)
+    assert isinstance(results[3], bot_module.MulticallCallFailed)
+
+
+def test_encode_batch_and_decode_batch_round_trip(client, config, chain, bot_module):
+    # What the portfolio's concurrent prefetch sends: an eth_call built and decoded outside of batch_call.
+    calls = _reads(client, config)
+    return_data = client.w3.eth.call(client.encode_batch(calls), chain.head)
+    results = client.decode_batch(calls, return_data)
+    assert _plain(results[:3]) == _plain(client.batch_call(calls[:3]))
+    assert isinstance(results[3], bot_module.MulticallCallFailed)
+
+
+def test_batch_call_raises_a_failed_call_unless_allowed(client, config, bot_module):
+    with pytest.raises(bot_module.MulticallCallFailed):
+        client.batch_call(_reads(client, config))
+
+
+def test_batch_call_chunks_by_batch_size(client, config, rpc_log):
+    config.MULTICALL_BATCH_SIZE = 3
+    calls = _reads(client, config)
+    rpc_log.clear()
+    client.batch_call(calls, allow_failure=True)
+    assert len(_eth_calls(rpc_log)) == 2
+
+
+def test_cycle_memoizes_reads_at_the_pinned_block(client, config, chain, rpc_log):
+    slot0, liquidity = _reads(client, config)[:2]
+    cycle = client.begin_cycle()
+    assert cycle.block_number == chain.head
+    rpc_log.clear()
+
+    first = client.call(slot0)
+    assert cycle.has(slot0)
+    assert not cycle.has(liquidity)
+    second = client.call(slot0)
+
+    assert first == second
+    assert (cycle.hits, cycle.misses, cycle.rpc_requests) == (1, 1, 1)
+    eth_calls = _eth_calls(rpc_log)
+    assert len(eth_calls) == 1
+    assert eth_calls[0]["params"][1] == hex(cycle.block_number)
+
+    # New blocks move the pool, but the cycle keeps reading its snapshot until it ends.
+    chain.mine(5, volatility=5.0)
+    assert client.call(slot0) == first
+    client.end_cycle()
+    assert client.read_stats == {"hits": 2, "misses": 1, "rpc_requests": 1}
+    client.begin_cycle()
+    assert client.call(slot0) != first
+
+
+def test_has_does_not_count_misses(client, config):
+    slot0 = _reads(client, config)[0]
+    cycle = client.begin_cycle()
+    for _ in range(3):
+        assert not cycle.has(slot0)
+    assert cycle.misses == 0
+    client.end_cycle()
+
+
+def test_batch_call_inside_a_cycle_only_fetches_what_is_not_cached(client, config, rpc_log):
+    calls = _reads(client, config)
+    cycle = client.begin_cycle()
+    client.call(calls[0])
+    rpc_log.clear()
+
+    client.batch_call(calls, allow_failure=True)
+    client.batch_call(calls, allow_failure=True)
+
+    assert len(_eth_calls(rpc_log)) == 1
+    assert (cycle.hits, cycle.misses, cycle.rpc_requests) == (1 + 4, 1 + 3, 1 + 1)
+    client.end_cycle()
+
+
+def test_falls_back_to_one_call_per_read_without_multicall(client, config, rpc_log, bot_module):
+    calls = _reads(client, config)
+    batched = client.batch_call(calls, allow_failure=True)
+    config.USE_MULTICALL = False
+    cycle = client.begin_cycle()
+    rpc_log.clear()
+
+    results = client.batch_call(calls, allow_failure=True)
+
+    eth_calls = _eth_calls(rpc_log)
+    assert len(eth_calls) == len(calls)
+    assert all(request["params"][0]["to"].lower() != config.MULTICALL3_ADDRESS.lower() for request in eth_calls)
+    assert all(request["params"][1] == hex(cycle.block_number) for request in eth_calls)
+    assert cycle.rpc_requests == len(calls)
+    assert _plain(results[:3]) == _plain(batched[:3])
+    assert isinstance(results[3], bot_module.MulticallCallFailed)
+    client.end_cycle()
@@ -0,0 +1,22 @@
+"""Where the single-position bot finds its tokenId on startup: the state journal, or a legacy POSITION_ID_PATH file."""
+
+
+def test_legacy_position_id_file_is_imported_into_the_journal_once(bot_module, config, client, tmp_path):
+    assert config.POSITION_ID_PATH == str(tmp_path / "position_id.txt")
+    (tmp_path / "position_id.txt").write_text("42\n")
+    bot = bot_module.LiquidityManagerBot(config, client)
+
+    assert bot._load_position_id() == 42
+    assert client.journal.get_position(bot.hedge_key) == 42
+    # From then on the journal is the source: the file is not read again.
+    (tmp_path / "position_id.txt").write_text("7\n")
+    assert bot._load_position_id() == 42
+    bot.derivatives_manager.session.close()
+
+
+def test_empty_position_id_path_skips_the_import(bot_module, config, client, tmp_path):
+    (tmp_path / "position_id.txt").write_text("42\n")
+    config.POSITION_ID_PATH = ""
+    bot = bot_module.LiquidityManagerBot(config, client)
+    assert bot._load_position_id() is None
+    bot.derivatives_manager.session.close()
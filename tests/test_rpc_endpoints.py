@@ -0,0 +1,117 @@
+"""MultiEndpointProvider against fake endpoints: failover, hedged requests and URL redaction."""
+import json
+import time
+from urllib.parse import urlsplit
+
+import pytest
+import requests
+
+URLS = ["https://a.example/v3/SECRET-A", "https://b.example:8545/v3/SECRET-B?key=SECRET-C"]
+
+
+class FakeSession:
+    """Stands in for an endpoint's requests.Session: answers, fails, rate-limits or answers late, as set."""
+    def __init__(self, behaviour: str = "ok", delay: float = 0.0):
+        self.behaviour = behaviour
+        self.delay = delay
+        self.posts = 0
+
+    def post(self, url, data=None, headers=None, timeout=None):
+        self.posts += 1
+        time.sleep(self.delay)
+        request = json.loads(data)
+        if self.behaviour == "down":
+            # requests quotes the path (and its key) in connection errors.
+            parsed = urlsplit(url)
+            path = f"{parsed.path}?{parsed.query}" if parsed.query else parsed.path
+            raise requests.ConnectionError(f"HTTPSConnectionPool(host='{parsed.hostname}'): Max retries exceeded with url: {path}")
+        if self.behaviour == "rate_limited":
+            body = {"jsonrpc": "2.0", "id": request["id"], "error": {"code": -32005, "message": "rate limited"}}
+        elif self.behaviour == "revert":
+            body = {"jsonrpc": "2.0", "id": request["id"], "error": {"code": 3, "message": "execution reverted"}}
+        else:
+            body = {"jsonrpc": "2.0", "id": request["id"], "result": url}
+        response = requests.Response()
+        response.status_code = 200
+        response._content = json.dumps(body).encode()
+        return response
+
+
+@pytest.fixture
+def make_provider(bot_module):
+    providers = []
+
+    def make(*sessions, hedged_methods=None, hedge_delay=0.05):
+        provider = bot_module.MultiEndpointProvider(URLS[:len(sessions)], hedge_delay=hedge_delay,
+                                                    hedged_methods=hedged_methods)
+        for endpoint, session in zip(provider.endpoints, sessions):
+            endpoint.session = session
+        providers.append(provider)
+        return provider
+
+    yield make
+    for provider in providers:
+        provider._executor.shutdown(wait=True)
+
+
+def test_fails_over_to_the_next_endpoint_and_cools_the_failed_one_down(make_provider, capsys):
+    down, up = FakeSession("down"), FakeSession()
+    provider = make_provider(down, up)
+
+    assert provider.make_request("eth_blockNumber", [])["result"] == URLS[1]
+    assert provider.endpoints[0].cooldown_until > time.time()
+    # The next request goes straight to the healthy endpoint.
+    provider.make_request("eth_blockNumber", [])
+    assert (down.posts, up.posts) == (1, 2)
+    assert "RPC endpoint #0 (https://a.example) failed" in capsys.readouterr().out
+
+
+def test_rate_limits_fail_over_but_reverts_are_answers(make_provider):
+    limited, reverting = FakeSession("rate_limited"), FakeSession("revert")
+    provider = make_provider(limited, reverting)
+
+    response = provider.make_request("eth_call", [])
+    assert response["error"]["code"] == 3
+    assert provider.endpoints[0].errors == 1 and provider.endpoints[1].errors == 0
+
+
+def test_raises_the_last_error_when_every_endpoint_fails(make_provider):
+    provider = make_provider(FakeSession("down"), FakeSession("down"))
+    with pytest.raises(requests.ConnectionError):
+        provider.make_request("eth_blockNumber", [])
+
+
+def test_hedges_a_slow_primary_with_the_second_endpoint(make_provider):
+    slow, fast = FakeSession(delay=0.5), FakeSession()
+    provider = make_provider(slow, fast, hedged_methods={"eth_call"})
+
+    started = time.perf_counter()
+    response = provider.make_request("eth_call", [])
+
+    assert response["result"] == URLS[1]
+    assert time.perf_counter() - started < 0.4
+    assert (slow.posts, fast.posts) == (1, 1)
+
+
+def test_hedged_request_fails_over_when_the_primary_fails_outright(make_provider):
+    down, up = FakeSession("down"), FakeSession()
+    provider = make_provider(down, up, hedged_methods={"eth_call"}, hedge_delay=1.0)
+    assert provider.make_request("eth_call", [])["result"] == URLS[1]
+
+
+def test_unhedged_methods_wait_for_a_slow_endpoint(make_provider):
+    slow, fast = FakeSession(delay=0.1), FakeSession()
+    provider = make_provider(slow, fast, hedged_methods={"eth_call"})
+    assert provider.make_request("eth_sendRawTransaction", [])["result"] == URLS[0]
+    assert fast.posts == 0
+
+
+def test_urls_are_redacted_from_logs_str_and_health(make_provider, capsys):
+    provider = make_provider(FakeSession("down"), FakeSession("rate_limited"))
+    with pytest.raises(requests.HTTPError):
+        provider.make_request("eth_blockNumber", [])
+
+    shown = capsys.readouterr().out + str(provider) + json.dumps(provider.health())
+    assert "SECRET" not in shown and "/v3" not in shown
+    assert str(provider) == "MultiEndpointProvider(#0 (https://a.example), #1 (https://b.example:8545))"
+    assert {entry["endpoint"] for entry in provider.health()} == {"#0 (https://a.example)", "#1 (https://b.example:8545)"}
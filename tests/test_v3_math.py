@@ -0,0 +1,180 @@
+"""uniswap_v3_math against the vectors of the Uniswap v3-core and v3-periphery test suites, and exact rational math."""
+from fractions import Fraction
+from math import ceil, floor, isqrt
+
+import pytest
+
+from uniswap_v3_math import (
+    MAX_SQRT_RATIO, MAX_TICK, MAX_UINT128, MAX_UINT256, MIN_SQRT_RATIO, MIN_TICK, Q96, Q128,
+    compute_swap_step, get_amount0_delta, get_amount1_delta, get_amounts_for_liquidity, get_liquidity_for_amounts,
+    get_sqrt_ratio_at_tick, get_tick_at_sqrt_ratio, mul_div, mul_div_rounding_up,
+)
+
+# getSqrtRatioAtTick results from the v3-core TickMath test suite.
+KNOWN_SQRT_RATIOS = {
+    MIN_TICK: MIN_SQRT_RATIO,
+    MIN_TICK + 1: 4295343490,
+    0: 79228162514264337593543950336,
+    50: 79426470787362580746886972461,
+    100: 79625275426524748796330556128,
+    250: 80224679980005306637834519095,
+    500: 81233731461783161732293370115,
+    1000: 83290069058676223003182343270,
+    2500: 89776708723587163891445672585,
+    3000: 92049301871182272007977902845,
+    4000: 96768528593268422080558758223,
+    5000: 101729702841318637793976746270,
+    50000: 965075977353221155028623082916,
+    150000: 143194173941309278083010301478497,
+    250000: 21246587762933397357449903968194344,
+    500000: 5697689776495288729098254600827762987878,
+    738203: 847134979253254120489401328389043031315994541,
+    MAX_TICK - 1: 1461373636630004318706518188784493106690254656249,
+    MAX_TICK: MAX_SQRT_RATIO,
+}
+
+# computeSwapStep cases from the v3-core SwapMath test suite: (args, (sqrt_next, amount_in, amount_out, fee_amount)).
+KNOWN_SWAP_STEPS = [
+    # Exact input capped at the price target (1.00 -> 1.01, one for zero).
+    ((Q96, 79623317895830914510639640423, 2 * 10**18, 10**18, 600),
+     (79623317895830914510639640423, 9975124224178055, 9925619580021728, 5988667735148)),
+    # Exact output capped at the price target.
+    ((Q96, 79623317895830914510639640423, 2 * 10**18, -(10**18), 600),
+     (79623317895830914510639640423, 9975124224178055, 9925619580021728, 5988667735148)),
+    # The entire input amount is taken as fee.
+    ((2413, 79887613182836312, 1985041575832132834610021537970, 10, 1872), (2413, 0, 0, 10)),
+]
+
+# Ranges at the ends of the tick space, where the Q64.96 ratios are smallest and largest.
+BOUNDARY_RANGES = [
+    (MIN_SQRT_RATIO, MAX_SQRT_RATIO),
+    (MIN_SQRT_RATIO, get_sqrt_ratio_at_tick(MIN_TICK + 1)),
+    (get_sqrt_ratio_at_tick(MAX_TICK - 1), MAX_SQRT_RATIO),
+]
+LIQUIDITIES = [1, 3, 10**18 + 7, MAX_UINT128]
+
+
+def encode_price_sqrt(reserve1: int, reserve0: int) -> int:
+    """The test suites' encodePriceSqrt: floor(sqrt(reserve1 / reserve0) * 2^96)."""
+    return isqrt(reserve1 * 2**192 // reserve0)
+
+
+@pytest.mark.parametrize("tick, expected", KNOWN_SQRT_RATIOS.items())
+def test_get_sqrt_ratio_at_tick(tick, expected):
+    assert get_sqrt_ratio_at_tick(tick) == expected
+
+
+@pytest.mark.parametrize("tick", [tick for tick in KNOWN_SQRT_RATIOS if tick < MAX_TICK])
+def test_get_tick_at_sqrt_ratio_round_trips(tick):
+    ratio = get_sqrt_ratio_at_tick(tick)
+    assert get_tick_at_sqrt_ratio(ratio) == tick
+    if tick > MIN_TICK:
+        assert get_tick_at_sqrt_ratio(ratio - 1) == tick - 1
+
+
+def test_tick_math_bounds():
+    assert get_tick_at_sqrt_ratio(MAX_SQRT_RATIO - 1) == MAX_TICK - 1
+    for tick in (MIN_TICK - 1, MAX_TICK + 1):
+        with pytest.raises(ValueError):
+            get_sqrt_ratio_at_tick(tick)
+    for ratio in (MIN_SQRT_RATIO - 1, MAX_SQRT_RATIO):
+        with pytest.raises(ValueError):
+            get_tick_at_sqrt_ratio(ratio)
+
+
+@pytest.mark.parametrize("args, expected", KNOWN_SWAP_STEPS)
+def test_compute_swap_step(args, expected):
+    assert compute_swap_step(*args) == expected
+
+
+# --- FullMath (v3-core FullMath test suite) ---
+def test_mul_div():
+    assert mul_div(MAX_UINT256, MAX_UINT256, MAX_UINT256) == MAX_UINT256
+    assert mul_div(Q128, Q128 // 2, 3 * Q128 // 2) == Q128 // 3
+    assert mul_div(Q128, 35 * Q128, 8 * Q128) == 4375 * Q128 // 1000
+    assert mul_div(Q128, 1000 * Q128, 3000 * Q128) == Q128 // 3
+
+
+def test_mul_div_rounding_up():
+    assert mul_div_rounding_up(MAX_UINT256, MAX_UINT256, MAX_UINT256) == MAX_UINT256
+    assert mul_div_rounding_up(Q128, Q128 // 2, 3 * Q128 // 2) == Q128 // 3 + 1
+    assert mul_div_rounding_up(Q128, 35 * Q128, 8 * Q128) == 4375 * Q128 // 1000
+    assert mul_div_rounding_up(Q128, 1000 * Q128, 3000 * Q128) == Q128 // 3 + 1
+
+
+@pytest.mark.parametrize("function, args, error", [
+    (mul_div, (Q128, 5, 0), ZeroDivisionError),
+    (mul_div, (Q128, Q128, 1), OverflowError),
+    (mul_div_rounding_up, (Q128, Q128, 1), OverflowError),
+    (mul_div_rounding_up, (MAX_UINT256, MAX_UINT256, MAX_UINT256 - 1), OverflowError),
+    # The floor fits in uint256, rounding it up doesn't.
+    (mul_div_rounding_up, (535006138814359, 432862656469423142931042426214547535783388063929571229938474969, 2), OverflowError),
+])
+def test_full_math_reverts(function, args, error):
+    with pytest.raises(error):
+        function(*args)
+
+
+@pytest.mark.parametrize("sqrt_a, sqrt_b", BOUNDARY_RANGES)
+@pytest.mark.parametrize("liquidity", LIQUIDITIES)
+def test_amount_deltas_round_exactly_at_the_tick_bounds(sqrt_a, sqrt_b, liquidity):
+    # Amounts owed to the pool round up, amounts paid out round down: exactly the ceiling and floor of the real value.
+    amount0 = Fraction(liquidity * Q96 * (sqrt_b - sqrt_a), sqrt_b * sqrt_a)
+    amount1 = Fraction(liquidity * (sqrt_b - sqrt_a), Q96)
+    assert get_amount0_delta(sqrt_a, sqrt_b, liquidity, True) == ceil(amount0)
+    assert get_amount0_delta(sqrt_a, sqrt_b, liquidity, False) == floor(amount0)
+    assert get_amount1_delta(sqrt_a, sqrt_b, liquidity, True) == ceil(amount1)
+    assert get_amount1_delta(sqrt_a, sqrt_b, liquidity, False) == floor(amount1)
+    # Order of the bounds doesn't matter.
+    assert get_amount0_delta(sqrt_b, sqrt_a, liquidity, True) == ceil(amount0)
+
+
+# --- LiquidityAmounts (v3-periphery LiquidityAmounts test suite) ---
+PERIPHERY_LOWER, PERIPHERY_UPPER = encode_price_sqrt(100, 110), encode_price_sqrt(110, 100)
+PERIPHERY_CASES = [
+    # (price, liquidity for amounts (100, 200), amounts for that liquidity)
+    ("inside", encode_price_sqrt(1, 1), 2148, (99, 99)),
+    ("below", encode_price_sqrt(99, 110), 1048, (99, 0)),
+    ("above", encode_price_sqrt(111, 100), 2097, (0, 199)),
+    ("at lower", PERIPHERY_LOWER, 1048, (99, 0)),
+    ("at upper", PERIPHERY_UPPER, 2097, (0, 199)),
+]
+
+
+@pytest.mark.parametrize("name, sqrt_price, liquidity, amounts", PERIPHERY_CASES, ids=[case[0] for case in PERIPHERY_CASES])
+def test_get_liquidity_for_amounts(name, sqrt_price, liquidity, amounts):
+    assert get_liquidity_for_amounts(sqrt_price, PERIPHERY_LOWER, PERIPHERY_UPPER, 100, 200) == liquidity
+
+
+@pytest.mark.parametrize("name, sqrt_price, liquidity, amounts", PERIPHERY_CASES, ids=[case[0] for case in PERIPHERY_CASES])
+def test_get_amounts_for_liquidity(name, sqrt_price, liquidity, amounts):
+    assert get_amounts_for_liquidity(sqrt_price, PERIPHERY_LOWER, PERIPHERY_UPPER, liquidity) == amounts
+    # The bounds may be given in either order.
+    assert get_amounts_for_liquidity(sqrt_price, PERIPHERY_UPPER, PERIPHERY_LOWER, liquidity) == amounts
+
+
+@pytest.mark.parametrize("sqrt_a, sqrt_b", BOUNDARY_RANGES)
+@pytest.mark.parametrize("liquidity", LIQUIDITIES)
+def test_amounts_for_liquidity_at_the_tick_bounds(sqrt_a, sqrt_b, liquidity):
+    # At or below the range everything is token0, at or above it token1, both rounded down.
+    below = get_amounts_for_liquidity(sqrt_a, sqrt_a, sqrt_b, liquidity)
+    above = get_amounts_for_liquidity(sqrt_b, sqrt_a, sqrt_b, liquidity)
+    assert below == (get_amount0_delta(sqrt_a, sqrt_b, liquidity, False), 0)
+    assert above == (0, get_amount1_delta(sqrt_a, sqrt_b, liquidity, False))
+
+
+@pytest.mark.parametrize("sqrt_a, sqrt_b", BOUNDARY_RANGES)
+@pytest.mark.parametrize("liquidity", LIQUIDITIES)
+def test_liquidity_for_amounts_never_exceeds_what_they_pay_for(sqrt_a, sqrt_b, liquidity):
+    # Withdrawing `liquidity` and depositing the amounts again buys at most `liquidity` back (rounding favours the pool).
+    for sqrt_price in (sqrt_a, (sqrt_a + sqrt_b) // 2, sqrt_b):
+        amount0, amount1 = get_amounts_for_liquidity(sqrt_price, sqrt_a, sqrt_b, liquidity)
+        assert get_liquidity_for_amounts(sqrt_price, sqrt_a, sqrt_b, amount0, amount1) <= liquidity
+
+
+def test_get_liquidity_for_amounts_overflows_uint128():
+    # At the top of the tick space one unit of token0 is worth about 2^78 of liquidity in a one-tick range.
+    sqrt_a = get_sqrt_ratio_at_tick(MAX_TICK - 1)
+    assert get_liquidity_for_amounts(sqrt_a, sqrt_a, MAX_SQRT_RATIO, 2**40, 0) <= MAX_UINT128
+    with pytest.raises(OverflowError):
+        get_liquidity_for_amounts(sqrt_a, sqrt_a, MAX_SQRT_RATIO, 2**60, 0)
@@ -0,0 +1,141 @@
+"""
+Contract ABIs for the bot, loaded on first use and served from one precompiled cache file.
+
+`Config` used to json.load every ABI file at construction (leaving the file handles open), and web3 then built
+a class for every entry of every ABI for each contract instance, although the bot calls a handful of functions
+per contract (about 0.1 ms per entry, ~5 ms for a full position manager ABI). Now:
+- each ABI is a lazy `Config` attribute (`LazyABI`), read the first time it is used, and one shared list object
+  per file afterwards (so `BlockchainClient.get_contract`'s cache keys stay stable);
+- reads go through ABI_CACHE_PATH, a single compact JSON holding, per source file, only the entries listed in
+  ABI_ENTRIES, each with its 4-byte selector (functions) or topic (events), plus the source file's size and
+  mtime. A missing or stale entry is rebuilt from the source file and the cache rewritten.
+
+Calling a contract function or event that isn't in ABI_ENTRIES raises web3's ABIFunctionNotFound /
+ABIEventFunctionNotFound: add its name below. ABI_TRIM=false loads the full ABIs instead.
+
+List the cached entries and their selectors:
+    python uniswap_lp_abi.py
+"""
+import json
+import os
+import sys
+import threading
+
+from eth_utils import event_abi_to_log_topic, function_abi_to_4byte_selector
+
+ABI_DIR = os.getenv("ABI_DIR", "abi")
+ABI_CACHE_PATH = os.getenv("ABI_CACHE_PATH", os.path.join(ABI_DIR, "abi_cache.json"))
+ABI_TRIM = os.getenv("ABI_TRIM", "true").lower() == "true"
+
+# Functions and events the bot uses, per ABI file. Entries missing from a file are skipped.
+ABI_ENTRIES = {
+    "UniswapV3Factory.json": ("getPool",),
+    "UniswapV3Pool.json": ("slot0", "tickSpacing", "liquidity", "Swap"),
+    "UniswapV3PositionManager.json": (
+        "positions", "mint", "increaseLiquidity", "decreaseLiquidity", "collect", "burn", "multicall", "selfPermit",
+        "balanceOf", "tokenOfOwnerByIndex", "IncreaseLiquidity", "DecreaseLiquidity", "Collect", "Transfer",
+    ),
+    "ERC20.json": ("decimals", "symbol", "balanceOf", "allowance", "approve", "Approval", "Transfer"),
+    "ChainlinkAggregatorV3.json": ("latestRoundData", "decimals"),
+    "Multicall3.json": ("aggregate3",),
+    "SwapRouter.json": ("exactInputSingle",),
+}
+
+_abis = {} # file name -> ABI list handed out (one object per file)
+_lock = threading.Lock()
+
+
+def _signature(entry: dict) -> str:
+    return "{}({})".format(entry["name"], ",".join(_type(i) for i in entry.get("inputs", [])))
+
+
+def _type(param: dict) -> str:
+    # Tuples (structs) are spelled out, as in the canonical signature.
+    if param["type"].startswith("tuple"):
+        return "({})".format(",".join(_type(c) for c in param["components"])) + param["type"][len("tuple"):]
+    return param["type"]
+
+
+def compile_abi(filename: str, abi: list) -> dict:
+    """Cache record of one ABI file: the kept entries plus each one's selector or topic."""
+    wanted = set(ABI_ENTRIES.get(filename, ())) if ABI_TRIM else None
+    kept = [entry for entry in abi if wanted is None or entry.get("name") in wanted]
+    selectors = {}
+    for entry in kept:
+        if entry.get("type") == "function":
+            selectors[_signature(entry)] = "0x" + function_abi_to_4byte_selector(entry).hex()
+        elif entry.get("type") == "event":
+            selectors[_signature(entry)] = "0x" + event_abi_to_log_topic(entry).hex()
+    return {"abi": kept, "selectors": selectors}
+
+
+def _source_stamp(path: str) -> list:
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime_ns, ABI_TRIM, sorted(ABI_ENTRIES.get(os.path.basename(path), ()))]
+
+
+def _read_cache() -> dict:
+    try:
+        with open(ABI_CACHE_PATH, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_cache(cache: dict):
+    try:
+        tmp_path = f"{ABI_CACHE_PATH}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(cache, f, separators=(",", ":"))
+        os.replace(tmp_path, ABI_CACHE_PATH)
+    except OSError as e:
+        print(f"Error writing ABI cache {ABI_CACHE_PATH}: {e}")
+
+
+def load_abi(filename: str) -> list:
+    """The (trimmed) ABI of abi/<filename>, from the precompiled cache when it is current."""
+    abi = _abis.get(filename)
+    if abi is not None:
+        return abi
+    with _lock:
+        if filename not in _abis:
+            path = os.path.join(ABI_DIR, filename)
+            stamp = _source_stamp(path)
+            cache = _read_cache()
+            record = cache.get(filename)
+            if record is None or record.get("stamp") != stamp:
+                with open(path, "r") as f:
+                    source = json.load(f)
+                # Some explorers wrap the ABI: {"abi": [...]}.
+                record = dict(compile_abi(filename, source["abi"] if isinstance(source, dict) else source), stamp=stamp)
+                cache[filename] = record
+                _write_cache(cache)
+            _abis[filename] = record["abi"]
+        return _abis[filename]
+
+
+class LazyABI:
+    """
+    Config attribute holding an ABI file's name; the ABI is loaded (see `load_abi`) when first read.
+    Non-data descriptor: assigning the attribute on a Config instance overrides it with a plain value.
+    """
+    def __init__(self, filename: str):
+        self.filename = filename
+
+    def __get__(self, instance, owner=None):
+        if instance is None:
+            return self
+        return load_abi(self.filename)
+
+
+if __name__ == "__main__":
+    for filename in sys.argv[1:] or ABI_ENTRIES:
+        try:
+            load_abi(filename)
+        except OSError as e:
+            print(f"{filename}: {e}")
+            continue
+        record = _read_cache().get(filename, {})
+        print(f"{filename}: {len(record.get('abi', []))} entries")
+        for signature, selector in record.get("selectors", {}).items():
+            print(f"    {selector}  {signature}")
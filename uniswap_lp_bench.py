@@ -0,0 +1,315 @@
+"""
+Benchmark suite of the LP bot, in two layers, with stored baselines.
+
+micro   the per-cycle math over large input sets (no node needed), in ns per call:
+            tick_from_price          UniswapLPManager.calculate_tick_from_price (exact TickMath)
+            price_from_tick          UniswapLPManager.calculate_price_from_tick
+            position_amounts         UniswapLPManager.calculate_position_amounts (the LP delta, exact Q64.96)
+            needs_rebalance          the rebalance rule (uniswap_lp_strategy.py)
+            lp_greeks                vectorized delta/gamma, per position at 5 price scenarios
+            book_scenarios           the hedge book's scenario report, per position
+
+e2e     full management cycles against a local anvil fork of Ethereum mainnet (Uniswap V3 is already deployed
+        there) with the mock derivatives venue (uniswap_lp_derivatives.MockExchangeServer):
+            rebalance cycle          run_cycle() on a position due for a rebalance: rebalance_lp (out of range,
+                                     so the sequential withdraw + swap + mint of REBALANCE_SWAP)
+                                     + manage_delta_neutral + the hedge order
+            steady cycle             the next run_cycle(): the position is in range, only the hedge is checked
+        Each reports wall time, JSON-RPC requests (every request the process sent, receipt polling included, from
+        the bot's metrics) and gas used. Every run starts from the same chain state (evm_snapshot/evm_revert) with
+        a fresh bot and state journal.
+
+        The setup funds anvil's first account, swaps WETH into USDT and mints a WETH/USDT 0.3% position whose range
+        lies entirely below the price, past REBALANCE_TRIGGER, then runs the bot with its default configuration,
+        so it rebalances that position the way it would live.
+
+            anvil --fork-url https://eth-mainnet.example/YOUR_KEY
+            NODE_URL=http://127.0.0.1:8545 python uniswap_lp_bench.py e2e --runs 3
+
+        The abi/ folder must be present (see uniswap_lp_bot.py).
+
+Baselines: --save FILE writes the results; --baseline FILE compares against them and exits with status 1 when
+a time regressed by more than --threshold (relative, default 0.25) or an RPC/gas count by more than
+--count-threshold (default 0.05):
+    python uniswap_lp_bench.py all --save bench_baseline.json
+    python uniswap_lp_bench.py all --baseline bench_baseline.json
+
+bench_baseline.json in the repo holds the micro results (`micro --save`); tests/test_bench.py fails when a micro
+benchmark is more than BENCH_THRESHOLD (default 1.0, i.e. 2x) slower than it. Timings are machine-specific:
+re-record it on the machine that runs the check.
+"""
+import argparse
+import asyncio
+import copy
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from decimal import Decimal
+
+MICRO_N = 10000
+MICRO_REPEATS = 5
+SCENARIO_SHOCKS = [-0.10, -0.05, 0.0, 0.05, 0.10]
+
+# Ethereum mainnet addresses (the e2e benchmark runs on a mainnet fork).
+WETH = "0xC02aaA39b223FE8D0A0e5C4F27eAD9083C756Cc2"
+USDT = "0xdAC17F958D2ee523a2206206994597C13D831ec7" # Sorts after WETH, so WETH is token0 (the volatile one)
+SWAP_ROUTER = "0xE592427A0AEce92De3Edee1F18E0157C05861564" # Uniswap V3 SwapRouter
+POOL_FEE = 3000
+# anvil's first default account (public test key).
+ANVIL_PRIVATE_KEY = "0xac0974bec39a17e36ba4a6b4d238ff944bacb478cbed5efcae784d7bf4f2ff80"
+ANVIL_ADDRESS = "0xf39Fd6e51aad88F6F4ce6aB8827279cffFb92266"
+EXACT_INPUT_SINGLE = "0x414bf389" # exactInputSingle((address,address,uint24,address,uint256,uint256,uint256,uint160))
+WETH_DEPOSIT = "0xd0e30db0" # deposit()
+
+
+# --- Micro benchmarks ---
+def _best_ns_per_call(fn, inputs: list, repeats: int) -> float:
+    """Best of `repeats` passes of fn(*args) over `inputs`, in nanoseconds per call."""
+    best = float("inf")
+    for _ in range(repeats):
+        started = time.perf_counter_ns()
+        for args in inputs:
+            fn(*args)
+        best = min(best, (time.perf_counter_ns() - started) / len(inputs))
+    return round(best, 1)
+
+
+def run_micro(n: int = MICRO_N, repeats: int = MICRO_REPEATS) -> dict:
+    import numpy as np
+    from uniswap_lp_bot import UniswapLPManager
+    from uniswap_lp_greeks import book_scenarios, lp_greeks, scenario_prices
+    from uniswap_lp_strategy import needs_rebalance
+    from uniswap_v3_math import get_sqrt_ratio_at_tick
+
+    # The conversion methods don't touch the manager's state (client, contracts), so no node is needed.
+    manager = object.__new__(UniswapLPManager)
+    rng = random.Random(42)
+    decimals0, decimals1 = 18, 6
+    # token0_per_token1 prices of a WETH/USDT-like pool (1 / 500..10000 USD per ETH).
+    prices = [Decimal(1) / Decimal(rng.uniform(500, 10000)).quantize(Decimal("0.0001")) for _ in range(n)]
+    ticks = [rng.randrange(-887000, 887000) for _ in range(n)]
+    positions = []
+    for _ in range(n):
+        center = rng.randrange(-200000, -190000)
+        width = rng.randrange(60, 6000)
+        positions.append((rng.randrange(10**12, 10**20), center - width, center + width,
+                          get_sqrt_ratio_at_tick(center + rng.randrange(-2 * width, 2 * width))))
+
+    results = {
+        "tick_from_price": _best_ns_per_call(manager.calculate_tick_from_price,
+                                             [(price, decimals0, decimals1) for price in prices], repeats),
+        "price_from_tick": _best_ns_per_call(manager.calculate_price_from_tick,
+                                             [(tick, decimals0, decimals1) for tick in ticks], repeats),
+        "position_amounts": _best_ns_per_call(manager.calculate_position_amounts,
+                                              [position + (decimals0, decimals1) for position in positions], repeats),
+        "needs_rebalance": _best_ns_per_call(needs_rebalance,
+                                             [(price, lower, upper, decimals0, decimals1, Decimal("0.01"))
+                                              for price, (_, lower, upper, _) in zip(prices, positions)], repeats),
+    }
+
+    # Vectorized engines: one call over the whole book, reported per position.
+    liquidity = [position[0] for position in positions]
+    lower = [position[1] for position in positions]
+    upper = [position[2] for position in positions]
+    spot = np.array([float(position[3]) ** 2 / 2.0**192 * 10.0 ** (decimals0 - decimals1) for position in positions])
+    scenarios = scenario_prices(spot, SCENARIO_SHOCKS)
+    results["lp_greeks"] = round(_best_ns_per_call(
+        lp_greeks, [(liquidity, lower, upper, [decimals0] * n, [decimals1] * n, scenarios)], repeats) / n, 1)
+    book = [{"symbol": f"SYM-{i % 10}", "liquidity": position[0], "tick_lower": position[1], "tick_upper": position[2],
+             "decimals0": decimals0, "decimals1": decimals1, "sqrt_price_x96": position[3]} for i, position in enumerate(positions)]
+    results["book_scenarios"] = round(_best_ns_per_call(book_scenarios, [(book, SCENARIO_SHOCKS)], repeats) / n, 1)
+    return {f"{name}_ns": value for name, value in results.items()}
+
+
+# --- End-to-end benchmark ---
+def _counts(metric) -> int:
+    return sum(metric.values().values())
+
+
+class _MockVenue:
+    """The mock derivatives venue, served from its own event loop thread."""
+    def __init__(self):
+        from uniswap_lp_derivatives import MockExchangeServer
+        self.loop = asyncio.new_event_loop()
+        threading.Thread(target=self.loop.run_forever, name="mock-venue", daemon=True).start()
+        # Marks don't move during the benchmark (mark_interval of an hour), so runs stay comparable.
+        self.server = MockExchangeServer(marks={"ETH-PERP": "3000"}, mark_interval=3600)
+        self.port = asyncio.run_coroutine_threadsafe(self.server.start(port=0), self.loop).result(timeout=10)
+
+    def stop(self):
+        asyncio.run_coroutine_threadsafe(self.server.stop(), self.loop).result(timeout=10)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+
+
+class E2EBench:
+    def __init__(self, node_url: str, workdir: str):
+        # The bot reads its settings from the environment when Config is built.
+        os.environ.update({
+            "NODE_URL": node_url, "PRIVATE_KEY": ANVIL_PRIVATE_KEY, "WALLET_ADDRESS": ANVIL_ADDRESS,
+            "POOL_REGISTRY_PATH": os.path.join(workdir, "pool_registry.json"),
+            "HEDGE_LEDGER_PATH": os.path.join(workdir, "hedge_ledger.jsonl"),
+            "EVENT_CURSOR_PATH": os.path.join(workdir, "swap_cursor.json"),
+            "POSITION_DISCOVERY": "false", "ALLOWANCE_POLICY": "cap",
+            "TX_POLL_INTERVAL": os.getenv("TX_POLL_INTERVAL", "0.1"), # anvil mines on receipt of each transaction
+        })
+        import uniswap_lp_bot as bot_module
+        self.bot_module = bot_module
+        self.workdir = workdir
+        self.venue = _MockVenue()
+        os.environ.update({"DERIVATIVES_EXCHANGE": "rest", "DERIVATIVES_EXCHANGE_URL": f"http://127.0.0.1:{self.venue.port}"})
+        base = bot_module.Config()
+        self.config = base.for_position({"token0": WETH, "token1": USDT, "fee": POOL_FEE, "short_symbol": "ETH-PERP",
+                                         "token0_symbol": "WETH", "token1_symbol": "USDT"})
+        self.w3 = bot_module.Web3(bot_module.Web3.HTTPProvider(node_url))
+        self.token_id = None
+        self.snapshot_id = None
+        self._runs = 0
+
+    def _rpc(self, method: str, params: list):
+        response = self.w3.provider.make_request(method, params)
+        if "error" in response:
+            raise Exception(f"{method} failed: {response['error']}")
+        return response["result"]
+
+    def _transact(self, tx: dict):
+        tx_hash = self.w3.eth.send_transaction(dict({"from": ANVIL_ADDRESS}, **tx))
+        receipt = self.w3.eth.wait_for_transaction_receipt(tx_hash)
+        if receipt.status != 1:
+            raise Exception(f"Setup transaction {tx_hash.hex()} reverted")
+        return receipt
+
+    def _build_bot(self, journal_name: str):
+        config = copy.copy(self.config)
+        config.JOURNAL_PATH = os.path.join(self.workdir, journal_name)
+        return self.bot_module.LiquidityManagerBot(config)
+
+    @staticmethod
+    def _close(bot):
+        bot.derivatives_manager.session.close()
+        bot.blockchain_client.journal.close()
+
+    def setup(self):
+        """Funds the account, gets USDT and mints the position to rebalance, then snapshots the chain."""
+        from eth_abi import encode as abi_encode
+        if "anvil" not in self.w3.client_version.lower():
+            raise Exception(f"The e2e benchmark needs anvil (it uses evm_snapshot/anvil_setBalance), not {self.w3.client_version}")
+        if not self.w3.eth.get_code(self.bot_module.Web3.to_checksum_address(self.config.UNISWAP_NFT_POSITION_MANAGER_ADDRESS)):
+            raise Exception("No Uniswap V3 position manager on this chain: start anvil with --fork-url <Ethereum mainnet RPC>.")
+        self._rpc("anvil_setBalance", [ANVIL_ADDRESS, hex(10_000 * 10**18)])
+        self._transact({"to": WETH, "value": 100 * 10**18, "data": WETH_DEPOSIT})
+        weth = self.w3.eth.contract(address=WETH, abi=self.config.ERC20_ABI)
+        self._transact({"to": WETH, "data": weth.encodeABI(fn_name="approve", args=[SWAP_ROUTER, 2**256 - 1])})
+        swap = abi_encode(["(address,address,uint24,address,uint256,uint256,uint256,uint160)"],
+                          [(WETH, USDT, POOL_FEE, ANVIL_ADDRESS, 2**64, 20 * 10**18, 0, 0)])
+        self._transact({"to": SWAP_ROUTER, "data": EXACT_INPUT_SINGLE + swap.hex()})
+
+        bot = self._build_bot("setup.db")
+        try:
+            pool_address = bot.lp_manager.get_pool_address(WETH, USDT, POOL_FEE)
+            _, price = bot.price_oracle.get_pool_prices(pool_address) # token0_per_token1 (WETH per USDT)
+            # A range 3% to 10% below the price (token0_per_token1), more than REBALANCE_TRIGGER (1%) out of it: due for
+            # a rebalance, and one-sided, so the re-deposit swaps first. The mint only takes one of the two tokens.
+            bot.initial_setup(Decimal("2"), Decimal("2") / price, price * Decimal("0.90"), price * Decimal("0.97"))
+            self.token_id = bot.position_token_id
+        finally:
+            self._close(bot)
+        if not self.token_id:
+            raise Exception("Setup mint failed")
+        self.snapshot_id = self._rpc("evm_snapshot", [])
+
+    def run(self) -> dict:
+        """One measured run from the setup snapshot: a rebalance cycle, then a steady cycle."""
+        self._rpc("evm_revert", [self.snapshot_id])
+        self.snapshot_id = self._rpc("evm_snapshot", []) # anvil drops a snapshot once reverted to
+        self._runs += 1
+        bot_module = self.bot_module
+        bot = self._build_bot(f"run{self._runs}.db")
+        try:
+            bot.position_token_id = self.token_id
+            result = {}
+            for name in ("rebalance", "steady"):
+                rpc_before, gas_before, txs_before = _counts(bot_module.RPC_LATENCY), _counts(bot_module.TX_GAS_USED), _counts(bot_module.TX_OUTCOMES)
+                started = time.perf_counter()
+                bot.run_cycle()
+                result[f"{name}_cycle_ms"] = round((time.perf_counter() - started) * 1000, 1)
+                result[f"{name}_rpc_requests"] = _counts(bot_module.RPC_LATENCY) - rpc_before
+                result[f"{name}_gas_used"] = _counts(bot_module.TX_GAS_USED) - gas_before
+                result[f"{name}_transactions"] = _counts(bot_module.TX_OUTCOMES) - txs_before
+            if bot.position_token_id == self.token_id:
+                raise Exception("The rebalance cycle didn't move the position (see the bot output above)")
+            return result
+        finally:
+            self._close(bot)
+
+    def close(self):
+        self.venue.stop()
+
+
+def run_e2e(node_url: str, runs: int) -> dict:
+    with tempfile.TemporaryDirectory(prefix="lpbot-bench-") as workdir:
+        bench = E2EBench(node_url, workdir)
+        try:
+            bench.setup()
+            results = [bench.run() for _ in range(runs)]
+        finally:
+            bench.close()
+    return {key: statistics.median(result[key] for result in results) for key in results[0]}
+
+
+# --- Baselines ---
+def regressions(results: dict, baseline: dict, threshold: float, count_threshold: float) -> list:
+    """Metrics worse than the baseline: *_ms/*_ns by more than `threshold`, RPC and gas counts by `count_threshold`."""
+    regressed = []
+    for section, values in results.items():
+        for key, value in values.items():
+            base = baseline.get(section, {}).get(key)
+            if not base:
+                continue
+            limit = threshold if key.endswith(("_ms", "_ns")) else count_threshold
+            if value > base * (1 + limit):
+                regressed.append(f"{section}.{key}: {value} vs baseline {base} (+{(value / base - 1) * 100:.0f}%, limit {limit:.0%})")
+    return regressed
+
+
+def _print_section(title: str, values: dict):
+    print(f"\n{title}")
+    for key, value in values.items():
+        print(f"    {key:<28}{value:>14,}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Micro and end-to-end benchmarks of the LP bot.")
+    parser.add_argument("suite", choices=("micro", "e2e", "all"))
+    parser.add_argument("--n", type=int, default=MICRO_N, help="inputs per micro benchmark")
+    parser.add_argument("--runs", type=int, default=3, help="e2e runs (medians are reported)")
+    parser.add_argument("--node-url", default=os.getenv("NODE_URL", "http://127.0.0.1:8545"), help="anvil mainnet fork")
+    parser.add_argument("--save", help="write the results to this JSON file")
+    parser.add_argument("--baseline", help="compare against results saved with --save")
+    parser.add_argument("--threshold", type=float, default=0.25, help="tolerated relative slowdown")
+    parser.add_argument("--count-threshold", type=float, default=0.05, help="tolerated relative RPC/gas increase")
+    args = parser.parse_args()
+
+    results = {}
+    if args.suite in ("micro", "all"):
+        results["micro"] = run_micro(args.n)
+    if args.suite in ("e2e", "all"):
+        results["e2e"] = run_e2e(args.node_url, args.runs)
+    for section, values in results.items():
+        _print_section(f"{section} (ns per call)" if section == "micro" else f"{section} (median of {args.runs} runs)", values)
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nSaved to {args.save}")
+    if args.baseline:
+        with open(args.baseline, "r") as f:
+            regressed = regressions(results, json.load(f), args.threshold, args.count_threshold)
+        if regressed:
+            print("\nREGRESSIONS against the baseline:\n    " + "\n    ".join(regressed))
+            sys.exit(1)
+        print(f"\nNo regressions against {args.baseline}.")
@@ -1,20 +1,108 @@
 import os
+import math
 import time
 import json
+import copy
+import asyncio
+import threading
+import importlib
+import uuid
+from collections import deque
+from urllib.parse import urlsplit
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError, as_completed
+import requests
+from requests.adapters import HTTPAdapter
 from web3 import Web3
 from web3.middleware import geth_poa_middleware
-from math import sqrt, log
+from web3.exceptions import ExtraDataLengthError, TimeExhausted, TransactionNotFound
+from web3.providers.base import JSONBaseProvider
+from hexbytes import HexBytes
+from eth_abi import decode as abi_decode
+from eth_account.messages import SignableMessage
+from eth_utils.abi import collapse_if_tuple
 from decimal import Decimal, getcontext
+from fractions import Fraction
+from uniswap_v3_math import (
+    MAX_UINT128, MAX_UINT256, get_sqrt_ratio_at_tick, get_tick_at_sqrt_ratio, get_amounts_for_liquidity, get_liquidity_for_amounts,
+    sqrt_price_x96_to_price, price_to_tick, tick_to_price
+)
+from uniswap_lp_strategy import (
+    hedge_adjustment, min_amount, needs_rebalance, new_range_prices, range_prices, range_ticks_for_prices, swap_to_range
+)
+from uniswap_lp_fastcall import FastCallClient, decode_result, encode_call, fast_call_spec
+from uniswap_lp_derivatives import ExchangeAdapter, ExchangeSession, PaperExchange, RestStreamExchange
+from uniswap_lp_journal import StateJournal
+from uniswap_lp_abi import LazyABI
+from uniswap_lp_metrics import METRICS
+# uniswap_lp_greeks (NumPy) is imported where it is used: it isn't needed to get connected, and `preload_modules`
+# loads it in the background meanwhile.
 
 # Set precision for financial calculations
 getcontext().prec = 50
 
 # --- 1. Configuration and Blockchain Connection ---
+# Metrics (see uniswap_lp_metrics.py). Cycle phases are timed with @METRICS.timed("<phase>") on the methods below.
+RPC_LATENCY = METRICS.histogram("lpbot_rpc_request_seconds", "JSON-RPC request latency, failover and hedging included.", ("method",))
+RPC_ERRORS = METRICS.counter("lpbot_rpc_errors_total", "Failed JSON-RPC requests (transport: every endpoint failed; rpc: error answer).", ("method", "kind"))
+RPC_ENDPOINT_REQUESTS = METRICS.counter("lpbot_rpc_endpoint_requests_total", "Requests sent to each RPC endpoint (index in NODE_URLS).", ("endpoint",))
+RPC_ENDPOINT_ERRORS = METRICS.counter("lpbot_rpc_endpoint_errors_total", "Failed requests per RPC endpoint.", ("endpoint",))
+RPC_ENDPOINT_LATENCY = METRICS.gauge("lpbot_rpc_endpoint_latency_seconds", "Moving average latency of each RPC endpoint.", ("endpoint",))
+TX_CONFIRMATION = METRICS.histogram("lpbot_tx_confirmation_seconds", "First broadcast to receipt, per transaction kind.", ("kind",))
+TX_OUTCOMES = METRICS.counter("lpbot_tx_total", "Supervised transactions by kind and outcome.", ("kind", "outcome"))
+TX_GAS_USED = METRICS.counter("lpbot_tx_gas_used_total", "Gas used by mined transactions.", ("kind",))
+HEDGE_ORDER_LATENCY = METRICS.histogram("lpbot_hedge_order_seconds", "Hedge order submission to the venue's acknowledgement.", ("symbol",))
+HEDGE_ORDERS = METRICS.counter("lpbot_hedge_orders_total", "Hedge orders by acknowledgement status.", ("symbol", "status"))
+
+
+GREEKS_MODULES = ("numpy", "uniswap_lp_greeks")
+
+
+def preload_modules(names: tuple):
+    """
+    Imports modules on a background thread. Used at startup for heavyweight modules that are only needed once the
+    first cycle runs, so their import overlaps the connection round trips instead of adding to them.
+    """
+    def _load():
+        for name in names:
+            try:
+                importlib.import_module(name)
+            except Exception as e:
+                print(f"Preloading {name} failed: {e}")
+    threading.Thread(target=_load, name="preload-modules", daemon=True).start()
+
+
+class MulticallCallFailed(Exception):
+    """Raised (or returned, when failures are allowed) for a call that reverted inside a Multicall3 batch."""
+
+
 class Config:
+    # ABIs (Application Binary Interfaces) for interacting with smart contracts.
+    # These JSON files define the contract's functions and events.
+    # Ensure these ABI files are located in a 'abi' subdirectory. Each one is read the first time it is used,
+    # trimmed to the entries the bot calls and kept in a precompiled cache (see uniswap_lp_abi.py).
+    UNISWAP_FACTORY_ABI = LazyABI("UniswapV3Factory.json")
+    UNISWAP_POOL_ABI = LazyABI("UniswapV3Pool.json")
+    UNISWAP_NFT_POSITION_MANAGER_ABI = LazyABI("UniswapV3PositionManager.json")
+    ERC20_ABI = LazyABI("ERC20.json") # Generic ABI for ERC20 tokens
+    # ABI for Chainlink AggregatorV3Interface.
+    # You can find this ABI on Chainlink's GitHub or Etherscan (search for a price feed contract).
+    CHAINLINK_ABI = LazyABI("ChainlinkAggregatorV3.json")
+    MULTICALL3_ABI = LazyABI("Multicall3.json")
+    SWAP_ROUTER_ABI = LazyABI("SwapRouter.json") # Uniswap V3 SwapRouter (exactInputSingle)
+
     def __init__(self):
         # Node URL for connecting to the blockchain (e.g., Infura, Alchemy, or a local node)
         # Use environment variables for sensitive info like API keys.
         self.NODE_URL = os.getenv("NODE_URL", "https://mainnet.infura.io/v3/YOUR_INFURA_ID") # Or your L2 RPC node
+        # Optional extra endpoints for the same chain (comma-separated). Reads go to the fastest healthy one,
+        # and requests fail over to the others when one errors out or rate-limits us.
+        self.NODE_URLS = [self.NODE_URL] + [url for url in os.getenv("NODE_URLS", "").split(",") if url and url != self.NODE_URL]
+        self.RPC_TIMEOUT = float(os.getenv("RPC_TIMEOUT", "10")) # Seconds per HTTP request
+        self.RPC_POOL_SIZE = int(os.getenv("RPC_POOL_SIZE", "16")) # Keep-alive connections per endpoint
+        # Hedged reads: if the best endpoint hasn't answered after RPC_HEDGE_DELAY seconds, the same request is
+        # also sent to the next best one and the first answer wins. Only for the methods listed here.
+        self.RPC_HEDGE_DELAY = float(os.getenv("RPC_HEDGE_DELAY", "0.3"))
+        self.RPC_HEDGED_METHODS = set(os.getenv("RPC_HEDGED_METHODS", "eth_call,eth_blockNumber").split(","))
         # Your wallet's private key. EXTREMELY DANGEROUS TO STORE IN CODE.
         # For production, use a more secure method (e.g., KMS, hardware wallet, encrypted keystore).
         self.PRIVATE_KEY = os.getenv("PRIVATE_KEY", "YOUR_PRIVATE_KEY")
@@ -25,14 +113,7 @@ class Config:
         # Verify these addresses for the specific network you are operating on.
         self.UNISWAP_FACTORY_ADDRESS = "0x1F98431c8Ef1800Ec79B6425a1F7Ff43C5f5fFfF" # V3 Factory
         self.UNISWAP_NFT_POSITION_MANAGER_ADDRESS = "0xC36442b4a4522E871399CD717aBDD847Ab11FE88" # NFT Position Manager
-
-        # ABIs (Application Binary Interfaces) for interacting with smart contracts.
-        # These JSON files define the contract's functions and events.
-        # Ensure these ABI files are located in a 'abi' subdirectory.
-        self.UNISWAP_FACTORY_ABI = json.load(open("abi/UniswapV3Factory.json"))
-        self.UNISWAP_POOL_ABI = json.load(open("abi/UniswapV3Pool.json"))
-        self.UNISWAP_NFT_POSITION_MANAGER_ABI = json.load(open("abi/UniswapV3PositionManager.json"))
-        self.ERC20_ABI = json.load(open("abi/ERC20.json")) # Generic ABI for ERC20 tokens
+        self.SWAP_ROUTER_ADDRESS = os.getenv("SWAP_ROUTER_ADDRESS", "0xE592427A0AEce92De3Edee1F18E0157C05861564") # V3 SwapRouter
 
         # Configuration for the specific Uniswap V3 pool to manage.
         # Example: WETH/USDC pool on Ethereum.
@@ -40,87 +121,1332 @@ class Config:
         # but Uniswap V3 handles this internally. For clarity, assign your primary volatile asset to TOKEN0.
         self.TOKEN0_ADDRESS = "0xC02aaA39b223FE8D0A0e5C4F27eAD9083C756Cc2" # WETH (assuming it's token0, the volatile one)
         self.TOKEN1_ADDRESS = "0xA0b86991c6218b36c1d19D4a2e9Eb0cE3606eB48" # USDC (assuming it's token1, the stablecoin)
+        # Token symbols for clearer logging messages (set per position by `for_position` in portfolio mode).
+        self.TOKEN0_ADDRESS_SYMBOL = "WETH"
+        self.TOKEN1_ADDRESS_SYMBOL = "USDC"
         self.POOL_FEE = 3000 # 0.3% fee tier for the pool (e.g., 500 for 0.05%, 3000 for 0.3%, 10000 for 1%)
 
+        # LP strategy parameters (shared with the backtester, see uniswap_lp_strategy.py).
+        self.REBALANCE_TRIGGER = Decimal(os.getenv("REBALANCE_TRIGGER", "0.01")) # Rebalance once price is 1% beyond the range
+        self.REBALANCE_RANGE_WIDTH = Decimal(os.getenv("REBALANCE_RANGE_WIDTH", "0.10")) # New range: +/- 10% around the price
+        self.MINT_SLIPPAGE = Decimal(os.getenv("MINT_SLIPPAGE", "0.01")) # 1% slippage tolerance on mint/increase
+        # A rebalanced position is out of range, so it holds (almost) only one token, while the new range takes both.
+        # REBALANCE_SWAP swaps the recovered amounts to the new range's ratio through the pool before re-depositing
+        # (only when more than REBALANCE_SWAP_MIN_SHARE of the value would otherwise stay idle).
+        self.REBALANCE_SWAP = os.getenv("REBALANCE_SWAP", "true").lower() == "true"
+        self.REBALANCE_SWAP_MIN_SHARE = Decimal(os.getenv("REBALANCE_SWAP_MIN_SHARE", "0.01"))
+        self.SWAP_SLIPPAGE = Decimal(os.getenv("SWAP_SLIPPAGE", "0.005")) # 0.5% below the expected swap output
+
         # Configuration for the delta neutral hedging strategy.
         # These would be API keys for a centralized exchange (CEX) or a decentralized derivatives platform.
         self.DERIVATIVES_EXCHANGE_API_KEY = os.getenv("DERIVATIVES_EXCHANGE_API_KEY", "YOUR_CEX_API_KEY")
         self.DERIVATIVES_EXCHANGE_API_SECRET = os.getenv("DERIVATIVES_EXCHANGE_API_SECRET", "YOUR_CEX_API_SECRET")
+        # Venue adapter (see uniswap_lp_derivatives.py): "paper" fills in-process for dry runs; "rest" talks to
+        # DERIVATIVES_EXCHANGE_URL over REST plus a websocket fill stream (e.g. the bundled mock exchange server).
+        self.DERIVATIVES_EXCHANGE = os.getenv("DERIVATIVES_EXCHANGE", "paper")
+        self.DERIVATIVES_EXCHANGE_URL = os.getenv("DERIVATIVES_EXCHANGE_URL", "http://127.0.0.1:8765")
+        self.DERIVATIVES_STREAM_URL = os.getenv("DERIVATIVES_STREAM_URL", "") # Default: the REST URL's ws://.../stream
+        self.DERIVATIVES_TIMEOUT = float(os.getenv("DERIVATIVES_TIMEOUT", "10")) # Seconds per venue request
+        self.DERIVATIVES_PAPER_MARK = Decimal(os.getenv("DERIVATIVES_PAPER_MARK", "3000")) # Fill price of paper orders
         self.SHORT_TOKEN_SYMBOL = "ETH-PERP" # The trading pair symbol for the perpetual swap or futures contract
+        # Minimum hedge adjustment (in units of the volatile token) worth trading; smaller drifts are ignored.
+        self.HEDGE_THRESHOLD = Decimal(os.getenv("HEDGE_THRESHOLD", "0.001")) # Example: 0.001 ETH
+        # Every hedge book flush (net order per symbol, with each position's exposure) is appended here as JSON lines.
+        self.HEDGE_LEDGER_PATH = os.getenv("HEDGE_LEDGER_PATH", "hedge_ledger.jsonl")
+        # Relative price moves at which each flush reports the book's net delta and gamma per symbol (empty: no report).
+        self.RISK_SCENARIOS = [float(shock) for shock in os.getenv("RISK_SCENARIOS", "-0.10,-0.05,0.05,0.10").split(",") if shock]
 
         # Chainlink Price Feed Addresses (Example for Ethereum Mainnet)
         # IMPORTANT: These addresses are specific to each blockchain network.
         # You MUST find the correct addresses for your chosen network (e.g., Polygon, Arbitrum, Base).
         # You can find them on Chainlink's official documentation: https://docs.chain.link/data-feeds/price-feeds/addresses
-        self.CHAINLINK_ETH_USD_FEED = "0x5f4eC3Df9cbd43714FE2740D5E3616155c5b841" # ETH/USD on Ethereum Mainnet
+        self.CHAINLINK_ETH_USD_FEED = "0x5f4eC3Df9cbd43714FE2740D5E3616155c5b8419" # ETH/USD on Ethereum Mainnet
         self.CHAINLINK_USDC_USD_FEED = "0x8fFfFfd4AfB6115b954Bd326cbe7B4BA57E2F0Cc" # USDC/USD on Ethereum Mainnet (often very close to 1)
-        # ABI for Chainlink AggregatorV3Interface.
-        # You can find this ABI on Chainlink's GitHub or Etherscan (search for a price feed contract).
-        self.CHAINLINK_ABI = json.load(open("abi/ChainlinkAggregatorV3.json"))
+
+        # Multicall3 is deployed at the same address on almost every EVM chain (Ethereum, Polygon, Arbitrum, Base, BNB...).
+        # All per-cycle reads are batched through its `aggregate3` function to save round trips.
+        # See https://www.multicall3.com/deployments to confirm it exists on your network.
+        self.MULTICALL3_ADDRESS = os.getenv("MULTICALL3_ADDRESS", "0xcA11bde05977b3631167028862bE2a173976CA11")
+        # Set USE_MULTICALL=false on chains without Multicall3; reads then fall back to one eth_call each.
+        self.USE_MULTICALL = os.getenv("USE_MULTICALL", "true").lower() == "true"
+        # Maximum number of calls packed into a single aggregate3 request (keeps eth_call under the node's gas cap).
+        self.MULTICALL_BATCH_SIZE = int(os.getenv("MULTICALL_BATCH_SIZE", "100"))
+        # Hot reads (slot0, positions, latestRoundData, allowance) skip web3's contract machinery: precomputed
+        # selectors, raw eth_call and fixed-layout decoders (see uniswap_lp_fastcall.py). Set to false to use web3 only.
+        self.FAST_READS = os.getenv("FAST_READS", "true").lower() == "true"
+
+        # Immutable pool metadata (pool address, token decimals, tick spacing) is resolved once
+        # and cached in this file, so restarts don't repeat the lookups.
+        self.POOL_REGISTRY_PATH = os.getenv("POOL_REGISTRY_PATH", "pool_registry.json")
+
+        # Crash-safe state journal (SQLite, WAL mode; see uniswap_lp_journal.py): position token IDs, rebalance steps,
+        # sent transactions and hedge orders. Unfinished rebalances are resumed from it on startup.
+        self.JOURNAL_PATH = os.getenv("JOURNAL_PATH", "bot_state.db")
+        # Legacy tokenId file (single-position mode): imported into the journal once if the journal has no position yet.
+        # Set it empty to skip the import.
+        self.POSITION_ID_PATH = os.getenv("POSITION_ID_PATH", "position_id.txt")
+        # Without a saved position, look for one in the wallet: every position NFT it owns is indexed in a few batched
+        # reads (see PositionIndex) and the one with the most liquidity in the configured pool is adopted.
+        self.POSITION_DISCOVERY = os.getenv("POSITION_DISCOVERY", "true").lower() == "true"
+
+        # Portfolio mode: manage every position listed in PORTFOLIO_PATH from one process.
+        # The file holds {"positions": [{"token_id": ..., "token0": ..., "token1": ..., "fee": ..., "short_symbol": ...}, ...]}
+        # (optional per-position keys: "token0_symbol", "token1_symbol", "chainlink_feed").
+        self.PORTFOLIO_MODE = os.getenv("PORTFOLIO_MODE", "false").lower() == "true"
+        self.PORTFOLIO_PATH = os.getenv("PORTFOLIO_PATH", "portfolio.json")
+        # Maximum number of positions whose rebalance/hedge work runs at the same time.
+        self.PORTFOLIO_CONCURRENCY = int(os.getenv("PORTFOLIO_CONCURRENCY", "8"))
+
+        # Event-driven mode: follow the managed pools' Swap logs and only run a cycle when a position's
+        # range or hedge band is threatened. The full cycle still runs every HEARTBEAT_INTERVAL as a fallback.
+        self.EVENT_DRIVEN = os.getenv("EVENT_DRIVEN", "false").lower() == "true"
+        self.EVENT_POLL_INTERVAL = float(os.getenv("EVENT_POLL_INTERVAL", "2")) # Seconds between eth_getLogs polls (~block time)
+        self.EVENT_CURSOR_PATH = os.getenv("EVENT_CURSOR_PATH", "swap_cursor.json") # Persisted fromBlock cursor
+        self.EVENT_MAX_BLOCK_RANGE = int(os.getenv("EVENT_MAX_BLOCK_RANGE", "2000")) # Max blocks per eth_getLogs request
+        # Trigger a rebalance check this many ticks before the price actually leaves the range (0 = at the edge).
+        self.EVENT_RANGE_MARGIN_TICKS = int(os.getenv("EVENT_RANGE_MARGIN_TICKS", "0"))
+        self.HEARTBEAT_INTERVAL = int(os.getenv("HEARTBEAT_INTERVAL", str(5 * 60))) # Seconds
+
+        # Adaptive polling (see AdaptiveScheduler): each position's next check depends on how close the price is to
+        # its rebalance trigger or hedge threshold, and on recent volatility. With ADAPTIVE_POLLING=false, every
+        # check is POLL_FIXED_INTERVAL apart.
+        self.ADAPTIVE_POLLING = os.getenv("ADAPTIVE_POLLING", "true").lower() == "true"
+        self.POLL_FIXED_INTERVAL = float(os.getenv("POLL_FIXED_INTERVAL", str(5 * 60))) # Seconds
+        self.POLL_MIN_INTERVAL = float(os.getenv("POLL_MIN_INTERVAL", "12")) # Seconds; about one block on mainnet
+        self.POLL_MAX_INTERVAL = float(os.getenv("POLL_MAX_INTERVAL", str(30 * 60))) # Seconds
+        self.POLL_SAFETY_Z = float(os.getenv("POLL_SAFETY_Z", "3")) # Check before a move of this many sigmas could matter
+        self.POLL_DEFAULT_VOLATILITY = float(os.getenv("POLL_DEFAULT_VOLATILITY", "0.8")) # Annualized, until measured
+        self.POLL_VOLATILITY_HALFLIFE = float(os.getenv("POLL_VOLATILITY_HALFLIFE", "3600")) # Seconds
+        # Hedge drift a position may accumulate between checks, as a fraction of its delta (never below HEDGE_THRESHOLD).
+        self.POLL_HEDGE_DRIFT = float(os.getenv("POLL_HEDGE_DRIFT", "0.02"))
+
+        # Transaction pipeline: dependent transactions are broadcast back-to-back and their receipts awaited together.
+        self.TX_RECEIPT_TIMEOUT = int(os.getenv("TX_RECEIPT_TIMEOUT", "300")) # Seconds
+        self.TX_POLL_INTERVAL = float(os.getenv("TX_POLL_INTERVAL", "1")) # Seconds between receipt polls
+        # Stuck transactions: after TX_STUCK_TIMEOUT without being mined, rebroadcast with fees x TX_FEE_BUMP
+        # (nodes require at least +10% for a replacement); after TX_MAX_REPLACEMENTS, replace with a cancel.
+        self.TX_STUCK_TIMEOUT = float(os.getenv("TX_STUCK_TIMEOUT", "60")) # Seconds
+        self.TX_FEE_BUMP = Decimal(os.getenv("TX_FEE_BUMP", "1.125"))
+        self.TX_MAX_REPLACEMENTS = int(os.getenv("TX_MAX_REPLACEMENTS", "3"))
+
+        # Fee oracle (EIP-1559). USE_EIP1559=false forces legacy gasPrice (it is also used when the chain has no base fee).
+        self.USE_EIP1559 = os.getenv("USE_EIP1559", "true").lower() == "true"
+        self.FEE_HISTORY_BLOCKS = int(os.getenv("FEE_HISTORY_BLOCKS", "20")) # Rolling eth_feeHistory window
+        self.FEE_REFRESH_INTERVAL = float(os.getenv("FEE_REFRESH_INTERVAL", "2")) # Seconds between head checks outside a cycle
+        # Some chains enforce a minimum tip (e.g. 30 gwei on Polygon PoS).
+        self.MIN_PRIORITY_FEE_WEI = int(os.getenv("MIN_PRIORITY_FEE_WEI", "0"))
+        # Urgency levels ("low", "medium", "high"): rebalance transactions vs routine work such as fee collection.
+        self.FEE_URGENCY_REBALANCE = os.getenv("FEE_URGENCY_REBALANCE", "high")
+        self.FEE_URGENCY_ROUTINE = os.getenv("FEE_URGENCY_ROUTINE", "low")
+        self.FEE_URGENCY_DEFAULT = os.getenv("FEE_URGENCY_DEFAULT", "medium")
+        # Gas limits for transactions sent behind still-pending ones (their gas can't be estimated in advance).
+        self.GAS_LIMIT_APPROVE = int(os.getenv("GAS_LIMIT_APPROVE", "100000"))
+        self.GAS_LIMIT_COLLECT = int(os.getenv("GAS_LIMIT_COLLECT", "250000"))
+        self.GAS_LIMIT_MINT = int(os.getenv("GAS_LIMIT_MINT", "700000"))
+        self.GAS_LIMIT_INCREASE = int(os.getenv("GAS_LIMIT_INCREASE", "500000"))
+        self.GAS_LIMIT_REBALANCE = int(os.getenv("GAS_LIMIT_REBALANCE", "1000000"))
+        self.GAS_LIMIT_SWAP = int(os.getenv("GAS_LIMIT_SWAP", "300000"))
+        # Rebalance in one NonfungiblePositionManager.multicall (decrease + collect + burn + mint) instead of
+        # separate withdraw and mint transactions. Rebalances that need a swap (REBALANCE_SWAP) are sent as
+        # withdraw, swap and mint transactions.
+        self.ATOMIC_REBALANCE = os.getenv("ATOMIC_REBALANCE", "true").lower() == "true"
+
+        # Allowances are tracked in memory (seeded once, updated from Approval/Transfer logs); see AllowanceTracker.
+        # ALLOWANCE_POLICY: "exact" (approve what is needed), "buffered" (ALLOWANCE_BUFFER_MULTIPLE x what is needed)
+        # or "cap" (a standing allowance: ALLOWANCE_CAPS as {"token address": raw amount}, unlimited for other tokens).
+        self.ALLOWANCE_POLICY = os.getenv("ALLOWANCE_POLICY", "buffered")
+        self.ALLOWANCE_BUFFER_MULTIPLE = Decimal(os.getenv("ALLOWANCE_BUFFER_MULTIPLE", "3"))
+        self.ALLOWANCE_CAPS = {Web3.to_checksum_address(token): int(cap)
+                               for token, cap in json.loads(os.getenv("ALLOWANCE_CAPS", "{}")).items()}
+        self.ALLOWANCE_SYNC_INTERVAL = float(os.getenv("ALLOWANCE_SYNC_INTERVAL", "300")) # Seconds between external Approval log checks
+        # EIP-2612 tokens (comma-separated addresses, e.g. USDC) get a signed permit inside the position manager
+        # multicall (selfPermit) instead of a separate approve transaction.
+        self.PERMIT_TOKENS = {Web3.to_checksum_address(token) for token in os.getenv("PERMIT_TOKENS", "").split(",") if token}
+
+        # Prometheus text endpoint (uniswap_lp_metrics.py): /metrics on METRICS_HOST:METRICS_PORT; 0 doesn't serve.
+        # Recording itself is switched with METRICS_ENABLED (read by uniswap_lp_metrics.py).
+        self.METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+        self.METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+
+        # Pool history ingestion (uniswap_lp_history.py): Swap/Mint/Burn/Collect logs stored as columnar .npy segments.
+        self.HISTORY_STORE_PATH = os.getenv("HISTORY_STORE_PATH", "history")
+        # Pools to ingest (comma-separated). Empty: the configured pool, or every portfolio pool in PORTFOLIO_MODE.
+        self.HISTORY_POOLS = [address for address in os.getenv("HISTORY_POOLS", "").split(",") if address]
+        self.HISTORY_START_BLOCK = int(os.getenv("HISTORY_START_BLOCK", "12369621")) # Uniswap V3 Factory deployment on Ethereum
+        # eth_getLogs block ranges adapt between these bounds to the node's limits and the pools' activity.
+        self.HISTORY_MIN_BLOCK_RANGE = int(os.getenv("HISTORY_MIN_BLOCK_RANGE", "10"))
+        self.HISTORY_MAX_BLOCK_RANGE = int(os.getenv("HISTORY_MAX_BLOCK_RANGE", "10000"))
+        # How many blocks below the head are checked for reorgs (and rolled back when their hash changed).
+        self.HISTORY_REORG_DEPTH = int(os.getenv("HISTORY_REORG_DEPTH", "64"))
+
+    def for_position(self, spec: dict) -> "Config":
+        """
+        Returns a copy of this configuration pointed at one portfolio position's pool and hedge instrument.
+        Everything else (node, wallet, ABIs, contract addresses) is shared with the base configuration.
+        """
+        position_config = copy.copy(self)
+        position_config.TOKEN0_ADDRESS = spec["token0"]
+        position_config.TOKEN1_ADDRESS = spec["token1"]
+        position_config.POOL_FEE = spec["fee"]
+        position_config.SHORT_TOKEN_SYMBOL = spec.get("short_symbol", self.SHORT_TOKEN_SYMBOL)
+        position_config.TOKEN0_ADDRESS_SYMBOL = spec.get("token0_symbol", "TOKEN0")
+        position_config.TOKEN1_ADDRESS_SYMBOL = spec.get("token1_symbol", "TOKEN1")
+        position_config.CHAINLINK_ETH_USD_FEED = spec.get("chainlink_feed", self.CHAINLINK_ETH_USD_FEED)
+        # Token IDs come from the portfolio file (and the journal), never from position_id.txt.
+        position_config.POSITION_ID_PATH = None
+        return position_config
+
+
+class CycleContext:
+    """
+    Read snapshot for one bot cycle: a pinned block number plus the memoized results of every
+    read made at that block, keyed by (contract, function, args, block).
+    """
+    def __init__(self, block_number: int):
+        self.block_number = block_number
+        self.cache = {}
+        self.hits = 0 # Reads served from the cache
+        self.misses = 0 # Reads that had to be fetched from the node
+        self.rpc_requests = 0 # Requests actually sent (a Multicall3 batch counts as one)
+
+    def _key(self, contract_function):
+        return (contract_function.address, contract_function.fn_name, tuple(contract_function.args), self.block_number)
+
+    def has(self, contract_function) -> bool:
+        return self._key(contract_function) in self.cache
+
+    def get(self, contract_function):
+        self.hits += 1
+        return self.cache[self._key(contract_function)]
+
+    def put(self, contract_function, result):
+        self.cache[self._key(contract_function)] = result
+
+
+class NonceManager:
+    """
+    Hands out the account's nonces from a local counter, so back-to-back transactions don't each need a
+    get_transaction_count round trip. The counter is (re)read from the node's pending count when unknown,
+    i.e. at startup and after any failed broadcast.
+    """
+    def __init__(self, w3: Web3, address: str):
+        self.w3 = w3
+        self.address = address
+        self._next_nonce = None
+        self._lock = threading.Lock()
+
+    def reserve(self) -> int:
+        """Returns the next nonce and advances the counter."""
+        with self._lock:
+            if self._next_nonce is None:
+                self._next_nonce = self.w3.eth.get_transaction_count(self.address, "pending")
+                print(f"Nonce synced from node: {self._next_nonce}")
+            nonce = self._next_nonce
+            self._next_nonce += 1
+            return nonce
+
+    def resync(self):
+        """Forgets the local counter; the next `reserve` reads it from the node again."""
+        with self._lock:
+            self._next_nonce = None
+
+
+class TransactionCancelled(Exception):
+    """A stuck transaction was replaced by a zero-value self-transfer (cancel) that got mined instead."""
+    def __init__(self, message: str, receipt=None):
+        super().__init__(message)
+        self.receipt = receipt
+
+
+class InFlightTransaction:
+    """One nonce being supervised: the transaction as built, every hash broadcast for it, and the caller's future."""
+    def __init__(self, nonce: int, tx_params: dict, tx_hash, kind: str = "transaction", first_broadcast: float = None):
+        self.nonce = nonce
+        self.tx_params = tx_params # The latest signed version (fees bumped on each replacement)
+        self.tx_hashes = [tx_hash] # Original and replacements; any of them may be the one that gets mined
+        self.kind = kind # Contract function name (mint, collect, ...), for the metrics
+        self.last_broadcast = time.time()
+        self.first_broadcast = first_broadcast or self.last_broadcast # Start of the confirmation time
+        self.replacements = 0
+        self.cancelled = False
+        self.future = Future() # Resolves to the receipt, or raises (reverted, cancelled, dropped)
+
+
+class TransactionSupervisor:
+    """
+    Watches every in-flight transaction by nonce from a background thread, so callers get their outcome through
+    a Future instead of blocking in wait_for_transaction_receipt.
+
+    When the lowest pending nonce has waited TX_STUCK_TIMEOUT without being mined, it is re-signed with fees
+    bumped by TX_FEE_BUMP and broadcast again with the same nonce. After TX_MAX_REPLACEMENTS bumps it is replaced
+    by a cancel (0-value transfer to ourselves), which keeps being bumped until it clears the nonce. Only the
+    lowest nonce is bumped: the ones above it cannot be mined before it anyway.
+
+    Can be exercised against anvil with automine off (`anvil --no-mining`, then `evm_mine`).
+    """
+    def __init__(self, client: "BlockchainClient"):
+        self.client = client
+        self.config = client.config
+        self.in_flight = {} # nonce -> InFlightTransaction
+        self._lock = threading.Lock()
+        self._thread = None
+        # When the current lowest in-flight nonce became the lowest; its stuck timer starts no earlier than this.
+        self._head_since = time.time()
+
+    def track(self, nonce: int, tx_params: dict, tx_hash, previous_hashes: list = (), kind: str = "transaction",
+              first_broadcast: float = None) -> Future:
+        """
+        Starts supervising a broadcast transaction. Returns the Future of its outcome.
+        previous_hashes: earlier versions of the same nonce (when re-adopting a journaled transaction after a restart).
+        kind: the contract function called; first_broadcast: when the nonce was first sent (now when None).
+        """
+        entry = InFlightTransaction(nonce, tx_params, tx_hash, kind, first_broadcast)
+        entry.tx_hashes[:0] = previous_hashes
+        with self._lock:
+            if not self.in_flight:
+                self._head_since = time.time()
+            self.in_flight[nonce] = entry
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="tx-supervisor", daemon=True)
+                self._thread.start()
+        return entry.future
+
+    def _run(self):
+        while True:
+            with self._lock:
+                if not self.in_flight:
+                    self._thread = None
+                    return
+                entries = sorted(self.in_flight.values(), key=lambda entry: entry.nonce)
+            try:
+                self._check(entries)
+            except Exception as e:
+                print(f"Transaction supervisor error: {e}")
+            time.sleep(self.config.TX_POLL_INTERVAL)
+
+    def _receipt(self, entry: InFlightTransaction):
+        for tx_hash in entry.tx_hashes:
+            try:
+                return self.client.w3.eth.get_transaction_receipt(tx_hash)
+            except TransactionNotFound:
+                continue
+        return None
+
+    def _resolve(self, entry: InFlightTransaction, receipt=None, error: Exception = None):
+        with self._lock:
+            self.in_flight.pop(entry.nonce, None)
+            self._head_since = time.time()
+        outcome = self._outcome(entry, receipt, error)
+        self._journal_outcome(entry, receipt, outcome)
+        TX_OUTCOMES.inc(1, entry.kind, outcome)
+        if receipt is not None:
+            TX_CONFIRMATION.observe(time.time() - entry.first_broadcast, entry.kind)
+            TX_GAS_USED.inc(receipt.gasUsed, entry.kind)
+        if error is not None:
+            entry.future.set_exception(error)
+        elif entry.cancelled:
+            entry.future.set_exception(TransactionCancelled(
+                f"Transaction with nonce {entry.nonce} was cancelled after {entry.replacements} replacements.", receipt))
+        else:
+            entry.future.set_result(receipt)
+
+    @staticmethod
+    def _outcome(entry: InFlightTransaction, receipt, error: Exception) -> str:
+        if error is not None:
+            return "dropped"
+        if entry.cancelled:
+            return "cancelled"
+        return "mined" if receipt.status == 1 else "reverted"
+
+    def _journal_outcome(self, entry: InFlightTransaction, receipt, outcome: str):
+        mined_hash = receipt.transactionHash if receipt is not None else None
+        for tx_hash in entry.tx_hashes:
+            mined = tx_hash == mined_hash
+            self.client.journal.update_transaction(tx_hash.hex(), outcome if mined or mined_hash is None else "replaced",
+                                                   receipt.blockNumber if mined else None)
+
+    def _check(self, entries: list):
+        mined_nonce = None # Fetched lazily: only needed when a nonce has no receipt
+        for position, entry in enumerate(entries):
+            receipt = self._receipt(entry)
+            if receipt is not None:
+                self._resolve(entry, receipt)
+                continue
+            if mined_nonce is None:
+                mined_nonce = self.client.w3.eth.get_transaction_count(self.client.account.address, "latest")
+            if mined_nonce > entry.nonce:
+                # The nonce was used by a transaction we didn't track (e.g. sent from another wallet app).
+                self.client.nonces.resync()
+                self._resolve(entry, error=Exception(f"Transaction with nonce {entry.nonce} was dropped/replaced externally."))
+                continue
+            stuck_since = max(entry.last_broadcast, self._head_since)
+            if position == 0 and time.time() - stuck_since > self.config.TX_STUCK_TIMEOUT:
+                self._replace(entry)
+
+    def _replace(self, entry: InFlightTransaction):
+        """Re-signs the stuck nonce with bumped fees: the same transaction, or a cancel once replacements run out."""
+        tx_params = dict(entry.tx_params)
+        if not entry.cancelled and entry.replacements >= self.config.TX_MAX_REPLACEMENTS:
+            entry.cancelled = True
+            tx_params = {key: value for key, value in tx_params.items()
+                         if key in ("chainId", "nonce", "gasPrice", "maxFeePerGas", "maxPriorityFeePerGas")}
+            tx_params.update({"to": self.client.account.address, "value": 0, "data": b"", "gas": 21000})
+            print(f"Cancelling stuck transaction with nonce {entry.nonce}.")
+        bump = self.config.TX_FEE_BUMP
+        for fee_field in ("gasPrice", "maxFeePerGas", "maxPriorityFeePerGas"):
+            if fee_field in tx_params:
+                # Nodes only accept a replacement paying at least 10% more; round up so small fees still rise.
+                tx_params[fee_field] = int(tx_params[fee_field] * bump) + 1
+        try:
+            signed_tx = self.client.w3.eth.account.sign_transaction(tx_params, private_key=self.config.PRIVATE_KEY)
+            tx_hash = self.client.w3.eth.send_raw_transaction(signed_tx.rawTransaction)
+        except Exception as e:
+            # E.g. "nonce too low" when the previous version was mined meanwhile: the next check picks its receipt up.
+            print(f"Replacement for nonce {entry.nonce} not accepted: {e}")
+            entry.last_broadcast = time.time()
+            return
+        self.client.journal.record_replacement(entry.tx_hashes[0].hex(), tx_hash.hex(), tx_params, cancel=entry.cancelled)
+        entry.tx_params = tx_params
+        entry.tx_hashes.append(tx_hash)
+        entry.last_broadcast = time.time()
+        if not entry.cancelled:
+            entry.replacements += 1
+        print(f"Rebroadcast nonce {entry.nonce} with bumped fees: {tx_hash.hex()}")
+
+
+class FeeOracle:
+    """
+    EIP-1559 fees from a rolling eth_feeHistory window. The window is extended with only the new blocks when the
+    head moves (at most once per block, or per pinned cycle block), not once per transaction.
+    Urgency levels trade inclusion speed for cost: the priority fee is the median of the window's per-block
+    reward percentile for the level, and maxFeePerGas leaves headroom above the next block's base fee.
+    Chains without a base fee (or USE_EIP1559=false) get a legacy gasPrice instead.
+    """
+    # urgency -> (reward percentile asked from eth_feeHistory, multiple of the next base fee allowed in maxFeePerGas)
+    URGENCY_LEVELS = {
+        "low": (10, Decimal("1.125")), # Fits if the base fee rises for at most one full block
+        "medium": (50, Decimal("1.5")),
+        "high": (90, Decimal("2")), # Survives ~6 consecutive full blocks of base fee increases
+    }
+
+    def __init__(self, client: "BlockchainClient"):
+        self.client = client
+        self.config = client.config
+        self.percentiles = [percentile for percentile, _ in self.URGENCY_LEVELS.values()]
+        self.rewards = deque(maxlen=self.config.FEE_HISTORY_BLOCKS) # Per block: rewards at self.percentiles
+        self.next_base_fee = None
+        self.head = None # Newest block in the window
+        self.eip1559 = self.config.USE_EIP1559
+        self.gas_price = None # Legacy fallback, refreshed with the head
+        self._head_checked_at = 0
+        self._lock = threading.Lock()
+
+    def _current_head(self) -> int:
+        """The block to price against: the cycle's pinned block, else the chain head (re-read every FEE_REFRESH_INTERVAL)."""
+        if self.client.cycle is not None:
+            return self.client.cycle.block_number
+        if self.head is not None and time.time() - self._head_checked_at < self.config.FEE_REFRESH_INTERVAL:
+            return self.head
+        self._head_checked_at = time.time()
+        return self.client.w3.eth.block_number
+
+    def refresh(self):
+        """Appends the blocks mined since the last refresh to the window."""
+        head = self._current_head()
+        if self.head is not None and head <= self.head:
+            return
+        if not self.eip1559:
+            self.gas_price = self.client.w3.eth.gas_price
+            self.head = head
+            return
+        block_count = self.config.FEE_HISTORY_BLOCKS if self.head is None else min(head - self.head, self.config.FEE_HISTORY_BLOCKS)
+        history = self.client.w3.eth.fee_history(block_count, head, self.percentiles)
+        if not any(history["baseFeePerGas"]):
+            print("No base fee on this chain. Falling back to legacy gasPrice.")
+            self.eip1559 = False
+            self.gas_price = self.client.w3.eth.gas_price
+        else:
+            self.rewards.extend(history["reward"])
+            # baseFeePerGas has one more entry than blocks requested: the base fee of the block after `head`.
+            self.next_base_fee = history["baseFeePerGas"][-1]
+        self.head = head
+
+    def fees(self, urgency: str = "medium") -> dict:
+        """Fee fields for a transaction at the given urgency ("low", "medium" or "high")."""
+        with self._lock:
+            self.refresh()
+            if not self.eip1559:
+                return {'gasPrice': self.gas_price}
+            percentile, base_fee_multiple = self.URGENCY_LEVELS[urgency]
+            index = self.percentiles.index(percentile)
+            tips = sorted(block_rewards[index] for block_rewards in self.rewards)
+            priority_fee = tips[len(tips) // 2] if tips else 0
+            priority_fee = max(priority_fee, self.config.MIN_PRIORITY_FEE_WEI)
+            return {
+                'maxFeePerGas': int(self.next_base_fee * base_fee_multiple) + priority_fee,
+                'maxPriorityFeePerGas': priority_fee
+            }
+
+
+class RPCEndpointHealth:
+    """Latency and error statistics of one RPC endpoint, plus its keep-alive HTTP session."""
+    LATENCY_ALPHA = 0.2 # Weight of the newest sample in the moving averages
+
+    def __init__(self, url: str, pool_size: int, label: str = "0"):
+        self.url = url
+        self.label = label # Metrics label: the endpoint's index in NODE_URLS (URLs often embed API keys)
+        # What logs and `health()` show instead of the URL: the index and scheme://host, never the path, query or
+        # credentials, where providers put the key.
+        parsed = urlsplit(url)
+        self.name = f"#{label} ({parsed.scheme}://{parsed.hostname}{f':{parsed.port}' if parsed.port else ''})"
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.latency = None # Moving average, seconds (None: not tried yet)
+        self.error_rate = 0.0 # Moving average of failures (0..1)
+        self.consecutive_errors = 0
+        self.cooldown_until = 0.0
+        self.requests = 0
+        self.errors = 0
+
+    def redact(self, message: str) -> str:
+        """`message` with this endpoint's URL, or its path and query (requests' errors quote them), replaced by its name."""
+        message = message.replace(self.url, self.name)
+        parsed = urlsplit(self.url)
+        secret = parsed.path + (f"?{parsed.query}" if parsed.query else "")
+        return message.replace(secret, "/...") if len(secret) > 1 else message
+
+    def score(self) -> float:
+        """Lower is better. Untried endpoints score 0 so they get measured."""
+        return (self.latency or 0.0) * (1 + 4 * self.error_rate)
+
+    def record_success(self, latency: float):
+        self.requests += 1
+        self.latency = latency if self.latency is None else (1 - self.LATENCY_ALPHA) * self.latency + self.LATENCY_ALPHA * latency
+        RPC_ENDPOINT_REQUESTS.inc(1, self.label)
+        RPC_ENDPOINT_LATENCY.set(self.latency, self.label)
+        self.error_rate *= 1 - self.LATENCY_ALPHA
+        self.consecutive_errors = 0
+
+    def record_error(self):
+        self.requests += 1
+        self.errors += 1
+        RPC_ENDPOINT_REQUESTS.inc(1, self.label)
+        RPC_ENDPOINT_ERRORS.inc(1, self.label)
+        self.error_rate = (1 - self.LATENCY_ALPHA) * self.error_rate + self.LATENCY_ALPHA
+        self.consecutive_errors += 1
+        # Back off exponentially (up to a minute) from an endpoint that keeps failing.
+        self.cooldown_until = time.time() + min(60, 2 ** self.consecutive_errors)
+
+
+class MultiEndpointProvider(JSONBaseProvider):
+    """
+    web3 provider over several JSON-RPC endpoints of the same chain.
+    Each request goes to the healthy endpoint with the best score (latency, penalized by recent errors); transport
+    failures, HTTP errors and rate-limit responses fail over to the next one and put the endpoint in a short
+    cooldown. Methods in RPC_HEDGED_METHODS are hedged: a duplicate goes to the second-best endpoint when the first
+    hasn't answered within RPC_HEDGE_DELAY, and whichever answers first is used.
+    JSON-RPC errors such as reverts are answers, not endpoint failures, and are returned as they are.
+    """
+    # JSON-RPC error codes that mean "this endpoint is refusing us", not "the request is invalid".
+    RATE_LIMIT_CODES = {-32005, -32090, 429}
+
+    def __init__(self, urls: list, timeout: float = 10, pool_size: int = 16, hedge_delay: float = 0.3,
+                 hedged_methods: set = None):
+        super().__init__()
+        self.endpoints = [RPCEndpointHealth(url, pool_size, str(index)) for index, url in enumerate(urls)]
+        self.timeout = timeout
+        self.hedge_delay = hedge_delay
+        self.hedged_methods = hedged_methods or set()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max(4, 2 * len(self.endpoints)), thread_name_prefix="rpc-hedge")
+
+    def __str__(self):
+        return f"MultiEndpointProvider({', '.join(endpoint.name for endpoint in self.endpoints)})"
+
+    def _ranked(self) -> list:
+        """Endpoints best first: healthy ones by score, then those cooling down by how soon they're back."""
+        now = time.time()
+        with self._lock:
+            healthy = sorted((e for e in self.endpoints if e.cooldown_until <= now), key=lambda e: e.score())
+            cooling = sorted((e for e in self.endpoints if e.cooldown_until > now), key=lambda e: e.cooldown_until)
+        return healthy + cooling
+
+    def _send(self, endpoint: RPCEndpointHealth, request_data: bytes, decode=None):
+        started = time.perf_counter()
+        try:
+            http_response = endpoint.session.post(
+                endpoint.url, data=request_data, headers={"Content-Type": "application/json"}, timeout=self.timeout
+            )
+            http_response.raise_for_status()
+            response = (decode or self.decode_rpc_response)(http_response.content)
+            error = response.get("error") if isinstance(response, dict) else None
+            if error and error.get("code") in self.RATE_LIMIT_CODES:
+                raise requests.HTTPError(f"{endpoint.name} refused the request: {error}")
+        except Exception:
+            with self._lock:
+                endpoint.record_error()
+            raise
+        with self._lock:
+            endpoint.record_success(time.perf_counter() - started)
+        return response
+
+    def _with_failover(self, endpoints: list, request_data: bytes, decode=None):
+        last_error = None
+        for endpoint in endpoints:
+            try:
+                return self._send(endpoint, request_data, decode)
+            except Exception as e:
+                print(f"RPC endpoint {endpoint.name} failed: {endpoint.redact(str(e))}")
+                last_error = e
+        raise last_error
+
+    def _hedged(self, endpoints: list, request_data: bytes, decode=None):
+        primary = self._executor.submit(self._send, endpoints[0], request_data, decode)
+        try:
+            return primary.result(timeout=self.hedge_delay)
+        except FutureTimeoutError:
+            if len(endpoints) < 2:
+                return primary.result()
+        except Exception:
+            # The best endpoint failed outright: plain failover over the rest.
+            return self._with_failover(endpoints[1:], request_data, decode) if len(endpoints) > 1 else primary.result()
+        # Slow primary: race it against the second best.
+        hedge = self._executor.submit(self._send, endpoints[1], request_data, decode)
+        last_error = None
+        for future in as_completed([primary, hedge]):
+            try:
+                return future.result()
+            except Exception as e:
+                last_error = e
+        if len(endpoints) > 2:
+            return self._with_failover(endpoints[2:], request_data, decode)
+        raise last_error
+
+    def make_request(self, method, params):
+        return self.request_raw(method, self.encode_rpc_request(method, params))
+
+    def request_raw(self, method: str, request_data: bytes, decode=None) -> dict:
+        """
+        Sends an already encoded JSON-RPC request with the same routing, failover and hedging as `make_request`.
+        `decode` turns the response body into a dict (web3's decoder when None); used by the eth_call fast path.
+        """
+        started = time.perf_counter()
+        endpoints = self._ranked()
+        try:
+            if method in self.hedged_methods and len(endpoints) > 1:
+                response = self._hedged(endpoints, request_data, decode)
+            else:
+                response = self._with_failover(endpoints, request_data, decode)
+        except Exception:
+            RPC_LATENCY.observe(time.perf_counter() - started, method)
+            RPC_ERRORS.inc(1, method, "transport")
+            raise
+        RPC_LATENCY.observe(time.perf_counter() - started, method)
+        if isinstance(response, dict) and response.get("error"):
+            RPC_ERRORS.inc(1, method, "rpc")
+        return response
+
+    def health(self) -> list:
+        """Per-endpoint statistics, best first (endpoints by name: see `RPCEndpointHealth.name`)."""
+        return [
+            {"endpoint": e.name, "latency_ms": None if e.latency is None else round(e.latency * 1000, 1),
+             "error_rate": round(e.error_rate, 3), "requests": e.requests, "errors": e.errors,
+             "cooling_down": e.cooldown_until > time.time()}
+            for e in self._ranked()
+        ]
 
 
 class BlockchainClient:
-    def __init__(self, config: Config):
-        self.w3 = Web3(Web3.HTTPProvider(config.NODE_URL))
+    def __init__(self, config: Config, provider=None):
+        # One provider over every configured endpoint (keep-alive sessions, health-based routing, hedged reads),
+        # unless one is passed in (e.g. the in-process chain emulator of uniswap_lp_emulator.py, for load tests).
+        # ens=None: every address the bot uses is hex, and without it web3 doesn't construct an ENS instance
+        # for each contract it builds (about half of the construction time).
+        self.w3 = Web3(provider or MultiEndpointProvider(
+            config.NODE_URLS, timeout=config.RPC_TIMEOUT, pool_size=config.RPC_POOL_SIZE,
+            hedge_delay=config.RPC_HEDGE_DELAY, hedged_methods=config.RPC_HEDGED_METHODS
+        ), ens=None)
+
         # Inject middleware for Proof-of-Authority (PoA) networks (like Polygon, BNB Chain)
         # This is necessary for proper transaction signing and nonce management on these networks.
-        if "polygon" in config.NODE_URL.lower() or "bsc" in config.NODE_URL.lower() or "arbitrum" in config.NODE_URL.lower() or "base" in config.NODE_URL.lower():
-             self.w3.middleware_onion.inject(geth_poa_middleware, layer=0)
-
-        # Verify blockchain connection.
-        if not self.w3.is_connected():
-            raise Exception("Could not connect to the blockchain.")
+        # Detected from the chain itself: PoA blocks carry more than 32 bytes of extraData.
+        # The same request verifies the connection (no separate is_connected round trip).
+        try:
+            self.w3.eth.get_block("latest")
+        except ExtraDataLengthError:
+            self.w3.middleware_onion.inject(geth_poa_middleware, layer=0)
+            print("Proof-of-Authority chain detected. PoA middleware enabled.")
+        except Exception as e:
+            raise Exception(f"Could not connect to the blockchain: {e}")
 
         self.config = config
         # Load account from private key. Use with extreme caution.
         self.account = self.w3.eth.account.from_key(config.PRIVATE_KEY)
         print(f"Connected to blockchain. Address: {self.account.address}")
 
+        self._multicall_contract = None
+        # Shared by every client copy: positions, rebalance steps, transactions and hedge orders (see uniswap_lp_journal.py).
+        self.journal = StateJournal(config.JOURNAL_PATH)
+        # The rebalance this client's transactions belong to, while one is in progress (per client copy).
+        self.journal_rebalance_id = None
+        # Raw eth_call path for the hot reads, over the same provider (None: every read goes through web3).
+        self.fast_calls = FastCallClient(self.w3.provider) if config.FAST_READS else None
+        # Contract instances built so far, keyed by (checksum address, ABI object id).
+        self._contracts = {}
+        self._chain_id = None
+        # The active per-cycle read snapshot (see `begin_cycle`). None outside of a bot cycle.
+        self.cycle = None
+        # Cumulative read counters over the bot's lifetime, for comparing against per-cycle numbers.
+        self.read_stats = {"hits": 0, "misses": 0, "rpc_requests": 0}
+        self._stats_lock = threading.Lock()
+        # Serializes nonce assignment and broadcast when several positions transact from this wallet concurrently.
+        self._tx_lock = threading.Lock()
+        # Shared by every client copy (see `for_config`): one nonce sequence per wallet.
+        self.nonces = NonceManager(self.w3, self.account.address)
+        # Tracks every broadcast transaction until it is mined, replacing it with higher fees when stuck.
+        self.supervisor = TransactionSupervisor(self)
+        # Prices every transaction (EIP-1559 where available) from a per-block fee history window.
+        self.fee_oracle = FeeOracle(self)
+        # In-memory ERC20 allowances, updated from our receipts (see `send_transactions`) and Approval logs.
+        self.allowances = AllowanceTracker(self)
+
+    def for_config(self, config: Config) -> "BlockchainClient":
+        """
+        Returns a client that shares this one's connection, account, contract cache, transaction lock and allowance
+        tracker, but uses `config` and has its own cycle snapshot. Used to run several positions side by side.
+        """
+        client = copy.copy(self)
+        client.config = config
+        client.cycle = None
+        client.journal_rebalance_id = None
+        return client
+
+    @property
+    def multicall(self):
+        """The Multicall3 contract (built on first use)."""
+        if self._multicall_contract is None:
+            self._multicall_contract = self.get_contract(self.config.MULTICALL3_ADDRESS, self.config.MULTICALL3_ABI)
+        return self._multicall_contract
+
     def get_contract(self, address, abi):
-        """Returns a Web3 contract instance for a given address and ABI."""
-        return self.w3.eth.contract(address=Web3.to_checksum_address(address), abi=abi)
-
-    def send_transaction(self, tx):
-        """Builds, signs, and sends a transaction to the blockchain."""
-        nonce = self.w3.eth.get_transaction_count(self.account.address)
-        # It's recommended to estimate gas before sending to avoid failures or overpaying
-        # gas_limit = tx.estimate_gas({'from': self.account.address}) # Uncomment if you want to estimate gas
-        tx_build = tx.build_transaction({
-            'chainId': self.w3.eth.chain_id,
-            'from': self.account.address,
-            'nonce': nonce,
-            # For Ethereum Mainnet (EIP-1559), you might want to use w3.eth.get_block('latest').baseFeePerGas
-            # For simplicity, using legacy gasPrice here. Adjust based on network.
-            'gasPrice': self.w3.eth.gas_price
-            # 'gas': gas_limit # Uncomment if using estimated gas
-        })
-        signed_tx = self.w3.eth.account.sign_transaction(tx_build, private_key=self.config.PRIVATE_KEY)
-        tx_hash = self.w3.eth.send_raw_transaction(signed_tx.rawTransaction)
-        print(f"Transaction sent: {tx_hash.hex()}")
-        receipt = self.w3.eth.wait_for_transaction_receipt(tx_hash)
-        if receipt.status == 1:
-            print(f"Transaction successful: {tx_hash.hex()}")
+        """Returns a Web3 contract instance for a given address and ABI (built once, then reused)."""
+        checksum_address = Web3.to_checksum_address(address)
+        # The cached contract keeps a reference to `abi`, so its id cannot be reused while the entry exists.
+        key = (checksum_address, id(abi))
+        contract = self._contracts.get(key)
+        if contract is None:
+            contract = self.w3.eth.contract(address=checksum_address, abi=abi)
+            self._contracts[key] = contract
+        return contract
+
+    @property
+    def chain_id(self) -> int:
+        """The connected chain's ID (fetched once; it cannot change for a given endpoint)."""
+        if self._chain_id is None:
+            self._chain_id = self.w3.eth.chain_id
+        return self._chain_id
+
+    def begin_cycle(self) -> "CycleContext":
+        """
+        Pins the latest block number for a new bot cycle. Until `end_cycle`, every read is sent
+        with that `block_identifier` and memoized, so the whole cycle sees one consistent snapshot.
+        """
+        self.cycle = CycleContext(self.w3.eth.block_number)
+        return self.cycle
+
+    def end_cycle(self):
+        """Closes the current cycle, reporting its read counters and discarding its cache."""
+        if self.cycle is None:
+            return
+        cycle = self.cycle
+        self.cycle = None
+        with self._stats_lock:
+            self.read_stats["hits"] += cycle.hits
+            self.read_stats["misses"] += cycle.misses
+            self.read_stats["rpc_requests"] += cycle.rpc_requests
+        print(f"Cycle reads at block {cycle.block_number}: {cycle.hits} cache hits, {cycle.misses} misses, {cycle.rpc_requests} RPC requests.")
+
+    def _block_identifier(self):
+        """The block reads should be made at: the pinned cycle block, or 'latest' outside a cycle."""
+        return self.cycle.block_number if self.cycle is not None else "latest"
+
+    @staticmethod
+    def _decode_call_result(contract_function, return_data: bytes):
+        """
+        Decodes the raw return data of a call the same way `ContractFunction.call()` does:
+        a single output is returned as a bare value, several outputs as a list, and addresses are checksummed.
+        The hot reads use their fixed-layout decoders instead of eth_abi.
+        """
+        fast_result = decode_result(contract_function, return_data)
+        if fast_result is not None:
+            return fast_result
+        output_abis = contract_function.abi["outputs"]
+        output_types = [collapse_if_tuple(output) for output in output_abis]
+        decoded = abi_decode(output_types, return_data)
+        normalized = [Web3.to_checksum_address(value) if output_type == "address" else value
+                      for output_type, value in zip(output_types, decoded)]
+        if len(normalized) == 1:
+            return normalized[0]
+        return normalized
+
+    def batch_call(self, calls: list, allow_failure: bool = False) -> list:
+        """
+        Executes several read-only contract calls in a single Multicall3 `aggregate3` request.
+        `calls` is a list of prepared contract functions (e.g. `pool.functions.slot0()`).
+        Returns the decoded results in the same order and shape as calling `.call()` on each one.
+        With `allow_failure=True`, a reverted call yields a `MulticallCallFailed` instance instead of raising.
+        Inside a cycle, calls already memoized at the pinned block are not sent again.
+        """
+        if not calls:
+            return []
+
+        results = [None] * len(calls)
+        pending = [] # (index, contract function) of the calls that must go to the node
+        for index, fn in enumerate(calls):
+            if self.cycle is not None and self.cycle.has(fn):
+                results[index] = self.cycle.get(fn)
+            else:
+                pending.append((index, fn))
+
+        if pending:
+            pending_fns = [fn for _, fn in pending]
+            if self.cycle is not None:
+                self.cycle.misses += len(pending_fns)
+            if self.config.USE_MULTICALL:
+                fetched = self._multicall(pending_fns)
+            else:
+                fetched = self._sequential_calls(pending_fns)
+            for (index, fn), result in zip(pending, fetched):
+                if self.cycle is not None:
+                    self.cycle.put(fn, result)
+                results[index] = result
+
+        if not allow_failure:
+            for result in results:
+                if isinstance(result, MulticallCallFailed):
+                    raise result
+        return results
+
+    def _multicall(self, calls: list) -> list:
+        """Sends the calls through Multicall3 `aggregate3`, chunked by MULTICALL_BATCH_SIZE."""
+        results = []
+        batch_size = self.config.MULTICALL_BATCH_SIZE
+        for start in range(0, len(calls), batch_size):
+            chunk = calls[start:start + batch_size]
+            return_data = self.w3.eth.call(self.encode_batch(chunk), self._block_identifier())
+            self._count_rpc_request()
+            results.extend(self.decode_batch(chunk, return_data))
+        return results
+
+    def encode_function(self, contract_function) -> str:
+        """
+        Hex calldata of a prepared contract function, e.g. for nesting in a multicall. Struct arguments may be dicts,
+        as when building a transaction. The hot reads use their precomputed selectors (uniswap_lp_fastcall.py).
+        """
+        fast_data = encode_call(contract_function)
+        if fast_data is not None:
+            return "0x" + fast_data.hex()
+        # Same contract instance (and ABI object) the function was prepared from, so this is a cache hit.
+        contract = self.get_contract(contract_function.address, contract_function.contract_abi)
+        return contract.encode_abi(contract_function.fn_name, args=contract_function.args, kwargs=contract_function.kwargs)
+
+    def encode_batch(self, calls: list) -> dict:
+        """
+        The eth_call transaction ({"to", "data"}) of a Multicall3 `aggregate3` that executes `calls`, allowing
+        individual failures. Send it at any block and decode the return data with `decode_batch`.
+        """
+        call_structs = [(fn.address, True, self.encode_function(fn)) for fn in calls]
+        return {"to": self.multicall.address, "data": self.multicall.encode_abi("aggregate3", args=[call_structs])}
+
+    def decode_batch(self, calls: list, return_data: bytes) -> list:
+        """
+        Decodes the return data of `encode_batch(calls)` into per-call results, in the same order and shape as
+        calling `.call()` on each one; a call that reverted (or returned undecodable data) yields MulticallCallFailed.
+        """
+        responses, = self.w3.codec.decode(["(bool,bytes)[]"], return_data)
+        results = []
+        for fn, (success, call_return_data) in zip(calls, responses):
+            if success:
+                try:
+                    results.append(self._decode_call_result(fn, call_return_data))
+                    continue
+                except Exception as e:
+                    # Empty return data (e.g. the target has no code) cannot be decoded.
+                    results.append(MulticallCallFailed(f"{fn.fn_name}{tuple(fn.args)} on {fn.address} returned undecodable data: {e}"))
+            else:
+                results.append(MulticallCallFailed(f"{fn.fn_name}{tuple(fn.args)} on {fn.address} reverted"))
+        return results
+
+    def _sequential_calls(self, calls: list) -> list:
+        """Fallback for chains without Multicall3: one eth_call per contract function."""
+        results = []
+        for fn in calls:
+            try:
+                results.append(self._call_one(fn, self._block_identifier()))
+            except Exception as e:
+                results.append(MulticallCallFailed(f"{fn.fn_name}{tuple(fn.args)} on {fn.address} failed: {e}"))
+            self._count_rpc_request()
+        return results
+
+    def _call_one(self, contract_function, block_identifier):
+        """One eth_call: over the fast path when the function has a fixed-layout decoder, else through web3."""
+        if self.fast_calls is not None and fast_call_spec(contract_function) is not None:
+            return self.fast_calls.call(contract_function, block_identifier)
+        return contract_function.call(block_identifier=block_identifier)
+
+    def _count_rpc_request(self):
+        if self.cycle is not None:
+            self.cycle.rpc_requests += 1
+
+    def prefetch(self, calls: list):
+        """
+        Reads a group of calls in one batched request so that the following `call()`s
+        for the same contract/function/args in this cycle are served without another round trip.
+        """
+        self.batch_call(calls, allow_failure=True)
+
+    def call(self, contract_function):
+        """
+        Executes a read-only contract call at the cycle's pinned block.
+        Inside a cycle, results are memoized by (contract, function, args, block).
+        """
+        if self.cycle is None:
+            return self._call_one(contract_function, "latest")
+        if self.cycle.has(contract_function):
+            result = self.cycle.get(contract_function)
         else:
-            print(f"Transaction failed: {tx_hash.hex()}")
+            result = self._call_one(contract_function, self.cycle.block_number)
+            self.cycle.misses += 1
+            self.cycle.rpc_requests += 1
+            self.cycle.put(contract_function, result)
+        if isinstance(result, MulticallCallFailed):
+            raise result
+        return result
+
+    def submit_transaction(self, tx, gas: int = None, fees: dict = None) -> Future:
+        """
+        Builds, signs and broadcasts a transaction without waiting for it, and hands it to the supervisor.
+        Returns a Future of its receipt (see `TransactionSupervisor`).
+        fees: fee fields from the FeeOracle; priced at FEE_URGENCY_DEFAULT when None.
+        gas: gas limit; estimated by the node when None. Transactions that depend on earlier, still pending ones
+        (e.g. a mint right after its approvals) must pass it, since the estimate would run against the old state.
+        """
+        # In portfolio mode several positions may transact at once: hold the lock from nonce assignment to broadcast,
+        # so nonces reach the node in order.
+        with self._tx_lock:
+            nonce = self.nonces.reserve()
+            tx_params = {
+                'chainId': self.chain_id, # Cached: it cannot change for a given endpoint
+                'from': self.account.address,
+                'nonce': nonce,
+            }
+            # maxFeePerGas/maxPriorityFeePerGas (EIP-1559), or gasPrice on legacy chains.
+            tx_params.update(fees if fees is not None else self.fee_oracle.fees(self.config.FEE_URGENCY_DEFAULT))
+            if gas is not None:
+                tx_params['gas'] = gas
+            signed_tx = None
+            try:
+                tx_build = tx.build_transaction(tx_params)
+                signed_tx = self.w3.eth.account.sign_transaction(tx_build, private_key=self.config.PRIVATE_KEY)
+                # Journaled BEFORE the broadcast (the hash is known once signed): a crash right after sending
+                # must not leave a transaction the journal doesn't know about.
+                kind = getattr(tx, "fn_name", "transaction")
+                self.journal.record_transaction(signed_tx.hash.hex(), nonce, kind, tx_build, self.journal_rebalance_id)
+                tx_hash = self.w3.eth.send_raw_transaction(signed_tx.rawTransaction)
+            except Exception:
+                if signed_tx is not None:
+                    self.journal.update_transaction(signed_tx.hash.hex(), "rejected")
+                # The reserved nonce was not used (or the node disagrees with our counter): re-read it next time.
+                self.nonces.resync()
+                raise
+            future = self.supervisor.track(nonce, tx_build, tx_hash, kind=kind)
+        print(f"Transaction sent: {tx_hash.hex()} (nonce {nonce})")
+        return future
+
+    @METRICS.timed("receipt_wait")
+    def wait_for_receipts(self, futures: list) -> list:
+        """
+        Waits for several supervised transactions at once; the total wait is that of the slowest one rather than
+        the sum. Returns the receipts in order. Stuck transactions are bumped by the supervisor meanwhile; after
+        TX_RECEIPT_TIMEOUT this gives up waiting (the supervisor keeps tracking them) and raises TimeExhausted.
+        """
+        deadline = time.time() + self.config.TX_RECEIPT_TIMEOUT
+        receipts = []
+        for future in futures:
+            try:
+                receipts.append(future.result(timeout=max(0, deadline - time.time())))
+            except FutureTimeoutError:
+                raise TimeExhausted(f"No receipt after {self.config.TX_RECEIPT_TIMEOUT}s for {len(futures)} transaction(s).")
+        return receipts
+
+    def send_transactions(self, txs: list, gas_limits: list = None, urgency: str = None) -> list:
+        """
+        Sends a dependent sequence of transactions back-to-back (consecutive nonces, one fee quote) and then
+        waits for all of their receipts together, so the sequence usually lands in one or two blocks.
+        gas_limits: one gas limit (or None to estimate) per transaction; see `submit_transaction`.
+        urgency: FeeOracle level ("low", "medium", "high"); FEE_URGENCY_DEFAULT when None.
+        Raises if any of them reverted.
+        """
+        gas_limits = gas_limits or [None] * len(txs)
+        fees = self.fee_oracle.fees(urgency or self.config.FEE_URGENCY_DEFAULT)
+        futures = [self.submit_transaction(tx, gas, fees) for tx, gas in zip(txs, gas_limits)]
+        receipts = self.wait_for_receipts(futures)
+        for receipt in receipts:
+            self.allowances.apply_receipt(receipt)
+        if self.cycle is not None:
+            # Our own transactions changed on-chain state: move the cycle's snapshot to the block that includes them.
+            self.cycle.block_number = max(receipt.blockNumber for receipt in receipts)
+        failed = []
+        for receipt in receipts:
+            # Receipts carry the hash that was actually mined (a replacement's, if the original was bumped).
+            if receipt.status == 1:
+                print(f"Transaction successful: {receipt.transactionHash.hex()}")
+            else:
+                print(f"Transaction failed: {receipt.transactionHash.hex()}")
+                failed.append(receipt.transactionHash.hex())
+        if failed:
             # It's crucial to add more robust error handling here, potentially reverting or retrying.
-            raise Exception(f"Transaction failed: {tx_hash.hex()}")
-        return receipt
+            raise Exception(f"Transaction failed: {', '.join(failed)}")
+        return receipts
+
+    def send_transaction(self, tx, urgency: str = None):
+        """Builds, signs, and sends a transaction to the blockchain, and waits for its receipt."""
+        return self.send_transactions([tx], urgency=urgency)[0]
+
+    def recover_transaction(self, rows: list):
+        """
+        Outcome of one journaled nonce after a restart, from the journal rows of every version broadcast for it
+        (newest first): the receipt of the version that was mined (check its status), or None when the nonce was
+        used by another transaction or never reached the node. A version still pending is handed back to the
+        supervisor, so it keeps being fee-bumped, and waited for like a fresh transaction (TimeExhausted after
+        TX_RECEIPT_TIMEOUT).
+        """
+        for row in rows:
+            try:
+                return self.w3.eth.get_transaction_receipt(row["tx_hash"])
+            except TransactionNotFound:
+                continue
+        nonce = rows[0]["nonce"]
+        if self.w3.eth.get_transaction_count(self.account.address, "latest") > nonce:
+            return None
+        if all(row["status"] == "rejected" for row in rows):
+            return None # Signed but refused by the node: nothing is pending for it.
+        entry = self.supervisor.in_flight.get(nonce)
+        if entry is not None:
+            future = entry.future
+        else:
+            hashes = [HexBytes(row["tx_hash"]) for row in reversed(rows)]
+            # The oldest row has the original kind (a replacement may be a cancel) and first broadcast time.
+            future = self.supervisor.track(nonce, rows[0]["params"], hashes[-1], hashes[:-1],
+                                           kind=rows[-1]["kind"], first_broadcast=rows[-1]["created_at"])
+        try:
+            return self.wait_for_receipts([future])[0]
+        except TransactionCancelled:
+            return None
+        except TimeExhausted:
+            raise
+        except Exception as e:
+            print(f"Journaled transaction with nonce {nonce} did not land: {e}")
+            return None
+
+
+class PoolRegistry:
+    """
+    Resolves immutable pool metadata once per (token0, token1, fee, chainId) and keeps it on disk.
+    Metadata per pool: pool address, fee, tick spacing (read from the pool itself) and both tokens' decimals.
+    """
+    def __init__(self, client: BlockchainClient):
+        self.client = client
+        self.path = client.config.POOL_REGISTRY_PATH
+        self.factory = client.get_contract(client.config.UNISWAP_FACTORY_ADDRESS, client.config.UNISWAP_FACTORY_ABI)
+        self.pools = {} # "chainId:token0:token1:fee" -> metadata dict
+        self.token_decimals = {} # "chainId:token" -> decimals
+        self._load()
+
+    def _load(self):
+        """Loads previously resolved metadata from the on-disk cache, if any."""
+        try:
+            if os.path.exists(self.path):
+                with open(self.path, "r") as f:
+                    data = json.load(f)
+                self.pools = data.get("pools", {})
+                self.token_decimals = data.get("token_decimals", {})
+                print(f"Loaded {len(self.pools)} pools from {self.path}")
+        except Exception as e:
+            print(f"Error loading pool registry cache {self.path}: {e}. Metadata will be re-resolved.")
+            self.pools = {}
+            self.token_decimals = {}
+
+    def _save(self):
+        """Writes the registry to disk atomically (write to a temp file, then rename)."""
+        try:
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump({"pools": self.pools, "token_decimals": self.token_decimals}, f, indent=2)
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            print(f"Error saving pool registry cache {self.path}: {e}")
+
+    def _pool_key(self, token0_address: str, token1_address: str, fee: int) -> str:
+        return f"{self.client.chain_id}:{Web3.to_checksum_address(token0_address)}:{Web3.to_checksum_address(token1_address)}:{fee}"
+
+    def _token_key(self, token_address: str) -> str:
+        return f"{self.client.chain_id}:{Web3.to_checksum_address(token_address)}"
+
+    def get_pool(self, token0_address: str, token1_address: str, fee: int) -> dict:
+        """Returns the metadata of a pool, resolving it on-chain the first time only."""
+        key = self._pool_key(token0_address, token1_address, fee)
+        metadata = self.pools.get(key)
+        if metadata is None:
+            metadata = self._resolve_pool(token0_address, token1_address, fee)
+            self.pools[key] = metadata
+            self._save()
+        return metadata
+
+    def _resolve_pool(self, token0_address: str, token1_address: str, fee: int) -> dict:
+        print(f"Resolving pool metadata for {token0_address}/{token1_address} ({fee})...")
+        token0_address = Web3.to_checksum_address(token0_address)
+        token1_address = Web3.to_checksum_address(token1_address)
+        token0_contract = self.client.get_contract(token0_address, self.client.config.ERC20_ABI)
+        token1_contract = self.client.get_contract(token1_address, self.client.config.ERC20_ABI)
+        pool_address, decimals0, decimals1 = self.client.batch_call([
+            self.factory.functions.getPool(token0_address, token1_address, fee),
+            token0_contract.functions.decimals(),
+            token1_contract.functions.decimals(),
+        ])
+        if pool_address == "0x0000000000000000000000000000000000000000":
+            raise Exception("Pool not found for the given parameters.")
+        pool_contract = self.client.get_contract(pool_address, self.client.config.UNISWAP_POOL_ABI)
+        tick_spacing = self.client.call(pool_contract.functions.tickSpacing())
+
+        self.token_decimals[self._token_key(token0_address)] = decimals0
+        self.token_decimals[self._token_key(token1_address)] = decimals1
+        return {
+            "pool_address": pool_address,
+            "token0": token0_address,
+            "token1": token1_address,
+            "fee": fee,
+            "tick_spacing": tick_spacing,
+            "decimals0": decimals0,
+            "decimals1": decimals1,
+        }
+
+    def get_pool_contract(self, token0_address: str, token1_address: str, fee: int):
+        """Returns the (cached) Web3 contract instance of a pool."""
+        pool_address = self.get_pool(token0_address, token1_address, fee)["pool_address"]
+        return self.client.get_contract(pool_address, self.client.config.UNISWAP_POOL_ABI)
+
+    def get_token_decimals(self, token_address: str) -> int:
+        """Returns a token's decimals, reading them on-chain the first time only."""
+        key = self._token_key(token_address)
+        if key not in self.token_decimals:
+            token_contract = self.client.get_contract(token_address, self.client.config.ERC20_ABI)
+            self.token_decimals[key] = self.client.call(token_contract.functions.decimals())
+            self._save()
+        return self.token_decimals[key]
+
+
+class AllowanceTracker:
+    """
+    Keeps the wallet's ERC20 allowances per (token, spender) in memory, so deposits don't read allowance()
+    every time. Entries are seeded once with a batched read, then kept current from:
+    - our own receipts: Approval logs set the allowance, Transfer logs out of the wallet spend it
+      (tokens that don't emit Approval on transferFrom, like USDC, are only seen through their Transfers);
+    - Approval logs for the wallet in other transactions (e.g. a revoke from another app), polled at most every
+      ALLOWANCE_SYNC_INTERVAL seconds and only when an allowance is actually needed.
+    New approvals follow ALLOWANCE_POLICY: "exact" (the amount needed), "buffered" (ALLOWANCE_BUFFER_MULTIPLE times
+    the amount, so the next deposits don't need one) or "cap" (a standing allowance from ALLOWANCE_CAPS,
+    unlimited by default). Tokens in PERMIT_TOKENS (EIP-2612) get a signed permit instead of an approve transaction.
+    """
+    APPROVAL_TOPIC = Web3.keccak(text="Approval(address,address,uint256)")
+    TRANSFER_TOPIC = Web3.keccak(text="Transfer(address,address,uint256)")
+    # keccak("Permit(address owner,address spender,uint256 value,uint256 nonce,uint256 deadline)")
+    PERMIT_TYPEHASH = Web3.keccak(text="Permit(address owner,address spender,uint256 value,uint256 nonce,uint256 deadline)")
+    DOMAIN_SEPARATOR_SELECTOR = Web3.keccak(text="DOMAIN_SEPARATOR()")[:4]
+    NONCES_SELECTOR = Web3.keccak(text="nonces(address)")[:4]
+
+    def __init__(self, client: "BlockchainClient"):
+        self.client = client
+        self.config = client.config
+        self.owner = client.account.address
+        self.allowances = {} # (token, spender) -> allowance in raw units
+        self.synced_block = None # Approval logs up to this block are reflected in `allowances`
+        self._last_sync = time.time()
+        self._own_tx_hashes = deque(maxlen=1000) # Receipts already applied; their logs are skipped when syncing
+        self._domain_separators = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(token: str, spender: str) -> tuple:
+        return Web3.to_checksum_address(token), Web3.to_checksum_address(spender)
+
+    @staticmethod
+    def _topic_address(topic) -> str:
+        return Web3.to_checksum_address(bytes(topic)[-20:])
+
+    def get(self, pairs: list, client: "BlockchainClient" = None) -> list:
+        """
+        Allowances for [(token, spender), ...]. Unknown pairs are seeded together in one batched read.
+        client: the caller's client copy (see `BlockchainClient.for_config`), so the seeding read and the Approval
+        log sync go through its cycle snapshot and pinned block; the tracker is shared by every copy and its own
+        client is the original.
+        """
+        client = client or self.client
+        keys = [self._key(token, spender) for token, spender in pairs]
+        with self._lock:
+            missing = [key for key in keys if key not in self.allowances]
+            if missing:
+                calls = [client.get_contract(token, self.config.ERC20_ABI).functions.allowance(self.owner, spender)
+                         for token, spender in missing]
+                for key, allowance in zip(missing, client.batch_call(calls)):
+                    self.allowances[key] = allowance
+                if self.synced_block is None:
+                    self.synced_block = client.cycle.block_number if client.cycle is not None else client.w3.eth.block_number
+            else:
+                self._sync(client)
+            return [self.allowances[key] for key in keys]
+
+    def _sync(self, client: "BlockchainClient"):
+        """
+        Applies Approval logs for the wallet from other transactions since the last sync (caller holds the lock),
+        up to the calling client's pinned cycle block (the latest block outside a cycle).
+        """
+        if time.time() - self._last_sync < self.config.ALLOWANCE_SYNC_INTERVAL or not self.allowances:
+            return
+        head = client.cycle.block_number if client.cycle is not None else client.w3.eth.block_number
+        if head <= self.synced_block:
+            # Another position's cycle already synced past this snapshot.
+            return
+        self._last_sync = time.time()
+        if head - self.synced_block > self.config.EVENT_MAX_BLOCK_RANGE:
+            # Too far behind for one eth_getLogs: re-seed on next use instead.
+            self.allowances.clear()
+            self.synced_block = None
+            return
+        logs = client.w3.eth.get_logs({
+            "address": sorted({token for token, _ in self.allowances}),
+            "topics": [self.APPROVAL_TOPIC, "0x" + "00" * 12 + self.owner[2:].lower()],
+            "fromBlock": self.synced_block + 1,
+            "toBlock": head,
+        })
+        for log in logs:
+            if log["transactionHash"] in self._own_tx_hashes:
+                continue
+            key = self._key(log["address"], self._topic_address(log["topics"][2]))
+            if key in self.allowances:
+                self.allowances[key] = int.from_bytes(bytes(log["data"]), "big")
+                print(f"Allowance of {key[1]} on {key[0]} changed externally: {self.allowances[key]}")
+        self.synced_block = head
+
+    def apply_receipt(self, receipt):
+        """Updates tracked allowances from one of our own receipts."""
+        with self._lock:
+            self._own_tx_hashes.append(receipt["transactionHash"])
+            approved = {} # key -> last Approval value in this receipt
+            spent = {} # token -> amount transferred out of the wallet
+            for log in receipt["logs"]:
+                topics = log["topics"]
+                if len(topics) != 3 or self._topic_address(topics[1]) != self.owner:
+                    continue
+                token = Web3.to_checksum_address(log["address"])
+                value = int.from_bytes(bytes(log["data"]), "big")
+                if bytes(topics[0]) == self.APPROVAL_TOPIC:
+                    approved[self._key(token, self._topic_address(topics[2]))] = value
+                elif bytes(topics[0]) == self.TRANSFER_TOPIC:
+                    spent[token] = spent.get(token, 0) + value
+            for key, value in approved.items():
+                if key in self.allowances:
+                    self.allowances[key] = value
+            # Transfers out of the wallet in our transactions to a contract (the position manager, the swap router)
+            # are pulled with that contract's allowance.
+            # Skip tokens that already reported the new allowance through an Approval log in this receipt.
+            if receipt["to"] is None:
+                return
+            spender = Web3.to_checksum_address(receipt["to"])
+            for token, amount in spent.items():
+                key = (token, spender)
+                if key in self.allowances and key not in approved and self.allowances[key] != MAX_UINT256:
+                    self.allowances[key] = max(0, self.allowances[key] - amount)
+
+    def target_allowance(self, token: str, amount: int) -> int:
+        """The allowance to grant when `amount` is needed, according to ALLOWANCE_POLICY."""
+        policy = self.config.ALLOWANCE_POLICY
+        if policy == "exact":
+            return amount
+        if policy == "buffered":
+            return min(MAX_UINT256, int(amount * self.config.ALLOWANCE_BUFFER_MULTIPLE))
+        if policy == "cap":
+            cap = self.config.ALLOWANCE_CAPS.get(Web3.to_checksum_address(token))
+            return MAX_UINT256 if cap is None else max(amount, cap)
+        raise ValueError(f"Unknown ALLOWANCE_POLICY: {policy}")
+
+    def uses_permit(self, token: str) -> bool:
+        return Web3.to_checksum_address(token) in self.config.PERMIT_TOKENS
+
+    def sign_permit(self, token: str, spender: str, value: int, deadline: int) -> tuple:
+        """EIP-2612 permit signature (v, r, s) for `spender`, using the token's on-chain DOMAIN_SEPARATOR and nonce."""
+        token = Web3.to_checksum_address(token)
+        if token not in self._domain_separators:
+            self._domain_separators[token] = bytes(self.client.w3.eth.call({"to": token, "data": self.DOMAIN_SEPARATOR_SELECTOR}))
+        nonce = int.from_bytes(bytes(self.client.w3.eth.call({
+            "to": token, "data": self.NONCES_SELECTOR + bytes(12) + bytes.fromhex(self.owner[2:])
+        })), "big")
+        struct_hash = Web3.keccak(
+            bytes(self.PERMIT_TYPEHASH)
+            + bytes(12) + bytes.fromhex(self.owner[2:])
+            + bytes(12) + bytes.fromhex(Web3.to_checksum_address(spender)[2:])
+            + value.to_bytes(32, "big") + nonce.to_bytes(32, "big") + deadline.to_bytes(32, "big")
+        )
+        # The EIP-712 message encode_typed_data would build, but with the token's own domain separator: tokens
+        # differ in the name and version they hash into it.
+        message = SignableMessage(version=b"\x01", header=self._domain_separators[token], body=bytes(struct_hash))
+        signed = self.client.account.sign_message(message)
+        return signed.v, signed.r.to_bytes(32, "big"), signed.s.to_bytes(32, "big")
+
 
 # --- 2. Price and Oracle Module ---
 class PriceOracle:
-    def __init__(self, blockchain_client: BlockchainClient):
+    def __init__(self, blockchain_client: BlockchainClient, pool_registry: PoolRegistry):
         self.client = blockchain_client
-        # Initialize Chainlink price feed contracts
-        self.eth_usd_feed = self.client.get_contract(self.client.config.CHAINLINK_ETH_USD_FEED, self.client.config.CHAINLINK_ABI)
-        self.usdc_usd_feed = self.client.get_contract(self.client.config.CHAINLINK_USDC_USD_FEED, self.client.config.CHAINLINK_ABI)
-        # Store token decimals for accurate price conversions.
-        # For a more generic solution, you would fetch these on demand or from a token list.
-        self.token_decimals = {
-            self.client.config.TOKEN0_ADDRESS: self.client.get_contract(self.client.config.TOKEN0_ADDRESS, self.client.config.ERC20_ABI).functions.decimals().call(),
-            self.client.config.TOKEN1_ADDRESS: self.client.get_contract(self.client.config.TOKEN1_ADDRESS, self.client.config.ERC20_ABI).functions.decimals().call(),
-        }
+        self.registry = pool_registry
+        # Feed contracts and token decimals are resolved on first use (see the properties below), so building
+        # an oracle costs nothing: a portfolio builds one per position at startup.
+        self._feeds = {}
+        self._token_decimals = None
+
+    def _feed(self, address: str):
+        if address not in self._feeds:
+            self._feeds[address] = self.client.get_contract(address, self.client.config.CHAINLINK_ABI)
+        return self._feeds[address]
+
+    @property
+    def eth_usd_feed(self):
+        """Chainlink price feed contract of the volatile token (ETH/USD)."""
+        return self._feed(self.client.config.CHAINLINK_ETH_USD_FEED)
+
+    @property
+    def usdc_usd_feed(self):
+        """Chainlink price feed contract of the stable token (USDC/USD)."""
+        return self._feed(self.client.config.CHAINLINK_USDC_USD_FEED)
+
+    @property
+    def token_decimals(self) -> dict:
+        """
+        Token decimals for accurate price conversions.
+        The pool registry resolves them once (and caches them on disk), so restarts skip the decimals() reads.
+        """
+        if self._token_decimals is None:
+            pool = self.registry.get_pool(self.client.config.TOKEN0_ADDRESS, self.client.config.TOKEN1_ADDRESS, self.client.config.POOL_FEE)
+            self._token_decimals = {
+                self.client.config.TOKEN0_ADDRESS: pool["decimals0"],
+                self.client.config.TOKEN1_ADDRESS: pool["decimals1"],
+            }
+        return self._token_decimals
 
 
+    @METRICS.timed("chainlink_price")
     def get_token_price_usd(self, token_address: str) -> Decimal:
         """
         Gets the price of a token in USD using Chainlink Price Feeds.
@@ -129,12 +1455,12 @@ class PriceOracle:
         try:
             if token_address == self.client.config.TOKEN0_ADDRESS: # WETH
                 # Chainlink's latestRoundData returns (roundId, answer, startedAt, updatedAt, answeredInRound)
-                latest_data = self.eth_usd_feed.functions.latestRoundData().call()
+                latest_data = self.client.call(self.eth_usd_feed.functions.latestRoundData())
                 price_raw = latest_data[1] # The 'answer' field
                 # Chainlink price feeds usually have 8 decimals, but check the specific feed's documentation
                 return Decimal(price_raw) / Decimal(10**8) # Assuming 8 decimals for Chainlink feeds
             elif token_address == self.client.config.TOKEN1_ADDRESS: # USDC
-                latest_data = self.usdc_usd_feed.functions.latestRoundData().call()
+                latest_data = self.client.call(self.usdc_usd_feed.functions.latestRoundData())
                 price_raw = latest_data[1]
                 return Decimal(price_raw) / Decimal(10**8) # Assuming 8 decimals for Chainlink feeds
             else:
@@ -145,119 +1471,260 @@ class PriceOracle:
             return Decimal("0") # Return 0 or raise an error as appropriate
 
 
+    @METRICS.timed("pool_prices")
     def get_pool_prices(self, pool_address: str) -> tuple[Decimal, Decimal]:
         """
         Gets the current prices of token0 and token1 in the pool from Uniswap V3's slot0.
         Returns (price0_per_1, price1_per_0) where price0_per_1 is how much of token1 you get for 1 token0.
         """
         pool_contract = self.client.get_contract(pool_address, self.client.config.UNISWAP_POOL_ABI)
-        slot0 = pool_contract.functions.slot0().call()
-        sqrt_price_x96 = Decimal(slot0[0])
+        slot0 = self.client.call(pool_contract.functions.slot0())
+        sqrt_price_x96 = slot0[0]
 
         # Get decimals for accurate price conversion
         decimals0 = self.token_decimals[self.client.config.TOKEN0_ADDRESS]
         decimals1 = self.token_decimals[self.client.config.TOKEN1_ADDRESS]
 
-        # Calculate price0_per_1 (how much token1 for 1 token0) from sqrtPriceX96
-        # price_token0_per_token1 = (sqrt_price_x96 / 2**96)**2
-        # price_token1_per_token0 = 1 / price_token0_per_token1
-        price0_per_1_raw = (sqrt_price_x96 / Decimal(2**96))**2
-
-        # Adjust for token decimals to get human-readable price
-        adjusted_price0_per_1 = price0_per_1_raw * Decimal(10**decimals1) / Decimal(10**decimals0)
+        # Calculate price0_per_1 (how much token1 for 1 token0) from sqrtPriceX96:
+        # (sqrt_price_x96 / 2**96)**2 is the raw token1/token0 ratio, scaled by 10**(decimals0 - decimals1)
+        # to get a human-readable price. Computed exactly from the integer sqrtPriceX96.
+        adjusted_price0_per_1 = sqrt_price_x96_to_price(sqrt_price_x96, decimals0, decimals1)
         adjusted_price1_per_0 = 1 / adjusted_price0_per_1
 
         print(f"Price in pool: {adjusted_price1_per_0} {self.client.config.TOKEN0_ADDRESS_SYMBOL}/{self.client.config.TOKEN1_ADDRESS_SYMBOL} (Token0 per Token1)")
         return adjusted_price0_per_1, adjusted_price1_per_0 # price0_per_1 (token1 per token0), price1_per_0 (token0 per token1)
 
+
+class SwapEventWatcher:
+    """
+    Follows new blocks with eth_getLogs filtered on the managed pools' Swap topic and keeps each pool's
+    latest tick and sqrtPriceX96 in memory. The fromBlock cursor is persisted so restarts resume where they left off.
+    """
+    # keccak("Swap(address,address,int256,int256,uint160,uint128,int24)")
+    SWAP_TOPIC = Web3.keccak(text="Swap(address,address,int256,int256,uint160,uint128,int24)").hex()
+    # Non-indexed Swap fields, in data order: amount0, amount1, sqrtPriceX96, liquidity, tick.
+    SWAP_DATA_TYPES = ["int256", "int256", "uint160", "uint128", "int24"]
+
+    def __init__(self, client: BlockchainClient, pool_addresses: list):
+        self.client = client
+        self.pool_addresses = [Web3.to_checksum_address(address) for address in pool_addresses]
+        self.cursor_path = client.config.EVENT_CURSOR_PATH
+        self.pool_state = {} # pool address -> (tick, sqrtPriceX96, block number) from the latest Swap
+        self.from_block = self._load_cursor()
+
+    def _load_cursor(self) -> int:
+        """Loads the persisted fromBlock, or starts at the current head (history is not replayed)."""
+        try:
+            if os.path.exists(self.cursor_path):
+                with open(self.cursor_path, "r") as f:
+                    from_block = json.load(f)["from_block"]
+                print(f"Resuming Swap log polling from block {from_block}")
+                return from_block
+        except Exception as e:
+            print(f"Error loading swap cursor {self.cursor_path}: {e}")
+        return self.client.w3.eth.block_number
+
+    def _save_cursor(self):
+        try:
+            tmp_path = f"{self.cursor_path}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump({"from_block": self.from_block}, f)
+            os.replace(tmp_path, self.cursor_path)
+        except Exception as e:
+            print(f"Error saving swap cursor {self.cursor_path}: {e}")
+
+    def poll(self) -> set:
+        """
+        Fetches the Swap logs since the cursor (at most EVENT_MAX_BLOCK_RANGE blocks per call),
+        updates the in-memory pool state and returns the set of pools that swapped.
+        """
+        latest_block = self.client.w3.eth.block_number
+        if self.from_block > latest_block:
+            return set()
+        to_block = min(latest_block, self.from_block + self.client.config.EVENT_MAX_BLOCK_RANGE - 1)
+        logs = self.client.w3.eth.get_logs({
+            "address": self.pool_addresses,
+            "topics": [self.SWAP_TOPIC],
+            "fromBlock": self.from_block,
+            "toBlock": to_block,
+        })
+        updated_pools = set()
+        # Logs come back in chain order, so the last Swap of each pool wins.
+        for log in logs:
+            _, _, sqrt_price_x96, _, tick = abi_decode(self.SWAP_DATA_TYPES, bytes(log["data"]))
+            pool_address = Web3.to_checksum_address(log["address"])
+            self.pool_state[pool_address] = (tick, sqrt_price_x96, log["blockNumber"])
+            updated_pools.add(pool_address)
+        self.from_block = to_block + 1
+        self._save_cursor()
+        return updated_pools
+
+
+class PositionIndex:
+    """
+    In-memory index of every Uniswap V3 position NFT the wallet owns: by token ID, by pool (token0, token1, fee)
+    and by (pool, tickLower, tickUpper), with each position's current liquidity.
+
+    `discover` builds it at one pinned block in a few round trips whatever the number of NFTs: balanceOf(wallet),
+    then tokenOfOwnerByIndex(wallet, i) for every i and positions(tokenId) for every token, both in Multicall3
+    batches of MULTICALL_BATCH_SIZE (300 NFTs: 8 requests, block number included). `sync` then keeps it current
+    from the position manager's logs since that block instead of rescanning: Transfers in/out of the wallet, and
+    IncreaseLiquidity / DecreaseLiquidity of owned tokens (liquidity deltas applied in place). Only tokens that
+    arrived are read again; more than EVENT_MAX_BLOCK_RANGE blocks behind, it rediscovers.
+    """
+    TRANSFER_TOPIC = Web3.keccak(text="Transfer(address,address,uint256)")
+    INCREASE_LIQUIDITY_TOPIC = Web3.keccak(text="IncreaseLiquidity(uint256,uint128,uint256,uint256)")
+    DECREASE_LIQUIDITY_TOPIC = Web3.keccak(text="DecreaseLiquidity(uint256,uint128,uint256,uint256)")
+    # Token ID topics per eth_getLogs request (nodes cap the size of topic OR-lists).
+    TOKEN_ID_TOPICS_PER_REQUEST = 500
+
+    def __init__(self, client: BlockchainClient):
+        self.client = client
+        self.config = client.config
+        self.owner = client.account.address
+        self.owner_topic = "0x" + "00" * 12 + self.owner[2:].lower()
+        self.nft_manager = client.get_contract(self.config.UNISWAP_NFT_POSITION_MANAGER_ADDRESS, self.config.UNISWAP_NFT_POSITION_MANAGER_ABI)
+        self.positions = {} # token ID -> {"token_id", "token0", "token1", "fee", "tick_lower", "tick_upper", "liquidity"}
+        self.by_pool = {} # (token0, token1, fee) -> set of token IDs
+        self.by_range = {} # (token0, token1, fee, tick_lower, tick_upper) -> set of token IDs
+        self.synced_block = None # Logs up to this block are reflected in the index
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def pool_key(token_a: str, token_b: str, fee: int) -> tuple:
+        """(token0, token1, fee) with the tokens checksummed and in pool order (token0 < token1), like positions()."""
+        token_a, token_b = Web3.to_checksum_address(token_a), Web3.to_checksum_address(token_b)
+        return (token_a, token_b, fee) if int(token_a, 16) < int(token_b, 16) else (token_b, token_a, fee)
+
+    def _reader(self, block_number: int) -> BlockchainClient:
+        # A client copy with its own snapshot pinned at block_number, so the index never touches a bot's cycle.
+        reader = self.client.for_config(self.config)
+        reader.cycle = CycleContext(block_number)
+        return reader
+
+    def _put(self, token_id: int, info):
+        self._remove(token_id)
+        position = {"token_id": token_id, "token0": info[2], "token1": info[3], "fee": info[4],
+                    "tick_lower": info[5], "tick_upper": info[6], "liquidity": info[7]}
+        self.positions[token_id] = position
+        pool = (position["token0"], position["token1"], position["fee"])
+        self.by_pool.setdefault(pool, set()).add(token_id)
+        self.by_range.setdefault(pool + (position["tick_lower"], position["tick_upper"]), set()).add(token_id)
+
+    def _remove(self, token_id: int):
+        position = self.positions.pop(token_id, None)
+        if position is None:
+            return
+        pool = (position["token0"], position["token1"], position["fee"])
+        for index, key in ((self.by_pool, pool), (self.by_range, pool + (position["tick_lower"], position["tick_upper"]))):
+            index[key].discard(token_id)
+            if not index[key]:
+                del index[key]
+
+    def _read_positions(self, reader: BlockchainClient, token_ids: list):
+        for token_id, info in zip(token_ids, reader.batch_call([self.nft_manager.functions.positions(token_id) for token_id in token_ids])):
+            self._put(token_id, info)
+
+    def discover(self) -> int:
+        """(Re)builds the index from the chain. Returns the number of position NFTs the wallet owns."""
+        with self._lock:
+            return self._discover()
+
+    def _discover(self) -> int:
+        block_number = self.client.w3.eth.block_number
+        reader = self._reader(block_number)
+        count = reader.call(self.nft_manager.functions.balanceOf(self.owner))
+        token_ids = reader.batch_call([self.nft_manager.functions.tokenOfOwnerByIndex(self.owner, index) for index in range(count)])
+        self.positions, self.by_pool, self.by_range = {}, {}, {}
+        self._read_positions(reader, token_ids)
+        self.synced_block = block_number
+        # +1 for the block number itself.
+        print(f"Discovered {count} positions in {len(self.by_pool)} pools at block {block_number} "
+              f"({reader.cycle.rpc_requests + 1} RPC requests).")
+        return count
+
+    def sync(self) -> bool:
+        """Applies the position manager's logs since the last sync (discovers first if needed). Returns True if anything changed."""
+        with self._lock:
+            if self.synced_block is None:
+                self._discover()
+                return True
+            head = self.client.w3.eth.block_number
+            if head <= self.synced_block:
+                return False
+            if head - self.synced_block > self.config.EVENT_MAX_BLOCK_RANGE:
+                print(f"Position index is {head - self.synced_block} blocks behind. Rediscovering...")
+                self._discover()
+                return True
+            span = {"address": self.nft_manager.address, "fromBlock": self.synced_block + 1, "toBlock": head}
+            logs = self.client.w3.eth.get_logs({**span, "topics": [self.TRANSFER_TOPIC, None, self.owner_topic]})
+            logs += self.client.w3.eth.get_logs({**span, "topics": [self.TRANSFER_TOPIC, self.owner_topic]})
+            owned = sorted(self.positions)
+            for start in range(0, len(owned), self.TOKEN_ID_TOPICS_PER_REQUEST):
+                id_topics = ["0x" + token_id.to_bytes(32, "big").hex() for token_id in owned[start:start + self.TOKEN_ID_TOPICS_PER_REQUEST]]
+                logs += self.client.w3.eth.get_logs({**span, "topics": [[self.INCREASE_LIQUIDITY_TOPIC, self.DECREASE_LIQUIDITY_TOPIC], id_topics]})
+            logs.sort(key=lambda log: (log["blockNumber"], log["logIndex"]))
+
+            arrived = set() # Owned at `head` after a transfer in: read again below rather than replayed
+            for log in logs:
+                topics = log["topics"]
+                token_id = int.from_bytes(bytes(topics[-1] if bytes(topics[0]) == self.TRANSFER_TOPIC else topics[1]), "big")
+                if bytes(topics[0]) == self.TRANSFER_TOPIC:
+                    if bytes(topics[2])[-20:] == bytes.fromhex(self.owner[2:]):
+                        arrived.add(token_id)
+                    else:
+                        arrived.discard(token_id)
+                        self._remove(token_id)
+                elif token_id in self.positions and token_id not in arrived:
+                    liquidity_delta = int.from_bytes(bytes(log["data"])[:32], "big")
+                    sign = 1 if bytes(topics[0]) == self.INCREASE_LIQUIDITY_TOPIC else -1
+                    self.positions[token_id]["liquidity"] += sign * liquidity_delta
+            if arrived:
+                self._read_positions(self._reader(head), sorted(arrived))
+            self.synced_block = head
+            return bool(logs)
+
+    def find(self, token_a: str, token_b: str, fee: int, tick_lower: int = None, tick_upper: int = None,
+             min_liquidity: int = 0) -> list:
+        """Owned positions in a pool (optionally with exactly this range), most liquidity first."""
+        pool = self.pool_key(token_a, token_b, fee)
+        with self._lock:
+            if tick_lower is not None and tick_upper is not None:
+                token_ids = self.by_range.get(pool + (tick_lower, tick_upper), set())
+            else:
+                token_ids = self.by_pool.get(pool, set())
+            positions = [dict(self.positions[token_id]) for token_id in token_ids]
+        return sorted((position for position in positions if position["liquidity"] >= min_liquidity),
+                      key=lambda position: (-position["liquidity"], position["token_id"]))
+
+
 # --- 3. Uniswap V3 Liquidity Management Module ---
 class UniswapLPManager:
-    def __init__(self, client: BlockchainClient, oracle: PriceOracle):
+    def __init__(self, client: BlockchainClient, oracle: PriceOracle, pool_registry: PoolRegistry):
         self.client = client
         self.oracle = oracle
-        self.factory = client.get_contract(client.config.UNISWAP_FACTORY_ADDRESS, client.config.UNISWAP_FACTORY_ABI)
+        self.registry = pool_registry
+        self.factory = pool_registry.factory
         self.nft_manager = client.get_contract(client.config.UNISWAP_NFT_POSITION_MANAGER_ADDRESS, client.config.UNISWAP_NFT_POSITION_MANAGER_ABI)
 
     def get_pool_address(self, token0_address, token1_address, fee):
         """Retrieves the address of a Uniswap V3 pool for a given token pair and fee tier."""
-        pool_address = self.factory.functions.getPool(
-            Web3.to_checksum_address(token0_address),
-            Web3.to_checksum_address(token1_address),
-            fee
-        ).call()
-        if pool_address == "0x0000000000000000000000000000000000000000":
-            raise Exception("Pool not found for the given parameters.")
+        # Pool addresses never change, so the registry only asks the factory the first time.
+        pool_address = self.registry.get_pool(token0_address, token1_address, fee)["pool_address"]
         print(f"Pool address: {pool_address}")
         return pool_address
 
     def calculate_tick_from_price(self, price: Decimal, token0_decimals: int, token1_decimals: int) -> int:
         """
         Calculates the Uniswap V3 tick corresponding to a given price.
-        Price is defined as amount_token1 / amount_token0.
-        """
-        # Adjust price by token decimals to match the contract's internal representation
-        adjusted_price = price * Decimal(10**token0_decimals) / Decimal(10**token1_decimals) # Price is token1 per token0, so adjust accordingly
-        # The formula for tick is log_1.0001(sqrt(adjusted_price))
-        # price = (sqrtPriceX96 / 2**96)^2 * (10**decimals0 / 10**decimals1)
-        # sqrtPriceX96 = sqrt(price / (10**decimals0 / 10**decimals1)) * 2**96
-        # tick = log(sqrtPriceX96 / (2**96), sqrt(1.0001))
-        # log_sqrt(1.0001)(P) = log(P) / log(sqrt(1.0001))
-        
-        # Invert the adjustment for price to match contract representation for tick calculation
-        price_for_tick_calc = price / (Decimal(10**token1_decimals) / Decimal(10**token0_decimals))
-        
-        # It's actually: P = (1.0001)^tick, so tick = log(1.0001, P)
-        # The price provided to `calculate_tick_from_price` is price of token0 in terms of token1.
-        # i.e., how many TOKEN1 you get for 1 TOKEN0.
-        # Uniswap V3's internal price is token1 / token0.
-        # So we need to ensure `adjusted_price` matches `token1 / token0` with 18 decimals each.
-        
-        # Normalize price to a common 1e18 basis (similar to how Uniswap's sqrtPriceX96 works relative to 1e18)
-        # P_actual = price_in_human_readable * 10**(decimals0 - decimals1)
-        # The 'price' argument here is token0 per token1.
-        # Uniswap uses `sqrtPriceX96 = sqrt(P) * 2^96` where P is token1/token0.
-        # So if we have price = token0_value / token1_value (e.g., ETH/USDC), we need to invert for internal price.
-        # price_internal = 1 / price_token0_per_token1 (how much token0 for 1 token1)
-        # If your `price` is (ETH/USDC), then that's `token0_per_token1`.
-        # Uniswap internal price `P` is `token1 / token0`.
-        # So, $P = 1/price$.
-        
-        # Re-evaluating based on Uniswap V3 whitepaper for tick and price:
-        # P_tick = (1.0001)^tick
-        # The current price (P_human) is token1 per token0, adjusted by decimals.
-        # P_human = (sqrtPriceX96 / 2^96)^2 * (10^decimals1 / 10^decimals0)
-        # If `price` input is token0_per_token1 (e.g., WETH/USDC):
-        # We need to compute tick for P_internal = 1/price
-        # P_internal_adjusted = (1/price) * (10**decimals0 / 10**decimals1) # internal price is token0/token1, adjusted for common scale
-        # tick = log(P_internal_adjusted, 1.0001)
-
-        # Let's assume 'price' is indeed `price_of_token0_in_token1` (e.g., $3000 USDC/WETH)
-        # The contract's internal price P is how much TOKEN1 you get for 1 unit of TOKEN0, normalized to 1e18.
-        # P = price * (10**decimals1 / 10**decimals0)
-        
-        normalized_price = price * Decimal(10**(decimals0 - decimals1))
-        # The formula for tick is log_sqrt(1.0001)(P) where P is the raw price.
-        # P = sqrtPriceX96^2 / 2^192
-        # price_token0_per_token1 = (sqrtPriceX96 / 2**96)**2 * (10**decimals1 / 10**decimals0)
-        # Rearranging to get (sqrtPriceX96 / 2**96)
-        # sqrtPriceRatio = sqrt(price / (10**decimals1 / 10**decimals0))
-        # tick = log(sqrtPriceRatio, sqrt(1.0001))
-        # Use Decimal.log10() and Decimal.from_float() for precision
-        
-        # Corrected tick calculation based on Uniswap V3 docs:
-        # price in P = token1 / token0
-        # Given `price` as `token0_per_token1` (e.g., WETH/USDC price).
-        # We need `price_token1_per_token0 = 1 / price`.
-        # Normalized price for internal tick calculation (P_normalized):
-        # P_normalized = (1 / price) * (10**decimals0 / 10**decimals1)
-        # tick = log_1.0001(P_normalized)
-
-        price_token1_per_token0 = Decimal("1") / price
-        P_normalized = price_token1_per_token0 * Decimal(10**decimals0) / Decimal(10**decimals1)
-        
-        # log_b(x) = log_e(x) / log_e(b)
-        tick = int(P_normalized.ln() / Decimal("1.0001").ln())
-        return tick
+        The price is `token0_per_token1` (e.g. USDC per WETH when WETH is token1), the same convention
+        as `calculate_price_from_tick` and `PriceOracle.get_pool_prices`' second value.
+        Uses exact integer TickMath, so the result is the tick the pool itself would report for that price.
+        """
+        # Uniswap's internal price P = 1.0001^tick is token1 per token0, so invert before converting.
+        # P_internal = (sqrtPriceX96 / 2**96)^2 = (1 / price) * 10**(decimals1 - decimals0)
+        price_token1_per_token0 = Fraction(1) / Fraction(price)
+        return price_to_tick(price_token1_per_token0, token0_decimals, token1_decimals)
 
 
     def calculate_price_from_tick(self, tick: int, token0_decimals: int, token1_decimals: int) -> Decimal:
@@ -265,21 +1732,33 @@ class UniswapLPManager:
         Calculates the price (amount_token0 / amount_token1) from a Uniswap V3 tick.
         This function returns price as `token0_per_token1`.
         """
-        # P = 1.0001^tick. This P is `token1 / token0` (internal price)
-        internal_price = Decimal("1.0001")**tick
-        
-        # Convert internal price back to human-readable `token0_per_token1`
-        # human_readable_price = (1 / internal_price) * (10**decimals1 / 10**decimals0)
-        # The convention is usually price of token0 in terms of token1.
-        # So price = token1 / token0 (from tick) * (10**decimals0 / 10**decimals1)
-        # Adjusted price is price of token0 in terms of token1 (ETH/USDC).
-        # P_human = (sqrtPriceX96 / 2**96)^2 * (10**decimals1 / 10**decimals0)
-        # From Uniswap's current tick, it's (1.0001)^tick.
-        # This is `price_token1_per_token0_raw`.
-        
-        price_token1_per_token0_raw = Decimal("1.0001")**tick
-        price_token0_per_token1 = (Decimal("1") / price_token1_per_token0_raw) * Decimal(10**token1_decimals) / Decimal(10**token0_decimals)
-        return price_token0_per_token1
+        # P = 1.0001^tick is `token1 / token0` (internal price), computed from the exact sqrt ratio at the tick.
+        # Invert it to get the human-readable `token0_per_token1` price.
+        price_token1_per_token0 = tick_to_price(tick, token0_decimals, token1_decimals)
+        return Decimal("1") / price_token1_per_token0
+
+
+    def calculate_position_amounts(self, liquidity: int, tick_lower: int, tick_upper: int, sqrt_price_x96: int,
+                                   decimals0: int, decimals1: int) -> tuple[Decimal, Decimal]:
+        """
+        Calculates the human-readable (amount0, amount1) held by a position with `liquidity` in
+        [tick_lower, tick_upper] when the pool is at `sqrt_price_x96`.
+        """
+        # Exact integer port of LiquidityAmounts.getAmountsForLiquidity: these are the amounts the position
+        # would return if fully withdrawn at the current price (bit-exact with the NonfungiblePositionManager).
+        # - Price below the range: only token0 is left in the position
+        # - Price above the range: only token1 is left in the position
+        # - Price within [lower_tick, upper_tick]: a mix of both
+        sqrt_price_lower_x96 = get_sqrt_ratio_at_tick(tick_lower)
+        sqrt_price_upper_x96 = get_sqrt_ratio_at_tick(tick_upper)
+        amount0_current, amount1_current = get_amounts_for_liquidity(
+            int(sqrt_price_x96), sqrt_price_lower_x96, sqrt_price_upper_x96, int(liquidity)
+        )
+
+        # Adjust for token decimals for human-readable amounts
+        amount0_human = Decimal(amount0_current) / Decimal(10**decimals0)
+        amount1_human = Decimal(amount1_current) / Decimal(10**decimals1)
+        return amount0_human, amount1_human
 
 
     def parse_mint_receipt_for_token_id(self, receipt) -> int:
@@ -306,66 +1785,112 @@ class UniswapLPManager:
             raise
 
 
-    def provide_liquidity(self, token0_amount: Decimal, token1_amount: Decimal, lower_price: Decimal, upper_price: Decimal) -> int:
-        """Provides new liquidity to a Uniswap V3 pool within a specified price range."""
-        pool_address = self.get_pool_address(self.client.config.TOKEN0_ADDRESS, self.client.config.TOKEN1_ADDRESS, self.client.config.POOL_FEE)
+    def _prepare_allowances(self, amount0_wei: int, amount1_wei: int, token0_amount: Decimal, token1_amount: Decimal):
+        """
+        What depositing the given amounts needs first, from the tracked allowances (no allowance() reads):
+        approve transactions (with gas limits) to send ahead of the deposit in one `send_transactions` sequence,
+        and selfPermit calls to put in front of the deposit inside a position manager multicall (PERMIT_TOKENS).
+        New allowances follow ALLOWANCE_POLICY, so most deposits need neither.
+        """
+        config = self.client.config
+        spender = config.UNISWAP_NFT_POSITION_MANAGER_ADDRESS
+        tracker = self.client.allowances
+        current_allowance0, current_allowance1 = tracker.get([(config.TOKEN0_ADDRESS, spender), (config.TOKEN1_ADDRESS, spender)], self.client)
+        txs, gas_limits, permit_calls = [], [], []
+        for token, symbol, current_allowance, amount_wei, amount in (
+            (config.TOKEN0_ADDRESS, config.TOKEN0_ADDRESS_SYMBOL, current_allowance0, amount0_wei, token0_amount),
+            (config.TOKEN1_ADDRESS, config.TOKEN1_ADDRESS_SYMBOL, current_allowance1, amount1_wei, token1_amount),
+        ):
+            # Check current allowance and approve if insufficient
+            if current_allowance >= amount_wei:
+                print(f"Allowance for {symbol} is sufficient.")
+                continue
+            allowance = tracker.target_allowance(token, amount_wei)
+            if tracker.uses_permit(token):
+                print(f"Signing permit for {amount} {symbol} for NFT Position Manager...")
+                deadline = int(time.time()) + 60 * 20
+                v, r, s = tracker.sign_permit(token, spender, allowance, deadline)
+                permit_calls.append(self.nft_manager.functions.selfPermit(Web3.to_checksum_address(token), allowance, deadline, v, r, s))
+            else:
+                print(f"Approving {amount} {symbol} for NFT Position Manager (allowance {allowance})...")
+                token_contract = self.client.get_contract(token, config.ERC20_ABI)
+                txs.append(token_contract.functions.approve(spender, allowance))
+                gas_limits.append(config.GAS_LIMIT_APPROVE)
+        return txs, gas_limits, permit_calls
 
-        token0_contract = self.client.get_contract(self.client.config.TOKEN0_ADDRESS, self.client.config.ERC20_ABI)
-        token1_contract = self.client.get_contract(self.client.config.TOKEN1_ADDRESS, self.client.config.ERC20_ABI)
-        decimals0 = token0_contract.functions.decimals().call()
-        decimals1 = token1_contract.functions.decimals().call()
 
-        lower_tick = self.calculate_tick_from_price(lower_price, decimals0, decimals1)
-        upper_tick = self.calculate_tick_from_price(upper_price, decimals0, decimals1)
+    def _with_permits(self, call, permit_calls: list):
+        """The deposit call itself, or a position manager multicall of the permits followed by it."""
+        if not permit_calls:
+            return call
+        return self.nft_manager.functions.multicall([self.client.encode_function(fn) for fn in permit_calls + [call]])
 
-        # Adjust ticks to the fee tier's granularity (tick spacing)
-        # Ticks must be multiples of tick_spacing for the chosen fee tier.
-        tick_spacing = self.client.config.POOL_FEE // 50 # e.g. 3000 / 50 = 60
-        lower_tick = (lower_tick // tick_spacing) * tick_spacing
-        upper_tick = (upper_tick // tick_spacing) * tick_spacing
-        # Ensure upper tick is greater than lower tick to form a valid range
-        if upper_tick <= lower_tick:
-            upper_tick = lower_tick + tick_spacing
 
+    def provide_liquidity(self, token0_amount: Decimal, token1_amount: Decimal, lower_price: Decimal, upper_price: Decimal,
+                          urgency: str = None, swap: bool = False) -> int:
+        """
+        Provides new liquidity to a Uniswap V3 pool within a specified price range.
+        urgency: fee level for the approvals and mint (FeeOracle); FEE_URGENCY_DEFAULT when None.
+        swap: first swap the amounts to the range's ratio (REBALANCE_SWAP), for re-deposits of a rebalance.
+        """
+        pool = self.registry.get_pool(self.client.config.TOKEN0_ADDRESS, self.client.config.TOKEN1_ADDRESS, self.client.config.POOL_FEE)
+        decimals0 = pool["decimals0"]
+        decimals1 = pool["decimals1"]
 
         # Convert human-readable amounts to wei/raw amounts using token decimals
         amount0_wei = int(token0_amount * Decimal(10**decimals0))
         amount1_wei = int(token1_amount * Decimal(10**decimals1))
 
-        # Check current allowance for token0 and approve if insufficient
-        current_allowance0 = token0_contract.functions.allowance(
-            self.client.config.WALLET_ADDRESS, self.client.config.UNISWAP_NFT_POSITION_MANAGER_ADDRESS
-        ).call()
-        if current_allowance0 < amount0_wei:
-            print(f"Approving {token0_amount} {self.client.config.TOKEN0_ADDRESS_SYMBOL} for NFT Position Manager...")
-            approval_tx0 = token0_contract.functions.approve(
-                self.client.config.UNISWAP_NFT_POSITION_MANAGER_ADDRESS, amount0_wei
-            )
-            self.client.send_transaction(approval_tx0)
-            print(f"Approval for {self.client.config.TOKEN0_ADDRESS_SYMBOL} successful.")
-        else:
-            print(f"Allowance for {self.client.config.TOKEN0_ADDRESS_SYMBOL} is sufficient.")
-
-        # Check current allowance for token1 and approve if insufficient
-        current_allowance1 = token1_contract.functions.allowance(
-            self.client.config.WALLET_ADDRESS, self.client.config.UNISWAP_NFT_POSITION_MANAGER_ADDRESS
-        ).call()
-        if current_allowance1 < amount1_wei:
-            print(f"Approving {token1_amount} {self.client.config.TOKEN1_ADDRESS_SYMBOL} for NFT Position Manager...")
-            approval_tx1 = token1_contract.functions.approve(
-                self.client.config.UNISWAP_NFT_POSITION_MANAGER_ADDRESS, amount1_wei
-            )
-            self.client.send_transaction(approval_tx1)
-            print(f"Approval for {self.client.config.TOKEN1_ADDRESS_SYMBOL} successful.")
-        else:
-            print(f"Allowance for {self.client.config.TOKEN1_ADDRESS_SYMBOL} is sufficient.")
+        sqrt_price_x96 = None
+        if swap and self.client.config.REBALANCE_SWAP:
+            amount0_wei, amount1_wei, sqrt_price_x96 = self.swap_for_range(pool, amount0_wei, amount1_wei, lower_price, upper_price, urgency)
+            token0_amount = Decimal(amount0_wei) / Decimal(10**decimals0)
+            token1_amount = Decimal(amount1_wei) / Decimal(10**decimals1)
+        if sqrt_price_x96 is None:
+            pool_contract = self.client.get_contract(pool["pool_address"], self.client.config.UNISWAP_POOL_ABI)
+            sqrt_price_x96 = self.client.call(pool_contract.functions.slot0())[0]
+
+        # Approvals (if needed, from the tracked allowances) and the mint are sent back-to-back and confirmed together.
+        txs, gas_limits, permit_calls = self._prepare_allowances(amount0_wei, amount1_wei, token0_amount, token1_amount)
+
+        # Build and send the mint transaction right behind the approvals (with any permits in front of it).
+        mint_tx = self._with_permits(
+            self.nft_manager.functions.mint(self._mint_params(pool, amount0_wei, amount1_wei, lower_price, upper_price, sqrt_price_x96)),
+            permit_calls
+        )
+        txs.append(mint_tx)
+        # With approvals still pending, the mint's gas can't be estimated yet.
+        gas_limits.append(self.client.config.GAS_LIMIT_MINT if gas_limits else None)
+        mint_receipt = self.client.send_transactions(txs, gas_limits, urgency)[-1]
+        print(f"Mint transaction sent. Receipt: {mint_receipt.transactionHash.hex()}")
+        
+        # Parse the transaction receipt to get the tokenId.
+        token_id = self.parse_mint_receipt_for_token_id(mint_receipt)
+        return token_id # Return the actual tokenId
+
 
+    def _mint_params(self, pool: dict, amount0_wei: int, amount1_wei: int, lower_price: Decimal, upper_price: Decimal,
+                     sqrt_price_x96: int) -> dict:
+        """
+        Parameters of a `mint` of the given raw amounts into the range [lower_price, upper_price] (token0_per_token1),
+        with minimum amounts from what the range takes of them at `sqrt_price_x96`.
+        """
+        # Convert the prices to ticks (same as calculate_tick_from_price) and adjust them to the fee tier's
+        # granularity (tick spacing). Ticks must be multiples of tick_spacing for the chosen fee tier.
+        # Read from the pool's tickSpacing() (e.g. 10 for 0.05%, 60 for 0.3%, 200 for 1%) and cached by the registry.
+        # Higher token0_per_token1 prices map to lower ticks, so the ticks are also put in order here,
+        # and the range is widened to one tick spacing if both ends round to the same tick.
+        tick_spacing = pool["tick_spacing"]
+        lower_tick, upper_tick = range_ticks_for_prices(lower_price, upper_price, pool["decimals0"], pool["decimals1"], tick_spacing)
+        used0, used1 = self.range_amounts(sqrt_price_x96, lower_tick, upper_tick, amount0_wei, amount1_wei)
 
         # Parameters for the `mint` function of the NFT Position Manager contract.
-        # amount0Min/amount1Min: Slippage tolerance. Ensure you don't receive less than expected.
+        # amount0Min/amount1Min: Slippage tolerance on what the pool will actually take. The range takes the desired
+        # amounts in its own ratio only, so the minimums are derived from the liquidity they buy, not from the desired
+        # amounts (a one-sided or off-ratio deposit would otherwise always fail the check).
         # recipient: The address that will receive the NFT representing the LP position.
         # deadline: The timestamp after which the transaction will revert if not processed.
-        params = {
+        return {
             'token0': Web3.to_checksum_address(self.client.config.TOKEN0_ADDRESS),
             'token1': Web3.to_checksum_address(self.client.config.TOKEN1_ADDRESS),
             'fee': self.client.config.POOL_FEE,
@@ -373,25 +1898,174 @@ class UniswapLPManager:
             'tickUpper': upper_tick,
             'amount0Desired': amount0_wei,
             'amount1Desired': amount1_wei,
-            'amount0Min': int(amount0_wei * Decimal("0.99")), # 1% slippage tolerance
-            'amount1Min': int(amount1_wei * Decimal("0.99")), # 1% slippage tolerance
+            'amount0Min': min_amount(used0, self.client.config.MINT_SLIPPAGE), # e.g. 1% slippage tolerance
+            'amount1Min': min_amount(used1, self.client.config.MINT_SLIPPAGE), # e.g. 1% slippage tolerance
             'recipient': self.client.config.WALLET_ADDRESS,
             'deadline': int(time.time()) + 60 * 20 # 20 minutes from now
         }
 
-        # Build and send the mint transaction.
-        mint_tx = self.nft_manager.functions.mint(params)
-        mint_receipt = self.client.send_transaction(mint_tx)
-        print(f"Mint transaction sent. Receipt: {mint_receipt.transactionHash.hex()}")
-        
-        # Parse the transaction receipt to get the tokenId.
-        token_id = self.parse_mint_receipt_for_token_id(mint_receipt)
-        return token_id # Return the actual tokenId
 
+    @staticmethod
+    def range_amounts(sqrt_price_x96: int, tick_lower: int, tick_upper: int, amount0_wei: int, amount1_wei: int) -> tuple[int, int]:
+        """The raw amounts a deposit of at most (amount0_wei, amount1_wei) into [tick_lower, tick_upper] uses at this price."""
+        sqrt_lower, sqrt_upper = get_sqrt_ratio_at_tick(tick_lower), get_sqrt_ratio_at_tick(tick_upper)
+        liquidity = get_liquidity_for_amounts(sqrt_price_x96, sqrt_lower, sqrt_upper, amount0_wei, amount1_wei)
+        return get_amounts_for_liquidity(sqrt_price_x96, sqrt_lower, sqrt_upper, liquidity)
+
+
+    def plan_redeposit(self, pool: dict, sqrt_price_x96: int, amount0_wei: int, amount1_wei: int,
+                       lower_price: Decimal, upper_price: Decimal) -> tuple[int, tuple]:
+        """
+        What re-depositing raw amounts into [lower_price, upper_price] at `sqrt_price_x96` takes: the liquidity they
+        buy as they are, and the swap to the range's ratio (zero_for_one, amount_in, expected_out) that REBALANCE_SWAP
+        would send first, or None when no swap is needed (or swaps are off).
+        """
+        config = self.client.config
+        lower_tick, upper_tick = range_ticks_for_prices(lower_price, upper_price, pool["decimals0"], pool["decimals1"], pool["tick_spacing"])
+        sqrt_lower, sqrt_upper = get_sqrt_ratio_at_tick(lower_tick), get_sqrt_ratio_at_tick(upper_tick)
+        liquidity = get_liquidity_for_amounts(sqrt_price_x96, sqrt_lower, sqrt_upper, amount0_wei, amount1_wei)
+        if not config.REBALANCE_SWAP:
+            return liquidity, None
+        swap = swap_to_range(amount0_wei, amount1_wei, sqrt_price_x96, sqrt_lower, sqrt_upper, config.POOL_FEE,
+                             config.REBALANCE_SWAP_MIN_SHARE)
+        return liquidity, (swap if swap[1] > 0 else None)
+
+
+    def swap_for_range(self, pool: dict, amount0_wei: int, amount1_wei: int, lower_price: Decimal, upper_price: Decimal,
+                       urgency: str = None) -> tuple[int, int, int]:
+        """
+        Swaps raw (amount0_wei, amount1_wei) to the ratio the range [lower_price, upper_price] takes at the current
+        price, with one SwapRouter.exactInputSingle through the position's own pool (plus an approval of the router
+        if needed, sent back-to-back).
+        Returns the amounts after the swap and the pool's sqrtPriceX96 right after it (None when no swap was needed).
+        """
+        config = self.client.config
+        pool_contract = self.client.get_contract(pool["pool_address"], config.UNISWAP_POOL_ABI)
+        sqrt_price_x96 = self.client.call(pool_contract.functions.slot0())[0]
+        _, swap = self.plan_redeposit(pool, sqrt_price_x96, amount0_wei, amount1_wei, lower_price, upper_price)
+        if swap is None:
+            return amount0_wei, amount1_wei, None
+        zero_for_one, amount_in, expected_out = swap
+        token_in, token_out = (config.TOKEN0_ADDRESS, config.TOKEN1_ADDRESS) if zero_for_one else (config.TOKEN1_ADDRESS, config.TOKEN0_ADDRESS)
+
+        txs, gas_limits = [], []
+        tracker = self.client.allowances
+        allowance, = tracker.get([(token_in, config.SWAP_ROUTER_ADDRESS)], self.client)
+        if allowance < amount_in:
+            # The router pulls the input with transferFrom: permits (PERMIT_TOKENS) only cover the position manager.
+            token_contract = self.client.get_contract(token_in, config.ERC20_ABI)
+            txs.append(token_contract.functions.approve(config.SWAP_ROUTER_ADDRESS, tracker.target_allowance(token_in, amount_in)))
+            gas_limits.append(config.GAS_LIMIT_APPROVE)
+        router = self.client.get_contract(config.SWAP_ROUTER_ADDRESS, config.SWAP_ROUTER_ABI)
+        txs.append(router.functions.exactInputSingle({
+            'tokenIn': Web3.to_checksum_address(token_in),
+            'tokenOut': Web3.to_checksum_address(token_out),
+            'fee': config.POOL_FEE,
+            'recipient': config.WALLET_ADDRESS,
+            'deadline': int(time.time()) + 60 * 20,
+            'amountIn': amount_in,
+            'amountOutMinimum': min_amount(expected_out, config.SWAP_SLIPPAGE),
+            'sqrtPriceLimitX96': 0
+        }))
+        gas_limits.append(config.GAS_LIMIT_SWAP if gas_limits else None)
+        print(f"Swapping {amount_in} raw {'token0' if zero_for_one else 'token1'} to the new range's ratio (expecting {expected_out})...")
+        receipt = self.client.send_transactions(txs, gas_limits, urgency)[-1]
+        delta0, delta1, sqrt_price_x96 = self.parse_swap_receipt(receipt, pool)
+        print(f"Swap landed in block {receipt.blockNumber}: pool amounts {delta0}, {delta1}. Receipt: {receipt.transactionHash.hex()}")
+        return amount0_wei - delta0, amount1_wei - delta1, sqrt_price_x96
+
+
+    def parse_swap_receipt(self, receipt, pool: dict) -> tuple[int, int, int]:
+        """
+        The pool's Swap event in a swap receipt: raw amount0 and amount1 (positive = paid into the pool, negative =
+        received) and the sqrtPriceX96 after the swap.
+        """
+        pool_contract = self.client.get_contract(pool["pool_address"], self.client.config.UNISWAP_POOL_ABI)
+        swaps = pool_contract.events.Swap().process_receipt(receipt)
+        if not swaps:
+            raise Exception(f"No Swap event found in transaction {receipt.transactionHash.hex()}")
+        args = swaps[0]['args']
+        return args['amount0'], args['amount1'], args['sqrtPriceX96']
+
+
+    def rebalance_position(self, token_id: int, position_info, lower_price: Decimal, upper_price: Decimal,
+                           urgency: str = None) -> tuple[int, Decimal, Decimal]:
+        """
+        Moves a position to a new range in ONE transaction: a NonfungiblePositionManager.multicall of
+        decreaseLiquidity(all) + collect(max) + burn + mint. Either all of it lands or none of it does, so the
+        bot can't be left half-withdrawn, and it costs one transaction's overhead instead of three to five.
+
+        The mint can't use the decrease's result inside the call, so its desired amounts are the principal the
+        decrease returns at the cycle's pinned price (exact Q64.96 math), and its minimums come from what the new
+        range takes of them at that price. If the price moves past the slippage tolerance before inclusion, the
+        decrease's or mint's minimum amounts revert the whole call and the old position stays as it was.
+        There is no swap in the call: `rebalance_lp` only takes this path when `plan_redeposit` finds none is needed.
+        Returns (new tokenId, recovered token0, recovered token1) with human amounts (principal only; fees stay in the wallet).
+        """
+        config = self.client.config
+        pool = self.registry.get_pool(config.TOKEN0_ADDRESS, config.TOKEN1_ADDRESS, config.POOL_FEE)
+        liquidity = position_info[7]
+        sqrt_price_x96, expected0, expected1 = self.expected_withdrawal(position_info[5], position_info[6], liquidity)
+        deadline = int(time.time()) + 60 * 20
+
+        calls = []
+        if liquidity > 0:
+            calls.append(self.nft_manager.functions.decreaseLiquidity({
+                'tokenId': token_id,
+                'liquidity': liquidity,
+                'amount0Min': min_amount(expected0, config.MINT_SLIPPAGE),
+                'amount1Min': min_amount(expected1, config.MINT_SLIPPAGE),
+                'deadline': deadline
+            }))
+        # Sweep the withdrawn principal and fees; burn requires the position to owe nothing.
+        calls.append(self.collect_tx(token_id))
+        calls.append(self.nft_manager.functions.burn(token_id))
+        calls.append(self.nft_manager.functions.mint(self._mint_params(pool, expected0, expected1, lower_price, upper_price, sqrt_price_x96)))
+
+        # Inside the multicall, mint pulls the tokens from our wallet like a direct mint, so it needs the same allowances.
+        txs, gas_limits, permit_calls = self._prepare_allowances(
+            expected0, expected1,
+            Decimal(expected0) / Decimal(10**pool["decimals0"]), Decimal(expected1) / Decimal(10**pool["decimals1"])
+        )
+        rebalance_tx = self.nft_manager.functions.multicall([self.client.encode_function(call) for call in permit_calls + calls])
+        txs.append(rebalance_tx)
+        gas_limits.append(config.GAS_LIMIT_REBALANCE if gas_limits else None)
+        receipt = self.client.send_transactions(txs, gas_limits, urgency)[-1]
+        print(f"Atomic rebalance of position {token_id} landed in block {receipt.blockNumber}: {receipt.transactionHash.hex()}")
+        return self.parse_rebalance_receipt(receipt, pool)
 
+
+    def parse_rebalance_receipt(self, receipt, pool: dict) -> tuple[int, Decimal, Decimal]:
+        """
+        Reads the outcome of an atomic rebalance from its single receipt:
+        DecreaseLiquidity (principal withdrawn), Collect (principal + fees paid out) and IncreaseLiquidity
+        (the new position's tokenId, liquidity and deposited amounts).
+        """
+        decimals0, decimals1 = pool["decimals0"], pool["decimals1"]
+        decreases = self.nft_manager.events.DecreaseLiquidity().process_receipt(receipt)
+        collects = self.nft_manager.events.Collect().process_receipt(receipt)
+        increases = self.nft_manager.events.IncreaseLiquidity().process_receipt(receipt)
+        if not increases:
+            raise Exception(f"No IncreaseLiquidity event found in transaction {receipt.transactionHash.hex()}")
+
+        recovered0 = Decimal(decreases[0]['args']['amount0'] if decreases else 0) / Decimal(10**decimals0)
+        recovered1 = Decimal(decreases[0]['args']['amount1'] if decreases else 0) / Decimal(10**decimals1)
+        if collects:
+            fees0 = Decimal(collects[0]['args']['amount0']) / Decimal(10**decimals0) - recovered0
+            fees1 = Decimal(collects[0]['args']['amount1']) / Decimal(10**decimals1) - recovered1
+            print(f"Collected fees: {fees0} {self.client.config.TOKEN0_ADDRESS_SYMBOL}, {fees1} {self.client.config.TOKEN1_ADDRESS_SYMBOL}")
+        new_position = increases[0]['args']
+        deposited0 = Decimal(new_position['amount0']) / Decimal(10**decimals0)
+        deposited1 = Decimal(new_position['amount1']) / Decimal(10**decimals1)
+        print(f"Recovered {recovered0} {self.client.config.TOKEN0_ADDRESS_SYMBOL} and {recovered1} {self.client.config.TOKEN1_ADDRESS_SYMBOL}; "
+              f"new position {new_position['tokenId']} holds {deposited0} / {deposited1} (liquidity {new_position['liquidity']}).")
+        return new_position['tokenId'], recovered0, recovered1
+
+
+    @METRICS.timed("position_info")
     def get_position_info(self, token_id: int):
         """Gets detailed information about a Uniswap V3 NFT position."""
-        position_data = self.nft_manager.functions.positions(token_id).call()
+        position_data = self.client.call(self.nft_manager.functions.positions(token_id))
         # position_data tuple: (nonce, operator, token0, token1, fee, tickLower, tickUpper,
         # liquidity, feeGrowthOutside0X128, feeGrowthOutside1X128, tokensOwed0, tokensOwed1)
         print(f"Position {token_id} info: {position_data}")
@@ -400,43 +2074,84 @@ class UniswapLPManager:
     def collect_fees(self, token_id: int):
         """Collects accrued fees from an LP position."""
         position_data = self.get_position_info(token_id)
-        tokens_owed0 = position_data[9] # tokensOwed0 (fee amounts)
-        tokens_owed1 = position_data[10] # tokensOwed1 (fee amounts)
+        tokens_owed0 = position_data[10] # tokensOwed0 (fee amounts)
+        tokens_owed1 = position_data[11] # tokensOwed1 (fee amounts)
 
         if tokens_owed0 == 0 and tokens_owed1 == 0:
             print(f"No fees to collect for position {token_id}.")
             return
 
-        # Parameters for the `collect` function.
-        # amount0Max/amount1Max: Max amounts to collect. Usually set to the owed amounts.
+        # Build and send the collect transaction.
+        collect_tx = self.collect_tx(token_id)
+        # Routine fee collection isn't time-critical: use the cheap fee level.
+        collect_receipt = self.client.send_transaction(collect_tx, self.client.config.FEE_URGENCY_ROUTINE)
+        print(f"Fees collected for position {token_id}. Receipt: {collect_receipt.transactionHash.hex()}")
+
+
+    def collect_tx(self, token_id: int):
+        """
+        A `collect` of everything the position is owed. amount0Max/amount1Max are set to the uint128 maximum
+        (rather than the tokensOwed read now) so the call also sweeps amounts that only become owed in the same
+        block, e.g. right after a pending decreaseLiquidity.
+        """
         params = {
             'tokenId': token_id,
             'recipient': self.client.config.WALLET_ADDRESS,
-            'amount0Max': tokens_owed0,
-            'amount1Max': tokens_owed1
+            'amount0Max': MAX_UINT128,
+            'amount1Max': MAX_UINT128
         }
+        return self.nft_manager.functions.collect(params)
 
-        # Build and send the collect transaction.
-        collect_tx = self.nft_manager.functions.collect(params)
-        collect_receipt = self.client.send_transaction(collect_tx)
-        print(f"Fees collected for position {token_id}. Receipt: {collect_receipt.transactionHash.hex()}")
 
+    def expected_withdrawal(self, tick_lower: int, tick_upper: int, liquidity: int) -> tuple[int, int, int]:
+        """
+        (sqrtPriceX96, amount0, amount1): the pool's price at the cycle's pinned block and the principal, in raw units,
+        that removing `liquidity` from the range would return at that price (exact Q64.96 math).
+        """
+        config = self.client.config
+        pool = self.registry.get_pool(config.TOKEN0_ADDRESS, config.TOKEN1_ADDRESS, config.POOL_FEE)
+        pool_contract = self.client.get_contract(pool["pool_address"], config.UNISWAP_POOL_ABI)
+        sqrt_price_x96 = self.client.call(pool_contract.functions.slot0())[0]
+        amount0, amount1 = get_amounts_for_liquidity(
+            sqrt_price_x96, get_sqrt_ratio_at_tick(tick_lower), get_sqrt_ratio_at_tick(tick_upper), liquidity
+        )
+        return sqrt_price_x96, amount0, amount1
 
-    def decrease_liquidity(self, token_id: int, liquidity_to_remove: int) -> tuple[Decimal, Decimal]:
-        """Decreases liquidity from an LP position."""
+    def decrease_liquidity(self, token_id: int, liquidity_to_remove: int, collect: bool = False,
+                           urgency: str = None) -> tuple[Decimal, Decimal]:
+        """
+        Decreases liquidity from an LP position.
+        With collect=True, a collect of everything owed (withdrawn principal and fees) is sent right behind the
+        decrease and both are confirmed together.
+        urgency: fee level (FeeOracle); FEE_URGENCY_DEFAULT when None.
+        """
+        position_info = self.client.call(self.nft_manager.functions.positions(token_id))
+        _, expected0, expected1 = self.expected_withdrawal(position_info[5], position_info[6], liquidity_to_remove)
         # Parameters for the `decreaseLiquidity` function.
-        # amount0Min/amount1Min: Slippage tolerance for tokens received after removing liquidity.
+        # amount0Min/amount1Min: Slippage tolerance for tokens received after removing liquidity, from what the
+        # decrease returns at the pinned price (as in `rebalance_position`), so a price pushed against us before
+        # inclusion reverts it instead of withdrawing at a loss.
         params = {
             'tokenId': token_id,
             'liquidity': liquidity_to_remove, # Amount of liquidity (not tokens) to remove
-            'amount0Min': 0, # Set to 0 for simplicity, but in production, use a non-zero value based on slippage
-            'amount1Min': 0,
+            'amount0Min': min_amount(expected0, self.client.config.MINT_SLIPPAGE),
+            'amount1Min': min_amount(expected1, self.client.config.MINT_SLIPPAGE),
             'deadline': int(time.time()) + 60 * 20
         }
         decrease_tx = self.nft_manager.functions.decreaseLiquidity(params)
-        decrease_receipt = self.client.send_transaction(decrease_tx)
+        if collect:
+            decrease_receipt, collect_receipt = self.client.send_transactions(
+                [decrease_tx, self.collect_tx(token_id)], [None, self.client.config.GAS_LIMIT_COLLECT], urgency
+            )
+            print(f"Withdrawn tokens and fees collected for position {token_id}. Receipt: {collect_receipt.transactionHash.hex()}")
+        else:
+            decrease_receipt = self.client.send_transaction(decrease_tx, urgency)
         print(f"Liquidity decreased for {token_id} by {liquidity_to_remove}. Receipt: {decrease_receipt.transactionHash.hex()}")
-        
+        return self.parse_decrease_receipt(decrease_receipt)
+
+
+    def parse_decrease_receipt(self, decrease_receipt) -> tuple[Decimal, Decimal]:
+        """The (token0, token1) principal a decreaseLiquidity withdrew, in human amounts, from its receipt."""
         # --- START OF TODO 4 IMPLEMENTATION (Parse recovered amounts) ---
         # Parse the transaction receipt to get the amounts of tokens received.
         # The 'DecreaseLiquidity' event is emitted:
@@ -465,136 +2180,151 @@ class UniswapLPManager:
 
     def increase_liquidity(self, token_id: int, token0_amount: Decimal, token1_amount: Decimal):
         """Increases liquidity for an existing LP position."""
-        token0_contract = self.client.get_contract(self.client.config.TOKEN0_ADDRESS, self.client.config.ERC20_ABI)
-        token1_contract = self.client.get_contract(self.client.config.TOKEN1_ADDRESS, self.client.config.ERC20_ABI)
-        decimals0 = token0_contract.functions.decimals().call()
-        decimals1 = token1_contract.functions.decimals().call()
+        decimals0 = self.registry.get_token_decimals(self.client.config.TOKEN0_ADDRESS)
+        decimals1 = self.registry.get_token_decimals(self.client.config.TOKEN1_ADDRESS)
 
         amount0_wei = int(token0_amount * Decimal(10**decimals0))
         amount1_wei = int(token1_amount * Decimal(10**decimals1))
 
         # Check and approve tokens again for increasing liquidity, as amounts might exceed previous approvals
-        # This logic is similar to `provide_liquidity`'s approval block.
-        current_allowance0 = token0_contract.functions.allowance(
-            self.client.config.WALLET_ADDRESS, self.client.config.UNISWAP_NFT_POSITION_MANAGER_ADDRESS
-        ).call()
-        if current_allowance0 < amount0_wei:
-            print(f"Approving {token0_amount} {self.client.config.TOKEN0_ADDRESS_SYMBOL} for NFT Position Manager (increase)...")
-            approval_tx0 = token0_contract.functions.approve(
-                self.client.config.UNISWAP_NFT_POSITION_MANAGER_ADDRESS, amount0_wei
-            )
-            self.client.send_transaction(approval_tx0)
-        else:
-            print(f"Allowance for {self.client.config.TOKEN0_ADDRESS_SYMBOL} is sufficient for increase.")
-
-        current_allowance1 = token1_contract.functions.allowance(
-            self.client.config.WALLET_ADDRESS, self.client.config.UNISWAP_NFT_POSITION_MANAGER_ADDRESS
-        ).call()
-        if current_allowance1 < amount1_wei:
-            print(f"Approving {token1_amount} {self.client.config.TOKEN1_ADDRESS_SYMBOL} for NFT Position Manager (increase)...")
-            approval_tx1 = token1_contract.functions.approve(
-                self.client.config.UNISWAP_NFT_POSITION_MANAGER_ADDRESS, amount1_wei
-            )
-            self.client.send_transaction(approval_tx1)
-        else:
-            print(f"Allowance for {self.client.config.TOKEN1_ADDRESS_SYMBOL} is sufficient for increase.")
+        # Same approval logic as `provide_liquidity`; approvals and the increase are sent back-to-back.
+        txs, gas_limits, permit_calls = self._prepare_allowances(amount0_wei, amount1_wei, token0_amount, token1_amount)
+
+        # As for a mint, the minimums are what the position's range takes of the desired amounts at the current price.
+        position_info = self.get_position_info(token_id)
+        pool_contract = self.client.get_contract(
+            self.get_pool_address(self.client.config.TOKEN0_ADDRESS, self.client.config.TOKEN1_ADDRESS, self.client.config.POOL_FEE),
+            self.client.config.UNISWAP_POOL_ABI
+        )
+        sqrt_price_x96 = self.client.call(pool_contract.functions.slot0())[0]
+        used0, used1 = self.range_amounts(sqrt_price_x96, position_info[5], position_info[6], amount0_wei, amount1_wei)
 
         # Parameters for the `increaseLiquidity` function.
         params = {
             'tokenId': token_id,
             'amount0Desired': amount0_wei,
             'amount1Desired': amount1_wei,
-            'amount0Min': int(amount0_wei * Decimal("0.99")),
-            'amount1Min': int(amount1_wei * Decimal("0.99")),
+            'amount0Min': min_amount(used0, self.client.config.MINT_SLIPPAGE),
+            'amount1Min': min_amount(used1, self.client.config.MINT_SLIPPAGE),
             'deadline': int(time.time()) + 60 * 20
         }
-        increase_tx = self.nft_manager.functions.increaseLiquidity(params)
-        increase_receipt = self.client.send_transaction(increase_tx)
+        increase_tx = self._with_permits(self.nft_manager.functions.increaseLiquidity(params), permit_calls)
+        txs.append(increase_tx)
+        gas_limits.append(self.client.config.GAS_LIMIT_INCREASE if gas_limits else None)
+        increase_receipt = self.client.send_transactions(txs, gas_limits)[-1]
         print(f"Liquidity increased for {token_id} with {token0_amount} {self.client.config.TOKEN0_ADDRESS_SYMBOL} and {token1_amount} {self.client.config.TOKEN1_ADDRESS_SYMBOL}. Receipt: {increase_receipt.transactionHash.hex()}")
 
 
 # --- 4. Derivatives Management Module (for Delta Neutral) ---
-# --- START OF TODO 5 IMPLEMENTATION (DerivativesManager with conceptual client) ---
-class DerivativesClient:
-    """Conceptual client for interacting with a derivatives exchange."""
-    def __init__(self, api_key: str, api_secret: str):
-        self.api_key = api_key
-        self.api_secret = api_secret
-        print("DerivativesClient initialized. (In a real scenario, this connects to a CEX/DEX SDK)")
-        # In a real scenario, you'd initialize a client for Binance, dYdX, etc.
-        # Example for a hypothetical Binance client:
-        # self.binance_client = Client(api_key, api_secret)
-
-    def get_market_price(self, symbol: str) -> Decimal:
-        """Gets the current market price of the perpetual/futures contract."""
-        print(f"Fetching market price for {symbol}...")
-        # This would be a real API call. Dummy value for demonstration.
-        # Example for Binance:
-        # ticker = self.binance_client.get_symbol_ticker(symbol=symbol)
-        # return Decimal(ticker['price'])
-        return Decimal("3000") # Dummy ETH-PERP price
-
-    def get_current_position(self, symbol: str) -> Decimal:
-        """Gets the current open position size for a given symbol."""
-        print(f"Fetching current position for {symbol}...")
-        # This would be a real API call to check your open futures/perpetual positions.
-        # Example for Binance:
-        # account_info = self.binance_client.futures_account()
-        # for position in account_info['positions']:
-        #     if position['symbol'] == symbol:
-        #         return Decimal(position['positionAmt']) # Returns amount, positive for long, negative for short
-        return Decimal("0") # Dummy: assume no open position initially
-
-    def place_order(self, symbol: str, side: str, amount: Decimal, order_type: str = "MARKET"):
-        """Places a market order on the derivatives exchange."""
-        print(f"Placing {side} {amount} {symbol} {order_type} order. (This would be a real API call)")
-        # This would be a real API call to execute a trade.
-        # Example for Binance:
-        # order = self.binance_client.futures_create_order(
-        #     symbol=symbol,
-        #     side=side, # 'BUY' or 'SELL'
-        #     type=order_type,
-        #     quantity=str(amount.normalize()) # Convert Decimal to string
-        # )
-        # print(f"Order placed: {order}")
-        print(f"Simulated order: {side} {amount} {symbol}")
+def make_exchange_adapter(config: Config) -> ExchangeAdapter:
+    """The venue adapter selected by DERIVATIVES_EXCHANGE (see uniswap_lp_derivatives.py)."""
+    if config.DERIVATIVES_EXCHANGE == "paper":
+        return PaperExchange({config.SHORT_TOKEN_SYMBOL: config.DERIVATIVES_PAPER_MARK})
+    if config.DERIVATIVES_EXCHANGE == "rest":
+        return RestStreamExchange(config.DERIVATIVES_EXCHANGE_URL, config.DERIVATIVES_EXCHANGE_API_KEY,
+                                  config.DERIVATIVES_EXCHANGE_API_SECRET, config.DERIVATIVES_STREAM_URL or None,
+                                  config.DERIVATIVES_TIMEOUT)
+    raise ValueError(f"Unknown DERIVATIVES_EXCHANGE: {config.DERIVATIVES_EXCHANGE}")
 
 
 class DerivativesManager:
-    def __init__(self, config: Config):
+    """
+    Hedge positions on the derivatives venue. Positions and mark prices come from a local cache kept current by the
+    venue's fill/position stream, so reading them costs no round trip; orders are sent in the background and
+    counted as pending until their fills arrive, so the next check doesn't order the same adjustment twice.
+    """
+    def __init__(self, config: Config, journal: StateJournal = None):
         self.config = config
-        self.client = DerivativesClient(config.DERIVATIVES_EXCHANGE_API_KEY, config.DERIVATIVES_EXCHANGE_API_SECRET)
-
+        # Connects in the background (overlapping the bot's first chain reads); every method that needs the
+        # venue waits for it first (`_ready`).
+        self.session = ExchangeSession(make_exchange_adapter(config), connect_timeout=config.DERIVATIVES_TIMEOUT,
+                                       background=True)
+        self.cache = self.session.cache
+        # Every order and its acknowledgement is journaled when a journal is given (see uniswap_lp_journal.py).
+        self.journal = journal
+        self._started = False
+        print(f"Derivatives session starting ({config.DERIVATIVES_EXCHANGE})...")
+
+    def _ready(self):
+        """Waits for the session's initial connect and snapshot (once; a failed start is retried on the next call)."""
+        if not self._started:
+            self.session.wait_started(self.config.DERIVATIVES_TIMEOUT)
+            self._started = True
+            print(f"Derivatives session started ({self.config.DERIVATIVES_EXCHANGE}). Positions: {self.cache.positions}")
+
+    @METRICS.timed("derivatives_position")
     def get_position_size(self, symbol: str) -> Decimal:
-        """Gets the current position size in the derivatives market for a given symbol."""
-        return self.client.get_current_position(symbol)
+        """
+        Net position for a symbol (positive for long, negative for short), including orders still in flight.
+        Read from the streamed cache; resynced from a snapshot only while the stream is down.
+        """
+        self._ready()
+        if not self.cache.live:
+            try:
+                self.session.refresh(self.config.DERIVATIVES_TIMEOUT)
+            except Exception as e:
+                print(f"Exchange stream is down and the snapshot failed ({e}). Using the last known position.")
+        return self.cache.position(symbol) + self.cache.pending_amount(symbol)
+
+    def get_market_price(self, symbol: str) -> Decimal | None:
+        """Latest streamed mark price of the contract (None until the venue has sent one)."""
+        self._ready()
+        return self.cache.mark(symbol)
 
     def open_short_position(self, symbol: str, amount: Decimal):
-        """Opens a short position on the asset."""
+        """Opens a short position on the asset. Returns a Future of the order acknowledgement (None if not sent)."""
         # For a short position, you usually 'SELL' the asset.
-        # Ensure amount is positive when calling place_order.
+        # Ensure amount is positive when placing the order.
         if amount > 0:
-            self.client.place_order(symbol, "SELL", amount, "MARKET")
-        else:
-            print(f"Attempted to open short position with non-positive amount: {amount}")
+            return self._submit(symbol, "SELL", amount)
+        print(f"Attempted to open short position with non-positive amount: {amount}")
+        return None
 
-    def close_position(self, symbol: str, amount: Decimal):
-        """Closes an existing position or part of it."""
+    def close_position(self, symbol: str, amount: Decimal, current_pos: Decimal = None):
+        """
+        Closes an existing position or part of it. Returns a Future of the order acknowledgement (None if not sent).
+        current_pos: the position the caller just read (`get_position_size`), so it isn't fetched a second time.
+        """
         # If your current position is short (negative amount), to close it, you 'BUY'.
         # If your current position is long (positive amount), to close it, you 'SELL'.
         # This function assumes 'amount' is the absolute quantity to close.
-        current_pos = self.get_position_size(symbol)
-        
+        if current_pos is None:
+            current_pos = self.get_position_size(symbol)
+
         if current_pos < 0: # Currently short, need to buy to close
             amount_to_buy = min(amount, abs(current_pos)) # Don't buy more than needed to close short
             if amount_to_buy > 0:
-                self.client.place_order(symbol, "BUY", amount_to_buy, "MARKET")
+                return self._submit(symbol, "BUY", amount_to_buy)
         elif current_pos > 0: # Currently long, need to sell to close
             amount_to_sell = min(amount, abs(current_pos)) # Don't sell more than needed to close long
             if amount_to_sell > 0:
-                self.client.place_order(symbol, "SELL", amount_to_sell, "MARKET")
+                return self._submit(symbol, "SELL", amount_to_sell)
         else:
             print(f"No open position for {symbol} to close.")
+        return None
+
+    def _submit(self, symbol: str, side: str, amount: Decimal):
+        """Sends a market order, journaling it first and its acknowledgement (or failure) when it comes back."""
+        self._ready()
+        client_order_id = uuid.uuid4().hex
+        if self.journal is not None:
+            self.journal.record_hedge_order(client_order_id, symbol, side, amount)
+        submitted = time.perf_counter()
+        future = self.session.submit_order(symbol, side, amount, "MARKET", client_order_id)
+        future.add_done_callback(lambda done: self._record_ack(client_order_id, symbol, submitted, done))
+        return future
+
+    def _record_ack(self, client_order_id: str, symbol: str, submitted: float, future):
+        HEDGE_ORDER_LATENCY.observe(time.perf_counter() - submitted, symbol)
+        error = future.exception()
+        status = "failed" if error is not None else future.result().get("status", "acknowledged")
+        HEDGE_ORDERS.inc(1, symbol, status)
+        if self.journal is None:
+            return
+        if error is not None:
+            self.journal.update_hedge_order(client_order_id, "failed", str(error))
+        else:
+            self.journal.update_hedge_order(client_order_id, status, json.dumps(future.result(), default=str))
 
 
     def calculate_delta_hedge_amount(self, current_lp_delta: Decimal, price_of_token_to_hedge: Decimal) -> Decimal:
@@ -608,17 +2338,241 @@ class DerivativesManager:
         # This function is now just a pass-through for the calculated LP delta.
         # The complexity of calculating LP delta is moved to `get_current_lp_exposure`.
         return current_lp_delta # This represents the amount in units of the volatile token (e.g., ETH)
-# --- END OF TODO 5 IMPLEMENTATION (DerivativesManager with conceptual client) ---
+
+
+class HedgeBook:
+    """
+    Nets the hedge of every managed position per perp symbol. Each position records its LP exposure (the short it
+    needs) during the cycle; `flush` then sends at most ONE adjustment order per symbol for the difference between
+    the summed target and the venue position, instead of one order per position (often in opposite directions).
+    Exposures persist between flushes, so a partial cycle (event-driven mode) still nets against the positions
+    that weren't re-read. Per-position attribution of every flush is appended to HEDGE_LEDGER_PATH for accounting.
+    """
+    def __init__(self, config: Config, derivatives_manager: DerivativesManager):
+        self.config = config
+        self.derivatives_manager = derivatives_manager
+        self._lock = threading.Lock()
+        # symbol -> {position key: {"exposure": Decimal, "token_id": int, "risk": dict or None}}
+        self.exposures = {}
+        # symbol -> {position key: exposure} as of the last accepted adjustment order (what the venue position covers)
+        self.hedged = {}
+        self.orders_sent = 0
+
+    def record(self, position_key: str, token_id: int, symbol: str, exposure: Decimal, risk: dict = None):
+        """
+        Sets a position's current LP exposure (units of the hedged token) for the next flush.
+        risk: the position's liquidity/ticks/decimals/sqrtPriceX96, for `scenario_report` (optional).
+        """
+        with self._lock:
+            self.exposures.setdefault(symbol, {})[position_key] = {"exposure": exposure, "token_id": token_id, "risk": risk}
+
+    def scenario_report(self, shocks: list = None) -> dict:
+        """
+        Net LP delta and gamma of the whole book per symbol at each relative price shock (default RISK_SCENARIOS,
+        plus 0), computed in one vectorized call. Returns {symbol: {"shocks", "delta", "gamma"}} (NumPy arrays).
+        """
+        shocks = sorted(set([0.0] + list(self.config.RISK_SCENARIOS if shocks is None else shocks)))
+        with self._lock:
+            positions = [dict(entry["risk"], symbol=symbol)
+                         for symbol, entries in self.exposures.items() for entry in entries.values() if entry["risk"]]
+        from uniswap_lp_greeks import book_scenarios
+        return book_scenarios(positions, shocks)
+
+    def attribution(self, symbol: str) -> dict:
+        """Per-position share of the symbol's hedge as of the last accepted adjustment order: {position key: short amount}."""
+        with self._lock:
+            return dict(self.hedged.get(symbol, {}))
+
+    def report_scenarios(self):
+        """Prints the book's net delta at each RISK_SCENARIOS price move. Reporting only: errors are printed, not raised."""
+        if not self.config.RISK_SCENARIOS:
+            return
+        try:
+            for symbol, report in self.scenario_report().items():
+                moves = ", ".join(f"{shock:+.0%}: {delta:.6g}" for shock, delta in zip(report["shocks"], report["delta"]))
+                print(f"Book delta {symbol} by price move: {moves} (gamma at spot {report['gamma'][list(report['shocks']).index(0.0)]:.6g})")
+        except Exception as e:
+            print(f"Error computing the hedge book scenarios: {e}")
+
+    @METRICS.timed("hedge_flush")
+    def flush(self) -> list:
+        """
+        Sends one net adjustment order per symbol whose summed target drifted from the venue position by more than
+        HEDGE_THRESHOLD. Returns the order Futures (orders are not waited for). A symbol that fails (venue
+        position unavailable, order rejected before sending) is reported and skipped; the others are still hedged.
+        """
+        with self._lock:
+            books = {symbol: dict(entries) for symbol, entries in self.exposures.items()}
+        futures = []
+        for symbol, entries in books.items():
+            try:
+                future = self._flush_symbol(symbol, entries)
+            except Exception as e:
+                print(f"Error adjusting the hedge of {symbol}: {e}")
+                continue
+            if future is not None:
+                futures.append(future)
+        # The scenario grid (NumPy) is reporting: it runs once the orders are out, and can't hold them up or stop them.
+        self.report_scenarios()
+        return futures
+
+    def _flush_symbol(self, symbol: str, entries: dict):
+        """Sends the net adjustment order of one symbol (if any) and returns its Future, or None."""
+        target_short = sum((entry["exposure"] for entry in entries.values()), Decimal("0"))
+        # get_position_size is positive for long, negative for short (orders in flight included).
+        current_position = self.derivatives_manager.get_position_size(symbol)
+        amount_to_adjust = hedge_adjustment(target_short, -current_position, self.config.HEDGE_THRESHOLD)
+        with self._lock:
+            previous = self.hedged.get(symbol, {})
+        changes = {key: entry["exposure"] - previous.get(key, Decimal("0")) for key, entry in entries.items()}
+        gross = sum((abs(change) for change in changes.values()), Decimal("0"))
+        print(f"Hedge book {symbol}: {len(entries)} positions, net target short {target_short}, "
+              f"venue position {current_position}, adjustment {amount_to_adjust} (gross per-position changes {gross}).")
+
+        future = None
+        if amount_to_adjust > 0: # Need to increase net short position (or reduce existing long)
+            future = self.derivatives_manager.open_short_position(symbol, amount_to_adjust)
+        elif amount_to_adjust < 0: # Need to reduce net short position
+            future = self.derivatives_manager.close_position(symbol, -amount_to_adjust, current_position)
+        if future is not None:
+            self.orders_sent += 1
+            # The attribution moves to these exposures only once the venue has accepted the order that covers them.
+            exposures = {key: entry["exposure"] for key, entry in entries.items()}
+            future.add_done_callback(lambda done: self._acknowledged(symbol, exposures, done))
+        self._append_ledger({
+            "time": int(time.time()), "symbol": symbol, "target_short": str(target_short),
+            "venue_position": str(current_position), "order": str(amount_to_adjust) if future is not None else "0",
+            "positions": {key: {"token_id": entry["token_id"], "exposure": str(entry["exposure"]),
+                                "change": str(changes[key])} for key, entry in entries.items()},
+        })
+        return future
+
+    def _acknowledged(self, symbol: str, exposures: dict, future):
+        """Done callback of an adjustment order: records what the venue position now covers if it was accepted."""
+        if future.exception() is not None or future.result().get("status") == "rejected":
+            return
+        with self._lock:
+            self.hedged[symbol] = exposures
+
+    def _append_ledger(self, record: dict):
+        try:
+            with open(self.config.HEDGE_LEDGER_PATH, "a") as f:
+                f.write(json.dumps(record) + "\n")
+        except Exception as e:
+            print(f"Error writing hedge ledger: {e}")
+
 
 # --- 5. Main Bot Logic ---
+class AdaptiveScheduler:
+    """
+    Picks when each position should be checked next, instead of one fixed interval for all of them.
+    The delay is the time in which a POLL_SAFETY_Z-sigma price move (at the position's recent realized volatility)
+    could reach the nearest of:
+      - the rebalance trigger (REBALANCE_TRIGGER beyond either range edge), or
+      - the move after which the hedge drifts by POLL_HEDGE_DRIFT of the position's delta, or HEDGE_THRESHOLD
+        if larger (from the position's gamma),
+    i.e. delay = (distance / (z * sigma))**2, clamped to [POLL_MIN_INTERVAL, POLL_MAX_INTERVAL].
+    A position at or past its trigger is checked every POLL_MIN_INTERVAL (about every block); one deep inside a wide
+    range in a calm market only every POLL_MAX_INTERVAL. Volatility is an EWMA of squared log returns per second
+    between observations, starting from POLL_DEFAULT_VOLATILITY (annualized).
+    """
+    SECONDS_PER_YEAR = 365 * 24 * 3600
+    LOG_TICK = math.log(1.0001)
+
+    def __init__(self, config: Config):
+        self.config = config
+        self._lock = threading.Lock()
+        # key -> {"tick", "time", "variance_rate" (per second), "next_time"}
+        self.states = {}
+
+    def _default_variance_rate(self) -> float:
+        return self.config.POLL_DEFAULT_VOLATILITY ** 2 / self.SECONDS_PER_YEAR
+
+    def observe(self, key: str, tick: int, now: float = None):
+        """Feeds a new pool tick for a position and updates its realized volatility estimate."""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            state = self.states.setdefault(key, {"tick": None, "time": None, "variance_rate": self._default_variance_rate(), "next_time": 0.0})
+            if state["tick"] is not None and now > state["time"]:
+                elapsed = now - state["time"]
+                log_return = (tick - state["tick"]) * self.LOG_TICK
+                # Time-weighted EWMA: an observation after a long gap counts for more.
+                weight = 1 - math.exp(-elapsed / self.config.POLL_VOLATILITY_HALFLIFE)
+                state["variance_rate"] = (1 - weight) * state["variance_rate"] + weight * log_return ** 2 / elapsed
+            state["tick"], state["time"] = tick, now
+
+    def volatility(self, key: str) -> float:
+        """Annualized realized volatility estimate of a position's pool price."""
+        with self._lock:
+            state = self.states.get(key)
+            variance_rate = state["variance_rate"] if state else self._default_variance_rate()
+        return math.sqrt(variance_rate * self.SECONDS_PER_YEAR)
+
+    def next_delay(self, key: str, tick: int, tick_lower: int, tick_upper: int, hedge_slack: float = None) -> float:
+        """
+        Seconds until the position should be checked again. hedge_slack: the log price move after which its
+        hedge drifts by the tolerated amount (None: ignored).
+        """
+        trigger_ticks = math.log(1 + float(self.config.REBALANCE_TRIGGER)) / self.LOG_TICK
+        distance = min(tick - (tick_lower - trigger_ticks), (tick_upper + trigger_ticks) - tick) * self.LOG_TICK
+        if hedge_slack is not None:
+            distance = min(distance, hedge_slack)
+        if distance <= 0:
+            return self.config.POLL_MIN_INTERVAL
+        with self._lock:
+            state = self.states.get(key)
+            variance_rate = state["variance_rate"] if state else self._default_variance_rate()
+        delay = (distance / self.config.POLL_SAFETY_Z) ** 2 / max(variance_rate, 1e-18)
+        return min(max(delay, self.config.POLL_MIN_INTERVAL), self.config.POLL_MAX_INTERVAL)
+
+    def schedule(self, key: str, delay: float, now: float = None):
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            state = self.states.setdefault(key, {"tick": None, "time": None, "variance_rate": self._default_variance_rate(), "next_time": 0.0})
+            state["next_time"] = now + delay
+
+    def is_due(self, key: str, now: float = None) -> bool:
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            state = self.states.get(key)
+            return state is None or state["next_time"] <= now
+
+    def seconds_until_next(self, keys: list, now: float = None) -> float:
+        """Time until the earliest of `keys` is due (0 if one already is)."""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            next_times = [self.states[key]["next_time"] if key in self.states else now for key in keys]
+        return max(0.0, min(next_times, default=now) - now)
+
+
 class LiquidityManagerBot:
-    def __init__(self):
-        self.config = Config()
-        self.blockchain_client = BlockchainClient(self.config)
-        self.price_oracle = PriceOracle(self.blockchain_client)
-        self.lp_manager = UniswapLPManager(self.blockchain_client, self.price_oracle)
-        self.derivatives_manager = DerivativesManager(self.config)
+    def __init__(self, config: Config = None, blockchain_client: BlockchainClient = None,
+                 pool_registry: PoolRegistry = None, derivatives_manager: "DerivativesManager" = None,
+                 hedge_book: HedgeBook = None, hedge_key: str = "position", scheduler: AdaptiveScheduler = None):
+        # Components can be passed in so several bots (one per position, see PortfolioManager) share
+        # one RPC connection, pool registry, derivatives client and hedge book.
+        # The greeks engine (NumPy) is first needed in the cycle: import it while the components connect.
+        preload_modules(GREEKS_MODULES)
+        self.config = config or Config()
+        if self.config.METRICS_PORT:
+            METRICS.serve(self.config.METRICS_PORT, self.config.METRICS_HOST)
+        self.blockchain_client = blockchain_client or BlockchainClient(self.config)
+        self.pool_registry = pool_registry or PoolRegistry(self.blockchain_client)
+        self.price_oracle = PriceOracle(self.blockchain_client, self.pool_registry)
+        self.lp_manager = UniswapLPManager(self.blockchain_client, self.price_oracle, self.pool_registry)
+        self.derivatives_manager = derivatives_manager or DerivativesManager(self.config, self.blockchain_client.journal)
+        self.hedge_book = hedge_book or HedgeBook(self.config, self.derivatives_manager)
+        self.hedge_key = hedge_key # This position's name in the hedge book's attribution (and the scheduler)
+        self.scheduler = scheduler or AdaptiveScheduler(self.config)
         self.position_token_id = None # Will store the tokenId of the LP position.
+        # (tick_lower, tick_upper, liquidity) of the managed position as of the last cycle.
+        self.position_state = None
+        # LP exposure the derivatives position currently offsets, as of the last hedge check.
+        self.hedged_exposure = None
+        # Liquidity, range, decimals and sqrtPriceX96 of the position as of the last exposure check (for the greeks engine).
+        self.position_risk = None
+        # The wallet's position NFTs, built on first use (see `discover_position`).
+        self.position_index = None
 
     def initial_setup(self, initial_token0_amount: Decimal, initial_token1_amount: Decimal,
                       lower_price: Decimal, upper_price: Decimal):
@@ -629,35 +2583,197 @@ class LiquidityManagerBot:
         
         if self.position_token_id:
             print(f"LP position created with Token ID: {self.position_token_id}")
-            # TODO: Store the tokenId persistently (e.g., in a database or file)
+            # Saved to the state journal, where `startup` loads it from on the next start.
             self._save_position_id(self.position_token_id)
         else:
             print("Failed to create LP position or retrieve Token ID.")
 
     def _save_position_id(self, token_id: int):
-        """Saves the position ID to a file for persistence."""
+        """Saves the position ID to the state journal (under this position's key) for persistence."""
         try:
-            with open("position_id.txt", "w") as f:
-                f.write(str(token_id))
-            print(f"Position ID {token_id} saved to position_id.txt")
+            self.blockchain_client.journal.set_position(self.hedge_key, token_id)
+            print(f"Position ID {token_id} saved to {self.blockchain_client.journal.path}")
         except Exception as e:
             print(f"Error saving position ID: {e}")
 
     def _load_position_id(self) -> int | None:
-        """Loads the position ID from a file."""
+        """
+        Loads the position ID from the state journal, following any rebalance that finished after it was saved.
+        A position_id.txt left by an older version is imported into the journal the first time.
+        """
+        journal = self.blockchain_client.journal
         try:
-            if os.path.exists("position_id.txt"):
-                with open("position_id.txt", "r") as f:
+            token_id = journal.get_position(self.hedge_key)
+            if token_id is None and self.config.POSITION_ID_PATH and os.path.exists(self.config.POSITION_ID_PATH):
+                with open(self.config.POSITION_ID_PATH, "r") as f:
                     token_id_str = f.read().strip()
-                    if token_id_str:
-                        token_id = int(token_id_str)
-                        print(f"Loaded existing position ID: {token_id}")
-                        return token_id
-            return None
+                if token_id_str:
+                    token_id = int(token_id_str)
+                    journal.set_position(self.hedge_key, token_id)
+                    print(f"Imported position ID {token_id} from {self.config.POSITION_ID_PATH} into {journal.path}")
+            if token_id is None:
+                return None
+            token_id = journal.latest_token_id(token_id)
+            print(f"Loaded existing position ID: {token_id}")
+            return token_id
         except Exception as e:
             print(f"Error loading position ID: {e}")
             return None
 
+    @METRICS.timed("discover_position")
+    def discover_position(self) -> int | None:
+        """
+        Finds a position to manage in the wallet when none is saved (POSITION_DISCOVERY): the one with the most
+        liquidity in the configured pool. The wallet is indexed once in a few batched reads; later calls only apply
+        the new position manager logs, so a position minted elsewhere (e.g. in the Uniswap UI) is picked up cheaply.
+        """
+        if not self.config.POSITION_DISCOVERY:
+            return None
+        if self.position_index is None:
+            self.position_index = PositionIndex(self.blockchain_client)
+        self.position_index.sync()
+        candidates = self.position_index.find(self.config.TOKEN0_ADDRESS, self.config.TOKEN1_ADDRESS, self.config.POOL_FEE, min_liquidity=1)
+        if not candidates:
+            print(f"No position with liquidity found in the {self.config.TOKEN0_ADDRESS_SYMBOL}/{self.config.TOKEN1_ADDRESS_SYMBOL} {self.config.POOL_FEE} pool.")
+            return None
+        position = candidates[0]
+        print(f"Adopting position {position['token_id']} from the wallet (ticks [{position['tick_lower']}, {position['tick_upper']}], "
+              f"liquidity {position['liquidity']}; {len(candidates)} candidate(s)).")
+        self._save_position_id(position["token_id"])
+        return position["token_id"]
+
+    @METRICS.timed("resume_rebalances")
+    def resume_rebalances(self):
+        """
+        Finishes any rebalance of the managed position that a crash (or a failed step) left half done, from the
+        state journal: only the receipts of the journaled transaction hashes are read, never chain history.
+        Cheap when there is nothing to resume (one indexed journal query), so it runs before every cycle.
+        """
+        if not self.position_token_id:
+            return
+        for rebalance in self.blockchain_client.journal.unfinished_rebalances(self.position_token_id):
+            print(f"Resuming rebalance {rebalance['id']} of position {rebalance['old_token_id']} (state: {rebalance['state']})...")
+            # Transactions sent while resuming belong to the same rebalance.
+            self.blockchain_client.journal_rebalance_id = rebalance["id"]
+            try:
+                self._resume_rebalance(rebalance)
+            except Exception as e:
+                print(f"Could not resume rebalance {rebalance['id']} yet: {e}. Retrying next cycle.")
+            finally:
+                self.blockchain_client.journal_rebalance_id = None
+
+    def _journaled_receipt(self, transactions: list, kinds: tuple):
+        """
+        The successful receipt of a rebalance transaction of one of `kinds` (contract function names), if any landed.
+        `transactions` are the rebalance's journal rows, newest first; each nonce is recovered once.
+        """
+        by_nonce = {}
+        for row in transactions:
+            by_nonce.setdefault(row["nonce"], []).append(row)
+        for rows in by_nonce.values():
+            # The oldest row is what was originally sent (later ones may be fee bumps or a cancel of it).
+            if rows[-1]["kind"] not in kinds:
+                continue
+            receipt = self.blockchain_client.recover_transaction(rows)
+            if receipt is not None and receipt.status == 1:
+                return receipt
+        return None
+
+    def _resume_rebalance(self, rebalance: dict):
+        journal = self.blockchain_client.journal
+        rebalance_id, old_token_id = rebalance["id"], rebalance["old_token_id"]
+        transactions = journal.rebalance_transactions(rebalance_id)
+        urgency = self.config.FEE_URGENCY_REBALANCE
+
+        if rebalance["mode"] == "atomic":
+            # All-or-nothing: either the multicall landed (new position) or the old position is untouched.
+            receipt = self._journaled_receipt(transactions, ("multicall",))
+            if receipt is None:
+                journal.update_rebalance(rebalance_id, "aborted", error="rebalance transaction did not land")
+                print(f"Rebalance {rebalance_id} never landed; position {old_token_id} is unchanged.")
+                return
+            pool = self.pool_registry.get_pool(self.config.TOKEN0_ADDRESS, self.config.TOKEN1_ADDRESS, self.config.POOL_FEE)
+            new_token_id, _, _ = self.lp_manager.parse_rebalance_receipt(receipt, pool)
+            self._finish_rebalance(rebalance_id, new_token_id)
+            return
+
+        if rebalance["state"] == "withdrawing":
+            decrease_receipt = self._journaled_receipt(transactions, ("decreaseLiquidity",))
+            if decrease_receipt is None:
+                if self.lp_manager.get_position_info(old_token_id)[7] > 0:
+                    journal.update_rebalance(rebalance_id, "aborted", error="withdrawal did not land")
+                    print(f"Withdrawal of rebalance {rebalance_id} never landed; position {old_token_id} is unchanged.")
+                else:
+                    # The liquidity is gone but not through a journaled transaction: the amounts are unknown here.
+                    journal.update_rebalance(rebalance_id, "failed", error="liquidity withdrawn outside the journal")
+                    print(f"Position {old_token_id} was emptied outside of rebalance {rebalance_id}. Check it manually.")
+                return
+            recovered0, recovered1 = self.lp_manager.parse_decrease_receipt(decrease_receipt)
+            if self._journaled_receipt(transactions, ("collect",)) is None:
+                # The withdrawn tokens are still owed by the old position: collect them before re-depositing.
+                self.blockchain_client.send_transaction(self.lp_manager.collect_tx(old_token_id), urgency)
+            journal.update_rebalance(rebalance_id, "withdrawn", recovered0=recovered0, recovered1=recovered1)
+            rebalance.update(recovered0=str(recovered0), recovered1=str(recovered1))
+
+        # Withdrawn: the funds are in the wallet. Use the mint if it landed, otherwise deposit them again
+        # (swapping them to the new range's ratio first, unless that swap already landed).
+        mint_receipt = self._journaled_receipt(transactions, ("mint", "multicall"))
+        if mint_receipt is not None:
+            new_token_id = self.lp_manager.parse_mint_receipt_for_token_id(mint_receipt)
+        else:
+            amount0, amount1 = Decimal(rebalance["recovered0"]), Decimal(rebalance["recovered1"])
+            swap_receipt = self._journaled_receipt(transactions, ("exactInputSingle",))
+            if swap_receipt is not None:
+                pool = self.pool_registry.get_pool(self.config.TOKEN0_ADDRESS, self.config.TOKEN1_ADDRESS, self.config.POOL_FEE)
+                delta0, delta1, _ = self.lp_manager.parse_swap_receipt(swap_receipt, pool)
+                amount0 -= Decimal(delta0) / Decimal(10**pool["decimals0"])
+                amount1 -= Decimal(delta1) / Decimal(10**pool["decimals1"])
+            new_token_id = self.lp_manager.provide_liquidity(
+                amount0, amount1, Decimal(rebalance["lower_price"]), Decimal(rebalance["upper_price"]), urgency,
+                swap=swap_receipt is None
+            )
+        self._finish_rebalance(rebalance_id, new_token_id)
+
+    def _finish_rebalance(self, rebalance_id: int, new_token_id: int):
+        self.blockchain_client.journal.update_rebalance(rebalance_id, "done", new_token_id=new_token_id)
+        self.position_token_id = new_token_id
+        self._save_position_id(new_token_id)
+        print(f"Rebalance {rebalance_id} completed: now managing position {new_token_id}.")
+
+    def cycle_reads(self, token_id: int) -> list:
+        """
+        Every on-chain read one management cycle needs for this position: `rebalance_lp`,
+        `get_current_lp_exposure` and `manage_delta_neutral` are then served from memory.
+        """
+        pool_contract = self.pool_registry.get_pool_contract(self.config.TOKEN0_ADDRESS, self.config.TOKEN1_ADDRESS, self.config.POOL_FEE)
+        return [
+            self.lp_manager.nft_manager.functions.positions(token_id),
+            pool_contract.functions.slot0(),
+            self.price_oracle.eth_usd_feed.functions.latestRoundData(),
+        ]
+
+    @METRICS.timed("prefetch_reads")
+    def _prefetch_cycle_reads(self, token_id: int):
+        """
+        Fetches the cycle's reads with a single Multicall3 request.
+        The pool address comes from the registry, so slot0 can go in the same batch.
+        """
+        self.blockchain_client.prefetch(self.cycle_reads(token_id))
+
+    @METRICS.timed("manage_position")
+    def manage_position(self, token_id: int):
+        """One management pass over a position: rebalance the LP first, then the delta neutral hedge."""
+        # Perform LP rebalancing first. A failed or stuck rebalance must not keep the hedge from being adjusted.
+        try:
+            self.rebalance_lp(token_id)
+        except Exception as e:
+            print(f"Error during LP rebalance of position {token_id}: {e}. Continuing with the hedge.")
+        # Rebalancing may have minted a new position
+        token_id = self.position_token_id or token_id
+        # Then manage the delta neutral hedge
+        self.manage_delta_neutral(token_id)
+
+    @METRICS.timed("get_current_lp_exposure")
     def get_current_lp_exposure(self, token_id: int) -> Decimal:
         """
         Calculates the net exposure of your LP position to the volatile token (TOKEN0).
@@ -665,109 +2781,49 @@ class LiquidityManagerBot:
         It assumes TOKEN0 is the volatile asset you want to hedge (e.g., ETH) and TOKEN1 is stable (USDC).
         """
         position_info = self.lp_manager.get_position_info(token_id)
-        liquidity = Decimal(position_info[7]) # Liquidity of the position
+        liquidity = position_info[7] # Liquidity of the position
         tick_lower = position_info[5]
         tick_upper = position_info[6]
 
         pool_address = self.lp_manager.get_pool_address(self.config.TOKEN0_ADDRESS, self.config.TOKEN1_ADDRESS, self.config.POOL_FEE)
         pool_contract = self.blockchain_client.get_contract(pool_address, self.config.UNISWAP_POOL_ABI)
-        slot0 = pool_contract.functions.slot0().call()
-        current_sqrt_price_x96 = Decimal(slot0[0])
+        slot0 = self.blockchain_client.call(pool_contract.functions.slot0())
+        current_sqrt_price_x96 = slot0[0]
 
         decimals0 = self.price_oracle.token_decimals[self.config.TOKEN0_ADDRESS]
         decimals1 = self.price_oracle.token_decimals[self.config.TOKEN1_ADDRESS]
 
-        sqrt_price_lower_x96 = Decimal.from_float(sqrt(Decimal("1.0001")**tick_lower)) * Decimal(2**96)
-        sqrt_price_upper_x96 = Decimal.from_float(sqrt(Decimal("1.0001")**tick_upper)) * Decimal(2**96)
-
         # --- START OF TODO 6 IMPLEMENTATION (More accurate LP delta calculation) ---
-        # Calculate x and y amounts for a given liquidity and price range
-        # These are the "virtual" amounts of tokens held by the position at the current price.
-        # This is based on Uniswap V3 whitepaper formulas for x and y reserves in a range.
-
-        amount0_current = Decimal("0")
-        amount1_current = Decimal("0")
-
-        # Normalize sqrt_price_x96 by 2**96 to get sqrt(P)
-        current_sqrt_price = current_sqrt_price_x96 / Decimal(2**96)
-        sqrt_price_lower = sqrt_price_lower_x96 / Decimal(2**96)
-        sqrt_price_upper = sqrt_price_upper_x96 / Decimal(2**96)
-
-        # Case 1: Current price is below the lower tick
-        if current_sqrt_price <= sqrt_price_lower:
-            amount0_current = liquidity * ((sqrt_price_upper - sqrt_price_lower) / (sqrt_price_lower * sqrt_price_upper))
-            amount1_current = Decimal("0") # Only token0 is left in the position
-
-        # Case 2: Current price is above the upper tick
-        elif current_sqrt_price >= sqrt_price_upper:
-            amount0_current = Decimal("0") # Only token1 is left in the position
-            amount1_current = liquidity * (sqrt_price_upper - sqrt_price_lower)
-
-        # Case 3: Current price is within the range [lower_tick, upper_tick]
-        else:
-            amount0_current = liquidity * ((sqrt_price_upper - current_sqrt_price) / (current_sqrt_price * sqrt_price_upper))
-            amount1_current = liquidity * (current_sqrt_price - sqrt_price_lower)
-        
-        # Adjust for token decimals for human-readable amounts
-        amount0_human = amount0_current / Decimal(10**decimals0)
-        amount1_human = amount1_current / Decimal(10**decimals1)
+        amount0_human, amount1_human = self.lp_manager.calculate_position_amounts(
+            liquidity, tick_lower, tick_upper, current_sqrt_price_x96, decimals0, decimals1
+        )
+        # Remember the range and liquidity so swap events can be checked against them without new reads.
+        self.position_state = (tick_lower, tick_upper, liquidity)
+        # Everything the greeks engine needs to re-price this position under price scenarios (see HedgeBook).
+        self.position_risk = {
+            "liquidity": liquidity, "tick_lower": tick_lower, "tick_upper": tick_upper,
+            "decimals0": decimals0, "decimals1": decimals1, "sqrt_price_x96": current_sqrt_price_x96,
+        }
 
         print(f"Current theoretical LP holdings: {amount0_human} {self.config.TOKEN0_ADDRESS_SYMBOL}, {amount1_human} {self.config.TOKEN1_ADDRESS_SYMBOL}")
 
-        # The delta exposure is primarily to TOKEN0 (WETH) in a WETH/USDC pool.
-        # It's the amount of TOKEN0 held (long exposure).
-        # We need to account for the value of TOKEN1 if we think of it as "short" TOKEN0.
-        # For a standard delta hedge, we want to short the volatile asset.
-        # So, the effective long exposure to TOKEN0 is `amount0_human`.
-        # However, as price moves, the ratio of tokens changes.
-        # When price goes up, you have more TOKEN1 (USDC), less TOKEN0 (ETH).
-        # When price goes down, you have more TOKEN0 (ETH), less TOKEN1 (USDC).
-        # Your effective delta is how many units of TOKEN0 your position is "long".
-
-        # A more precise delta calculation would be the derivative of the value function
-        # with respect to the price of TOKEN0.
-        # For simplicity in this context, we will consider the `amount0_human` as the primary
-        # long exposure to TOKEN0 that needs to be hedged. This is a common approximation.
-        # If your strategy needs to hedge the `amount1_human` against a short ETH position,
-        # it gets more complex (e.g., if you consider your USDC as a short ETH position when price goes up).
-
-        # For a delta-neutral position, if your LP has a long TOKEN0 exposure, you short TOKEN0.
-        # So, the amount of TOKEN0 to hedge is `amount0_human`.
-        
-        # Let's refine the delta: The position has TOKEN0 and TOKEN1.
-        # Value = Amount0 * Price_Token0 + Amount1 * Price_Token1
-        # If Price_Token0 changes, how much does Value change?
-        # dValue/dPrice_Token0 = Amount0 + Amount1 * (dPrice_Token1/dPrice_Token0)
-        # If Token1 is stable (Price_Token1 = 1), dPrice_Token1/dPrice_Token0 = 0.
-        # So, Delta ~ Amount0.
-
-        # This simple delta considers only the current actual token amounts.
-        # The issue is that the actual amounts in your position change as price moves.
-        # A true "delta" for a range order is non-linear.
-        # A common proxy for delta is the amount of TOKEN0 you would have if price moved to the lower bound,
-        # minus the amount if it moved to the upper bound, relative to liquidity.
-        
-        # A more common interpretation of delta for LP:
-        # If current price `P` is between `P_L` and `P_U`:
-        # x_amount = L * (1/sqrt(P) - 1/sqrt(P_U))
-        # y_amount = L * (sqrt(P) - sqrt(P_L))
-        # Where L is liquidity, sqrt(P) is current sqrtPriceX96 normalized, etc.
-        # Delta_x = dx/dP = -0.5 * L * P^(-1.5) + 0 (if P_U is constant wrt P)
-        # Delta_y = dy/dP = 0.5 * L * P^(-0.5)
-        # Total delta in terms of token0 would be Delta_x + Delta_y / P_current
-
-        # For practical purposes and given the context, let's use the current `amount0_human` as the delta.
-        # This implicitly assumes you're hedging against the ETH exposure in your LP position.
-        # If `amount0_human` is high, you're long ETH, and need to short ETH.
-        # If `amount0_human` is low (meaning more USDC), you're less long ETH.
-
+        # The position's value in TOKEN1 is V(P) = amount1 + P * amount0, with P the price of TOKEN0 in TOKEN1.
+        # In closed form (see uniswap_lp_greeks.py), dV/dP is exactly the TOKEN0 amount the position holds:
+        # L * (1/sqrt(P) - 1/sqrt(P_upper)) in range, all of it below the range, none above. So the exact integer
+        # amount0 IS the delta, not an approximation of it; what changes with price is the delta itself, at the
+        # rate given by gamma = -L / (2 * P**1.5) while in range (the hedge has to be re-adjusted as price moves).
         estimated_delta_exposure_token0 = amount0_human
-        
-        print(f"Estimated Delta Exposure to {self.config.TOKEN0_ADDRESS_SYMBOL} from LP: {estimated_delta_exposure_token0} {self.config.TOKEN0_ADDRESS_SYMBOL}")
+        from uniswap_lp_greeks import lp_greeks, price_from_sqrt_price_x96
+        spot = price_from_sqrt_price_x96([current_sqrt_price_x96], [decimals0], [decimals1])
+        _, gamma = lp_greeks([liquidity], [tick_lower], [tick_upper], [decimals0], [decimals1], spot)
+
+        print(f"Estimated Delta Exposure to {self.config.TOKEN0_ADDRESS_SYMBOL} from LP: {estimated_delta_exposure_token0} {self.config.TOKEN0_ADDRESS_SYMBOL} "
+              f"(gamma {gamma[0, 0]:.6g} {self.config.TOKEN0_ADDRESS_SYMBOL} per unit of price)")
         return estimated_delta_exposure_token0
         # --- END OF TODO 6 IMPLEMENTATION (More accurate LP delta calculation) ---
 
 
+    @METRICS.timed("rebalance_lp")
     def rebalance_lp(self, token_id: int):
         """
         Rebalances the LP position if the price moves out of range or if optimization is needed.
@@ -784,8 +2840,8 @@ class LiquidityManagerBot:
         decimals0 = self.price_oracle.token_decimals[self.config.TOKEN0_ADDRESS]
         decimals1 = self.price_oracle.token_decimals[self.config.TOKEN1_ADDRESS]
 
-        current_lower_price = self.lp_manager.calculate_price_from_tick(lower_tick, decimals0, decimals1)
-        current_upper_price = self.lp_manager.calculate_price_from_tick(upper_tick, decimals0, decimals1)
+        # A higher tick is a lower token0_per_token1 price, so the range bounds come back sorted.
+        current_lower_price, current_upper_price = range_prices(lower_tick, upper_tick, decimals0, decimals1)
 
         print(f"Current Pool Price (Token0/Token1): {current_price1_per_0}, LP Range: {current_lower_price} (lower price for Token0) - {current_upper_price} (upper price for Token0)")
 
@@ -797,38 +2853,76 @@ class LiquidityManagerBot:
         #    - Re-provide liquidity in the new range with the recovered tokens.
         # Note: This strategy incurs gas fees for each rebalance.
         # Define a threshold for "out of range" to avoid rebalancing too frequently on small price movements.
-        # E.g., if price is 1% below lower bound or 1% above upper bound.
-        if current_price1_per_0 < current_lower_price * Decimal("0.99") or current_price1_per_0 > current_upper_price * Decimal("1.01"):
+        # E.g., if price is 1% below lower bound or 1% above upper bound (REBALANCE_TRIGGER).
+        # The rule lives in uniswap_lp_strategy.py so the backtester applies exactly the same one.
+        if needs_rebalance(current_price1_per_0, lower_tick, upper_tick, decimals0, decimals1, self.config.REBALANCE_TRIGGER):
             print("Price is out of range (or near boundary). Rebalancing LP...")
             # Decrease all liquidity from the current position.
             liquidity_to_remove = position_info[7] # Get total liquidity from position info
-            
-            # Use the updated decrease_liquidity to get recovered amounts
-            recovered_token0_amount, recovered_token1_amount = self.lp_manager.decrease_liquidity(token_id, liquidity_to_remove)
-            self.lp_manager.collect_fees(token_id) # Collect fees before re-depositing
-
-            print(f"Recovered amounts: {recovered_token0_amount} {self.config.TOKEN0_ADDRESS_SYMBOL}, {recovered_token1_amount} {self.config.TOKEN1_ADDRESS_SYMBOL}")
 
-            # Calculate a new range: e.g., +/- 10% of the current price
+            # Calculate a new range: e.g., +/- 10% of the current price (REBALANCE_RANGE_WIDTH)
             # Always ensure the new range is valid (lower < upper) and aligned with tick spacing.
-            new_lower_price = current_price1_per_0 * Decimal("0.90")
-            new_upper_price = current_price1_per_0 * Decimal("1.10")
-
-            # Re-provide liquidity with the recovered tokens and the new range.
-            # IMPORTANT: After `decreaseLiquidity`, the `token_id` of the old position might be burned
-            # or the liquidity moved. A new `mint` operation will create a new `tokenId`.
-            # So, we should call `initial_setup` to get a new `tokenId` or update `self.position_token_id`.
-            
-            # Since `provide_liquidity` already returns a new tokenId, let's use that.
-            self.position_token_id = self.lp_manager.provide_liquidity(recovered_token0_amount, recovered_token1_amount,
-                                               new_lower_price, new_upper_price)
-            self._save_position_id(self.position_token_id) # Save new ID
+            new_lower_price, new_upper_price = new_range_prices(current_price1_per_0, self.config.REBALANCE_RANGE_WIDTH)
+
+            # Out of range, the position holds (almost) only one token, and the new range around the price takes both:
+            # see what the withdrawn principal buys there as it is, and the swap to the range's ratio (REBALANCE_SWAP).
+            pool = self.pool_registry.get_pool(self.config.TOKEN0_ADDRESS, self.config.TOKEN1_ADDRESS, self.config.POOL_FEE)
+            pool_contract = self.blockchain_client.get_contract(pool["pool_address"], self.config.UNISWAP_POOL_ABI)
+            sqrt_price_x96 = self.blockchain_client.call(pool_contract.functions.slot0())[0]
+            expected0, expected1 = get_amounts_for_liquidity(
+                sqrt_price_x96, get_sqrt_ratio_at_tick(lower_tick), get_sqrt_ratio_at_tick(upper_tick), liquidity_to_remove
+            )
+            new_liquidity, swap = self.lp_manager.plan_redeposit(pool, sqrt_price_x96, expected0, expected1, new_lower_price, new_upper_price)
+            if new_liquidity == 0 and swap is None:
+                print("The withdrawn amounts can't fund the new range without a swap (REBALANCE_SWAP is off). Skipping the rebalance.")
+                return
+            # The atomic multicall can't swap, so rebalances that need one are sent as withdraw, swap and mint.
+            atomic = self.config.ATOMIC_REBALANCE and swap is None
+
+            # Each step is journaled, and every transaction is tagged with the rebalance: if the process dies halfway
+            # (e.g. withdrawn but not re-deposited), `resume_rebalances` finishes it on the next start.
+            journal = self.blockchain_client.journal
+            rebalance_id = journal.begin_rebalance(self.hedge_key, "atomic" if atomic else "sequential",
+                                                   token_id, new_lower_price, new_upper_price)
+            self.blockchain_client.journal_rebalance_id = rebalance_id
+            try:
+                # Rebalance transactions use the rebalance fee level: the position is out of range until they land.
+                if atomic:
+                    # Withdraw, collect, burn and re-mint in one multicall transaction (one block, all-or-nothing).
+                    new_token_id, recovered_token0_amount, recovered_token1_amount = self.lp_manager.rebalance_position(
+                        token_id, position_info, new_lower_price, new_upper_price, self.config.FEE_URGENCY_REBALANCE
+                    )
+                else:
+                    # The collect (withdrawn tokens + fees) is pipelined right behind the decrease, so both land together.
+                    recovered_token0_amount, recovered_token1_amount = self.lp_manager.decrease_liquidity(
+                        token_id, liquidity_to_remove, collect=True, urgency=self.config.FEE_URGENCY_REBALANCE
+                    )
+                    journal.update_rebalance(rebalance_id, "withdrawn", recovered0=recovered_token0_amount, recovered1=recovered_token1_amount)
+
+                    print(f"Recovered amounts: {recovered_token0_amount} {self.config.TOKEN0_ADDRESS_SYMBOL}, {recovered_token1_amount} {self.config.TOKEN1_ADDRESS_SYMBOL}")
+
+                    # Re-provide liquidity with the recovered tokens and the new range.
+                    # IMPORTANT: After `decreaseLiquidity`, the `token_id` of the old position might be burned
+                    # or the liquidity moved. A new `mint` operation will create a new `tokenId`.
+                    # So, we should call `initial_setup` to get a new `tokenId` or update `self.position_token_id`.
+
+                    # Since `provide_liquidity` already returns a new tokenId, let's use that.
+                    # It swaps the recovered amounts to the new range's ratio first when they are off it (REBALANCE_SWAP).
+                    new_token_id = self.lp_manager.provide_liquidity(recovered_token0_amount, recovered_token1_amount,
+                                                       new_lower_price, new_upper_price, self.config.FEE_URGENCY_REBALANCE, swap=True)
+            finally:
+                self.blockchain_client.journal_rebalance_id = None
+            self._finish_rebalance(rebalance_id, new_token_id) # Save new ID
             print("LP rebalance completed and new position ID saved.")
         else:
             print("Price is within range. No LP rebalance needed.")
 
+    @METRICS.timed("manage_delta_neutral")
     def manage_delta_neutral(self, token_id: int):
-        """Manages the hedging position to maintain delta neutrality."""
+        """
+        Records the position's hedge target in the hedge book. The book nets it with the other positions hedged
+        on the same symbol and sends the single adjustment order when it is flushed at the end of the cycle.
+        """
         print("Managing delta neutral strategy...")
 
         # 1. Get the current estimated delta exposure of the LP position to the volatile token (TOKEN0).
@@ -840,95 +2934,348 @@ class LiquidityManagerBot:
             print("Could not get Token0 USD price. Skipping delta hedge.")
             return
 
-        # 3. Get the current size of your short position on the derivatives exchange.
-        # Note: get_position_size will return positive for long, negative for short.
-        current_short_position_size = self.derivatives_manager.get_position_size(self.config.SHORT_TOKEN_SYMBOL)
-
-        # Calculate the target short amount to neutralize the LP's delta exposure.
-        # If lp_exposure_token0 is positive (meaning your LP is effectively "long" token0),
-        # you need a short position of that same amount to neutralize it.
-        # Target short amount is simply lp_exposure_token0 (since we're hedging the long).
-        target_short_amount = lp_exposure_token0 
-
-        # Determine the amount of adjustment needed for the short position.
-        # If target_short_amount is 5 ETH and current_short_position_size is 3 ETH,
-        # you need to increase short by 2 ETH (5 - 3 = 2).
-        # If target_short_amount is 5 ETH and current_short_position_size is -2 ETH (meaning 2 ETH long),
-        # you need to increase short by 7 ETH (5 - (-2) = 7).
-        # If target_short_amount is 2 ETH and current_short_position_size is 5 ETH,
-        # you need to decrease short by 3 ETH (2 - 5 = -3).
-        amount_to_adjust = target_short_amount - current_short_position_size
-
-        # Execute derivative trades to adjust the short position.
-        # Use a small threshold (e.g., 0.001) to avoid tiny, gas-inefficient trades.
-        HEDGE_THRESHOLD = Decimal("0.001") # Example: 0.001 ETH
-
-        if amount_to_adjust > HEDGE_THRESHOLD: # Need to increase short position (or reduce existing long)
-            print(f"Need to increase net short position by {amount_to_adjust} {self.config.SHORT_TOKEN_SYMBOL}")
-            self.derivatives_manager.open_short_position(self.config.SHORT_TOKEN_SYMBOL, amount_to_adjust)
-        elif amount_to_adjust < -HEDGE_THRESHOLD: # Need to reduce short position (or increase existing long)
-            # Note: -amount_to_adjust is positive, representing the amount to reduce.
-            print(f"Need to reduce net short position by {-amount_to_adjust} {self.config.SHORT_TOKEN_SYMBOL}")
-            # The close_position function in DerivativesManager handles if it's currently short or long
-            self.derivatives_manager.close_position(self.config.SHORT_TOKEN_SYMBOL, -amount_to_adjust)
-        else:
-            print("Delta neutral hedge position stable. No significant adjustment needed.")
+        # 3. The target short amount neutralizes the LP's delta exposure: if lp_exposure_token0 is positive
+        # (the LP is effectively "long" token0), a short of that same amount offsets it.
+        # The book compares the summed targets of the symbol against the venue position; adjustments within
+        # HEDGE_THRESHOLD are skipped to avoid tiny, fee-inefficient trades.
+        target_short_amount = lp_exposure_token0
+        self.hedge_book.record(self.hedge_key, token_id, self.config.SHORT_TOKEN_SYMBOL, target_short_amount, self.position_risk)
+        self.hedged_exposure = target_short_amount
+
+    @METRICS.timed("cycle")
+    def run_cycle(self):
+        """One full management cycle: pin a block, batch the reads, rebalance and hedge."""
+        try:
+            # A rebalance left half done (crash, failed step) is finished before anything else, outside the
+            # pinned block: it may mint a new position.
+            self.resume_rebalances()
+            if not self.position_token_id:
+                # No saved position: look for one in the wallet (batched discovery, then log-driven updates).
+                self.position_token_id = self.discover_position()
+            if self.position_token_id:
+                print(f"\n--- Managing LP Position {self.position_token_id} ---")
+                # Pin this cycle's block and batch all of its reads up front (Multicall3)
+                self.blockchain_client.begin_cycle()
+                self._prefetch_cycle_reads(self.position_token_id)
+                self.manage_position(self.position_token_id)
+                self.hedge_book.flush()
+
+                # You can also collect fees periodically
+                # self.lp_manager.collect_fees(self.position_token_id)
+            else:
+                print("\nNo active LP position loaded. Attempting initial setup (if enabled)...")
+                # This will attempt to mint a new position if one isn't loaded.
+                # ONLY UNCOMMENT AND USE IF YOU INTEND TO MINT A NEW LP POSITION!
+                # You need to ensure your wallet has sufficient tokens and has approved the NFT Manager.
+                # Example: 0.01 WETH and 25 USDC, target range for WETH: $2400-$2600.
+                # If you run this, it will attempt to mint a new position and save its ID.
+                # self.initial_setup(Decimal("0.01"), Decimal("25"), Decimal("2400"), Decimal("2600")) 
+                
+                # If you're just testing the loop without minting, leave this commented.
+                # If you uncommented `initial_setup`, you must restart the bot after the first successful mint
+                # to ensure the `position_token_id` is loaded from the state journal (JOURNAL_PATH).
+                
+                pass # Keep looping but don't try to manage non-existent position.
+
+        except Exception as e:
+            print(f"Error during bot execution: {e}")
+            # In case of a critical error, you might want to stop the bot or implement a backoff.
+            # For now, just print and continue after a delay.
+        finally:
+            # Never carry cached reads over into the next cycle.
+            self.blockchain_client.end_cycle()
+
+    def next_check_delay(self) -> float:
+        """
+        Seconds until this position should be checked again, from the state read in the last cycle
+        (see AdaptiveScheduler). Falls back to POLL_FIXED_INTERVAL without adaptive polling or position data.
+        """
+        if not self.config.ADAPTIVE_POLLING or self.position_risk is None:
+            return self.config.POLL_FIXED_INTERVAL
+        risk = self.position_risk
+        tick = get_tick_at_sqrt_ratio(risk["sqrt_price_x96"])
+        self.scheduler.observe(self.hedge_key, tick)
+        # Log price move after which the hedge drifts by the tolerated amount: tolerance / |d(delta)/d(log price)|.
+        from uniswap_lp_greeks import lp_greeks, price_from_sqrt_price_x96
+        spot = price_from_sqrt_price_x96([risk["sqrt_price_x96"]], [risk["decimals0"]], [risk["decimals1"]])
+        delta, gamma = lp_greeks([risk["liquidity"]], [risk["tick_lower"]], [risk["tick_upper"]],
+                                 [risk["decimals0"]], [risk["decimals1"]], spot)
+        delta_per_log_move = abs(gamma[0, 0]) * spot[0]
+        tolerance = max(float(self.config.HEDGE_THRESHOLD), self.config.POLL_HEDGE_DRIFT * abs(delta[0, 0]))
+        hedge_slack = tolerance / delta_per_log_move if delta_per_log_move > 0 else None
+        delay = self.scheduler.next_delay(self.hedge_key, tick, risk["tick_lower"], risk["tick_upper"], hedge_slack)
+        print(f"Next check of {self.hedge_key} in {delay:.0f}s (tick {tick}, range [{risk['tick_lower']}, {risk['tick_upper']}], "
+              f"volatility {self.scheduler.volatility(self.hedge_key):.0%}).")
+        return delay
+
+    def position_threatened(self, tick: int, sqrt_price_x96: int) -> bool:
+        """
+        Checks a new pool tick (from a Swap event) against the managed position without any RPC reads.
+        The position is threatened when the tick leaves its range (minus EVENT_RANGE_MARGIN_TICKS),
+        or when the LP exposure at that price drifted from the hedged exposure by more than HEDGE_THRESHOLD.
+        """
+        if self.position_state is None or self.hedged_exposure is None:
+            return True # Nothing known about the position yet: run a full cycle.
+        tick_lower, tick_upper, liquidity = self.position_state
+        margin = self.config.EVENT_RANGE_MARGIN_TICKS
+        if tick < tick_lower + margin or tick >= tick_upper - margin:
+            print(f"Tick {tick} is outside range [{tick_lower}, {tick_upper}) (margin {margin}). Checking rebalance...")
+            return True
+        decimals0 = self.price_oracle.token_decimals[self.config.TOKEN0_ADDRESS]
+        decimals1 = self.price_oracle.token_decimals[self.config.TOKEN1_ADDRESS]
+        exposure, _ = self.lp_manager.calculate_position_amounts(liquidity, tick_lower, tick_upper, sqrt_price_x96, decimals0, decimals1)
+        if abs(exposure - self.hedged_exposure) > self.config.HEDGE_THRESHOLD:
+            print(f"LP exposure {exposure} drifted from hedged {self.hedged_exposure}. Checking hedge...")
+            return True
+        return False
+
+    def _run_event_driven(self):
+        """
+        Event-driven loop: poll the pool's Swap logs every EVENT_POLL_INTERVAL seconds and run a cycle only when
+        the new tick threatens the position's range or hedge band. A full cycle still runs every HEARTBEAT_INTERVAL.
+        """
+        pool_address = self.lp_manager.get_pool_address(self.config.TOKEN0_ADDRESS, self.config.TOKEN1_ADDRESS, self.config.POOL_FEE)
+        watcher = SwapEventWatcher(self.blockchain_client, [pool_address])
+        last_cycle = None
+        while True:
+            try:
+                heartbeat_due = last_cycle is None or time.monotonic() - last_cycle >= self.config.HEARTBEAT_INTERVAL
+                threatened = False
+                if pool_address in watcher.poll():
+                    tick, sqrt_price_x96, block_number = watcher.pool_state[pool_address]
+                    threatened = self.position_threatened(tick, sqrt_price_x96)
+                if heartbeat_due or threatened:
+                    self.run_cycle()
+                    last_cycle = time.monotonic()
+            except Exception as e:
+                print(f"Error during event polling: {e}")
+            time.sleep(self.config.EVENT_POLL_INTERVAL)
+
+    def startup(self):
+        """Loads the tokenId of the existing position, if there is one, and finishes any rebalance a crash interrupted."""
+        self.position_token_id = self._load_position_id()
+        self.resume_rebalances()
 
     def run(self):
         """Main execution loop for the bot."""
         print("Starting liquidity management and delta neutral bot...")
+        self.startup()
 
-        # Load tokenId of existing positions if you already have them
-        self.position_token_id = self._load_position_id()
+        if self.config.EVENT_DRIVEN:
+            self._run_event_driven()
+            return
+
+        # Continuous loop for bot operations. The wait adapts to how close the position is to needing action.
+        while True:
+            self.run_cycle()
+            time.sleep(self.next_check_delay())
+
+
+# --- 6. Portfolio Mode (many positions, one process) ---
+class PortfolioManager:
+    """
+    Manages N LP positions across N pools from one process. All positions share one RPC connection,
+    one pool registry and one derivatives client. Each cycle:
+      1. pins a single block and reads every position's state in concurrent Multicall3 batches (sent from worker
+         threads through the client's provider, so they get the same endpoint failover, hedging and RPC metrics),
+      2. runs each position's `rebalance_lp` / `manage_delta_neutral` concurrently, at most
+         PORTFOLIO_CONCURRENCY at a time, so cycle wall time follows the slowest position, not the sum.
+    """
+    def __init__(self, config: Config = None):
+        preload_modules(GREEKS_MODULES)
+        self.config = config or Config()
+        if self.config.METRICS_PORT:
+            METRICS.serve(self.config.METRICS_PORT, self.config.METRICS_HOST)
+        self.blockchain_client = BlockchainClient(self.config)
+        self.pool_registry = PoolRegistry(self.blockchain_client)
+        self.derivatives_manager = DerivativesManager(self.config, self.blockchain_client.journal)
+        # Every position's hedge is netted per symbol: one order per symbol per cycle.
+        self.hedge_book = HedgeBook(self.config, self.derivatives_manager)
+        # Decides which positions are due for a check (see AdaptiveScheduler).
+        self.scheduler = AdaptiveScheduler(self.config)
+        self.specs = self._load_portfolio()
+        self.bots = [self._build_bot(index, spec) for index, spec in enumerate(self.specs)]
+        if self.config.POSITION_DISCOVERY:
+            self._check_wallet_positions()
+        print(f"Portfolio loaded: {len(self.bots)} positions across {len({(s['token0'], s['token1'], s['fee']) for s in self.specs})} pools.")
+
+    def _load_portfolio(self) -> list:
+        """Loads the list of managed positions from PORTFOLIO_PATH."""
+        with open(self.config.PORTFOLIO_PATH, "r") as f:
+            return json.load(f)["positions"]
+
+    def _save_portfolio(self):
+        """Persists the (possibly re-minted) token IDs back to the portfolio file."""
+        try:
+            tmp_path = f"{self.config.PORTFOLIO_PATH}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump({"positions": self.specs}, f, indent=2)
+            os.replace(tmp_path, self.config.PORTFOLIO_PATH)
+        except Exception as e:
+            print(f"Error saving portfolio file: {e}")
+
+    def _check_wallet_positions(self):
+        """Compares the portfolio with the wallet's position NFTs (one batched discovery) and reports mismatches."""
+        index = PositionIndex(self.blockchain_client)
+        try:
+            index.discover()
+        except Exception as e:
+            print(f"Could not index the wallet's positions: {e}")
+            return
+        managed = {bot.position_token_id for bot in self.bots}
+        for token_id in sorted(managed - set(index.positions)):
+            print(f"Warning: portfolio position {token_id} is not owned by {index.owner}.")
+        for token_id, position in sorted(index.positions.items()):
+            if token_id not in managed and position["liquidity"] > 0:
+                print(f"Unmanaged position {token_id} in the wallet: {position['token0']}/{position['token1']} {position['fee']}, "
+                      f"ticks [{position['tick_lower']}, {position['tick_upper']}], liquidity {position['liquidity']}.")
+
+    def _build_bot(self, index: int, spec: dict) -> LiquidityManagerBot:
+        """Creates the per-position bot: its own config and cycle snapshot, shared connection, registry and hedge book."""
+        position_config = self.config.for_position(spec)
+        client = self.blockchain_client.for_config(position_config)
+        # The key survives re-mints (the token ID changes on every rebalance), so attribution follows the position.
+        hedge_key = f"{index}:{position_config.TOKEN0_ADDRESS_SYMBOL}/{position_config.TOKEN1_ADDRESS_SYMBOL}/{position_config.POOL_FEE}"
+        bot = LiquidityManagerBot(position_config, client, self.pool_registry, self.derivatives_manager,
+                                  self.hedge_book, hedge_key, self.scheduler)
+        # A rebalance that finished after the portfolio file was last saved is followed through the journal.
+        bot.position_token_id = client.journal.latest_token_id(spec["token_id"])
+        return bot
+
+    async def _prefetch_all(self, bots: list, block_number: int) -> dict:
+        """
+        Reads the cycle state of `bots` at `block_number`. Duplicate reads (e.g. the slot0 of a pool
+        shared by several positions) are sent once; Multicall3 chunks are sent concurrently.
+        Returns {(address, function name, args): result}.
+        """
+        unique_calls = {}
+        for bot in bots:
+            for fn in bot.cycle_reads(bot.position_token_id):
+                unique_calls.setdefault((fn.address, fn.fn_name, tuple(fn.args)), fn)
+        keys = list(unique_calls)
+        calls = list(unique_calls.values())
+
+        batch_size = self.config.MULTICALL_BATCH_SIZE
+        chunks = [calls[start:start + batch_size] for start in range(0, len(calls), batch_size)]
+        chunk_results = await asyncio.gather(*(self._async_multicall(chunk, block_number) for chunk in chunks))
+        results = [result for chunk_result in chunk_results for result in chunk_result]
+        return dict(zip(keys, results))
+
+    async def _async_multicall(self, calls: list, block_number: int) -> list:
+        """Sends one Multicall3 `aggregate3` from a worker thread and decodes it like BlockchainClient.batch_call."""
+        client = self.blockchain_client
+        return_data = await asyncio.to_thread(client.w3.eth.call, client.encode_batch(calls), block_number)
+        return client.decode_batch(calls, return_data)
+
+    def _manage_sync(self, bot: LiquidityManagerBot, block_number: int, prefetched: dict):
+        """Runs one position's cycle in a worker thread, starting from the reads prefetched for the whole portfolio."""
+        client = bot.blockchain_client
+        client.cycle = CycleContext(block_number)
+        for fn in bot.cycle_reads(bot.position_token_id):
+            key = (fn.address, fn.fn_name, tuple(fn.args))
+            if key in prefetched:
+                client.cycle.put(fn, prefetched[key])
+        try:
+            print(f"\n--- Managing LP Position {bot.position_token_id} ({bot.config.TOKEN0_ADDRESS_SYMBOL}/{bot.config.TOKEN1_ADDRESS_SYMBOL} {bot.config.POOL_FEE}) ---")
+            bot.manage_position(bot.position_token_id)
+        except Exception as e:
+            # One failing position must not stop the others.
+            print(f"Error managing position {bot.position_token_id}: {e}")
+        finally:
+            client.end_cycle()
 
-        # Set token symbols for clearer logging messages
-        self.config.TOKEN0_ADDRESS_SYMBOL = "WETH"
-        self.config.TOKEN1_ADDRESS_SYMBOL = "USDC"
+    async def _manage(self, bot: LiquidityManagerBot, block_number: int, prefetched: dict, semaphore: asyncio.Semaphore):
+        async with semaphore:
+            await asyncio.to_thread(self._manage_sync, bot, block_number, prefetched)
 
-        # Continuous loop for bot operations
+    @METRICS.timed("portfolio_cycle")
+    async def run_cycle(self, bots: list = None):
+        """
+        One portfolio cycle: pin a block, batch-read the positions, then manage them concurrently.
+        `bots` restricts the cycle to some positions (event-driven mode); by default all are managed.
+        """
+        bots = self.bots if bots is None else bots
+        # Half-done rebalances are finished first (usually a no-op journal query per position), before the block is pinned.
+        for bot in bots:
+            await asyncio.to_thread(bot.resume_rebalances)
+        block_number = await asyncio.to_thread(lambda: self.blockchain_client.w3.eth.block_number)
+        prefetched = await self._prefetch_all(bots, block_number) if self.config.USE_MULTICALL else {}
+        semaphore = asyncio.Semaphore(self.config.PORTFOLIO_CONCURRENCY)
+        await asyncio.gather(*(self._manage(bot, block_number, prefetched, semaphore) for bot in bots))
+        # All positions have recorded their exposure: one net hedge order per symbol.
+        await asyncio.to_thread(self.hedge_book.flush)
+
+        # Rebalances mint new NFTs: keep the portfolio file in sync with the bots.
+        changed = False
+        for spec, bot in zip(self.specs, self.bots):
+            if bot.position_token_id != spec["token_id"]:
+                spec["token_id"] = bot.position_token_id
+                changed = True
+        if changed:
+            self._save_portfolio()
+
+    def _pool_address(self, bot: LiquidityManagerBot) -> str:
+        return self.pool_registry.get_pool(bot.config.TOKEN0_ADDRESS, bot.config.TOKEN1_ADDRESS, bot.config.POOL_FEE)["pool_address"]
+
+    async def _run_event_driven(self):
+        """
+        Event-driven portfolio loop: one eth_getLogs poll covers every managed pool, and only the positions
+        whose range or hedge band is threatened by the new ticks are managed. All positions still get a full
+        cycle every HEARTBEAT_INTERVAL.
+        """
+        watcher = SwapEventWatcher(self.blockchain_client, list({self._pool_address(bot) for bot in self.bots}))
+        last_cycle = None
         while True:
             try:
-                if self.position_token_id:
-                    print(f"\n--- Managing LP Position {self.position_token_id} ---")
-                    # Perform LP rebalancing first
-                    self.rebalance_lp(self.position_token_id)
-                    # Then manage the delta neutral hedge
-                    self.manage_delta_neutral(self.position_token_id)
-
-                    # You can also collect fees periodically
-                    # self.lp_manager.collect_fees(self.position_token_id)
+                if last_cycle is None or time.monotonic() - last_cycle >= self.config.HEARTBEAT_INTERVAL:
+                    await self.run_cycle()
+                    last_cycle = time.monotonic()
                 else:
-                    print("\nNo active LP position loaded. Attempting initial setup (if enabled)...")
-                    # This will attempt to mint a new position if one isn't loaded.
-                    # ONLY UNCOMMENT AND USE IF YOU INTEND TO MINT A NEW LP POSITION!
-                    # You need to ensure your wallet has sufficient tokens and has approved the NFT Manager.
-                    # Example: 0.01 WETH and 25 USDC, target range for WETH: $2400-$2600.
-                    # If you run this, it will attempt to mint a new position and save its ID.
-                    # self.initial_setup(Decimal("0.01"), Decimal("25"), Decimal("2400"), Decimal("2600")) 
-                    
-                    # If you're just testing the loop without minting, leave this commented.
-                    # If you uncommented `initial_setup`, you must restart the bot after the first successful mint
-                    # to ensure the `position_token_id` is loaded from `position_id.txt`.
-                    
-                    pass # Keep looping but don't try to manage non-existent position.
+                    updated_pools = await asyncio.to_thread(watcher.poll)
+                    threatened = []
+                    for bot in self.bots:
+                        pool_address = self._pool_address(bot)
+                        if pool_address in updated_pools:
+                            tick, sqrt_price_x96, block_number = watcher.pool_state[pool_address]
+                            if bot.position_threatened(tick, sqrt_price_x96):
+                                threatened.append(bot)
+                    if threatened:
+                        await self.run_cycle(threatened)
+            except Exception as e:
+                print(f"Error during portfolio event polling: {e}")
+            await asyncio.sleep(self.config.EVENT_POLL_INTERVAL)
 
+    async def _run_forever(self):
+        print(f"Starting portfolio bot for {len(self.bots)} positions...")
+        if self.config.EVENT_DRIVEN:
+            await self._run_event_driven()
+            return
+        keys = [bot.hedge_key for bot in self.bots]
+        while True:
+            # Only the positions that are due are read and managed; the hedge book still nets every position.
+            due = [bot for bot in self.bots if self.scheduler.is_due(bot.hedge_key)]
+            started = time.monotonic()
+            try:
+                await self.run_cycle(due)
             except Exception as e:
-                print(f"Error during bot execution: {e}")
-                # TODO: Implement a robust alert system (e.g., Telegram, Discord, email)
-                # to notify you of errors or critical events.
-                
-                # In case of a critical error, you might want to stop the bot or implement a backoff.
-                # For now, just print and continue after a delay.
+                print(f"Error during portfolio cycle: {e}")
+            for bot in due:
+                self.scheduler.schedule(bot.hedge_key, bot.next_check_delay())
+            wait = self.scheduler.seconds_until_next(keys)
+            print(f"Portfolio cycle over {len(due)}/{len(self.bots)} positions took {time.monotonic() - started:.2f}s. Next check in {wait:.0f}s...")
+            await asyncio.sleep(wait)
 
-            print("Waiting 5 minutes before next execution cycle...")
-            time.sleep(5 * 60) # Pause for 5 minutes (adjust as needed for your strategy and gas costs)
+    def run(self):
+        """Main execution loop for portfolio mode."""
+        asyncio.run(self._run_forever())
 
 
 # --- Bot Execution (Example Usage) ---
 if __name__ == "__main__":
     # BEFORE RUNNING:
     # 1. Create an 'abi' folder in the same directory as this script.
-    # 2. Download and save the ABIs for Uniswap V3 Factory, Pool, NonfungiblePositionManager, ERC20, and Chainlink AggregatorV3Interface into the 'abi' folder.
+    # 2. Download and save the ABIs for Uniswap V3 Factory, Pool, NonfungiblePositionManager, ERC20, Chainlink AggregatorV3Interface, Multicall3 and SwapRouter (V3, for REBALANCE_SWAP) into the 'abi' folder.
+    #    - The Multicall3 ABI is published at https://www.multicall3.com/abi (save it as abi/Multicall3.json).
     #    - Chainlink AggregatorV3Interface ABI can be found on Chainlink's official documentation or Etherscan for any Chainlink price feed.
     # 3. Set your environment variables (NODE_URL, PRIVATE_KEY, WALLET_ADDRESS, DERIVATIVES_EXCHANGE_API_KEY, DERIVATIVES_EXCHANGE_API_SECRET).
     #    - Example for Linux/macOS:
@@ -939,24 +3286,28 @@ if __name__ == "__main__":
     #      export DERIVATIVES_EXCHANGE_API_SECRET="YOUR_CEX_API_SECRET"
     #    - Or hardcode them in Config, but BE AWARE OF THE SECURITY RISKS.
 
-    bot = LiquidityManagerBot()
+    # Portfolio mode: set PORTFOLIO_MODE=true and list your positions in portfolio.json (see Config).
+    if os.getenv("PORTFOLIO_MODE", "false").lower() == "true":
+        PortfolioManager().run()
+    else:
+        bot = LiquidityManagerBot()
     
-    # --- IMPORTANT ---
-    # If you want to create a NEW LP position from scratch:
-    # 1. Ensure your wallet has enough WETH and USDC (or your chosen tokens).
-    # 2. Ensure the Uniswap V3 NFT Position Manager has **approval** to spend your WETH and USDC.
-    #    The `provide_liquidity` function includes approval checks, but it's good to be aware.
-    # 3. UNCOMMENT the `bot.initial_setup` line below and set desired amounts and price range.
-    #    After a successful mint, the `tokenId` will be saved to `position_id.txt`.
-    #    You should then **comment out `initial_setup` again** and restart the bot so it loads the existing ID.
-    #
-    # Example: 0.01 WETH, 25 USDC, target range for WETH: $2400-$2600.
-    # bot.initial_setup(Decimal("0.01"), Decimal("25"), Decimal("2400"), Decimal("2600"))
-
-    # If you have an EXISTING Uniswap V3 LP position (an NFT):
-    # 1. Find its Token ID (e.g., on Etherscan, by looking up your wallet address under ERC721 tokens).
-    # 2. UNCOMMENT the `bot.position_token_id` line below and REPLACE `123456789` with your actual NFT ID.
-    #    This will tell the bot to manage that specific position.
-    # bot.position_token_id = 123456789 # <--- REPLACE WITH YOUR ACTUAL LP NFT ID
-
-    bot.run()
+        # --- IMPORTANT ---
+        # If you want to create a NEW LP position from scratch:
+        # 1. Ensure your wallet has enough WETH and USDC (or your chosen tokens).
+        # 2. Ensure the Uniswap V3 NFT Position Manager has **approval** to spend your WETH and USDC.
+        #    The `provide_liquidity` function includes approval checks, but it's good to be aware.
+        # 3. UNCOMMENT the `bot.initial_setup` line below and set desired amounts and price range.
+        #    After a successful mint, the `tokenId` will be saved to the state journal (bot_state.db).
+        #    You should then **comment out `initial_setup` again** and restart the bot so it loads the existing ID.
+        #
+        # Example: 0.01 WETH, 25 USDC, target range for WETH: $2400-$2600.
+        # bot.initial_setup(Decimal("0.01"), Decimal("25"), Decimal("2400"), Decimal("2600"))
+
+        # If you have an EXISTING Uniswap V3 LP position (an NFT):
+        # 1. Find its Token ID (e.g., on Etherscan, by looking up your wallet address under ERC721 tokens).
+        # 2. UNCOMMENT the `bot.position_token_id` line below and REPLACE `123456789` with your actual NFT ID.
+        #    This will tell the bot to manage that specific position.
+        # bot.position_token_id = 123456789 # <--- REPLACE WITH YOUR ACTUAL LP NFT ID
+
+        bot.run()
@@ -0,0 +1,436 @@
+"""
+Derivatives venue access for the delta neutral hedge: async exchange adapters, a local position/mark cache fed by
+the venue's fill stream, and a mock exchange server that stands in for the venue.
+
+- `ExchangeAdapter` is the interface a venue implements (snapshot, order placement, event stream).
+  `PaperExchange` fills in-process (dry runs); `RestStreamExchange` speaks the small REST + websocket protocol
+  below, which the mock server implements. A real venue gets its own subclass translating its API to the
+  same calls and events.
+- `ExchangeSession` runs the adapter on its own event loop thread. Stream events keep a `PositionCache` current,
+  so hedge decisions read memory instead of polling, and orders are submitted without blocking the caller.
+
+Protocol of `RestStreamExchange` (amounts and prices are decimal strings; positions are signed, negative = short):
+    GET  /snapshot  -> {"positions": {symbol: amount}, "marks": {symbol: price}, "open_orders": {client_order_id: remaining}}
+    POST /orders    {"symbol", "side": "BUY"|"SELL", "amount", "type", "client_order_id"} -> {"order_id", "status"}
+    WS   /stream    events: {"type": "subscribed"} (first message, once the subscription is live)
+                            {"type": "fill", "symbol", "side", "amount", "price", "client_order_id", "position"}
+                            {"type": "position", "symbol", "position"}
+                            {"type": "mark", "symbol", "price"}
+
+Run the mock venue (marks random-walk from 3000; orders fill after an optional delay):
+    python uniswap_lp_derivatives.py mock-server [PORT] [FILL_DELAY_SECONDS]
+and point the bot at it with DERIVATIVES_EXCHANGE=rest DERIVATIVES_EXCHANGE_URL=http://127.0.0.1:PORT.
+"""
+import asyncio
+import hashlib
+import hmac
+import json
+import random
+import sys
+import threading
+import time
+import uuid
+from decimal import Decimal
+
+import aiohttp
+# aiohttp.web (server side) is imported by MockExchangeServer only: the bot itself never serves.
+
+
+class ExchangeAdapter:
+    """Interface of a derivatives venue. All methods are coroutines run on the session's event loop."""
+
+    async def connect(self):
+        """Opens connections/sessions. Called once before anything else."""
+
+    async def snapshot(self) -> dict:
+        """Current state: {"positions": {symbol: Decimal}, "marks": {symbol: Decimal}, "open_orders": {id: Decimal}}."""
+        raise NotImplementedError
+
+    async def place_order(self, symbol: str, side: str, amount: Decimal, order_type: str, client_order_id: str) -> dict:
+        """Submits an order and returns the venue's acknowledgement ({"order_id", "status"}). Fills arrive on the stream."""
+        raise NotImplementedError
+
+    async def stream(self):
+        """Async iterator of fill/position/mark events (see the module docstring). Ends or raises on disconnect."""
+        raise NotImplementedError
+        yield
+
+    async def close(self):
+        """Releases connections."""
+
+
+class PositionCache:
+    """
+    In-memory positions, mark prices and in-flight orders per symbol, updated from stream events.
+    Thread-safe: the session's loop writes, bot threads read.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.positions = {}
+        self.marks = {}
+        # client_order_id -> [symbol, signed remaining amount (SELL negative), acknowledged?]
+        self.pending = {}
+        self.updated_at = 0.0 # time.time() of the last applied snapshot or event
+        self.live = False # True while the stream is connected and the state was resynced after connecting
+
+    def position(self, symbol: str) -> Decimal:
+        with self._lock:
+            return self.positions.get(symbol, Decimal("0"))
+
+    def pending_amount(self, symbol: str) -> Decimal:
+        """Signed amount of orders sent but not filled yet (they will move the position by this much)."""
+        with self._lock:
+            return sum((entry[1] for entry in self.pending.values() if entry[0] == symbol), Decimal("0"))
+
+    def mark(self, symbol: str) -> Decimal | None:
+        with self._lock:
+            return self.marks.get(symbol)
+
+    def add_pending(self, client_order_id: str, symbol: str, signed_amount: Decimal):
+        with self._lock:
+            self.pending[client_order_id] = [symbol, signed_amount, False]
+
+    def acknowledge(self, client_order_id: str, accepted: bool):
+        with self._lock:
+            if not accepted:
+                self.pending.pop(client_order_id, None)
+            elif client_order_id in self.pending:
+                self.pending[client_order_id][2] = True
+
+    def reset(self, snapshot: dict):
+        """Replaces the state with a venue snapshot (on connect/reconnect). Unacknowledged orders are kept."""
+        with self._lock:
+            self.positions = dict(snapshot.get("positions", {}))
+            self.marks.update(snapshot.get("marks", {}))
+            open_orders = snapshot.get("open_orders", {})
+            for client_order_id, entry in list(self.pending.items()):
+                if client_order_id in open_orders:
+                    entry[1] = open_orders[client_order_id] if entry[1] > 0 else -open_orders[client_order_id]
+                elif entry[2]:
+                    # Acknowledged and no longer open: filled (or cancelled) while we were disconnected,
+                    # and the snapshot's position already reflects it.
+                    del self.pending[client_order_id]
+            self.updated_at = time.time()
+
+    def apply(self, event: dict):
+        kind = event["type"]
+        if kind == "subscribed":
+            return
+        with self._lock:
+            symbol = event["symbol"]
+            if kind == "mark":
+                self.marks[symbol] = Decimal(event["price"])
+            elif kind == "position":
+                self.positions[symbol] = Decimal(event["position"])
+            elif kind == "fill":
+                self.positions[symbol] = Decimal(event["position"])
+                self.marks.setdefault(symbol, Decimal(event["price"]))
+                entry = self.pending.get(event.get("client_order_id"))
+                if entry is not None:
+                    filled = Decimal(event["amount"])
+                    entry[1] = entry[1] - filled if entry[1] > 0 else entry[1] + filled
+                    if entry[1] == 0:
+                        del self.pending[event["client_order_id"]]
+            self.updated_at = time.time()
+
+
+def _to_decimals(mapping: dict) -> dict:
+    return {key: Decimal(str(value)) for key, value in mapping.items()}
+
+
+class PaperExchange(ExchangeAdapter):
+    """In-process venue for dry runs: market orders fill immediately at the mark price."""
+
+    def __init__(self, marks: dict = None):
+        self.positions = {}
+        self.marks = _to_decimals(marks or {})
+        self._events = None
+
+    async def connect(self):
+        self._events = asyncio.Queue()
+
+    async def snapshot(self) -> dict:
+        return {"positions": dict(self.positions), "marks": dict(self.marks), "open_orders": {}}
+
+    async def place_order(self, symbol: str, side: str, amount: Decimal, order_type: str, client_order_id: str) -> dict:
+        position = self.positions.get(symbol, Decimal("0")) + (amount if side == "BUY" else -amount)
+        self.positions[symbol] = position
+        price = self.marks.get(symbol, Decimal("0"))
+        print(f"Paper fill: {side} {amount} {symbol} at {price} (position now {position})")
+        await self._events.put({"type": "fill", "symbol": symbol, "side": side, "amount": str(amount), "price": str(price),
+                                "client_order_id": client_order_id, "position": str(position)})
+        return {"order_id": client_order_id, "status": "filled"}
+
+    async def stream(self):
+        yield {"type": "subscribed"}
+        while True:
+            yield await self._events.get()
+
+
+class RestStreamExchange(ExchangeAdapter):
+    """
+    Venue speaking the REST + websocket protocol of the module docstring (the mock server implements it).
+    REST requests are signed: X-SIGNATURE = HMAC-SHA256(secret, timestamp + method + path + body).
+    """
+    def __init__(self, base_url: str, api_key: str, api_secret: str, stream_url: str = None, timeout: float = 10):
+        self.base_url = base_url.rstrip("/")
+        self.stream_url = stream_url or self.base_url.replace("http", "ws", 1) + "/stream"
+        self.api_key = api_key
+        self.api_secret = api_secret
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self.session = None
+
+    async def connect(self):
+        # One pooled keep-alive session for REST and the websocket.
+        self.session = aiohttp.ClientSession(timeout=self.timeout)
+
+    def _headers(self, method: str, path: str, body: str) -> dict:
+        timestamp = str(int(time.time() * 1000))
+        signature = hmac.new(self.api_secret.encode(), (timestamp + method + path + body).encode(), hashlib.sha256).hexdigest()
+        return {"X-API-KEY": self.api_key, "X-TIMESTAMP": timestamp, "X-SIGNATURE": signature, "Content-Type": "application/json"}
+
+    async def _request(self, method: str, path: str, payload: dict = None) -> dict:
+        body = json.dumps(payload) if payload is not None else ""
+        async with self.session.request(method, self.base_url + path, data=body or None,
+                                        headers=self._headers(method, path, body)) as response:
+            data = await response.json()
+            if response.status >= 400:
+                raise Exception(f"{method} {path} failed ({response.status}): {data}")
+            return data
+
+    async def snapshot(self) -> dict:
+        data = await self._request("GET", "/snapshot")
+        return {"positions": _to_decimals(data["positions"]), "marks": _to_decimals(data["marks"]),
+                "open_orders": _to_decimals(data.get("open_orders", {}))}
+
+    async def place_order(self, symbol: str, side: str, amount: Decimal, order_type: str, client_order_id: str) -> dict:
+        return await self._request("POST", "/orders", {
+            "symbol": symbol, "side": side, "amount": str(amount), "type": order_type, "client_order_id": client_order_id
+        })
+
+    async def stream(self):
+        async with self.session.ws_connect(self.stream_url, headers=self._headers("GET", "/stream", ""), heartbeat=15) as ws:
+            async for message in ws:
+                if message.type == aiohttp.WSMsgType.TEXT:
+                    yield json.loads(message.data)
+                elif message.type in (aiohttp.WSMsgType.CLOSED, aiohttp.WSMsgType.ERROR):
+                    break
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+
+
+class ExchangeSession:
+    """
+    Runs an ExchangeAdapter on a dedicated event loop thread. The stream keeps `cache` current (reconnecting with
+    backoff and resyncing from a snapshot each time); orders are submitted from any thread and return a
+    concurrent.futures.Future of the venue's acknowledgement.
+    With background=True the constructor returns at once and the venue is connected while the caller carries on
+    (e.g. while the bot reads the chain); `wait_started` blocks until it is.
+    """
+    MAX_RECONNECT_DELAY = 30
+
+    def __init__(self, adapter: ExchangeAdapter, cache: PositionCache = None, connect_timeout: float = 10,
+                 background: bool = False):
+        self.adapter = adapter
+        self.cache = cache or PositionCache()
+        self.connect_timeout = connect_timeout
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever, name="exchange-session", daemon=True)
+        self._thread.start()
+        self._stream_task = None
+        self._connected = False
+        self.started = asyncio.run_coroutine_threadsafe(self._start(), self.loop)
+        if not background:
+            self.started.result(timeout=connect_timeout)
+
+    async def _start(self):
+        if not self._connected:
+            await self.adapter.connect()
+            self._connected = True
+        self.cache.reset(await self.adapter.snapshot())
+        self._stream_task = asyncio.ensure_future(self._follow_stream())
+
+    def wait_started(self, timeout: float = None):
+        """
+        Blocks until the initial connect and snapshot are done (raising if they fail or time out).
+        A start that failed is retried, so a venue that was down at startup is picked up once it is back.
+        """
+        if self.started.done() and self.started.exception() is not None:
+            self.started = asyncio.run_coroutine_threadsafe(self._start(), self.loop)
+        self.started.result(timeout=timeout or self.connect_timeout)
+
+    async def _follow_stream(self):
+        delay = 1
+        while True:
+            try:
+                resynced = False
+                async for event in self.adapter.stream():
+                    if not resynced:
+                        # The first event ("subscribed") proves the stream is up: resync so nothing before it is missed.
+                        self.cache.reset(await self.adapter.snapshot())
+                        self.cache.live = resynced = True
+                        delay = 1
+                    self.cache.apply(event)
+                print("Exchange stream closed. Reconnecting...")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Exchange stream error: {e}. Reconnecting in {delay}s...")
+            self.cache.live = False
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, self.MAX_RECONNECT_DELAY)
+
+    def refresh(self, timeout: float = 10):
+        """Blocking snapshot resync, for when the stream is down and the cache may be stale."""
+        snapshot = asyncio.run_coroutine_threadsafe(self.adapter.snapshot(), self.loop).result(timeout=timeout)
+        self.cache.reset(snapshot)
+
+    def submit_order(self, symbol: str, side: str, amount: Decimal, order_type: str = "MARKET", client_order_id: str = None):
+        """
+        Sends an order without waiting for it. The cache counts it as pending until its fills arrive.
+        client_order_id: the caller's ID for the order (e.g. already journaled); a random one when None.
+        """
+        client_order_id = client_order_id or uuid.uuid4().hex
+        self.cache.add_pending(client_order_id, symbol, amount if side == "BUY" else -amount)
+        return asyncio.run_coroutine_threadsafe(self._place(symbol, side, amount, order_type, client_order_id), self.loop)
+
+    async def _place(self, symbol: str, side: str, amount: Decimal, order_type: str, client_order_id: str) -> dict:
+        try:
+            ack = await self.adapter.place_order(symbol, side, amount, order_type, client_order_id)
+        except Exception as e:
+            self.cache.acknowledge(client_order_id, accepted=False)
+            print(f"Order {side} {amount} {symbol} failed: {e}")
+            raise
+        self.cache.acknowledge(client_order_id, accepted=ack.get("status") != "rejected")
+        print(f"Order {side} {amount} {symbol} acknowledged: {ack}")
+        return ack
+
+    def close(self, timeout: float = 5):
+        async def _close():
+            if self._stream_task is not None:
+                self._stream_task.cancel()
+            await self.adapter.close()
+        asyncio.run_coroutine_threadsafe(_close(), self.loop).result(timeout=timeout)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+
+
+class MockExchangeServer:
+    """
+    Local stand-in for a derivatives venue implementing the RestStreamExchange protocol. Marks random-walk every
+    `mark_interval` seconds; market orders fill in full at the mark after `fill_delay` seconds.
+    """
+    def __init__(self, marks: dict = None, fill_delay: float = 0.0, mark_interval: float = 1.0, volatility: float = 0.001):
+        self.positions = {}
+        self.marks = _to_decimals(marks or {"ETH-PERP": "3000"})
+        self.open_orders = {}
+        self.fill_delay = fill_delay
+        self.mark_interval = mark_interval
+        self.volatility = volatility
+        self.orders_received = []
+        self._clients = set()
+        self._tasks = set()
+        self._runner = None
+        from aiohttp import web
+        self.app = web.Application()
+        self.app.add_routes([web.get("/snapshot", self._snapshot), web.post("/orders", self._orders),
+                             web.get("/stream", self._stream), web.post("/mark", self._set_mark)])
+
+    async def _broadcast(self, event: dict):
+        message = json.dumps(event)
+        for ws in list(self._clients):
+            try:
+                await ws.send_str(message)
+            except ConnectionError:
+                self._clients.discard(ws)
+
+    async def _snapshot(self, request):
+        from aiohttp import web
+        return web.json_response({
+            "positions": {s: str(a) for s, a in self.positions.items()}, "marks": {s: str(p) for s, p in self.marks.items()},
+            "open_orders": {i: str(o["amount"]) for i, o in self.open_orders.items()},
+        })
+
+    async def _orders(self, request):
+        from aiohttp import web
+        order = await request.json()
+        self.orders_received.append(order)
+        amount = Decimal(order["amount"])
+        if order["symbol"] not in self.marks or amount <= 0 or order["side"] not in ("BUY", "SELL"):
+            return web.json_response({"status": "rejected", "error": "invalid order"}, status=400)
+        order_id = uuid.uuid4().hex
+        self.open_orders[order["client_order_id"]] = dict(order, amount=amount)
+        task = asyncio.ensure_future(self._fill(order["client_order_id"]))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return web.json_response({"order_id": order_id, "status": "accepted"})
+
+    async def _fill(self, client_order_id: str):
+        await asyncio.sleep(self.fill_delay)
+        order = self.open_orders.pop(client_order_id)
+        symbol, amount = order["symbol"], order["amount"]
+        position = self.positions.get(symbol, Decimal("0")) + (amount if order["side"] == "BUY" else -amount)
+        self.positions[symbol] = position
+        await self._broadcast({"type": "fill", "symbol": symbol, "side": order["side"], "amount": str(amount),
+                               "price": str(self.marks[symbol]), "client_order_id": client_order_id, "position": str(position)})
+
+    async def _set_mark(self, request):
+        from aiohttp import web
+        data = await request.json()
+        self.marks[data["symbol"]] = Decimal(data["price"])
+        await self._broadcast({"type": "mark", "symbol": data["symbol"], "price": data["price"]})
+        return web.json_response({"ok": True})
+
+    async def _stream(self, request):
+        from aiohttp import web
+        ws = web.WebSocketResponse(heartbeat=15)
+        await ws.prepare(request)
+        self._clients.add(ws)
+        await ws.send_str(json.dumps({"type": "subscribed"}))
+        for symbol, price in self.marks.items():
+            await ws.send_str(json.dumps({"type": "mark", "symbol": symbol, "price": str(price)}))
+        try:
+            async for _ in ws:
+                pass
+        finally:
+            self._clients.discard(ws)
+        return ws
+
+    async def _walk_marks(self):
+        while True:
+            await asyncio.sleep(self.mark_interval)
+            for symbol, price in list(self.marks.items()):
+                self.marks[symbol] = (price * Decimal(str(1 + random.gauss(0, self.volatility)))).quantize(Decimal("0.01"))
+                await self._broadcast({"type": "mark", "symbol": symbol, "price": str(self.marks[symbol])})
+
+    async def start(self, host: str = "127.0.0.1", port: int = 8765) -> int:
+        """Starts serving on the running loop; returns the bound port (pass port=0 for a free one)."""
+        from aiohttp import web
+        self._runner = web.AppRunner(self.app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        self._tasks.add(asyncio.ensure_future(self._walk_marks()))
+        return self._runner.addresses[0][1]
+
+    async def stop(self):
+        for task in list(self._tasks):
+            task.cancel()
+        for ws in list(self._clients):
+            await ws.close()
+        await self._runner.cleanup()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] != "mock-server":
+        print("Usage: python uniswap_lp_derivatives.py mock-server [PORT] [FILL_DELAY_SECONDS]")
+        sys.exit(1)
+
+    async def _serve():
+        server = MockExchangeServer(fill_delay=float(sys.argv[3]) if len(sys.argv) > 3 else 0.0)
+        port = await server.start(port=int(sys.argv[2]) if len(sys.argv) > 2 else 8765)
+        print(f"Mock exchange listening on http://127.0.0.1:{port} (marks: {server.marks})")
+        await asyncio.Event().wait()
+
+    asyncio.run(_serve())
@@ -0,0 +1,1908 @@
+"""
+In-process Uniswap V3 chain emulator: a web3 provider for load tests and profiling of the LP bot, with no node.
+
+EmulatedChain runs, in Python, the contracts the bot talks to, at the addresses of its configuration:
+    Factory                 getPool, createPool, feeAmountTickSpacing (pool addresses derived as in CREATE2)
+    Pool                    slot0, liquidity, tickSpacing, ... with the core contract's mint/burn/collect/swap logic:
+                            ticks, fee growth inside/outside, the tick bitmap's word-by-word search, and the exact
+                            integer TickMath/SqrtPriceMath/SwapMath of uniswap_v3_math.py, so amounts match mainnet
+    NonfungiblePositionManager   positions, mint, increaseLiquidity, decreaseLiquidity, collect, burn, multicall,
+                            selfPermit and the enumerable ERC721 surface, with the periphery's checks and events
+    ERC20                   balanceOf, allowance, approve, transfer(From) and EIP-2612 permit
+    Chainlink feed          latestRoundData, optionally following a pool's price block by block
+    Multicall3              aggregate3
+    SwapRouter              exactInputSingle (the input is pulled from the sender in the swap callback)
+EmulatorProvider serves it over JSON-RPC (eth_call, eth_estimateGas, eth_sendRawTransaction, receipts, eth_getLogs,
+eth_feeHistory, ...), so `BlockchainClient(config, provider=EmulatorProvider(chain))` runs the bot unchanged:
+signing, nonces, the transaction supervisor, Multicall3 batching and the eth_call fast path all go through it.
+
+Every signed transaction is mined at once in a block of its own ("automine"). `EmulatedChain.mine` adds blocks of
+random-walk swaps (geometric Brownian motion at a given annualized volatility) to every pool, so positions drift out
+of range and get rebalanced. Simplifications, none of which the bot relies on:
+- reads at an older block see the latest state (the bot pins the head block anyway);
+- gas is a fixed schedule per contract function plus calldata gas, not metered opcode by opcode (see the GAS tables);
+- the base fee is constant and block timestamps follow the wall clock (the bot's deadlines do);
+- pool callbacks are Python callables (the position manager and the swap router pull their payment with
+  transferFrom, a random-walk swap's input is minted to the pool), no oracle observations, protocol fees, flash loans, ETH balances or ERC721 approvals.
+
+Load test: N positions across the WETH/USDT 0.05%, 0.3% and 1% pools, M blocks, a management cycle every K blocks:
+    python uniswap_lp_emulator.py --positions 8 --blocks 5000 --blocks-per-cycle 25 --profile emulator.prof
+Prints blocks/s, cycles/s, rebalances, transactions and JSON-RPC requests per method. The bot's output is hidden
+unless --verbose. The ABIs of the emulated contracts can be written out with --write-abis DIR.
+
+Crash recovery check: rebalances left half done in the state journal (sequential withdrawing / withdrawn, atomic
+submitted) must be finished, or aborted, by the next start of a single-position bot with the default Config:
+    python uniswap_lp_emulator.py --check-resume
+"""
+import functools
+import json
+import math
+import os
+import random
+import threading
+import time
+from bisect import bisect_left, bisect_right
+from collections import Counter, namedtuple
+
+import rlp
+from eth_abi import decode as abi_decode, encode as abi_encode
+from eth_abi.exceptions import DecodingError, EncodingError
+from eth_account import Account
+from eth_keys import keys
+from eth_utils import keccak, to_checksum_address
+from web3.providers.base import JSONBaseProvider
+
+from uniswap_lp_metrics import METRICS
+from uniswap_v3_math import (
+    MAX_SQRT_RATIO, MAX_TICK, MAX_UINT128, MAX_UINT256, MIN_SQRT_RATIO, MIN_TICK, Q128,
+    compute_swap_step, get_amount0_delta_signed, get_amount1_delta_signed, get_liquidity_for_amount0, get_liquidity_for_amounts,
+    get_sqrt_ratio_at_tick, get_tick_at_sqrt_ratio, mul_div, price_to_sqrt_price_x96,
+)
+
+# The bot's RPC metrics (registering an existing name returns the bot's metric), so load tests read the same counters.
+RPC_LATENCY = METRICS.histogram("lpbot_rpc_request_seconds", "JSON-RPC request latency, failover and hedging included.", ("method",))
+RPC_ERRORS = METRICS.counter("lpbot_rpc_errors_total", "Failed JSON-RPC requests (transport: every endpoint failed; rpc: error answer).", ("method", "kind"))
+
+ZERO_ADDRESS = "0x0000000000000000000000000000000000000000"
+ERROR_SELECTOR = bytes.fromhex("08c379a0") # Error(string)
+UINT256_MOD = 2**256
+UINT128_MOD = 2**128
+SECONDS_PER_YEAR = 365 * 24 * 3600
+# Gas of the random-walk swaps of `mine` (a router exactInputSingle, roughly).
+SWAP_GAS = 130_000
+# Exact input of a random-walk swap: more than any pool can take, so the swap always stops at its price limit.
+SWAP_EXACT_INPUT = 2**200
+# Takes the other side of every random-walk swap.
+TRADER = to_checksum_address(keccak(b"uniswap-lp-emulator trader")[12:])
+# Provides the pools' background (full range) liquidity.
+MARKET_MAKER = to_checksum_address(keccak(b"uniswap-lp-emulator market maker")[12:])
+
+
+class Revert(Exception):
+    """A revert of the emulated EVM. `data` is the revert data: Error(string) of the reason, or empty."""
+    def __init__(self, reason: str = ""):
+        super().__init__(reason)
+        self.reason = reason
+        self.data = ERROR_SELECTOR + abi_encode(["string"], [reason]) if reason else b""
+
+
+class OutOfGas(Revert):
+    pass
+
+
+class RPCError(Exception):
+    """A JSON-RPC error answer (e.g. -32000 "nonce too low")."""
+    def __init__(self, code: int, message: str):
+        super().__init__(message)
+        self.code = code
+        self.message = message
+
+
+# Python errors the ported contract math raises where the EVM would revert (overflow, division by zero, bad calldata).
+_EVM_FAULTS = (ArithmeticError, ValueError, DecodingError, EncodingError)
+
+
+def _require(condition, reason: str = ""):
+    if not condition:
+        raise Revert(reason)
+
+
+def _intrinsic_gas(data: bytes) -> int:
+    zero_bytes = data.count(0)
+    return 21_000 + 4 * zero_bytes + 16 * (len(data) - zero_bytes)
+
+
+def _add_delta(x: int, y: int) -> int:
+    """LiquidityMath.addDelta."""
+    z = x + y
+    _require(z >= 0, "LS")
+    _require(z <= MAX_UINT128, "LA")
+    return z
+
+
+def _sort_tokens(token_a: str, token_b: str) -> tuple:
+    return (token_a, token_b) if int(token_a, 16) < int(token_b, 16) else (token_b, token_a)
+
+
+# --- Undo journal ---
+# Every state write logs how to undo it, so a revert (a failed transaction, a failed Multicall3 sub-call, any
+# eth_call or eth_estimateGas) rolls the state back without copying it.
+_MISSING = object()
+
+
+def _restore_item(mapping: dict, key, old):
+    if old is _MISSING:
+        dict.pop(mapping, key, None)
+    else:
+        dict.__setitem__(mapping, key, old)
+
+
+def _pop_last(items: list):
+    items.pop()
+
+
+class _Journal:
+    def __init__(self):
+        self.entries = []
+
+    def log(self, restore, *args):
+        self.entries.append((restore, args))
+
+    def checkpoint(self) -> int:
+        return len(self.entries)
+
+    def revert(self, checkpoint: int):
+        entries = self.entries
+        while len(entries) > checkpoint:
+            restore, args = entries.pop()
+            restore(*args)
+
+    def commit(self):
+        self.entries.clear()
+
+
+class _JDict(dict):
+    """A dict whose item writes and deletions are journaled. Only [] assignment and `del` may modify it."""
+    __slots__ = ("journal",)
+
+    def __init__(self, journal: _Journal):
+        super().__init__()
+        self.journal = journal
+
+    def __setitem__(self, key, value):
+        self.journal.log(_restore_item, self, key, self.get(key, _MISSING))
+        dict.__setitem__(self, key, value)
+
+    def __delitem__(self, key):
+        self.journal.log(_restore_item, self, key, self[key])
+        dict.__delitem__(self, key)
+
+
+# --- Interfaces ---
+# Each contract declares the functions and events it serves as Solidity-style signatures; they are parsed once
+# into the ABI (also written out for the bot, see `write_abis`) and the selector/topic dispatch tables.
+def _closing_paren(text: str, start: int) -> int:
+    depth = 0
+    for index in range(start, len(text)):
+        if text[index] == "(":
+            depth += 1
+        elif text[index] == ")":
+            depth -= 1
+            if depth == 0:
+                return index
+    raise ValueError(f"Unbalanced parentheses in {text!r}")
+
+
+def _split_top_level(text: str) -> list:
+    parts, depth, start = [], 0, 0
+    for index, char in enumerate(text):
+        if char == "(":
+            depth += 1
+        elif char == ")":
+            depth -= 1
+        elif char == "," and depth == 0:
+            parts.append(text[start:index])
+            start = index + 1
+    parts.append(text[start:])
+    return [part.strip() for part in parts if part.strip()]
+
+
+def _parse_param(text: str) -> dict:
+    """'uint256 amount', 'address indexed owner' or '(address target, bytes callData)[] calls'."""
+    param = {}
+    if text.startswith("("):
+        close = _closing_paren(text, 0)
+        param["components"] = [_parse_param(part) for part in _split_top_level(text[1:close])]
+        words = text[close + 1:].split()
+        suffix = words.pop(0) if words and words[0].startswith("[") else ""
+        param["type"] = "tuple" + suffix
+    else:
+        words = text.split()
+        param["type"] = words.pop(0)
+    if words and words[0] == "indexed":
+        param["indexed"] = True
+        words.pop(0)
+    param["name"] = words[0] if words else ""
+    return param
+
+
+def _parse_entry(text: str) -> dict:
+    """ABI entry of 'function name(params) [view|pure|payable] [returns (params)]' or 'event Name(params)'."""
+    kind, rest = text.split(" ", 1)
+    name, rest = rest.split("(", 1)
+    close = _closing_paren("(" + rest, 0) - 1
+    inputs = [_parse_param(part) for part in _split_top_level(rest[:close])]
+    tail = rest[close + 1:].strip()
+    if kind == "event":
+        for param in inputs:
+            param["indexed"] = param.get("indexed", False)
+        return {"type": "event", "name": name.strip(), "inputs": inputs, "anonymous": False}
+    mutability = "nonpayable"
+    outputs = []
+    if tail and not tail.startswith("returns"):
+        mutability, _, tail = tail.partition(" ")
+        tail = tail.strip()
+    if tail.startswith("returns"):
+        returns = tail[len("returns"):].strip()
+        outputs = [_parse_param(part) for part in _split_top_level(returns[1:_closing_paren(returns, 0)])]
+    return {"type": "function", "name": name.strip(), "inputs": inputs, "outputs": outputs, "stateMutability": mutability}
+
+
+# Checksumming hashes the address: the few addresses a run sees are cached.
+_checksum = functools.lru_cache(maxsize=4096)(to_checksum_address)
+
+
+def _checksummed(values):
+    """Decoded arguments with their addresses checksummed (eth_abi decodes them lowercase): state is keyed by checksum address."""
+    if isinstance(values, str):
+        return _checksum(values) # Only addresses decode to str (no external function takes a string)
+    if isinstance(values, (tuple, list)):
+        return type(values)(_checksummed(value) for value in values)
+    return values
+
+
+# --- ABI codec ---
+# eth_abi validates every value (checksumming each address) and dominates a swap's cost. Argument lists of static
+# one-word types (address, bool, (u)intN, bytes32: every event and most calls) are coded word by word here instead.
+def _word_codec(abi_type: str):
+    """(encode, decode) of one 32-byte word of `abi_type`, or None if it isn't a static one-word type."""
+    if abi_type == "address":
+        return (lambda value: bytes(12) + bytes.fromhex(value[2:]),
+                lambda word: _checksum("0x" + word[12:].hex()))
+    if abi_type == "bool":
+        return (lambda value: (1 if value else 0).to_bytes(32, "big"),
+                lambda word: bool(word[31]))
+    if abi_type == "bytes32":
+        return (lambda value: bytes(value).ljust(32, b"\0"),
+                lambda word: word)
+    if abi_type.startswith("uint"):
+        limit = 1 << int(abi_type[4:] or 256)
+
+        def encode_uint(value):
+            if not 0 <= value < limit:
+                raise OverflowError(f"{value} does not fit in {abi_type}")
+            return value.to_bytes(32, "big")
+
+        def decode_uint(word):
+            value = int.from_bytes(word, "big")
+            if value >= limit:
+                raise ValueError(f"{value} does not fit in {abi_type}")
+            return value
+        return encode_uint, decode_uint
+    if abi_type.startswith("int"):
+        half = 1 << (int(abi_type[3:] or 256) - 1)
+
+        def encode_int(value):
+            if not -half <= value < half:
+                raise OverflowError(f"{value} does not fit in {abi_type}")
+            return (value % UINT256_MOD).to_bytes(32, "big")
+
+        def decode_int(word):
+            value = int.from_bytes(word, "big", signed=True)
+            if not -half <= value < half:
+                raise ValueError(f"{value} does not fit in {abi_type}")
+            return value
+        return encode_int, decode_int
+    return None
+
+
+@functools.lru_cache(maxsize=None)
+def _codecs(types: tuple):
+    codecs = [_word_codec(abi_type) for abi_type in types]
+    return None if None in codecs else tuple(codecs)
+
+
+def _encode(types: tuple, values) -> bytes:
+    codecs = _codecs(types)
+    if codecs is None:
+        return abi_encode(types, values)
+    if len(values) != len(codecs):
+        raise ValueError(f"{len(values)} values for {len(codecs)} types")
+    return b"".join(codec[0](value) for codec, value in zip(codecs, values))
+
+
+def _decode(types: tuple, data: bytes) -> tuple:
+    codecs = _codecs(types)
+    if codecs is None:
+        return _checksummed(abi_decode(types, data))
+    if len(data) < 32 * len(codecs):
+        raise ValueError("calldata too short")
+    return tuple(codec[1](data[32 * index:32 * index + 32]) for index, codec in enumerate(codecs))
+
+
+def _canonical(param: dict) -> str:
+    if param["type"].startswith("tuple"):
+        return "({})".format(",".join(_canonical(c) for c in param["components"])) + param["type"][len("tuple"):]
+    return param["type"]
+
+
+class Contract:
+    """
+    Base of the emulated contracts. External functions are methods named like the Solidity ones, called as
+    `method(sender, *decoded_args)`; a non-callable attribute listed in INTERFACE is served as a public variable.
+    Attribute writes are journaled (see _Journal); mappings are _JDicts of immutable values.
+    """
+    INTERFACE = ()
+    GAS = {} # function name -> gas charged per call (on top of the transaction's intrinsic gas)
+    DEFAULT_GAS = 2_600
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls.ABI = [_parse_entry(line) for line in cls.INTERFACE]
+        cls.FUNCTIONS, cls.EVENTS = {}, {}
+        for entry in cls.ABI:
+            types = [_canonical(param) for param in entry["inputs"]]
+            signature = "{}({})".format(entry["name"], ",".join(types))
+            if entry["type"] == "function":
+                cls.FUNCTIONS[keccak(text=signature)[:4]] = (entry["name"], tuple(types), tuple(_canonical(p) for p in entry["outputs"]))
+            else:
+                indexed = [param["indexed"] for param in entry["inputs"]]
+                # (topic0, types of the indexed values, types of the data values, indexed flag per value)
+                cls.EVENTS[entry["name"]] = (keccak(text=signature), tuple(t for t, i in zip(types, indexed) if i),
+                                             tuple(t for t, i in zip(types, indexed) if not i), tuple(indexed))
+
+    def __init__(self, chain: "EmulatedChain", address: str):
+        self.__dict__["chain"] = chain
+        self.__dict__["address"] = to_checksum_address(address)
+
+    def __setattr__(self, name, value):
+        state = self.__dict__
+        self.chain.journal.log(_restore_item, state, name, state.get(name, _MISSING))
+        state[name] = value
+
+    def execute(self, sender: str, data: bytes) -> bytes:
+        """Runs one external call (ABI-encoded `data` from `sender`) and returns the ABI-encoded result."""
+        entry = self.FUNCTIONS.get(bytes(data[:4]))
+        _require(entry is not None) # No fallback function
+        name, input_types, output_types = entry
+        self.chain.use_gas(self.GAS.get(name, self.DEFAULT_GAS))
+        args = _decode(input_types, bytes(data[4:])) if input_types else ()
+        member = getattr(self, name)
+        result = member(sender, *args) if callable(member) else member
+        if not output_types:
+            return b""
+        return _encode(output_types, (result,) if len(output_types) == 1 else result)
+
+    def emit(self, name: str, *values):
+        topic, topic_types, data_types, indexed = self.EVENTS[name]
+        topic_values = [value for value, is_indexed in zip(values, indexed) if is_indexed]
+        topics = [topic] + [_encode((t,), (value,)) for t, value in zip(topic_types, topic_values)]
+        data = _encode(data_types, [value for value, is_indexed in zip(values, indexed) if not is_indexed])
+        self.chain.add_log(self.address, topics, data)
+
+    def on_block(self, number: int, timestamp: int):
+        """Called after every mined block (see Feed)."""
+
+    def _erc20(self, address: str) -> "ERC20":
+        return self.chain.contracts[address.lower()]
+
+
+# --- Contracts ---
+class ERC20(Contract):
+    INTERFACE = (
+        "function name() view returns (string)",
+        "function symbol() view returns (string)",
+        "function decimals() view returns (uint8)",
+        "function totalSupply() view returns (uint256)",
+        "function balanceOf(address account) view returns (uint256)",
+        "function allowance(address owner, address spender) view returns (uint256)",
+        "function approve(address spender, uint256 amount) returns (bool)",
+        "function transfer(address to, uint256 amount) returns (bool)",
+        "function transferFrom(address from, address to, uint256 amount) returns (bool)",
+        "function DOMAIN_SEPARATOR() view returns (bytes32)",
+        "function nonces(address owner) view returns (uint256)",
+        "function permit(address owner, address spender, uint256 value, uint256 deadline, uint8 v, bytes32 r, bytes32 s)",
+        "event Transfer(address indexed from, address indexed to, uint256 value)",
+        "event Approval(address indexed owner, address indexed spender, uint256 value)",
+    )
+    GAS = {"approve": 26_000, "transfer": 35_000, "transferFrom": 40_000, "permit": 55_000}
+    DOMAIN_TYPEHASH = keccak(text="EIP712Domain(string name,string version,uint256 chainId,address verifyingContract)")
+    PERMIT_TYPEHASH = keccak(text="Permit(address owner,address spender,uint256 value,uint256 nonce,uint256 deadline)")
+
+    def __init__(self, chain, address, symbol: str, decimals: int, name: str = None):
+        super().__init__(chain, address)
+        self.name = name or symbol
+        self.symbol = symbol
+        self.decimals = decimals
+        self.total_supply = 0
+        self.balances = _JDict(chain.journal) # account -> balance
+        self.allowances = _JDict(chain.journal) # (owner, spender) -> allowance
+        self.permit_nonces = _JDict(chain.journal) # owner -> EIP-2612 nonce
+
+    def totalSupply(self, sender):
+        return self.total_supply
+
+    def balanceOf(self, sender, account):
+        return self.balances.get(account, 0)
+
+    def allowance(self, sender, owner, spender):
+        return self.allowances.get((owner, spender), 0)
+
+    def approve(self, sender, spender, amount):
+        self._approve(sender, spender, amount)
+        return True
+
+    def transfer(self, sender, to, amount):
+        self._transfer(sender, to, amount)
+        return True
+
+    def transferFrom(self, sender, from_, to, amount):
+        # An unlimited allowance is never spent; spending emits no Approval (like current OpenZeppelin and USDC).
+        allowed = self.allowances.get((from_, sender), 0)
+        if allowed != MAX_UINT256:
+            _require(allowed >= amount, "ERC20: insufficient allowance")
+            self.allowances[(from_, sender)] = allowed - amount
+        self._transfer(from_, to, amount)
+        return True
+
+    def DOMAIN_SEPARATOR(self, sender):
+        return keccak(abi_encode(["bytes32", "bytes32", "bytes32", "uint256", "address"],
+                                 [self.DOMAIN_TYPEHASH, keccak(text=self.name), keccak(text="1"), self.chain.chain_id, self.address]))
+
+    def nonces(self, sender, owner):
+        return self.permit_nonces.get(owner, 0)
+
+    def permit(self, sender, owner, spender, value, deadline, v, r, s):
+        _require(self.chain.timestamp <= deadline, "ERC20Permit: expired deadline")
+        nonce = self.permit_nonces.get(owner, 0)
+        self.permit_nonces[owner] = nonce + 1
+        struct_hash = keccak(abi_encode(["bytes32", "address", "address", "uint256", "uint256", "uint256"],
+                                        [self.PERMIT_TYPEHASH, owner, spender, value, nonce, deadline]))
+        digest = keccak(b"\x19\x01" + self.DOMAIN_SEPARATOR(sender) + struct_hash)
+        try:
+            signer = keys.Signature(vrs=(v - 27, int.from_bytes(r, "big"), int.from_bytes(s, "big"))) \
+                .recover_public_key_from_msg_hash(digest).to_checksum_address()
+        except Exception:
+            signer = None
+        _require(signer == owner, "ERC20Permit: invalid signature")
+        self._approve(owner, spender, value)
+
+    def _approve(self, owner, spender, amount):
+        self.allowances[(owner, spender)] = amount
+        self.emit("Approval", owner, spender, amount)
+
+    def _transfer(self, from_, to, amount):
+        balance = self.balances.get(from_, 0)
+        _require(balance >= amount, "ERC20: transfer amount exceeds balance")
+        self.balances[from_] = balance - amount
+        self.balances[to] = self.balances.get(to, 0) + amount
+        self.emit("Transfer", from_, to, amount)
+
+    def _mint(self, to, amount):
+        self.total_supply += amount
+        self.balances[to] = self.balances.get(to, 0) + amount
+        self.emit("Transfer", ZERO_ADDRESS, to, amount)
+
+
+class Feed(Contract):
+    """
+    Chainlink AggregatorV3. With `pool`, the answer follows the pool's price (token1 per token0, `decimals`
+    decimals) and is updated after every block in which it changed; otherwise it stays at `answer`.
+    """
+    INTERFACE = (
+        "function decimals() view returns (uint8)",
+        "function description() view returns (string)",
+        "function latestRoundData() view returns (uint80 roundId, int256 answer, uint256 startedAt, uint256 updatedAt, uint80 answeredInRound)",
+    )
+
+    def __init__(self, chain, address, answer: int = 0, decimals: int = 8, description: str = "", pool: str = None):
+        super().__init__(chain, address)
+        self.decimals = decimals
+        self.description = description
+        self.pool = pool
+        self.answer = answer
+        self.round_id = 1
+        self.updated_at = chain.timestamp
+
+    def latestRoundData(self, sender):
+        return self.round_id, self.answer, self.updated_at, self.updated_at, self.round_id
+
+    def on_block(self, number, timestamp):
+        if self.pool is None:
+            return
+        pool = self.chain.contracts[self.pool.lower()]
+        scale = self.decimals + self._erc20(pool.token0).decimals - self._erc20(pool.token1).decimals
+        price = pool.sqrt_price_x96 ** 2
+        answer = price * 10**scale >> 192 if scale >= 0 else (price >> 192) // 10**-scale
+        if answer != self.answer:
+            self.answer = answer
+            self.round_id += 1
+            self.updated_at = timestamp
+
+
+class Multicall3(Contract):
+    INTERFACE = (
+        "function aggregate3((address target, bool allowFailure, bytes callData)[] calls) payable "
+        "returns ((bool success, bytes returnData)[] returnData)",
+        "function getBlockNumber() view returns (uint256 blockNumber)",
+        "function getCurrentBlockTimestamp() view returns (uint256 timestamp)",
+    )
+    GAS = {"aggregate3": 5_000}
+
+    def aggregate3(self, sender, calls):
+        results = []
+        for target, allow_failure, call_data in calls:
+            checkpoint = self.chain.journal.checkpoint()
+            try:
+                results.append((True, self.chain.call_contract(self.address, target, call_data)))
+            except OutOfGas:
+                raise
+            except Revert as e:
+                self.chain.journal.revert(checkpoint)
+                _require(allow_failure, "Multicall3: call failed")
+                results.append((False, e.data))
+        return results
+
+    def getBlockNumber(self, sender):
+        return self.chain.block_number
+
+    def getCurrentBlockTimestamp(self, sender):
+        return self.chain.timestamp
+
+
+class Factory(Contract):
+    INTERFACE = (
+        "function getPool(address tokenA, address tokenB, uint24 fee) view returns (address pool)",
+        "function feeAmountTickSpacing(uint24 fee) view returns (int24)",
+        "function createPool(address tokenA, address tokenB, uint24 fee) returns (address pool)",
+        "event PoolCreated(address indexed token0, address indexed token1, uint24 indexed fee, int24 tickSpacing, address pool)",
+    )
+    GAS = {"createPool": 4_500_000}
+    FEE_TICK_SPACING = {100: 1, 500: 10, 3000: 60, 10000: 200}
+    # keccak256 of the UniswapV3Pool creation code, as in the periphery's PoolAddress library.
+    POOL_INIT_CODE_HASH = bytes.fromhex("e34f199b19b2b4f47f68442619d555527d244f78a3297ea89325f843f87b8b54")
+
+    def __init__(self, chain, address):
+        super().__init__(chain, address)
+        self.pools = _JDict(chain.journal) # (tokenA, tokenB, fee) -> pool address, both token orders
+
+    def getPool(self, sender, token_a, token_b, fee):
+        return self.pools.get((token_a, token_b, fee), ZERO_ADDRESS)
+
+    def feeAmountTickSpacing(self, sender, fee):
+        return self.FEE_TICK_SPACING.get(fee, 0)
+
+    def createPool(self, sender, token_a, token_b, fee):
+        _require(token_a != token_b)
+        token0, token1 = _sort_tokens(token_a, token_b)
+        _require(token0 != ZERO_ADDRESS)
+        tick_spacing = self.FEE_TICK_SPACING.get(fee, 0)
+        _require(tick_spacing != 0)
+        _require((token0, token1, fee) not in self.pools)
+        address = self.pool_address(token0, token1, fee)
+        self.chain.deploy(Pool, address, self.address, token0, token1, fee, tick_spacing)
+        self.pools[(token0, token1, fee)] = address
+        self.pools[(token1, token0, fee)] = address
+        self.emit("PoolCreated", token0, token1, fee, tick_spacing, address)
+        return address
+
+    def pool_address(self, token0: str, token1: str, fee: int) -> str:
+        """The pool's CREATE2 address (PoolAddress.computeAddress)."""
+        salt = keccak(abi_encode(["address", "address", "uint24"], [token0, token1, fee]))
+        return to_checksum_address(keccak(b"\xff" + bytes.fromhex(self.address[2:]) + salt + self.POOL_INIT_CODE_HASH)[12:])
+
+
+_Tick = namedtuple("_Tick", "liquidity_gross liquidity_net fee_growth_outside0_x128 fee_growth_outside1_x128")
+_PoolPosition = namedtuple("_PoolPosition", "liquidity fee_growth_inside0_last_x128 fee_growth_inside1_last_x128 tokens_owed0 tokens_owed1")
+_EMPTY_TICK = _Tick(0, 0, 0, 0)
+_EMPTY_POOL_POSITION = _PoolPosition(0, 0, 0, 0, 0)
+
+
+class Pool(Contract):
+    """
+    UniswapV3Pool. `mint`, `burn`, `collect` and `swap` are Python entry points for the position manager and the
+    random walk (their callbacks are Python callables), not external functions.
+    """
+    INTERFACE = (
+        "function slot0() view returns (uint160 sqrtPriceX96, int24 tick, uint16 observationIndex, "
+        "uint16 observationCardinality, uint16 observationCardinalityNext, uint8 feeProtocol, bool unlocked)",
+        "function liquidity() view returns (uint128)",
+        "function tickSpacing() view returns (int24)",
+        "function fee() view returns (uint24)",
+        "function token0() view returns (address)",
+        "function token1() view returns (address)",
+        "function factory() view returns (address)",
+        "function feeGrowthGlobal0X128() view returns (uint256)",
+        "function feeGrowthGlobal1X128() view returns (uint256)",
+        "event Initialize(uint160 sqrtPriceX96, int24 tick)",
+        "event Mint(address sender, address indexed owner, int24 indexed tickLower, int24 indexed tickUpper, uint128 amount, uint256 amount0, uint256 amount1)",
+        "event Burn(address indexed owner, int24 indexed tickLower, int24 indexed tickUpper, uint128 amount, uint256 amount0, uint256 amount1)",
+        "event Collect(address indexed owner, address recipient, int24 indexed tickLower, int24 indexed tickUpper, uint128 amount0, uint128 amount1)",
+        "event Swap(address indexed sender, address indexed recipient, int256 amount0, int256 amount1, uint160 sqrtPriceX96, uint128 liquidity, int24 tick)",
+    )
+
+    def __init__(self, chain, address, factory: str, token0: str, token1: str, fee: int, tick_spacing: int):
+        super().__init__(chain, address)
+        self.factory = factory
+        self.token0 = token0
+        self.token1 = token1
+        self.fee = fee
+        self.tick_spacing = tick_spacing
+        # Tick.tickSpacingToMaxLiquidityPerTick (Solidity division truncates toward zero).
+        min_tick = -(-MIN_TICK // tick_spacing) * tick_spacing
+        max_tick = (MAX_TICK // tick_spacing) * tick_spacing
+        self.max_liquidity_per_tick = MAX_UINT128 // ((max_tick - min_tick) // tick_spacing + 1)
+        self.sqrt_price_x96 = 0
+        self.tick = 0
+        self.liquidity = 0
+        self.fee_growth_global0_x128 = 0
+        self.fee_growth_global1_x128 = 0
+        self.ticks = _JDict(chain.journal) # tick -> _Tick
+        self.positions = _JDict(chain.journal) # (owner, tick_lower, tick_upper) -> _PoolPosition
+        # Initialized ticks, sorted: the tick bitmap (searched word by word in `_next_initialized_tick`).
+        self.initialized_ticks = ()
+
+    def slot0(self, sender):
+        return self.sqrt_price_x96, self.tick, 0, 1, 1, 0, self.sqrt_price_x96 != 0
+
+    def tickSpacing(self, sender):
+        return self.tick_spacing
+
+    def feeGrowthGlobal0X128(self, sender):
+        return self.fee_growth_global0_x128
+
+    def feeGrowthGlobal1X128(self, sender):
+        return self.fee_growth_global1_x128
+
+    def initialize(self, sqrt_price_x96: int):
+        _require(self.sqrt_price_x96 == 0, "AI")
+        self.tick = get_tick_at_sqrt_ratio(sqrt_price_x96)
+        self.sqrt_price_x96 = sqrt_price_x96
+        self.emit("Initialize", sqrt_price_x96, self.tick)
+
+    def mint(self, sender: str, recipient: str, tick_lower: int, tick_upper: int, amount: int, callback) -> tuple:
+        """Adds `amount` liquidity for `recipient`; `callback(amount0, amount1)` must pay the pool."""
+        _require(amount > 0)
+        amount0, amount1 = self._modify_position(recipient, tick_lower, tick_upper, amount)
+        balance0_before = self._balance(self.token0) if amount0 > 0 else 0
+        balance1_before = self._balance(self.token1) if amount1 > 0 else 0
+        callback(amount0, amount1)
+        if amount0 > 0:
+            _require(balance0_before + amount0 <= self._balance(self.token0), "M0")
+        if amount1 > 0:
+            _require(balance1_before + amount1 <= self._balance(self.token1), "M1")
+        self.emit("Mint", sender, recipient, tick_lower, tick_upper, amount, amount0, amount1)
+        return amount0, amount1
+
+    def burn(self, sender: str, tick_lower: int, tick_upper: int, amount: int) -> tuple:
+        """Removes `amount` of the sender's liquidity; the tokens are owed to the position until collected."""
+        amount0, amount1 = self._modify_position(sender, tick_lower, tick_upper, -amount)
+        amount0, amount1 = -amount0, -amount1
+        if amount0 > 0 or amount1 > 0:
+            key = (sender, tick_lower, tick_upper)
+            position = self.positions[key]
+            self.positions[key] = position._replace(tokens_owed0=(position.tokens_owed0 + amount0) % UINT128_MOD,
+                                                    tokens_owed1=(position.tokens_owed1 + amount1) % UINT128_MOD)
+        self.emit("Burn", sender, tick_lower, tick_upper, amount, amount0, amount1)
+        return amount0, amount1
+
+    def collect(self, sender: str, recipient: str, tick_lower: int, tick_upper: int,
+                amount0_requested: int, amount1_requested: int) -> tuple:
+        key = (sender, tick_lower, tick_upper)
+        position = self.positions.get(key, _EMPTY_POOL_POSITION)
+        amount0 = min(amount0_requested, position.tokens_owed0)
+        amount1 = min(amount1_requested, position.tokens_owed1)
+        if amount0 > 0 or amount1 > 0:
+            self.positions[key] = position._replace(tokens_owed0=position.tokens_owed0 - amount0,
+                                                    tokens_owed1=position.tokens_owed1 - amount1)
+        if amount0 > 0:
+            self._transfer(self.token0, recipient, amount0)
+        if amount1 > 0:
+            self._transfer(self.token1, recipient, amount1)
+        self.emit("Collect", sender, recipient, tick_lower, tick_upper, amount0, amount1)
+        return amount0, amount1
+
+    def swap(self, sender: str, recipient: str, zero_for_one: bool, amount_specified: int,
+             sqrt_price_limit_x96: int, callback) -> tuple:
+        """UniswapV3Pool.swap: `amount_specified` > 0 is exact input; `callback(amount0, amount1)` must pay the input."""
+        _require(amount_specified != 0, "AS")
+        sqrt_price = self.sqrt_price_x96
+        _require(sqrt_price != 0, "LOK")
+        if zero_for_one:
+            _require(MIN_SQRT_RATIO < sqrt_price_limit_x96 < sqrt_price, "SPL")
+        else:
+            _require(sqrt_price < sqrt_price_limit_x96 < MAX_SQRT_RATIO, "SPL")
+
+        exact_input = amount_specified > 0
+        remaining, calculated = amount_specified, 0
+        tick, liquidity = self.tick, self.liquidity
+        fee_growth_global = self.fee_growth_global0_x128 if zero_for_one else self.fee_growth_global1_x128
+        while remaining != 0 and sqrt_price != sqrt_price_limit_x96:
+            sqrt_price_start = sqrt_price
+            tick_next, initialized = self._next_initialized_tick(tick, zero_for_one)
+            tick_next = min(max(tick_next, MIN_TICK), MAX_TICK)
+            sqrt_price_next = get_sqrt_ratio_at_tick(tick_next)
+            past_limit = sqrt_price_next < sqrt_price_limit_x96 if zero_for_one else sqrt_price_next > sqrt_price_limit_x96
+            sqrt_price, amount_in, amount_out, fee_amount = compute_swap_step(
+                sqrt_price, sqrt_price_limit_x96 if past_limit else sqrt_price_next, liquidity, remaining, self.fee
+            )
+            if exact_input:
+                remaining -= amount_in + fee_amount
+                calculated -= amount_out
+            else:
+                remaining += amount_out
+                calculated += amount_in + fee_amount
+            if liquidity > 0:
+                fee_growth_global = (fee_growth_global + mul_div(fee_amount, Q128, liquidity)) % UINT256_MOD
+            if sqrt_price == sqrt_price_next:
+                # Reached the next tick: cross it if it is initialized.
+                if initialized:
+                    if zero_for_one:
+                        liquidity_net = -self._cross(tick_next, fee_growth_global, self.fee_growth_global1_x128)
+                    else:
+                        liquidity_net = self._cross(tick_next, self.fee_growth_global0_x128, fee_growth_global)
+                    liquidity = _add_delta(liquidity, liquidity_net)
+                tick = tick_next - 1 if zero_for_one else tick_next
+            elif sqrt_price != sqrt_price_start:
+                tick = get_tick_at_sqrt_ratio(sqrt_price)
+
+        self.sqrt_price_x96 = sqrt_price
+        self.tick = tick
+        if liquidity != self.liquidity:
+            self.liquidity = liquidity
+        if zero_for_one:
+            self.fee_growth_global0_x128 = fee_growth_global
+        else:
+            self.fee_growth_global1_x128 = fee_growth_global
+        if zero_for_one == exact_input:
+            amount0, amount1 = amount_specified - remaining, calculated
+        else:
+            amount0, amount1 = calculated, amount_specified - remaining
+
+        if zero_for_one:
+            if amount1 < 0:
+                self._transfer(self.token1, recipient, -amount1)
+            balance0_before = self._balance(self.token0)
+            callback(amount0, amount1)
+            _require(balance0_before + amount0 <= self._balance(self.token0), "IIA")
+        else:
+            if amount0 < 0:
+                self._transfer(self.token0, recipient, -amount0)
+            balance1_before = self._balance(self.token1)
+            callback(amount0, amount1)
+            _require(balance1_before + amount1 <= self._balance(self.token1), "IIA")
+        self.emit("Swap", sender, recipient, amount0, amount1, sqrt_price, liquidity, tick)
+        return amount0, amount1
+
+    def _balance(self, token: str) -> int:
+        return self._erc20(token).balances.get(self.address, 0)
+
+    def _transfer(self, token: str, to: str, amount: int):
+        try:
+            self._erc20(token).transfer(self.address, to, amount)
+        except Revert:
+            raise Revert("TF")
+
+    def _next_initialized_tick(self, tick: int, lte: bool) -> tuple:
+        """TickBitmap.nextInitializedTickWithinOneWord: (next tick, initialized), never past the 256-tick word."""
+        spacing = self.tick_spacing
+        ticks = self.initialized_ticks
+        compressed = tick // spacing
+        if lte:
+            word_start = (compressed >> 8) << 8
+            index = bisect_right(ticks, compressed * spacing) - 1
+            if index >= 0 and ticks[index] >= word_start * spacing:
+                return ticks[index], True
+            return word_start * spacing, False
+        compressed += 1
+        word_end = ((compressed >> 8) << 8) + 255
+        index = bisect_left(ticks, compressed * spacing)
+        if index < len(ticks) and ticks[index] <= word_end * spacing:
+            return ticks[index], True
+        return word_end * spacing, False
+
+    def _cross(self, tick: int, fee_growth_global0_x128: int, fee_growth_global1_x128: int) -> int:
+        info = self.ticks[tick]
+        self.ticks[tick] = info._replace(
+            fee_growth_outside0_x128=(fee_growth_global0_x128 - info.fee_growth_outside0_x128) % UINT256_MOD,
+            fee_growth_outside1_x128=(fee_growth_global1_x128 - info.fee_growth_outside1_x128) % UINT256_MOD,
+        )
+        return info.liquidity_net
+
+    def _modify_position(self, owner: str, tick_lower: int, tick_upper: int, liquidity_delta: int) -> tuple:
+        _require(tick_lower < tick_upper, "TLU")
+        _require(tick_lower >= MIN_TICK, "TLM")
+        _require(tick_upper <= MAX_TICK, "TUM")
+        self._update_position(owner, tick_lower, tick_upper, liquidity_delta)
+        amount0 = amount1 = 0
+        if liquidity_delta != 0:
+            sqrt_lower, sqrt_upper = get_sqrt_ratio_at_tick(tick_lower), get_sqrt_ratio_at_tick(tick_upper)
+            if self.tick < tick_lower:
+                amount0 = get_amount0_delta_signed(sqrt_lower, sqrt_upper, liquidity_delta)
+            elif self.tick < tick_upper:
+                amount0 = get_amount0_delta_signed(self.sqrt_price_x96, sqrt_upper, liquidity_delta)
+                amount1 = get_amount1_delta_signed(sqrt_lower, self.sqrt_price_x96, liquidity_delta)
+                self.liquidity = _add_delta(self.liquidity, liquidity_delta)
+            else:
+                amount1 = get_amount1_delta_signed(sqrt_lower, sqrt_upper, liquidity_delta)
+        return amount0, amount1
+
+    def _update_position(self, owner: str, tick_lower: int, tick_upper: int, liquidity_delta: int):
+        key = (owner, tick_lower, tick_upper)
+        position = self.positions.get(key, _EMPTY_POOL_POSITION)
+        flipped_lower = flipped_upper = False
+        if liquidity_delta != 0:
+            flipped_lower = self._update_tick(tick_lower, liquidity_delta, False)
+            flipped_upper = self._update_tick(tick_upper, liquidity_delta, True)
+            for tick, flipped in ((tick_lower, flipped_lower), (tick_upper, flipped_upper)):
+                if flipped:
+                    self._flip_tick(tick)
+        inside0, inside1 = self._fee_growth_inside(tick_lower, tick_upper)
+
+        # Position.update
+        if liquidity_delta == 0:
+            _require(position.liquidity > 0, "NP") # Disallow pokes of empty positions
+        owed0 = mul_div((inside0 - position.fee_growth_inside0_last_x128) % UINT256_MOD, position.liquidity, Q128) % UINT128_MOD
+        owed1 = mul_div((inside1 - position.fee_growth_inside1_last_x128) % UINT256_MOD, position.liquidity, Q128) % UINT128_MOD
+        self.positions[key] = _PoolPosition(
+            _add_delta(position.liquidity, liquidity_delta), inside0, inside1,
+            (position.tokens_owed0 + owed0) % UINT128_MOD, (position.tokens_owed1 + owed1) % UINT128_MOD,
+        )
+        if liquidity_delta < 0:
+            # Ticks that are no longer referenced by any position are cleared.
+            if flipped_lower:
+                del self.ticks[tick_lower]
+            if flipped_upper:
+                del self.ticks[tick_upper]
+
+    def _update_tick(self, tick: int, liquidity_delta: int, upper: bool) -> bool:
+        """Tick.update: returns whether the tick flipped between initialized and uninitialized."""
+        info = self.ticks.get(tick, _EMPTY_TICK)
+        gross_after = _add_delta(info.liquidity_gross, liquidity_delta)
+        _require(gross_after <= self.max_liquidity_per_tick, "LO")
+        outside0, outside1 = info.fee_growth_outside0_x128, info.fee_growth_outside1_x128
+        if info.liquidity_gross == 0 and tick <= self.tick:
+            # By convention, all growth before a tick was initialized happened below it.
+            outside0, outside1 = self.fee_growth_global0_x128, self.fee_growth_global1_x128
+        liquidity_net = info.liquidity_net - liquidity_delta if upper else info.liquidity_net + liquidity_delta
+        _require(-2**127 <= liquidity_net < 2**127)
+        self.ticks[tick] = _Tick(gross_after, liquidity_net, outside0, outside1)
+        return (gross_after == 0) != (info.liquidity_gross == 0)
+
+    def _flip_tick(self, tick: int):
+        _require(tick % self.tick_spacing == 0) # TickBitmap.flipTick
+        ticks = self.initialized_ticks
+        index = bisect_left(ticks, tick)
+        if index < len(ticks) and ticks[index] == tick:
+            self.initialized_ticks = ticks[:index] + ticks[index + 1:]
+        else:
+            self.initialized_ticks = ticks[:index] + (tick,) + ticks[index:]
+
+    def _fee_growth_inside(self, tick_lower: int, tick_upper: int) -> tuple:
+        lower = self.ticks.get(tick_lower, _EMPTY_TICK)
+        upper = self.ticks.get(tick_upper, _EMPTY_TICK)
+        global0, global1 = self.fee_growth_global0_x128, self.fee_growth_global1_x128
+        if self.tick >= tick_lower:
+            below0, below1 = lower.fee_growth_outside0_x128, lower.fee_growth_outside1_x128
+        else:
+            below0, below1 = global0 - lower.fee_growth_outside0_x128, global1 - lower.fee_growth_outside1_x128
+        if self.tick < tick_upper:
+            above0, above1 = upper.fee_growth_outside0_x128, upper.fee_growth_outside1_x128
+        else:
+            above0, above1 = global0 - upper.fee_growth_outside0_x128, global1 - upper.fee_growth_outside1_x128
+        return (global0 - below0 - above0) % UINT256_MOD, (global1 - below1 - above1) % UINT256_MOD
+
+
+_Position = namedtuple("_Position", "nonce operator pool tick_lower tick_upper liquidity "
+                                    "fee_growth_inside0_last_x128 fee_growth_inside1_last_x128 tokens_owed0 tokens_owed1")
+
+
+class PositionManager(Contract):
+    """NonfungiblePositionManager. Only a position's owner may decrease, collect or burn it (no ERC721 approvals)."""
+    INTERFACE = (
+        "function positions(uint256 tokenId) view returns (uint96 nonce, address operator, address token0, address token1, "
+        "uint24 fee, int24 tickLower, int24 tickUpper, uint128 liquidity, uint256 feeGrowthInside0LastX128, "
+        "uint256 feeGrowthInside1LastX128, uint128 tokensOwed0, uint128 tokensOwed1)",
+        "function mint((address token0, address token1, uint24 fee, int24 tickLower, int24 tickUpper, uint256 amount0Desired, "
+        "uint256 amount1Desired, uint256 amount0Min, uint256 amount1Min, address recipient, uint256 deadline) params) payable "
+        "returns (uint256 tokenId, uint128 liquidity, uint256 amount0, uint256 amount1)",
+        "function increaseLiquidity((uint256 tokenId, uint256 amount0Desired, uint256 amount1Desired, uint256 amount0Min, "
+        "uint256 amount1Min, uint256 deadline) params) payable returns (uint128 liquidity, uint256 amount0, uint256 amount1)",
+        "function decreaseLiquidity((uint256 tokenId, uint128 liquidity, uint256 amount0Min, uint256 amount1Min, "
+        "uint256 deadline) params) payable returns (uint256 amount0, uint256 amount1)",
+        "function collect((uint256 tokenId, address recipient, uint128 amount0Max, uint128 amount1Max) params) payable "
+        "returns (uint256 amount0, uint256 amount1)",
+        "function burn(uint256 tokenId) payable",
+        "function multicall(bytes[] data) payable returns (bytes[] results)",
+        "function selfPermit(address token, uint256 value, uint256 deadline, uint8 v, bytes32 r, bytes32 s) payable",
+        "function balanceOf(address owner) view returns (uint256)",
+        "function ownerOf(uint256 tokenId) view returns (address)",
+        "function tokenOfOwnerByIndex(address owner, uint256 index) view returns (uint256)",
+        "function totalSupply() view returns (uint256)",
+        "function factory() view returns (address)",
+        "event IncreaseLiquidity(uint256 indexed tokenId, uint128 liquidity, uint256 amount0, uint256 amount1)",
+        "event DecreaseLiquidity(uint256 indexed tokenId, uint128 liquidity, uint256 amount0, uint256 amount1)",
+        "event Collect(uint256 indexed tokenId, address recipient, uint256 amount0, uint256 amount1)",
+        "event Transfer(address indexed from, address indexed to, uint256 indexed tokenId)",
+        "event Approval(address indexed owner, address indexed approved, uint256 indexed tokenId)",
+    )
+    # Typical mainnet gas of each call (pool and token calls included).
+    GAS = {"mint": 330_000, "increaseLiquidity": 130_000, "decreaseLiquidity": 110_000, "collect": 75_000,
+           "burn": 45_000, "selfPermit": 60_000, "multicall": 2_000}
+
+    def __init__(self, chain, address, factory: str):
+        super().__init__(chain, address)
+        self.factory = factory
+        self.next_id = 1
+        self.position_data = _JDict(chain.journal) # tokenId -> _Position
+        self.owners = _JDict(chain.journal) # tokenId -> owner
+        self.owned = _JDict(chain.journal) # owner -> tuple of tokenIds (ERC721Enumerable order)
+
+    # --- Positions ---
+    def positions(self, sender, token_id):
+        position = self._position(token_id)
+        pool = self.chain.contracts[position.pool.lower()]
+        return (position.nonce, position.operator, pool.token0, pool.token1, pool.fee, position.tick_lower,
+                position.tick_upper, position.liquidity, position.fee_growth_inside0_last_x128,
+                position.fee_growth_inside1_last_x128, position.tokens_owed0, position.tokens_owed1)
+
+    def mint(self, sender, params):
+        token0, token1, fee, tick_lower, tick_upper, amount0_desired, amount1_desired, amount0_min, amount1_min, recipient, deadline = params
+        self._check_deadline(deadline)
+        _require(int(token0, 16) < int(token1, 16)) # PoolAddress.computeAddress
+        pool_address = self.chain.contracts[self.factory.lower()].pools.get((token0, token1, fee))
+        _require(pool_address is not None) # No pool: the call to its address fails
+        pool = self.chain.contracts[pool_address.lower()]
+        liquidity, amount0, amount1 = self._add_liquidity(sender, pool, tick_lower, tick_upper, amount0_desired,
+                                                          amount1_desired, amount0_min, amount1_min)
+        token_id = self.next_id
+        self.next_id = token_id + 1
+        self._mint_token(recipient, token_id)
+        pool_position = pool.positions[(self.address, tick_lower, tick_upper)]
+        self.position_data[token_id] = _Position(0, ZERO_ADDRESS, pool.address, tick_lower, tick_upper, liquidity,
+                                                 pool_position.fee_growth_inside0_last_x128,
+                                                 pool_position.fee_growth_inside1_last_x128, 0, 0)
+        self.emit("IncreaseLiquidity", token_id, liquidity, amount0, amount1)
+        return token_id, liquidity, amount0, amount1
+
+    def increaseLiquidity(self, sender, params):
+        token_id, amount0_desired, amount1_desired, amount0_min, amount1_min, deadline = params
+        self._check_deadline(deadline)
+        position = self._position(token_id)
+        pool = self.chain.contracts[position.pool.lower()]
+        liquidity, amount0, amount1 = self._add_liquidity(sender, pool, position.tick_lower, position.tick_upper,
+                                                          amount0_desired, amount1_desired, amount0_min, amount1_min)
+        self.position_data[token_id] = self._accrue(position, pool, 0, 0)._replace(liquidity=position.liquidity + liquidity)
+        self.emit("IncreaseLiquidity", token_id, liquidity, amount0, amount1)
+        return liquidity, amount0, amount1
+
+    def decreaseLiquidity(self, sender, params):
+        token_id, liquidity, amount0_min, amount1_min, deadline = params
+        self._check_authorized(sender, token_id)
+        self._check_deadline(deadline)
+        _require(liquidity > 0)
+        position = self._position(token_id)
+        _require(position.liquidity >= liquidity)
+        pool = self.chain.contracts[position.pool.lower()]
+        amount0, amount1 = pool.burn(self.address, position.tick_lower, position.tick_upper, liquidity)
+        _require(amount0 >= amount0_min and amount1 >= amount1_min, "Price slippage check")
+        # The withdrawn principal is owed to the position with its fees, until collected.
+        self.position_data[token_id] = self._accrue(position, pool, amount0, amount1)._replace(liquidity=position.liquidity - liquidity)
+        self.emit("DecreaseLiquidity", token_id, liquidity, amount0, amount1)
+        return amount0, amount1
+
+    def collect(self, sender, params):
+        token_id, recipient, amount0_max, amount1_max = params
+        self._check_authorized(sender, token_id)
+        _require(amount0_max > 0 or amount1_max > 0)
+        if recipient == ZERO_ADDRESS:
+            recipient = self.address
+        position = self._position(token_id)
+        pool = self.chain.contracts[position.pool.lower()]
+        if position.liquidity > 0:
+            # Poke the pool position so its fees are up to date.
+            pool.burn(self.address, position.tick_lower, position.tick_upper, 0)
+            position = self._accrue(position, pool, 0, 0)
+        collect0 = min(amount0_max, position.tokens_owed0)
+        collect1 = min(amount1_max, position.tokens_owed1)
+        amount0, amount1 = pool.collect(self.address, recipient, position.tick_lower, position.tick_upper, collect0, collect1)
+        self.position_data[token_id] = position._replace(tokens_owed0=position.tokens_owed0 - collect0,
+                                                         tokens_owed1=position.tokens_owed1 - collect1)
+        self.emit("Collect", token_id, recipient, collect0, collect1)
+        return amount0, amount1
+
+    def burn(self, sender, token_id):
+        self._check_authorized(sender, token_id)
+        position = self._position(token_id)
+        _require(position.liquidity == 0 and position.tokens_owed0 == 0 and position.tokens_owed1 == 0, "Not cleared")
+        del self.position_data[token_id]
+        self._burn_token(token_id)
+
+    def multicall(self, sender, data):
+        # Delegatecalls into this contract: every call keeps the original sender; any revert reverts them all.
+        return [self.execute(sender, call) for call in data]
+
+    def selfPermit(self, sender, token, value, deadline, v, r, s):
+        self._erc20(token).permit(self.address, sender, self.address, value, deadline, v, r, s)
+
+    def _position(self, token_id: int) -> _Position:
+        position = self.position_data.get(token_id)
+        _require(position is not None, "Invalid token ID")
+        return position
+
+    def _check_deadline(self, deadline: int):
+        _require(self.chain.timestamp <= deadline, "Transaction too old")
+
+    def _check_authorized(self, sender: str, token_id: int):
+        owner = self.owners.get(token_id)
+        _require(owner is not None, "ERC721: operator query for nonexistent token")
+        _require(owner == sender, "Not approved")
+
+    def _add_liquidity(self, payer: str, pool: Pool, tick_lower: int, tick_upper: int, amount0_desired: int,
+                       amount1_desired: int, amount0_min: int, amount1_min: int) -> tuple:
+        """LiquidityManagement.addLiquidity: the most liquidity the desired amounts allow, paid by `payer`."""
+        liquidity = get_liquidity_for_amounts(pool.sqrt_price_x96, get_sqrt_ratio_at_tick(tick_lower),
+                                              get_sqrt_ratio_at_tick(tick_upper), amount0_desired, amount1_desired)
+
+        def pay(amount0_owed, amount1_owed):
+            # uniswapV3MintCallback: pull the owed amounts from the payer straight into the pool.
+            for token, amount in ((pool.token0, amount0_owed), (pool.token1, amount1_owed)):
+                if amount > 0:
+                    try:
+                        self._erc20(token).transferFrom(self.address, payer, pool.address, amount)
+                    except Revert:
+                        raise Revert("STF")
+
+        amount0, amount1 = pool.mint(self.address, self.address, tick_lower, tick_upper, liquidity, pay)
+        _require(amount0 >= amount0_min and amount1 >= amount1_min, "Price slippage check")
+        return liquidity, amount0, amount1
+
+    def _accrue(self, position: _Position, pool: Pool, amount0: int, amount1: int) -> _Position:
+        """The position with the fees earned since its last update (plus `amount0/1` withdrawn) added to what it is owed."""
+        pool_position = pool.positions[(self.address, position.tick_lower, position.tick_upper)]
+        inside0, inside1 = pool_position.fee_growth_inside0_last_x128, pool_position.fee_growth_inside1_last_x128
+        fees0 = mul_div((inside0 - position.fee_growth_inside0_last_x128) % UINT256_MOD, position.liquidity, Q128)
+        fees1 = mul_div((inside1 - position.fee_growth_inside1_last_x128) % UINT256_MOD, position.liquidity, Q128)
+        return position._replace(fee_growth_inside0_last_x128=inside0, fee_growth_inside1_last_x128=inside1,
+                                 tokens_owed0=(position.tokens_owed0 + amount0 + fees0) % UINT128_MOD,
+                                 tokens_owed1=(position.tokens_owed1 + amount1 + fees1) % UINT128_MOD)
+
+    # --- ERC721 (enumerable) ---
+    def balanceOf(self, sender, owner):
+        _require(owner != ZERO_ADDRESS, "ERC721: balance query for the zero address")
+        return len(self.owned.get(owner, ()))
+
+    def ownerOf(self, sender, token_id):
+        owner = self.owners.get(token_id)
+        _require(owner is not None, "ERC721: owner query for nonexistent token")
+        return owner
+
+    def tokenOfOwnerByIndex(self, sender, owner, index):
+        token_ids = self.owned.get(owner, ())
+        _require(index < len(token_ids), "ERC721Enumerable: owner index out of bounds")
+        return token_ids[index]
+
+    def totalSupply(self, sender):
+        return len(self.owners)
+
+    def _mint_token(self, to: str, token_id: int):
+        _require(to != ZERO_ADDRESS, "ERC721: mint to the zero address")
+        self.owners[token_id] = to
+        self.owned[to] = self.owned.get(to, ()) + (token_id,)
+        self.emit("Transfer", ZERO_ADDRESS, to, token_id)
+
+    def _burn_token(self, token_id: int):
+        owner = self.owners[token_id]
+        # ERC721Enumerable removes a token by moving the owner's last token into its slot.
+        token_ids = list(self.owned[owner])
+        last = token_ids.pop()
+        if last != token_id:
+            token_ids[token_ids.index(token_id)] = last
+        self.owned[owner] = tuple(token_ids)
+        del self.owners[token_id]
+        self.emit("Approval", owner, ZERO_ADDRESS, token_id)
+        self.emit("Transfer", owner, ZERO_ADDRESS, token_id)
+
+
+# The ABI files the bot loads (see uniswap_lp_abi.py), per emulated contract.
+class SwapRouter(Contract):
+    """SwapRouter (V3 periphery), single-pool exact input swaps only."""
+    INTERFACE = (
+        "function exactInputSingle((address tokenIn, address tokenOut, uint24 fee, address recipient, uint256 deadline, "
+        "uint256 amountIn, uint256 amountOutMinimum, uint160 sqrtPriceLimitX96) params) payable returns (uint256 amountOut)",
+        "function factory() view returns (address)",
+    )
+    GAS = {"exactInputSingle": SWAP_GAS}
+
+    def __init__(self, chain, address, factory: str):
+        super().__init__(chain, address)
+        self.factory = factory
+
+    def exactInputSingle(self, sender, params):
+        token_in, token_out, fee, recipient, deadline, amount_in, amount_out_minimum, sqrt_price_limit_x96 = params
+        _require(self.chain.timestamp <= deadline, "Transaction too old")
+        token0, token1 = _sort_tokens(token_in, token_out)
+        pool_address = self.chain.contracts[self.factory.lower()].pools.get((token0, token1, fee))
+        _require(pool_address is not None)
+        pool = self.chain.contracts[pool_address.lower()]
+        zero_for_one = token_in == token0
+        if sqrt_price_limit_x96 == 0:
+            sqrt_price_limit_x96 = MIN_SQRT_RATIO + 1 if zero_for_one else MAX_SQRT_RATIO - 1
+
+        def pay(amount0_delta, amount1_delta):
+            # uniswapV3SwapCallback: pull the input from the sender straight into the pool.
+            try:
+                self._erc20(token_in).transferFrom(self.address, sender, pool.address,
+                                                   amount0_delta if zero_for_one else amount1_delta)
+            except Revert:
+                raise Revert("STF")
+
+        amount0, amount1 = pool.swap(self.address, recipient, zero_for_one, amount_in, sqrt_price_limit_x96, pay)
+        amount_out = -(amount1 if zero_for_one else amount0)
+        _require(amount_out >= amount_out_minimum, "Too little received")
+        return amount_out
+
+
+ABI_FILES = {
+    "UniswapV3Factory.json": Factory,
+    "UniswapV3Pool.json": Pool,
+    "UniswapV3PositionManager.json": PositionManager,
+    "ERC20.json": ERC20,
+    "ChainlinkAggregatorV3.json": Feed,
+    "Multicall3.json": Multicall3,
+    "SwapRouter.json": SwapRouter,
+}
+
+
+def write_abis(directory: str):
+    """Writes the emulated contracts' ABIs under the file names the bot expects (an abi/ folder for ABI_DIR)."""
+    os.makedirs(directory, exist_ok=True)
+    for filename, contract_class in ABI_FILES.items():
+        with open(os.path.join(directory, filename), "w") as f:
+            json.dump(contract_class.ABI, f, indent=2)
+
+
+# --- Chain ---
+def _int(value: bytes) -> int:
+    return int.from_bytes(value, "big")
+
+
+def _decode_transaction(raw: bytes) -> dict:
+    """The fields of a signed legacy, EIP-2930 (type 1) or EIP-1559 (type 2) transaction."""
+    try:
+        if raw[0] >= 0xc0:
+            nonce, gas_price, gas, to, value, data, v = rlp.decode(raw)[:7]
+            v = _int(v)
+            tx = {"type": 0, "chain_id": (v - 35) // 2 if v >= 35 else None, "max_fee": _int(gas_price), "priority_fee": _int(gas_price)}
+        elif raw[0] == 1:
+            chain_id, nonce, gas_price, gas, to, value, data = rlp.decode(raw[1:])[:7]
+            tx = {"type": 1, "chain_id": _int(chain_id), "max_fee": _int(gas_price), "priority_fee": _int(gas_price)}
+        elif raw[0] == 2:
+            chain_id, nonce, priority_fee, max_fee, gas, to, value, data = rlp.decode(raw[1:])[:8]
+            tx = {"type": 2, "chain_id": _int(chain_id), "max_fee": _int(max_fee), "priority_fee": _int(priority_fee)}
+        else:
+            raise RPCError(-32000, "transaction type not supported")
+    except (rlp.exceptions.DecodingError, ValueError, IndexError):
+        raise RPCError(-32000, "rlp: invalid transaction")
+    tx.update(nonce=_int(nonce), gas=_int(gas), to=to_checksum_address(to) if to else None, value=_int(value), data=bytes(data))
+    return tx
+
+
+class EmulatedChain:
+    """
+    The emulated chain: contracts by address, account nonces, blocks, receipts and logs. Thread-safe (one lock).
+    Signed transactions are mined immediately, one per block; `mine` adds blocks of random-walk swaps.
+    """
+    BLOCK_GAS_LIMIT = 30_000_000
+    CALL_GAS_LIMIT = 50_000_000 # Gas cap of eth_call and eth_estimateGas
+
+    def __init__(self, chain_id: int = 31337, base_fee: int = 10**9, priority_fee: int = 10**8, seed: int = 0):
+        self.chain_id = chain_id
+        self.base_fee = base_fee
+        self.priority_fee = priority_fee
+        self.rng = random.Random(seed)
+        self.lock = threading.RLock()
+        self.journal = _Journal()
+        self.contracts = _JDict(self.journal) # lowercase address -> Contract
+        self.block_hooks = [] # Contracts with an on_block
+        self.nonces = {} # lowercase address -> next nonce
+        self.blocks = []
+        self.receipts = {} # transaction hash (hex) -> receipt (JSON-RPC form)
+        self.logs = [] # every log (JSON-RPC form), in chain order
+        self.log_blocks = [] # block number of each entry of `logs`, for bisecting block ranges
+        # Context of the transaction or call being executed.
+        self.gas_limit = self.gas_used = 0
+        self.tx_logs = []
+        self._seal_block(self._open_block())
+
+    @property
+    def head(self) -> int:
+        return len(self.blocks) - 1
+
+    def contract_at(self, address: str):
+        return self.contracts.get(address.lower())
+
+    def deploy(self, contract_class, address: str, *args, **kwargs) -> Contract:
+        """Creates a contract at `address` (outside a transaction, the change is final)."""
+        with self.lock:
+            if address.lower() in self.contracts:
+                raise ValueError(f"A contract is already deployed at {address}")
+            contract = contract_class(self, address, *args, **kwargs)
+            self.contracts[address.lower()] = contract
+            if type(contract).on_block is not Contract.on_block:
+                self.block_hooks.append(contract)
+            if not self.gas_limit:
+                self.journal.commit()
+            return contract
+
+    def fund(self, token: str, to: str, amount: int):
+        """Mints `amount` (raw units) of an emulated ERC20 to `to`."""
+        with self.lock:
+            self.contracts[token.lower()]._mint(to_checksum_address(to), amount)
+            self.journal.commit()
+
+    def use_gas(self, amount: int):
+        self.gas_used += amount
+        if self.gas_used > self.gas_limit:
+            raise OutOfGas("out of gas")
+
+    def add_log(self, address: str, topics: list, data: bytes):
+        self.tx_logs.append((address, topics, data))
+        self.journal.log(_pop_last, self.tx_logs)
+
+    def call_contract(self, sender: str, to: str, data: bytes) -> bytes:
+        """One external call. Calls to an address without code succeed and return nothing, as in the EVM."""
+        contract = self.contracts.get(to.lower())
+        if contract is None:
+            return b""
+        try:
+            return contract.execute(sender, data)
+        except Revert:
+            raise
+        except _EVM_FAULTS as e:
+            raise Revert() from e
+
+    def _begin(self, gas_limit: int, intrinsic_gas: int):
+        self.gas_limit = gas_limit
+        self.gas_used = intrinsic_gas
+        self.tx_logs = []
+
+    def call(self, sender: str, to: str, data: bytes, gas: int = None) -> bytes:
+        """eth_call against the latest state; nothing it changes is kept."""
+        with self.lock:
+            checkpoint = self.journal.checkpoint()
+            self._begin(gas or self.CALL_GAS_LIMIT, _intrinsic_gas(data))
+            try:
+                return self.call_contract(sender, to, data)
+            finally:
+                self.journal.revert(checkpoint)
+                self.gas_limit = 0
+
+    def estimate_gas(self, sender: str, to: str, data: bytes) -> int:
+        """eth_estimateGas: the gas the call uses against the latest state. Raises Revert if it reverts."""
+        with self.lock:
+            checkpoint = self.journal.checkpoint()
+            self._begin(self.CALL_GAS_LIMIT, _intrinsic_gas(data))
+            try:
+                if to is not None:
+                    self.call_contract(sender, to, data)
+                return self.gas_used
+            finally:
+                self.journal.revert(checkpoint)
+                self.gas_limit = 0
+
+    def send_raw_transaction(self, raw: bytes) -> bytes:
+        """Validates a signed transaction and mines it in a new block. Returns its hash."""
+        with self.lock:
+            tx = _decode_transaction(raw)
+            try:
+                sender = Account.recover_transaction(raw)
+            except Exception:
+                raise RPCError(-32000, "invalid sender")
+            if tx["chain_id"] is not None and tx["chain_id"] != self.chain_id:
+                raise RPCError(-32000, f"invalid chain id {tx['chain_id']}, expected {self.chain_id}")
+            expected_nonce = self.nonces.get(sender.lower(), 0)
+            if tx["nonce"] < expected_nonce:
+                raise RPCError(-32000, "nonce too low")
+            if tx["nonce"] > expected_nonce:
+                # A node would queue it; nothing here ever fills the gap.
+                raise RPCError(-32000, "nonce too high")
+            intrinsic_gas = _intrinsic_gas(tx["data"])
+            if tx["gas"] < intrinsic_gas:
+                raise RPCError(-32000, "intrinsic gas too low")
+            if tx["gas"] > self.BLOCK_GAS_LIMIT:
+                raise RPCError(-32000, "exceeds block gas limit")
+            if tx["max_fee"] < self.base_fee:
+                raise RPCError(-32000, "max fee per gas less than block base fee")
+
+            self.nonces[sender.lower()] = expected_nonce + 1
+            tx_hash = keccak(raw)
+
+            def run():
+                _require(tx["to"] is not None, "contract creation is not supported")
+                self.call_contract(sender, tx["to"], tx["data"])
+
+            block = self._open_block()
+            gas_price = min(tx["max_fee"], self.base_fee + tx["priority_fee"])
+            self._apply(block, tx_hash, sender, tx["to"], tx["gas"], intrinsic_gas, run, tx["type"], gas_price)
+            self._seal_block(block)
+            return tx_hash
+
+    def mine(self, blocks: int = 1, swaps_per_block: int = 1, volatility: float = 0.8, block_time: float = 12.0) -> int:
+        """
+        Mines `blocks` blocks, each with `swaps_per_block` random-walk swaps in every initialized pool: the price moves
+        by a lognormal step of annualized `volatility` over `block_time` seconds per block. Returns the head block.
+        """
+        sigma = volatility * math.sqrt(block_time / SECONDS_PER_YEAR / max(swaps_per_block, 1))
+        with self.lock:
+            pools = [contract for contract in self.contracts.values() if isinstance(contract, Pool) and contract.sqrt_price_x96]
+            for _ in range(blocks):
+                block = self._open_block()
+                for _ in range(swaps_per_block):
+                    for pool in pools:
+                        self._random_swap(block, pool, sigma)
+                self._seal_block(block)
+            return self.head
+
+    def _random_swap(self, block: dict, pool: Pool, sigma: float):
+        current = pool.sqrt_price_x96
+        # sqrt(price) moves by half the log price step.
+        target = int(current * math.exp(sigma * self.rng.gauss(0.0, 1.0) / 2))
+        target = min(max(target, MIN_SQRT_RATIO + 1), MAX_SQRT_RATIO - 1)
+        if target == current:
+            return
+        zero_for_one = target < current
+        token_in = self._token(pool.token0 if zero_for_one else pool.token1)
+
+        def pay(amount0, amount1):
+            token_in._mint(pool.address, amount0 if zero_for_one else amount1)
+
+        def run():
+            pool.swap(TRADER, TRADER, zero_for_one, SWAP_EXACT_INPUT, target, pay)
+
+        tx_hash = keccak(b"swap" + block["number"].to_bytes(8, "big") + len(block["transactions"]).to_bytes(4, "big"))
+        self._apply(block, tx_hash, TRADER, pool.address, SWAP_GAS, SWAP_GAS, run, 2, self.base_fee + self.priority_fee)
+
+    def _token(self, address: str) -> ERC20:
+        return self.contracts[address.lower()]
+
+    def _open_block(self) -> dict:
+        number = len(self.blocks)
+        parent_hash = self.blocks[-1]["hash"] if self.blocks else bytes(32)
+        # Timestamps follow the wall clock (never backwards), as the bot's deadlines do.
+        timestamp = max(self.blocks[-1]["timestamp"], int(time.time())) if self.blocks else int(time.time())
+        self.block_number, self.timestamp = number, timestamp
+        return {"number": number, "hash": keccak(number.to_bytes(32, "big") + parent_hash), "parent_hash": parent_hash,
+                "timestamp": timestamp, "gas_used": 0, "log_count": 0, "transactions": []}
+
+    def _seal_block(self, block: dict):
+        for contract in self.block_hooks:
+            contract.on_block(block["number"], block["timestamp"])
+        self.journal.commit()
+        self.blocks.append(block)
+
+    def _apply(self, block: dict, tx_hash: bytes, sender: str, to: str, gas_limit: int, intrinsic_gas: int, run,
+               tx_type: int, gas_price: int) -> dict:
+        """Executes one transaction in `block` (reverting its changes if it fails) and records its receipt and logs."""
+        checkpoint = self.journal.checkpoint()
+        self._begin(gas_limit, intrinsic_gas)
+        status = 1
+        try:
+            run()
+        except Revert as e:
+            self.journal.revert(checkpoint)
+            status = 0
+            if isinstance(e, OutOfGas):
+                self.gas_used = gas_limit
+        except _EVM_FAULTS:
+            self.journal.revert(checkpoint)
+            status = 0
+        self.journal.commit()
+        self.gas_limit = 0
+
+        number = block["number"]
+        block["gas_used"] += self.gas_used
+        tx_hex, block_hex = "0x" + tx_hash.hex(), "0x" + block["hash"].hex()
+        index = len(block["transactions"])
+        logs = []
+        for address, topics, data in self.tx_logs:
+            log = {"address": address, "topics": ["0x" + topic.hex() for topic in topics], "data": "0x" + data.hex(),
+                   "blockNumber": hex(number), "blockHash": block_hex, "transactionHash": tx_hex,
+                   "transactionIndex": hex(index), "logIndex": hex(block["log_count"]), "removed": False}
+            block["log_count"] += 1
+            logs.append(log)
+            self.logs.append(log)
+            self.log_blocks.append(number)
+        receipt = {
+            "transactionHash": tx_hex, "transactionIndex": hex(index), "blockHash": block_hex, "blockNumber": hex(number),
+            "from": sender, "to": to, "contractAddress": None, "cumulativeGasUsed": hex(block["gas_used"]),
+            "gasUsed": hex(self.gas_used), "effectiveGasPrice": hex(gas_price), "logs": logs,
+            "logsBloom": "0x" + "00" * 256, "status": hex(status), "type": hex(tx_type),
+        }
+        self.receipts[tx_hex] = receipt
+        block["transactions"].append(tx_hex)
+        return receipt
+
+    def get_logs(self, from_block: int, to_block: int, addresses: set = None, topics: list = None) -> list:
+        """Logs in [from_block, to_block]; `addresses` lowercase, `topics` per position: None, a topic or a list of topics."""
+        start, end = bisect_left(self.log_blocks, from_block), bisect_right(self.log_blocks, to_block)
+        matches = []
+        for log in self.logs[start:end]:
+            if addresses is not None and log["address"].lower() not in addresses:
+                continue
+            if topics and not _topics_match(log["topics"], topics):
+                continue
+            matches.append(log)
+        return matches
+
+
+def _topics_match(log_topics: list, wanted_topics: list) -> bool:
+    for position, wanted in enumerate(wanted_topics):
+        if wanted is None:
+            continue
+        if position >= len(log_topics) or log_topics[position] not in wanted:
+            return False
+    return True
+
+
+# --- Provider ---
+class EmulatorProvider(JSONBaseProvider):
+    """
+    web3 provider answering JSON-RPC from an EmulatedChain, in-process. Offers the `request_raw` and `health`
+    of MultiEndpointProvider, so the bot's eth_call fast path and benchmarks work over it unchanged.
+    """
+    def __init__(self, chain: EmulatedChain):
+        super().__init__()
+        self.chain = chain
+        self.requests = Counter() # method -> requests
+        self.errors = 0
+        self._latency = None # moving average, seconds
+        self._methods = {
+            "eth_chainId": lambda: hex(chain.chain_id),
+            "net_version": lambda: str(chain.chain_id),
+            "web3_clientVersion": lambda: "uniswap-lp-emulator",
+            "eth_blockNumber": lambda: hex(chain.head),
+            "eth_gasPrice": lambda: hex(chain.base_fee + chain.priority_fee),
+            "eth_maxPriorityFeePerGas": lambda: hex(chain.priority_fee),
+            "eth_getBlockByNumber": self._get_block_by_number,
+            "eth_feeHistory": self._fee_history,
+            "eth_getTransactionCount": lambda address, block="latest": hex(chain.nonces.get(address.lower(), 0)),
+            "eth_getCode": lambda address, block="latest": "0xfe" if chain.contract_at(address) else "0x",
+            "eth_call": self._call,
+            "eth_estimateGas": self._estimate_gas,
+            "eth_sendRawTransaction": lambda raw: "0x" + chain.send_raw_transaction(bytes.fromhex(raw[2:])).hex(),
+            "eth_getTransactionReceipt": lambda tx_hash: chain.receipts.get(tx_hash.lower()),
+            "eth_getLogs": self._get_logs,
+        }
+
+    def is_connected(self, show_traceback: bool = False) -> bool:
+        return True
+
+    def make_request(self, method, params):
+        return self.request_raw(method, self.encode_rpc_request(method, params))
+
+    def request_raw(self, method: str, request_data: bytes, decode=None) -> dict:
+        """Answers an encoded JSON-RPC request. `decode` is accepted for MultiEndpointProvider compatibility (unused)."""
+        started = time.perf_counter()
+        request = json.loads(request_data)
+        self.requests[method] += 1
+        response = {"jsonrpc": "2.0", "id": request.get("id")}
+        try:
+            handler = self._methods.get(method)
+            if handler is None:
+                raise RPCError(-32601, f"the method {method} does not exist/is not available")
+            with self.chain.lock:
+                response["result"] = handler(*request.get("params", []))
+        except Revert as e:
+            response["error"] = {"code": 3, "message": f"execution reverted: {e.reason}" if e.reason else "execution reverted"}
+            if e.data:
+                response["error"]["data"] = "0x" + e.data.hex()
+        except RPCError as e:
+            response["error"] = {"code": e.code, "message": e.message}
+        elapsed = time.perf_counter() - started
+        self._latency = elapsed if self._latency is None else 0.9 * self._latency + 0.1 * elapsed
+        RPC_LATENCY.observe(elapsed, method)
+        if "error" in response:
+            self.errors += 1
+            RPC_ERRORS.inc(1, method, "rpc")
+        return response
+
+    def health(self) -> list:
+        """Same shape as MultiEndpointProvider.health: one in-process endpoint."""
+        total = sum(self.requests.values())
+        return [{"url": "emulator", "latency_ms": None if self._latency is None else round(self._latency * 1000, 3),
+                 "error_rate": round(self.errors / total, 3) if total else 0.0, "requests": total, "errors": self.errors,
+                 "cooling_down": False}]
+
+    def _block_number(self, tag) -> int:
+        if tag in (None, "latest", "pending", "safe", "finalized"):
+            return self.chain.head
+        if tag == "earliest":
+            return 0
+        return int(tag, 16)
+
+    def _get_block_by_number(self, tag, full_transactions: bool = False):
+        number = self._block_number(tag)
+        if number > self.chain.head:
+            return None
+        block = self.chain.blocks[number]
+        zero_hash = "0x" + "00" * 32
+        return {
+            "number": hex(number), "hash": "0x" + block["hash"].hex(), "parentHash": "0x" + block["parent_hash"].hex(),
+            "timestamp": hex(block["timestamp"]), "gasLimit": hex(self.chain.BLOCK_GAS_LIMIT),
+            "gasUsed": hex(block["gas_used"]), "baseFeePerGas": hex(self.chain.base_fee), "miner": ZERO_ADDRESS,
+            "extraData": "0x", "difficulty": "0x0", "totalDifficulty": "0x0", "nonce": "0x0000000000000000",
+            "sha3Uncles": zero_hash, "mixHash": zero_hash, "stateRoot": zero_hash, "transactionsRoot": zero_hash,
+            "receiptsRoot": zero_hash, "logsBloom": "0x" + "00" * 256, "size": "0x0", "uncles": [],
+            # Full transaction objects aren't kept: hashes only.
+            "transactions": list(block["transactions"]),
+        }
+
+    def _fee_history(self, block_count, newest_block, reward_percentiles=None):
+        newest = min(self._block_number(newest_block), self.chain.head)
+        count = min(int(block_count, 16) if isinstance(block_count, str) else block_count, newest + 1)
+        oldest = newest - count + 1
+        blocks = self.chain.blocks[oldest:newest + 1]
+        history = {
+            "oldestBlock": hex(oldest),
+            "baseFeePerGas": [hex(self.chain.base_fee)] * (count + 1),
+            "gasUsedRatio": [block["gas_used"] / self.chain.BLOCK_GAS_LIMIT for block in blocks],
+        }
+        if reward_percentiles:
+            history["reward"] = [[hex(self.chain.priority_fee)] * len(reward_percentiles) for _ in blocks]
+        return history
+
+    @staticmethod
+    def _transaction_fields(tx: dict) -> tuple:
+        sender = to_checksum_address(tx["from"]) if tx.get("from") else ZERO_ADDRESS
+        to = to_checksum_address(tx["to"]) if tx.get("to") else None
+        data = tx.get("data") or tx.get("input") or "0x"
+        return sender, to, bytes.fromhex(data[2:])
+
+    def _call(self, tx: dict, block="latest", *state_overrides):
+        # Every block reads the latest state (see the module docstring); only blocks that don't exist yet fail.
+        if self._block_number(block) > self.chain.head:
+            raise RPCError(-32000, "header not found")
+        sender, to, data = self._transaction_fields(tx)
+        if to is None:
+            return "0x"
+        gas = int(tx["gas"], 16) if tx.get("gas") else None
+        return "0x" + self.chain.call(sender, to, data, gas).hex()
+
+    def _estimate_gas(self, tx: dict, block="latest"):
+        sender, to, data = self._transaction_fields(tx)
+        return hex(self.chain.estimate_gas(sender, to, data))
+
+    def _get_logs(self, log_filter: dict):
+        head = self.chain.head
+        from_block = self._block_number(log_filter.get("fromBlock", "latest"))
+        to_block = min(self._block_number(log_filter.get("toBlock", "latest")), head)
+        address = log_filter.get("address")
+        addresses = None
+        if address:
+            addresses = {a.lower() for a in ([address] if isinstance(address, str) else address)}
+        topics = [None if wanted is None else {t.lower() for t in ([wanted] if isinstance(wanted, str) else wanted)}
+                  for wanted in log_filter.get("topics") or []]
+        return self.chain.get_logs(from_block, to_block, addresses, topics)
+
+
+def deploy_for_config(chain: EmulatedChain, config, price, decimals: tuple = (18, 6), depth: int = 10_000) -> Pool:
+    """
+    Deploys what `config` points at, at its addresses: the two tokens, the factory, the position manager, Multicall3,
+    the swap router, the Chainlink feeds (CHAINLINK_ETH_USD_FEED follows the pool, CHAINLINK_USDC_USD_FEED stays at 1) and the
+    POOL_FEE pool, initialized at `price` (token1 per token0, e.g. 3000 USDT per WETH) with `depth` token0 of
+    full range liquidity from a market maker. Contracts already deployed (another fee tier) are reused.
+    The bot treats TOKEN0 as the pool's token0, so TOKEN0_ADDRESS must sort below TOKEN1_ADDRESS.
+    Returns the pool.
+    """
+    token0_address, token1_address = to_checksum_address(config.TOKEN0_ADDRESS), to_checksum_address(config.TOKEN1_ADDRESS)
+    if int(token0_address, 16) >= int(token1_address, 16):
+        raise ValueError(f"TOKEN0_ADDRESS {token0_address} must sort below TOKEN1_ADDRESS {token1_address} (it is the pool's token0)")
+    with chain.lock:
+        symbols = (config.TOKEN0_ADDRESS_SYMBOL, config.TOKEN1_ADDRESS_SYMBOL)
+        for address, symbol, token_decimals in zip((token0_address, token1_address), symbols, decimals):
+            if chain.contract_at(address) is None:
+                chain.deploy(ERC20, address, symbol, token_decimals)
+        factory = chain.contract_at(config.UNISWAP_FACTORY_ADDRESS) or chain.deploy(Factory, config.UNISWAP_FACTORY_ADDRESS)
+        if chain.contract_at(config.UNISWAP_NFT_POSITION_MANAGER_ADDRESS) is None:
+            chain.deploy(PositionManager, config.UNISWAP_NFT_POSITION_MANAGER_ADDRESS, factory.address)
+        if chain.contract_at(config.MULTICALL3_ADDRESS) is None:
+            chain.deploy(Multicall3, config.MULTICALL3_ADDRESS)
+        if chain.contract_at(config.SWAP_ROUTER_ADDRESS) is None:
+            chain.deploy(SwapRouter, config.SWAP_ROUTER_ADDRESS, factory.address)
+
+        pool_address = factory.pools.get((token0_address, token1_address, config.POOL_FEE))
+        if pool_address is None:
+            pool_address = factory.createPool(factory.address, token0_address, token1_address, config.POOL_FEE)
+        pool = chain.contract_at(pool_address)
+        if not pool.sqrt_price_x96:
+            decimals0, decimals1 = chain.contract_at(token0_address).decimals, chain.contract_at(token1_address).decimals
+            pool.initialize(price_to_sqrt_price_x96(price, decimals0, decimals1))
+            spacing = pool.tick_spacing
+            lower, upper = -(-MIN_TICK // spacing) * spacing, (MAX_TICK // spacing) * spacing
+            amount0 = depth * 10**decimals0
+            # The liquidity `depth` token0 buys above the price; the token1 below it is whatever that liquidity needs.
+            liquidity = get_liquidity_for_amount0(pool.sqrt_price_x96, get_sqrt_ratio_at_tick(upper), amount0)
+
+            def pay(owed0, owed1):
+                chain.contract_at(token0_address)._mint(pool.address, owed0)
+                chain.contract_at(token1_address)._mint(pool.address, owed1)
+
+            pool.mint(MARKET_MAKER, MARKET_MAKER, lower, upper, liquidity, pay)
+
+        if chain.contract_at(config.CHAINLINK_ETH_USD_FEED) is None:
+            chain.deploy(Feed, config.CHAINLINK_ETH_USD_FEED, description="ETH / USD", pool=pool.address)
+        if chain.contract_at(config.CHAINLINK_USDC_USD_FEED) is None:
+            chain.deploy(Feed, config.CHAINLINK_USDC_USD_FEED, answer=10**8, description="USDC / USD")
+        # Feeds that follow a pool start at its price.
+        for contract in chain.block_hooks:
+            contract.on_block(chain.head, chain.timestamp)
+        chain.journal.commit()
+        return pool
+
+
+# --- Load test driver ---
+WETH = "0xC02aaA39b223FE8D0A0e5C4F27eAD9083C756Cc2"
+USDT = "0xdAC17F958D2ee523a2206206994597C13D831ec7" # Sorts above WETH: WETH is the pool's token0
+ETH_USD_FEED = "0x5f4eC3Df9cbd43714FE2740D5E3616155c5b8419"
+LOAD_TEST_FEES = (3000, 500, 10000)
+# Positions get range widths of REBALANCE_RANGE_WIDTH times these, in turn, so they rebalance at different times.
+RANGE_WIDTH_STEPS = ("0.5", "0.75", "1", "1.25")
+
+
+def _bot_environment():
+    """
+    Points the bot at a fresh working directory (ABIs of the emulated contracts, state journal, registry files) and
+    the emulator's account, through the environment. Returns (account, the uniswap_lp_bot module).
+    """
+    import tempfile
+
+    workdir = tempfile.mkdtemp(prefix="lpbot-emulator-")
+    abi_dir = os.path.join(workdir, "abi")
+    write_abis(abi_dir)
+    account = Account.from_key(keccak(b"uniswap-lp-emulator"))
+    # The bot reads its settings (and uniswap_lp_abi its ABI_DIR) from the environment when it is imported.
+    os.environ.update({
+        "NODE_URL": "http://emulator.invalid", "PRIVATE_KEY": account.key.hex(), "WALLET_ADDRESS": account.address,
+        "ABI_DIR": abi_dir, "ABI_CACHE_PATH": os.path.join(abi_dir, "abi_cache.json"),
+        "JOURNAL_PATH": os.path.join(workdir, "bot_state.db"),
+        "POOL_REGISTRY_PATH": os.path.join(workdir, "pool_registry.json"),
+        "HEDGE_LEDGER_PATH": os.path.join(workdir, "hedge_ledger.jsonl"),
+        "EVENT_CURSOR_PATH": os.path.join(workdir, "swap_cursor.json"),
+    })
+    for key, value in {"DERIVATIVES_EXCHANGE": "paper", "ALLOWANCE_POLICY": "cap", "TX_POLL_INTERVAL": "0.001",
+                       "POSITION_DISCOVERY": "false"}.items():
+        os.environ.setdefault(key, value)
+    import uniswap_lp_bot as bot_module
+    return account, bot_module
+
+
+def _quiet_output(verbose: bool):
+    """Context manager hiding the bot's output unless `verbose`."""
+    import contextlib
+    import warnings
+
+    if verbose:
+        return contextlib.nullcontext()
+    # web3 warns about every log of a receipt that isn't the event it decodes (Transfer logs of a mint, ...).
+    warnings.filterwarnings("ignore", category=UserWarning, module="web3")
+    return contextlib.redirect_stdout(open(os.devnull, "w"))
+
+
+def run_load_test(args) -> dict:
+    import cProfile
+    import pstats
+    from decimal import Decimal
+
+    account, bot_module = _bot_environment()
+    chain = EmulatedChain(seed=args.seed)
+    base = bot_module.Config()
+    specs = [{"token0": WETH, "token1": USDT, "fee": LOAD_TEST_FEES[index % len(LOAD_TEST_FEES)], "short_symbol": "ETH-PERP",
+              "token0_symbol": "WETH", "token1_symbol": "USDT", "chainlink_feed": ETH_USD_FEED} for index in range(args.positions)]
+    for spec in specs:
+        deploy_for_config(chain, base.for_position(spec), args.price)
+    chain.fund(WETH, account.address, 10**6 * 10**18)
+    chain.fund(USDT, account.address, 10**6 * int(args.price) * 10**6)
+
+    output = _quiet_output(args.verbose)
+    provider = EmulatorProvider(chain)
+    bots = []
+    with output:
+        client = bot_module.BlockchainClient(base, provider=provider)
+        registry = bot_module.PoolRegistry(client)
+        derivatives = bot_module.DerivativesManager(base, client.journal)
+        hedge_book = bot_module.HedgeBook(base, derivatives)
+        for index, spec in enumerate(specs):
+            config = base.for_position(spec)
+            config.REBALANCE_RANGE_WIDTH = base.REBALANCE_RANGE_WIDTH * Decimal(RANGE_WIDTH_STEPS[index % len(RANGE_WIDTH_STEPS)])
+            bot = bot_module.LiquidityManagerBot(config, client.for_config(config), registry, derivatives, hedge_book,
+                                                 f"{index}:WETH/USDT/{spec['fee']}")
+            pool_address = bot.lp_manager.get_pool_address(WETH, USDT, spec["fee"])
+            _, price = bot.price_oracle.get_pool_prices(pool_address) # token0_per_token1 (WETH per USDT)
+            amount0 = Decimal(args.deposit)
+            width = config.REBALANCE_RANGE_WIDTH
+            bot.initial_setup(amount0, amount0 / price, price * (1 - width), price * (1 + width))
+            if not bot.position_token_id:
+                raise RuntimeError(f"Initial mint of position {index} failed (run with --verbose)")
+            bots.append(bot)
+
+    setup_requests = sum(provider.requests.values())
+    setup_outcomes = bot_module.TX_OUTCOMES.values()
+    profiler = cProfile.Profile() if args.profile else None
+    rebalances = cycles = 0
+    mining_seconds = cycle_seconds = 0.0
+    started = time.perf_counter()
+    if profiler:
+        profiler.enable()
+    with output:
+        for _ in range(max(args.blocks // args.blocks_per_cycle, 1)):
+            mark = time.perf_counter()
+            chain.mine(args.blocks_per_cycle, args.swaps_per_block, args.volatility, args.block_time)
+            mining_seconds += time.perf_counter() - mark
+            mark = time.perf_counter()
+            for bot in bots:
+                token_id = bot.position_token_id
+                bot.run_cycle()
+                cycles += 1
+                rebalances += bot.position_token_id != token_id
+            cycle_seconds += time.perf_counter() - mark
+    elapsed = time.perf_counter() - started
+    if profiler:
+        profiler.disable()
+        profiler.dump_stats(args.profile)
+
+    derivatives.session.close()
+    client.journal.close()
+    outcomes = Counter({kind_outcome: count - setup_outcomes.get(kind_outcome, 0)
+                        for kind_outcome, count in bot_module.TX_OUTCOMES.values().items()})
+    pool = chain.contract_at(chain.contract_at(base.UNISWAP_FACTORY_ADDRESS).pools[(WETH, USDT, specs[0]["fee"])])
+    result = {
+        "blocks": chain.head, "seconds": round(elapsed, 2),
+        "blocks_per_second": round(chain.head / elapsed, 1),
+        "cycles": cycles, "cycles_per_second": round(cycles / cycle_seconds, 1) if cycle_seconds else 0.0,
+        "mining_seconds": round(mining_seconds, 2), "cycle_seconds": round(cycle_seconds, 2),
+        "rebalances": rebalances,
+        "transactions": {outcome: sum(count for (_, o), count in outcomes.items() if o == outcome)
+                         for outcome in sorted({o for _, o in outcomes})},
+        "rpc_requests": sum(provider.requests.values()) - setup_requests,
+        "rpc_requests_by_method": dict(provider.requests.most_common()),
+        "final_price": float(Decimal(pool.sqrt_price_x96) ** 2 / Decimal(2**192) * Decimal(10**12)),
+    }
+    if profiler:
+        stats = pstats.Stats(args.profile)
+        stats.sort_stats("cumulative").print_stats(25)
+    return result
+
+
+def check_resume(args) -> list:
+    """
+    Crash recovery of the single-position bot, with the default Config as `LiquidityManagerBot()` builds it: each
+    scenario leaves a rebalance half done in the state journal the way a crash would, then starts a new bot on the
+    same journal and checks that its `startup` (what `run` does first) finishes or aborts it.
+    Returns the failures (empty when every scenario passed).
+    """
+    from decimal import Decimal
+
+    account, bot_module = _bot_environment()
+    chain = EmulatedChain(seed=args.seed)
+    config = bot_module.Config()
+    # USDC sorts below WETH, so it would be the emulated pool's token0: the pool is WETH/USDT instead.
+    config.TOKEN1_ADDRESS = USDT
+    deploy_for_config(chain, config, args.price)
+    chain.fund(WETH, account.address, 10**3 * 10**18)
+    chain.fund(USDT, account.address, 10**3 * int(args.price) * 10**6)
+    provider = EmulatorProvider(chain)
+
+    def start_bot():
+        bot = bot_module.LiquidityManagerBot(config, bot_module.BlockchainClient(config, provider=provider))
+        bot.startup()
+        return bot
+
+    def crash(bot):
+        # Nothing is finished or cleaned up: only the process' connections go away.
+        bot.derivatives_manager.session.close()
+        bot.blockchain_client.journal.close()
+
+    def leave_sequential(bot, token_id, lower, upper, state):
+        journal = bot.blockchain_client.journal
+        rebalance_id = journal.begin_rebalance(bot.hedge_key, "sequential", token_id, lower, upper)
+        bot.blockchain_client.journal_rebalance_id = rebalance_id
+        liquidity = bot.lp_manager.get_position_info(token_id)[7]
+        if state == "withdrawing":
+            # The decrease landed, the collect was never sent.
+            bot.lp_manager.decrease_liquidity(token_id, liquidity)
+        else:
+            recovered0, recovered1 = bot.lp_manager.decrease_liquidity(token_id, liquidity, collect=True)
+            journal.update_rebalance(rebalance_id, "withdrawn", recovered0=recovered0, recovered1=recovered1)
+        return rebalance_id
+
+    def leave_atomic(bot, token_id, lower, upper, landed):
+        rebalance_id = bot.blockchain_client.journal.begin_rebalance(bot.hedge_key, "atomic", token_id, lower, upper)
+        bot.blockchain_client.journal_rebalance_id = rebalance_id
+        if landed:
+            bot.lp_manager.rebalance_position(token_id, bot.lp_manager.get_position_info(token_id), lower, upper)
+        return rebalance_id
+
+    scenarios = (
+        ("sequential, withdrawing", lambda bot, *range_: leave_sequential(bot, *range_, "withdrawing"), "done"),
+        ("sequential, withdrawn", lambda bot, *range_: leave_sequential(bot, *range_, "withdrawn"), "done"),
+        ("atomic, submitted and landed", lambda bot, *range_: leave_atomic(bot, *range_, True), "done"),
+        ("atomic, submitted, never sent", lambda bot, *range_: leave_atomic(bot, *range_, False), "aborted"),
+    )
+    failures = []
+    with _quiet_output(args.verbose):
+        bot = start_bot()
+        pool_address = bot.lp_manager.get_pool_address(config.TOKEN0_ADDRESS, config.TOKEN1_ADDRESS, config.POOL_FEE)
+        _, price = bot.price_oracle.get_pool_prices(pool_address) # token0_per_token1 (WETH per USDT)
+        lower, upper = bot_module.new_range_prices(price, config.REBALANCE_RANGE_WIDTH)
+        amount0 = Decimal(args.deposit)
+        bot.initial_setup(amount0, amount0 / price, lower, upper)
+        for name, leave, expected_state in scenarios:
+            token_id = bot.position_token_id
+            rebalance_id = leave(bot, token_id, lower, upper)
+            crash(bot)
+            bot = start_bot()
+            rebalance = bot.blockchain_client.journal.get_rebalance(rebalance_id)
+            moved = bot.position_token_id != token_id
+            liquidity = bot.lp_manager.get_position_info(bot.position_token_id)[7] if bot.position_token_id else 0
+            if rebalance["state"] != expected_state or moved != (expected_state == "done") or liquidity == 0:
+                failures.append(f"{name}: rebalance {rebalance['state']} ({rebalance['error']}), "
+                                f"position {token_id} -> {bot.position_token_id} with liquidity {liquidity}")
+        crash(bot)
+    for name, _, expected_state in scenarios:
+        status = "FAILED" if any(failure.startswith(name + ":") for failure in failures) else expected_state
+        print(f"{name:<34}{status}")
+    return failures
+
+
+def _parse_args(argv: list = None):
+    """The command line options of `run_load_test` and `check_resume` (argv defaults to sys.argv[1:])."""
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Drive the LP bot against an in-process Uniswap V3 emulator (load test).")
+    parser.add_argument("--positions", type=int, default=4, help="managed positions, across the 0.3%%, 0.05%% and 1%% pools")
+    parser.add_argument("--blocks", type=int, default=2000, help="blocks to mine")
+    parser.add_argument("--blocks-per-cycle", type=int, default=20, help="blocks between management cycles")
+    parser.add_argument("--swaps-per-block", type=int, default=1, help="random-walk swaps per pool per block")
+    parser.add_argument("--volatility", type=float, default=2.0, help="annualized volatility of the random walk")
+    parser.add_argument("--block-time", type=float, default=12.0, help="simulated seconds per block (for the volatility)")
+    parser.add_argument("--price", type=float, default=3000.0, help="initial price, USDT per WETH")
+    parser.add_argument("--deposit", default="1", help="WETH per position (plus the USDT to match)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--profile", metavar="FILE", help="profile the run (cProfile) and write the stats to FILE")
+    parser.add_argument("--verbose", action="store_true", help="show the bot's output")
+    parser.add_argument("--write-abis", metavar="DIR", help="only write the emulated contracts' ABIs to DIR")
+    parser.add_argument("--check-resume", action="store_true",
+                        help="instead of the load test, check that a restarted bot finishes interrupted rebalances")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = _parse_args()
+    if args.write_abis:
+        write_abis(args.write_abis)
+        print(f"Wrote {len(ABI_FILES)} ABI files to {args.write_abis}")
+    elif args.check_resume:
+        failures = check_resume(args)
+        if failures:
+            print("\n" + "\n".join(failures))
+            raise SystemExit(1)
+    else:
+        result = run_load_test(args)
+        print(f"\n{result['blocks']} blocks in {result['seconds']}s: {result['blocks_per_second']} blocks/s "
+              f"(mining {result['mining_seconds']}s, bot cycles {result['cycle_seconds']}s)")
+        print(f"{result['cycles']} cycles ({result['cycles_per_second']} cycles/s), {result['rebalances']} rebalances, "
+              f"transactions {result['transactions']}, final price {result['final_price']:.2f}")
+        print(f"{result['rpc_requests']} JSON-RPC requests; by method (setup included):")
+        for method, count in result["rpc_requests_by_method"].items():
+            print(f"    {method:<28}{count:>8}")
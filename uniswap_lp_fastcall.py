@@ -0,0 +1,251 @@
+"""
+Lean eth_call path for the bot's hot reads: `slot0()`, `positions(uint256)`, `latestRoundData()` and
+`allowance(address,address)`.
+
+`ContractFunction.call()` goes through ABI lookup, argument normalization, the middleware onion and result
+formatting on every read. For these four functions the layouts are fixed, so this module encodes the call with a
+precomputed 4-byte selector, sends a raw JSON-RPC `eth_call` (orjson when installed, else the stdlib codec) and
+decodes the return data at fixed 32-byte offsets. Results have the same shape and types as the web3 path:
+a list for several outputs, a bare value for one, checksummed addresses.
+
+`BlockchainClient.call`/`batch_call` use it automatically (FAST_READS=true) whenever the contract function's ABI
+matches one of the signatures below, so `PriceOracle` and `UniswapLPManager` need no changes; anything else still
+goes through web3. `FastCallClient.slot0()` etc. read without building a contract function at all.
+
+Check the fast path against web3 on a live node (every cycle read of the configured position):
+    python uniswap_lp_fastcall.py verify [TOKEN_ID]
+"""
+import itertools
+import json
+import sys
+from functools import lru_cache
+
+from eth_utils import to_checksum_address
+from web3.exceptions import BadFunctionCallOutput, ContractLogicError
+
+try:
+    import orjson
+    _dumps = orjson.dumps
+    _loads = orjson.loads
+except ImportError: # Optional: the stdlib codec is slower but equivalent.
+    def _dumps(obj) -> bytes:
+        return json.dumps(obj, separators=(",", ":")).encode()
+    _loads = json.loads
+
+# Selectors (first 4 bytes of keccak256 of the signature), precomputed.
+SLOT0_SELECTOR = bytes.fromhex("3850c7bd") # slot0()
+POSITIONS_SELECTOR = bytes.fromhex("99fbab88") # positions(uint256)
+LATEST_ROUND_DATA_SELECTOR = bytes.fromhex("feaf968c") # latestRoundData()
+ALLOWANCE_SELECTOR = bytes.fromhex("dd62ed3e") # allowance(address,address)
+
+
+def _word(data: bytes, index: int, signed: bool = False) -> int:
+    """The index-th 32-byte ABI word of `data` as an int."""
+    return int.from_bytes(data[index * 32:(index + 1) * 32], "big", signed=signed)
+
+
+def _signed(data: bytes, index: int, bits: int) -> int:
+    """A sign-extended intN word (e.g. int24), read from its low `bits` bits like the ABI decoder."""
+    value = _word(data, index) & ((1 << bits) - 1)
+    return value - (1 << bits) if value >> (bits - 1) else value
+
+
+@lru_cache(maxsize=1024)
+def _checksum(raw: bytes) -> str:
+    # Positions return the same few token/operator addresses over and over: checksum each one once.
+    return to_checksum_address(raw)
+
+
+def _address(data: bytes, index: int) -> str:
+    return _checksum(data[index * 32 + 12:(index + 1) * 32])
+
+
+def _check_length(data: bytes, words: int, name: str):
+    if len(data) < words * 32:
+        # Same error web3 raises for e.g. a call to an address without code.
+        raise BadFunctionCallOutput(f"Could not decode {name} output: expected {words * 32} bytes, got {len(data)}")
+
+
+def decode_slot0(data: bytes) -> list:
+    """(sqrtPriceX96, tick, observationIndex, observationCardinality, observationCardinalityNext, feeProtocol, unlocked)"""
+    _check_length(data, 7, "slot0()")
+    return [_word(data, 0), _signed(data, 1, 24), _word(data, 2), _word(data, 3), _word(data, 4), _word(data, 5),
+            bool(_word(data, 6))]
+
+
+def decode_positions(data: bytes) -> list:
+    """
+    (nonce, operator, token0, token1, fee, tickLower, tickUpper, liquidity,
+    feeGrowthInside0LastX128, feeGrowthInside1LastX128, tokensOwed0, tokensOwed1)
+    """
+    _check_length(data, 12, "positions(uint256)")
+    return [_word(data, 0), _address(data, 1), _address(data, 2), _address(data, 3), _word(data, 4),
+            _signed(data, 5, 24), _signed(data, 6, 24), _word(data, 7), _word(data, 8), _word(data, 9),
+            _word(data, 10), _word(data, 11)]
+
+
+def decode_latest_round_data(data: bytes) -> list:
+    """(roundId, answer, startedAt, updatedAt, answeredInRound)"""
+    _check_length(data, 5, "latestRoundData()")
+    return [_word(data, 0), _word(data, 1, signed=True), _word(data, 2), _word(data, 3), _word(data, 4)]
+
+
+def decode_uint256(data: bytes) -> int:
+    _check_length(data, 1, "uint256")
+    return _word(data, 0)
+
+
+def _address_word(address: str) -> bytes:
+    return bytes.fromhex(address[2:]).rjust(32, b"\0")
+
+
+def encode_slot0() -> bytes:
+    return SLOT0_SELECTOR
+
+
+def encode_positions(token_id: int) -> bytes:
+    return POSITIONS_SELECTOR + token_id.to_bytes(32, "big")
+
+
+def encode_latest_round_data() -> bytes:
+    return LATEST_ROUND_DATA_SELECTOR
+
+
+def encode_allowance(owner: str, spender: str) -> bytes:
+    return ALLOWANCE_SELECTOR + _address_word(owner) + _address_word(spender)
+
+
+# Full signature (inputs and outputs) -> (encoder taking the call's args, decoder of its return data).
+# A contract function takes the fast path only if its ABI entry matches exactly, so a look-alike
+# (e.g. a fork's slot0 with other fields) still goes through web3.
+FAST_CALLS = {
+    "slot0()->(uint160,int24,uint16,uint16,uint16,uint8,bool)": (encode_slot0, decode_slot0),
+    "positions(uint256)->(uint96,address,address,address,uint24,int24,int24,uint128,uint256,uint256,uint128,uint128)":
+        (encode_positions, decode_positions),
+    "latestRoundData()->(uint80,int256,uint256,uint256,uint80)": (encode_latest_round_data, decode_latest_round_data),
+    "allowance(address,address)->(uint256)": (encode_allowance, decode_uint256),
+}
+
+# id(abi entry) -> (abi entry, FAST_CALLS value or None). Holding the entry keeps its id from being reused.
+_spec_cache = {}
+
+
+def fast_call_spec(contract_function):
+    """The (encoder, decoder) for a prepared contract function, or None when it must go through web3."""
+    abi = contract_function.abi
+    cached = _spec_cache.get(id(abi))
+    if cached is None:
+        signature = "{}({})->({})".format(
+            abi.get("name"), ",".join(i["type"] for i in abi.get("inputs", [])), ",".join(o["type"] for o in abi.get("outputs", []))
+        )
+        cached = _spec_cache[id(abi)] = (abi, FAST_CALLS.get(signature))
+    spec = cached[1]
+    if spec is None or contract_function.kwargs:
+        return None
+    return spec
+
+
+def encode_call(contract_function) -> bytes | None:
+    """Calldata for a supported contract function without web3's argument normalization, else None."""
+    spec = fast_call_spec(contract_function)
+    return spec[0](*contract_function.args) if spec else None
+
+
+def decode_result(contract_function, return_data: bytes):
+    """Decodes return data for a supported contract function, else returns None (use the ABI decoder)."""
+    spec = fast_call_spec(contract_function)
+    return spec[1](return_data) if spec else None
+
+
+class FastCallClient:
+    """
+    Raw eth_call over the bot's MultiEndpointProvider (same endpoints, health scoring and hedging as web3 requests),
+    with the request and response JSON handled here instead of by web3's formatters.
+    """
+    def __init__(self, provider):
+        self.provider = provider
+        self._ids = itertools.count()
+
+    def eth_call(self, to: str, data: bytes, block_identifier="latest") -> bytes:
+        block = hex(block_identifier) if isinstance(block_identifier, int) else block_identifier
+        request_data = _dumps({
+            "jsonrpc": "2.0", "id": next(self._ids), "method": "eth_call",
+            "params": [{"to": to, "data": "0x" + data.hex()}, block],
+        })
+        response = self.provider.request_raw("eth_call", request_data, decode=_loads)
+        error = response.get("error")
+        if error:
+            message = error.get("message", "")
+            # Reverts surface as ContractLogicError, like web3; anything else is a node error.
+            if error.get("code") == 3 or "revert" in message.lower():
+                raise ContractLogicError(message, data=error.get("data"))
+            raise ValueError(error)
+        return bytes.fromhex(response["result"][2:])
+
+    def call(self, contract_function, block_identifier="latest"):
+        """Executes a supported contract function (see `fast_call_spec`) over the fast path."""
+        encoder, decoder = fast_call_spec(contract_function)
+        return decoder(self.eth_call(contract_function.address, encoder(*contract_function.args), block_identifier))
+
+    # Direct reads, for callers that don't need a contract object (and its cycle-cache key) at all.
+    def slot0(self, pool_address: str, block_identifier="latest") -> list:
+        return decode_slot0(self.eth_call(pool_address, encode_slot0(), block_identifier))
+
+    def positions(self, position_manager_address: str, token_id: int, block_identifier="latest") -> list:
+        return decode_positions(self.eth_call(position_manager_address, encode_positions(token_id), block_identifier))
+
+    def latest_round_data(self, feed_address: str, block_identifier="latest") -> list:
+        return decode_latest_round_data(self.eth_call(feed_address, encode_latest_round_data(), block_identifier))
+
+    def allowance(self, token_address: str, owner: str, spender: str, block_identifier="latest") -> int:
+        return decode_uint256(self.eth_call(token_address, encode_allowance(owner, spender), block_identifier))
+
+
+def _as_list(result):
+    return list(result) if isinstance(result, (list, tuple)) else result
+
+
+def verify_equivalence(client, calls: list, block_identifier="latest") -> list:
+    """
+    Runs each contract function through web3 (`.call()`) and through the fast path at the same block, and also
+    compares the calldata both encode. Returns a list of mismatch descriptions (empty when everything agrees).
+    """
+    mismatches = []
+    for fn in calls:
+        label = f"{fn.fn_name}{tuple(fn.args)} on {fn.address}"
+        if fast_call_spec(fn) is None:
+            mismatches.append(f"{label}: ABI entry doesn't match a fast-path signature")
+            continue
+        contract = client.get_contract(fn.address, fn.contract_abi)
+        web3_data = bytes.fromhex(contract.encode_abi(fn.fn_name, args=fn.args)[2:])
+        if encode_call(fn) != web3_data:
+            mismatches.append(f"{label}: calldata differs ({encode_call(fn).hex()} vs {web3_data.hex()})")
+        web3_result = fn.call(block_identifier=block_identifier)
+        fast_result = client.fast_calls.call(fn, block_identifier)
+        if _as_list(web3_result) != _as_list(fast_result):
+            mismatches.append(f"{label}: web3 returned {web3_result}, fast path {fast_result}")
+    return mismatches
+
+
+if __name__ == "__main__":
+    from uniswap_lp_bot import Config, LiquidityManagerBot
+
+    if len(sys.argv) < 2 or sys.argv[1] != "verify":
+        print("Usage: python uniswap_lp_fastcall.py verify [TOKEN_ID]")
+        sys.exit(1)
+    bot = LiquidityManagerBot(Config())
+    client = bot.blockchain_client
+    token_id = int(sys.argv[2]) if len(sys.argv) > 2 else bot._load_position_id()
+    calls = bot.cycle_reads(token_id) if token_id is not None else []
+    config = client.config
+    calls += [
+        bot.price_oracle.usdc_usd_feed.functions.latestRoundData(),
+        client.get_contract(config.TOKEN0_ADDRESS, config.ERC20_ABI).functions.allowance(
+            client.account.address, config.UNISWAP_NFT_POSITION_MANAGER_ADDRESS),
+    ]
+    block_number = client.w3.eth.block_number
+    problems = verify_equivalence(client, calls, block_number)
+    for problem in problems:
+        print(f"MISMATCH {problem}")
+    print(f"Checked {len(calls)} reads at block {block_number}: {'all equivalent' if not problems else f'{len(problems)} mismatches'}.")
+    sys.exit(1 if problems else 0)
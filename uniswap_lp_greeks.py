@@ -0,0 +1,95 @@
+"""
+Closed-form delta and gamma of Uniswap V3 positions, vectorized with NumPy over positions and price scenarios.
+
+A position with liquidity L in [Pa, Pb] (P = raw token1 per token0) is worth, in token1,
+    V(P) = L * (sqrt(P) - sqrt(Pa)) + P * L * (1/sqrt(P) - 1/sqrt(Pb))      for Pa < P < Pb
+so its delta dV/dP is exactly its token0 amount:
+    delta = L * (1/sqrt(P) - 1/sqrt(Pb))   in range,   L * (1/sqrt(Pa) - 1/sqrt(Pb))   below,   0   above
+and its gamma is
+    gamma = -L / (2 * P**1.5)   in range,   0   outside.
+Here prices are HUMAN prices of token0 in token1 (e.g. 3000 USDC per WETH), delta is in human token0 units and
+gamma in token0 per unit of that price. Note the bot's range prices use the inverse convention (token0_per_token1).
+
+Every function takes arrays of positions (shape (n,)) and prices of shape (n,) or (n, m) (m scenarios per
+position), so a whole book at +/-5% and +/-10% is one call:
+    prices = scenario_prices(spot, [-0.10, -0.05, 0.0, 0.05, 0.10])       # (n, 5)
+    delta, gamma = lp_greeks(liquidity, tick_lower, tick_upper, decimals0, decimals1, prices)
+    by_symbol = net_by_symbol(symbols, delta)                                # {symbol: (5,) net delta}
+Float64 is plenty for risk numbers; the exact integer amounts (uniswap_v3_math) stay the reference for
+amounts sent on chain.
+"""
+import numpy as np
+
+Q96 = float(2**96)
+
+
+def _column(values) -> np.ndarray:
+    """Positions as a (n, 1) float64 column so they broadcast against (n, m) scenario prices."""
+    return np.asarray(values, dtype=np.float64).reshape(-1, 1)
+
+
+def _as_matrix(prices, n: int) -> np.ndarray:
+    prices = np.asarray(prices, dtype=np.float64)
+    return prices.reshape(n, -1) if prices.ndim <= 1 else prices
+
+
+def price_from_sqrt_price_x96(sqrt_price_x96, decimals0, decimals1) -> np.ndarray:
+    """Human token1-per-token0 price for each pool sqrtPriceX96 (ints are converted to float64)."""
+    sqrt_price = np.array([float(value) for value in np.atleast_1d(sqrt_price_x96)]) / Q96
+    return sqrt_price ** 2 * 10.0 ** (np.asarray(decimals0, dtype=np.float64) - np.asarray(decimals1, dtype=np.float64))
+
+
+def scenario_prices(spot, shocks) -> np.ndarray:
+    """(n, m) prices: each position's spot price moved by each relative shock (e.g. -0.05 for -5%)."""
+    return _column(spot) * (1.0 + np.asarray(shocks, dtype=np.float64))[None, :]
+
+
+def lp_greeks(liquidity, tick_lower, tick_upper, decimals0, decimals1, prices) -> tuple[np.ndarray, np.ndarray]:
+    """
+    (delta, gamma) of n positions at the given human prices (shape (n,) or (n, m)); both results are (n, m).
+    liquidity/ticks/decimals are length-n sequences (Python ints are fine: liquidity is converted to float64).
+    """
+    n = len(liquidity)
+    liquidity = _column([float(value) for value in liquidity])
+    sqrt_lower = 1.0001 ** (_column(tick_lower) / 2)
+    sqrt_upper = 1.0001 ** (_column(tick_upper) / 2)
+    decimals0 = _column(decimals0)
+    scale = 10.0 ** (decimals0 - _column(decimals1)) # human price = raw price * scale
+    raw_price = _as_matrix(prices, n) / scale
+    sqrt_price = np.sqrt(raw_price)
+
+    # Below the range the position is all token0 (as if at the lower bound); above it, none.
+    amount0_raw = liquidity * (1.0 / np.clip(sqrt_price, sqrt_lower, sqrt_upper) - 1.0 / sqrt_upper)
+    delta = amount0_raw / 10.0 ** decimals0
+    in_range = (sqrt_price > sqrt_lower) & (sqrt_price < sqrt_upper)
+    gamma_raw = np.where(in_range, -liquidity / (2.0 * raw_price ** 1.5), 0.0)
+    gamma = gamma_raw / 10.0 ** decimals0 / scale
+    return delta, gamma
+
+
+def net_by_symbol(symbols, values) -> dict:
+    """Sums per-position rows of `values` ((n,) or (n, m)) by hedge symbol: {symbol: row total}."""
+    labels, index = np.unique(np.asarray(symbols), return_inverse=True)
+    values = np.asarray(values, dtype=np.float64)
+    totals = np.zeros((len(labels),) + values.shape[1:])
+    np.add.at(totals, index, values)
+    return {str(label): totals[i] for i, label in enumerate(labels)}
+
+
+def book_scenarios(positions: list, shocks) -> dict:
+    """
+    Net delta and gamma per hedge symbol across a book of positions, at each relative price shock.
+    positions: dicts with "symbol", "liquidity", "tick_lower", "tick_upper", "decimals0", "decimals1", "sqrt_price_x96".
+    Returns {symbol: {"shocks": array, "delta": array, "gamma": array}}.
+    """
+    if not positions:
+        return {}
+    columns = {key: [position[key] for position in positions]
+               for key in ("symbol", "liquidity", "tick_lower", "tick_upper", "decimals0", "decimals1", "sqrt_price_x96")}
+    spot = price_from_sqrt_price_x96(columns["sqrt_price_x96"], columns["decimals0"], columns["decimals1"])
+    shocks = np.asarray(shocks, dtype=np.float64)
+    delta, gamma = lp_greeks(columns["liquidity"], columns["tick_lower"], columns["tick_upper"],
+                             columns["decimals0"], columns["decimals1"], scenario_prices(spot, shocks))
+    net_delta = net_by_symbol(columns["symbol"], delta)
+    net_gamma = net_by_symbol(columns["symbol"], gamma)
+    return {symbol: {"shocks": shocks, "delta": net_delta[symbol], "gamma": net_gamma[symbol]} for symbol in net_delta}
@@ -0,0 +1,403 @@
+"""
+Incremental ingestion of Uniswap V3 pool history (Swap, Mint, Burn and Collect logs) into a columnar store.
+
+Layout of the store directory (HISTORY_STORE_PATH):
+    state.json                               cursor, pool list and recent block hashes (for reorg detection)
+    swap/000012370000-000012371999/block.npy one directory per ingested chunk and event type,
+    swap/000012370000-000012371999/tick.npy  one .npy file per column
+    mint/...  burn/...  collect/...
+
+Columns are plain fixed-width NumPy arrays, so readers get them memory-mapped (np.load(mmap_mode="r"))
+without copying or parsing. `HistoryStore.compact` merges an event type's chunk segments into one,
+after which `read` returns the memory-mapped arrays directly.
+
+Values:
+- block (int64), log_index (int32), tx_index (int32), pool (uint16 index into state.json "pools")
+- token amounts and liquidity are float64 in raw units (exact up to 2**53; use them for analytics)
+- swap sqrt_price_x96 is exact, stored as three little-endian uint64 limbs per row (see `limbs_to_int`)
+- ticks are int32
+
+Usage:
+    python uniswap_lp_history.py ingest            # catch up to the chain head, then exit
+    python uniswap_lp_history.py follow            # keep ingesting new blocks
+    python uniswap_lp_history.py compact           # merge segments for zero-copy reads
+    python uniswap_lp_history.py info
+Pools come from HISTORY_POOLS (comma-separated addresses), or else from the bot's configured pool
+(or every pool in the portfolio file in PORTFOLIO_MODE). Any Web3 instance works, including a local
+dev chain (anvil/hardhat) that emits synthetic events.
+"""
+import json
+import os
+import shutil
+import sys
+import time
+
+import numpy as np
+from web3 import Web3
+
+# Topics of the pool events, computed once. Indexed fields are in the topics, the rest in `data`.
+SWAP_TOPIC = Web3.keccak(text="Swap(address,address,int256,int256,uint160,uint128,int24)")
+MINT_TOPIC = Web3.keccak(text="Mint(address,address,int24,int24,uint128,uint256,uint256)")
+BURN_TOPIC = Web3.keccak(text="Burn(address,int24,int24,uint128,uint256,uint256)")
+COLLECT_TOPIC = Web3.keccak(text="Collect(address,address,int24,int24,uint128,uint128)")
+
+EVENT_NAMES = {SWAP_TOPIC: "swap", MINT_TOPIC: "mint", BURN_TOPIC: "burn", COLLECT_TOPIC: "collect"}
+
+COMMON_COLUMNS = {"block": np.int64, "log_index": np.int32, "tx_index": np.int32, "pool": np.uint16}
+EVENT_COLUMNS = {
+    "swap": {"amount0": np.float64, "amount1": np.float64, "sqrt_price_x96": np.uint64,
+             "liquidity": np.float64, "tick": np.int32},
+    "mint": {"tick_lower": np.int32, "tick_upper": np.int32, "amount": np.float64,
+             "amount0": np.float64, "amount1": np.float64},
+    "burn": {"tick_lower": np.int32, "tick_upper": np.int32, "amount": np.float64,
+             "amount0": np.float64, "amount1": np.float64},
+    "collect": {"tick_lower": np.int32, "tick_upper": np.int32, "amount0": np.float64, "amount1": np.float64},
+}
+
+UINT64_MASK = (1 << 64) - 1
+
+
+def _word(data: bytes, index: int, signed: bool = False) -> int:
+    """The index-th 32-byte ABI word of `data` as an int."""
+    return int.from_bytes(data[index * 32:(index + 1) * 32], "big", signed=signed)
+
+
+def _int_to_limbs(value: int) -> tuple:
+    return value & UINT64_MASK, (value >> 64) & UINT64_MASK, value >> 128
+
+
+def limbs_to_int(limbs) -> int:
+    """Exact integer from a row of the (n, 3) uint64 limb column, e.g. `limbs_to_int(swap["sqrt_price_x96"][i])`."""
+    return int(limbs[0]) | (int(limbs[1]) << 64) | (int(limbs[2]) << 128)
+
+
+def decode_log(log) -> tuple:
+    """
+    Decodes one pool log without the ABI machinery: fixed offsets into topics and data.
+    Returns (event name, dict of event-specific values), or (None, None) for other topics.
+    """
+    topics = log["topics"]
+    event = EVENT_NAMES.get(bytes(topics[0]))
+    if event is None:
+        return None, None
+    data = bytes(log["data"])
+    if event == "swap":
+        # data: amount0 int256, amount1 int256, sqrtPriceX96 uint160, liquidity uint128, tick int24
+        return event, {
+            "amount0": _word(data, 0, True), "amount1": _word(data, 1, True),
+            "sqrt_price_x96": _int_to_limbs(_word(data, 2)), "liquidity": _word(data, 3), "tick": _word(data, 4, True),
+        }
+    # Mint/Burn/Collect: topics are (event, owner, tickLower, tickUpper).
+    ticks = {"tick_lower": int.from_bytes(bytes(topics[2]), "big", signed=True),
+             "tick_upper": int.from_bytes(bytes(topics[3]), "big", signed=True)}
+    if event == "mint":
+        # data: sender address, amount uint128, amount0 uint256, amount1 uint256
+        return event, dict(ticks, amount=_word(data, 1), amount0=_word(data, 2), amount1=_word(data, 3))
+    if event == "burn":
+        # data: amount uint128, amount0 uint256, amount1 uint256
+        return event, dict(ticks, amount=_word(data, 0), amount0=_word(data, 1), amount1=_word(data, 2))
+    # collect data: recipient address, amount0 uint128, amount1 uint128
+    return event, dict(ticks, amount0=_word(data, 1), amount1=_word(data, 2))
+
+
+class HistoryStore:
+    """On-disk columnar store of pool events. Segments are written atomically (temp directory, then rename)."""
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self.state_path = os.path.join(path, "state.json")
+        self.state = self._load_state()
+
+    def _load_state(self) -> dict:
+        if os.path.exists(self.state_path):
+            with open(self.state_path, "r") as f:
+                return json.load(f)
+        # next_block: first block not yet ingested. recent_blocks: [[number, hash], ...] near the head.
+        return {"pools": [], "next_block": None, "recent_blocks": []}
+
+    def save_state(self):
+        tmp_path = f"{self.state_path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.state, f)
+        os.replace(tmp_path, self.state_path)
+
+    def pool_index(self, address: str) -> int:
+        address = Web3.to_checksum_address(address)
+        if address not in self.state["pools"]:
+            self.state["pools"].append(address)
+        return self.state["pools"].index(address)
+
+    # --- Segments ---
+
+    def segment_dirs(self, event: str) -> list:
+        """(from_block, to_block, directory) of an event type's segments, in block order."""
+        event_dir = os.path.join(self.path, event)
+        if not os.path.isdir(event_dir):
+            return []
+        segments = []
+        for name in os.listdir(event_dir):
+            if name.endswith(".tmp") or "-" not in name:
+                continue
+            from_block, to_block = (int(part) for part in name.split("-"))
+            segments.append((from_block, to_block, os.path.join(event_dir, name)))
+        # A segment inside a wider one is left over from an interrupted `compact`; its rows are already merged.
+        kept = []
+        for from_block, to_block, directory in sorted(segments, key=lambda s: (s[0], -s[1])):
+            if kept and to_block <= kept[-1][1]:
+                shutil.rmtree(directory)
+                continue
+            kept.append((from_block, to_block, directory))
+        return kept
+
+    def write_segment(self, event: str, from_block: int, to_block: int, columns: dict):
+        event_dir = os.path.join(self.path, event)
+        os.makedirs(event_dir, exist_ok=True)
+        final_dir = os.path.join(event_dir, f"{from_block:012d}-{to_block:012d}")
+        tmp_dir = f"{final_dir}.tmp"
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+        for name, values in columns.items():
+            np.save(os.path.join(tmp_dir, f"{name}.npy"), values)
+        shutil.rmtree(final_dir, ignore_errors=True)
+        os.replace(tmp_dir, final_dir)
+
+    @staticmethod
+    def load_segment(directory: str, columns=None) -> dict:
+        """Memory-maps a segment's columns (no copy)."""
+        names = columns or [name[:-4] for name in os.listdir(directory) if name.endswith(".npy")]
+        return {name: np.load(os.path.join(directory, f"{name}.npy"), mmap_mode="r") for name in names}
+
+    def read(self, event: str, columns=None) -> dict:
+        """
+        All rows of an event type, column by column. With a single segment (after `compact`) these are the
+        memory-mapped arrays themselves; with several they are concatenated into memory.
+        """
+        segments = [self.load_segment(directory, columns) for _, _, directory in self.segment_dirs(event)]
+        if not segments:
+            names = columns or list(COMMON_COLUMNS) + list(EVENT_COLUMNS[event])
+            return {name: np.empty(0) for name in names}
+        if len(segments) == 1:
+            return segments[0]
+        return {name: np.concatenate([segment[name] for segment in segments]) for name in segments[0]}
+
+    def compact(self, event: str):
+        """Merges an event type's segments into one, so `read` is zero-copy."""
+        segments = self.segment_dirs(event)
+        if len(segments) <= 1:
+            return
+        merged = self.read(event)
+        self.write_segment(event, segments[0][0], segments[-1][1], {name: np.asarray(v) for name, v in merged.items()})
+        for from_block, to_block, directory in segments:
+            if (from_block, to_block) != (segments[0][0], segments[-1][1]):
+                shutil.rmtree(directory)
+        print(f"Compacted {len(segments)} {event} segments.")
+
+    def truncate(self, last_block: int):
+        """
+        Drops every row after `last_block` (used on reorgs and to discard segments written past the saved cursor
+        by an interrupted run). Segments that straddle the block are rewritten without the dropped rows.
+        """
+        for event in EVENT_COLUMNS:
+            for from_block, to_block, directory in self.segment_dirs(event):
+                if to_block <= last_block:
+                    continue
+                if from_block <= last_block:
+                    kept = {name: np.array(values) for name, values in self.load_segment(directory).items()}
+                    keep = kept["block"] <= last_block
+                    self.write_segment(event, from_block, last_block, {name: v[keep] for name, v in kept.items()})
+                shutil.rmtree(directory)
+
+    # --- Convenience readers ---
+
+    def swap_series(self, pool_address: str) -> dict:
+        """
+        One pool's Swap history as inputs for the backtester (uniswap_lp_backtest.Backtester.run):
+        ticks, amount0, amount1 and the pool's active liquidity, one step per swap.
+        """
+        swaps = self.read("swap")
+        rows = swaps["pool"] == self.state["pools"].index(Web3.to_checksum_address(pool_address))
+        return {
+            "blocks": swaps["block"][rows], "ticks": swaps["tick"][rows], "amount0": swaps["amount0"][rows],
+            "amount1": swaps["amount1"][rows], "pool_liquidity": swaps["liquidity"][rows],
+        }
+
+
+class HistoryIngester:
+    """
+    Pulls pool logs in adaptive block ranges and appends them to a HistoryStore.
+    The range doubles while responses stay small and halves when the node refuses one (too many results,
+    timeouts), between min_block_range and max_block_range.
+    """
+
+    def __init__(self, w3: Web3, store: HistoryStore, pool_addresses: list, start_block: int = 0,
+                 min_block_range: int = 10, max_block_range: int = 10000, target_logs: int = 5000,
+                 reorg_depth: int = 64):
+        self.w3 = w3
+        self.store = store
+        self.pool_addresses = [Web3.to_checksum_address(address) for address in pool_addresses]
+        for address in self.pool_addresses:
+            store.pool_index(address)
+        self.start_block = start_block
+        self.min_block_range = min_block_range
+        self.max_block_range = max_block_range
+        self.target_logs = target_logs
+        self.reorg_depth = reorg_depth
+        self.block_range = min_block_range
+        # Largest range the node has not refused yet. Growth stops below a range that failed.
+        self.range_ceiling = max_block_range
+        if store.state["next_block"] is None:
+            store.state["next_block"] = start_block
+        # Anything written past the saved cursor comes from an interrupted run and is ingested again.
+        store.truncate(store.state["next_block"] - 1)
+
+    def _block_hash(self, number: int) -> str:
+        return self.w3.eth.get_block(number)["hash"].hex()
+
+    def check_reorg(self) -> bool:
+        """
+        Compares the recorded hashes of recent blocks with the chain. On a mismatch, rolls the store back to the
+        newest block that still matches (or to before the oldest recorded one) and returns True.
+        """
+        recent = self.store.state["recent_blocks"]
+        if not recent:
+            return False
+        number, recorded_hash = recent[-1]
+        if self._block_hash(number) == recorded_hash:
+            return False
+        print(f"Reorg detected at block {number}. Rolling back...")
+        while recent and self._block_hash(recent[-1][0]) != recent[-1][1]:
+            recent.pop()
+        last_good = recent[-1][0] if recent else number - self.reorg_depth
+        last_good = max(last_good, self.start_block - 1)
+        self.store.truncate(last_good)
+        self.store.state["next_block"] = last_good + 1
+        self.store.state["recent_blocks"] = recent
+        self.store.save_state()
+        print(f"Rolled back to block {last_good}.")
+        return True
+
+    def _get_logs(self, from_block: int, to_block: int) -> list:
+        return self.w3.eth.get_logs({
+            "address": self.pool_addresses,
+            "topics": [[SWAP_TOPIC, MINT_TOPIC, BURN_TOPIC, COLLECT_TOPIC]],
+            "fromBlock": from_block,
+            "toBlock": to_block,
+        })
+
+    def _columns(self, logs: list) -> dict:
+        """Decodes a chunk's logs into per-event column arrays."""
+        rows = {event: {name: [] for name in list(COMMON_COLUMNS) + list(columns)}
+                for event, columns in EVENT_COLUMNS.items()}
+        pool_ids = {address.lower(): self.store.pool_index(address) for address in self.pool_addresses}
+        for log in logs:
+            event, values = decode_log(log)
+            if event is None:
+                continue
+            event_rows = rows[event]
+            event_rows["block"].append(log["blockNumber"])
+            event_rows["log_index"].append(log["logIndex"])
+            event_rows["tx_index"].append(log["transactionIndex"])
+            event_rows["pool"].append(pool_ids[log["address"].lower()])
+            for name, value in values.items():
+                event_rows[name].append(value)
+        columns = {}
+        for event, event_rows in rows.items():
+            if not event_rows["block"]:
+                continue
+            dtypes = dict(COMMON_COLUMNS, **EVENT_COLUMNS[event])
+            columns[event] = {name: np.array(values, dtype=dtypes[name]) for name, values in event_rows.items()}
+        return columns
+
+    def ingest_chunk(self, to_block_limit: int) -> int:
+        """Ingests the next block range (up to `to_block_limit`). Returns the number of logs stored."""
+        from_block = self.store.state["next_block"]
+        to_block = min(to_block_limit, from_block + self.block_range - 1)
+        try:
+            logs = self._get_logs(from_block, to_block)
+        except Exception as e:
+            if self.block_range <= self.min_block_range:
+                raise
+            self.range_ceiling = max(self.min_block_range, self.block_range - 1)
+            self.block_range = max(self.min_block_range, self.block_range // 2)
+            print(f"eth_getLogs failed for {from_block}-{to_block} ({e}). Retrying with {self.block_range} blocks.")
+            return 0
+
+        for event, columns in self._columns(logs).items():
+            self.store.write_segment(event, from_block, to_block, columns)
+
+        # Remember recent block hashes so a reorg within reorg_depth can be detected and undone.
+        recent = self.store.state["recent_blocks"]
+        recent.append([to_block, self._block_hash(to_block)])
+        while recent and recent[0][0] < to_block - self.reorg_depth:
+            recent.pop(0)
+        self.store.state["next_block"] = to_block + 1
+        self.store.save_state()
+
+        # Grow the range while responses are comfortably small.
+        if len(logs) < self.target_logs // 2:
+            self.block_range = min(self.range_ceiling, self.block_range * 2)
+        elif len(logs) > self.target_logs:
+            self.block_range = max(self.min_block_range, self.block_range // 2)
+        return len(logs)
+
+    def ingest(self, to_block: int = None) -> int:
+        """Catches up to `to_block` (default: the chain head). Returns the number of logs stored."""
+        self.check_reorg()
+        head = self.w3.eth.block_number if to_block is None else to_block
+        total = 0
+        while self.store.state["next_block"] <= head:
+            total += self.ingest_chunk(head)
+        print(f"Ingested {total} logs up to block {head}.")
+        return total
+
+    def follow(self, poll_interval: float = 2):
+        """Keeps ingesting new blocks."""
+        while True:
+            try:
+                self.ingest()
+            except Exception as e:
+                print(f"Error during history ingestion: {e}")
+            time.sleep(poll_interval)
+
+
+def _configured_pools(config) -> list:
+    """The pools to ingest: HISTORY_POOLS, else the bot's pool (or every portfolio pool in PORTFOLIO_MODE)."""
+    if config.HISTORY_POOLS:
+        return config.HISTORY_POOLS
+    from uniswap_lp_bot import BlockchainClient, PoolRegistry
+    registry = PoolRegistry(BlockchainClient(config))
+    specs = [{"token0": config.TOKEN0_ADDRESS, "token1": config.TOKEN1_ADDRESS, "fee": config.POOL_FEE}]
+    if config.PORTFOLIO_MODE:
+        with open(config.PORTFOLIO_PATH, "r") as f:
+            specs = json.load(f)["positions"]
+    return sorted({registry.get_pool(spec["token0"], spec["token1"], spec["fee"])["pool_address"] for spec in specs})
+
+
+if __name__ == "__main__":
+    from uniswap_lp_bot import Config
+
+    command = sys.argv[1] if len(sys.argv) > 1 else "ingest"
+    config = Config()
+    store = HistoryStore(config.HISTORY_STORE_PATH)
+    if command == "compact":
+        for event_name in EVENT_COLUMNS:
+            store.compact(event_name)
+    elif command == "info":
+        print(f"Pools: {store.state['pools']}, next block: {store.state['next_block']}")
+        for event_name in EVENT_COLUMNS:
+            segments = store.segment_dirs(event_name)
+            print(f"{event_name}: {len(store.read(event_name, ['block'])['block'])} rows in {len(segments)} segments")
+    elif command in ("ingest", "follow"):
+        ingester = HistoryIngester(
+            Web3(Web3.HTTPProvider(config.NODE_URL)), store, _configured_pools(config),
+            start_block=config.HISTORY_START_BLOCK, min_block_range=config.HISTORY_MIN_BLOCK_RANGE,
+            max_block_range=config.HISTORY_MAX_BLOCK_RANGE, reorg_depth=config.HISTORY_REORG_DEPTH
+        )
+        if command == "ingest":
+            ingester.ingest()
+        else:
+            ingester.follow(config.EVENT_POLL_INTERVAL)
+    else:
+        print("Usage: python uniswap_lp_history.py [ingest|follow|compact|info]")
+        sys.exit(1)
@@ -0,0 +1,204 @@
+"""
+Crash-safe state journal of the LP bot (SQLite in WAL mode), replacing position_id.txt.
+
+Tables:
+    positions     the current token ID of each managed position (by position key)
+    rebalances    every rebalance and the step it reached:
+                  sequential: withdrawing -> withdrawn (recovered amounts known) -> done
+                  atomic:     submitted -> done
+                  (aborted: the old position was left intact; failed: needs a look, see `error`)
+    transactions  every broadcast transaction (and fee-bumped replacement) with its nonce, signed parameters,
+                  the rebalance it belongs to, and its outcome
+    hedge_orders  every derivatives order and its acknowledgement
+
+The bot writes each step before/after the action it describes, so after a crash `LiquidityManagerBot.resume_rebalances`
+can tell from the journal alone (plus receipts of the journaled transaction hashes) where a rebalance stopped,
+without rescanning chain history. Rebalances are found by the token ID they started from, and `latest_token_id`
+follows finished ones, so neither depends on how positions are named or ordered in a portfolio file.
+
+Writes are single-row statements in autocommit mode. With journal_mode=WAL and synchronous=NORMAL each one is an
+append to the WAL file without an fsync (durable across process crashes; a power loss can drop the last few
+commits), which keeps them in the tens of microseconds.
+
+Inspect a journal:
+    python uniswap_lp_journal.py [JOURNAL_PATH]
+"""
+import json
+import sqlite3
+import sys
+import threading
+import time
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS positions (
+    position_key TEXT PRIMARY KEY,
+    token_id INTEGER NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS rebalances (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    position_key TEXT NOT NULL,
+    mode TEXT NOT NULL,
+    state TEXT NOT NULL,
+    old_token_id INTEGER NOT NULL,
+    new_token_id INTEGER,
+    lower_price TEXT NOT NULL,
+    upper_price TEXT NOT NULL,
+    recovered0 TEXT,
+    recovered1 TEXT,
+    error TEXT,
+    started_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS rebalances_old_token ON rebalances (old_token_id, state);
+CREATE TABLE IF NOT EXISTS transactions (
+    tx_hash TEXT PRIMARY KEY,
+    nonce INTEGER NOT NULL,
+    kind TEXT NOT NULL,
+    rebalance_id INTEGER,
+    params TEXT,
+    status TEXT NOT NULL,
+    block_number INTEGER,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS transactions_rebalance ON transactions (rebalance_id);
+CREATE TABLE IF NOT EXISTS hedge_orders (
+    client_order_id TEXT PRIMARY KEY,
+    symbol TEXT NOT NULL,
+    side TEXT NOT NULL,
+    amount TEXT NOT NULL,
+    status TEXT NOT NULL,
+    detail TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+"""
+
+OPEN_REBALANCE_STATES = ("withdrawing", "withdrawn", "submitted")
+
+
+def _params_to_json(params: dict) -> str:
+    # Signed transaction parameters hold ints, hex strings and possibly bytes (e.g. a cancel's empty data).
+    return json.dumps({key: ("0x" + value.hex() if isinstance(value, (bytes, bytearray)) else value)
+                       for key, value in params.items()})
+
+
+class StateJournal:
+    """Thread-safe journal over one SQLite connection (see the module docstring)."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("PRAGMA busy_timeout=5000")
+        self.conn.executescript(SCHEMA)
+
+    def _write(self, sql: str, args: tuple = ()):
+        with self._lock:
+            return self.conn.execute(sql, args)
+
+    def _read(self, sql: str, args: tuple = ()) -> list:
+        with self._lock:
+            return [dict(row) for row in self.conn.execute(sql, args).fetchall()]
+
+    # --- Positions ---
+    def set_position(self, position_key: str, token_id: int):
+        self._write("INSERT INTO positions (position_key, token_id, updated_at) VALUES (?, ?, ?) "
+                    "ON CONFLICT(position_key) DO UPDATE SET token_id = excluded.token_id, updated_at = excluded.updated_at",
+                    (position_key, token_id, time.time()))
+
+    def get_position(self, position_key: str) -> int | None:
+        rows = self._read("SELECT token_id FROM positions WHERE position_key = ?", (position_key,))
+        return rows[0]["token_id"] if rows else None
+
+    # --- Rebalances ---
+    def begin_rebalance(self, position_key: str, mode: str, old_token_id: int, lower_price, upper_price) -> int:
+        """Records a rebalance before its first transaction is sent. Returns its ID."""
+        now = time.time()
+        state = "submitted" if mode == "atomic" else "withdrawing"
+        cursor = self._write(
+            "INSERT INTO rebalances (position_key, mode, state, old_token_id, lower_price, upper_price, started_at, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (position_key, mode, state, old_token_id, str(lower_price), str(upper_price), now, now))
+        return cursor.lastrowid
+
+    def update_rebalance(self, rebalance_id: int, state: str, **fields):
+        """Moves a rebalance to `state`, setting any of new_token_id, recovered0, recovered1, error."""
+        columns = ["state = ?", "updated_at = ?"] + [f"{name} = ?" for name in fields]
+        values = [state, time.time()] + [str(value) if name.startswith("recovered") else value for name, value in fields.items()]
+        self._write(f"UPDATE rebalances SET {', '.join(columns)} WHERE id = ?", tuple(values) + (rebalance_id,))
+
+    def get_rebalance(self, rebalance_id: int) -> dict | None:
+        rows = self._read("SELECT * FROM rebalances WHERE id = ?", (rebalance_id,))
+        return rows[0] if rows else None
+
+    def unfinished_rebalances(self, token_id: int) -> list:
+        """Rebalances of the position `token_id` that stopped before reaching done/aborted/failed."""
+        placeholders = ", ".join("?" for _ in OPEN_REBALANCE_STATES)
+        return self._read(f"SELECT * FROM rebalances WHERE old_token_id = ? AND state IN ({placeholders}) ORDER BY id",
+                          (token_id,) + OPEN_REBALANCE_STATES)
+
+    def latest_token_id(self, token_id: int) -> int:
+        """Follows finished rebalances from `token_id` to the position it was last moved to."""
+        seen = set()
+        while token_id not in seen:
+            seen.add(token_id)
+            rows = self._read("SELECT new_token_id FROM rebalances WHERE old_token_id = ? AND state = 'done' "
+                              "ORDER BY id DESC LIMIT 1", (token_id,))
+            if not rows or rows[0]["new_token_id"] is None:
+                break
+            token_id = rows[0]["new_token_id"]
+        return token_id
+
+    # --- Transactions ---
+    def record_transaction(self, tx_hash: str, nonce: int, kind: str, params: dict, rebalance_id: int = None):
+        now = time.time()
+        self._write("INSERT OR REPLACE INTO transactions (tx_hash, nonce, kind, rebalance_id, params, status, created_at, updated_at) "
+                    "VALUES (?, ?, ?, ?, ?, 'sent', ?, ?)",
+                    (tx_hash, nonce, kind, rebalance_id, _params_to_json(params), now, now))
+
+    def record_replacement(self, original_hash: str, tx_hash: str, params: dict, cancel: bool = False):
+        """A fee-bumped (or cancelling) rebroadcast of `original_hash`'s nonce; it inherits its kind and rebalance."""
+        now = time.time()
+        self._write("INSERT OR REPLACE INTO transactions (tx_hash, nonce, kind, rebalance_id, params, status, created_at, updated_at) "
+                    "SELECT ?, nonce, CASE WHEN ? THEN 'cancel' ELSE kind END, rebalance_id, ?, 'sent', ?, ? "
+                    "FROM transactions WHERE tx_hash = ?",
+                    (tx_hash, cancel, _params_to_json(params), now, now, original_hash))
+
+    def update_transaction(self, tx_hash: str, status: str, block_number: int = None):
+        self._write("UPDATE transactions SET status = ?, block_number = ?, updated_at = ? WHERE tx_hash = ?",
+                    (status, block_number, time.time(), tx_hash))
+
+    def rebalance_transactions(self, rebalance_id: int) -> list:
+        """The rebalance's transactions, newest first (replacements come after what they replace)."""
+        rows = self._read("SELECT * FROM transactions WHERE rebalance_id = ? ORDER BY created_at DESC", (rebalance_id,))
+        for row in rows:
+            row["params"] = json.loads(row["params"]) if row["params"] else None
+        return rows
+
+    # --- Hedge orders ---
+    def record_hedge_order(self, client_order_id: str, symbol: str, side: str, amount):
+        now = time.time()
+        self._write("INSERT INTO hedge_orders (client_order_id, symbol, side, amount, status, created_at, updated_at) "
+                    "VALUES (?, ?, ?, ?, 'submitted', ?, ?)", (client_order_id, symbol, side, str(amount), now, now))
+
+    def update_hedge_order(self, client_order_id: str, status: str, detail: str = None):
+        self._write("UPDATE hedge_orders SET status = ?, detail = ?, updated_at = ? WHERE client_order_id = ?",
+                    (status, detail, time.time(), client_order_id))
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
+
+
+if __name__ == "__main__":
+    journal = StateJournal(sys.argv[1] if len(sys.argv) > 1 else "bot_state.db")
+    for table, order in (("positions", "updated_at"), ("rebalances", "id"), ("transactions", "created_at"), ("hedge_orders", "created_at")):
+        rows = journal._read(f"SELECT * FROM {table} ORDER BY {order} DESC LIMIT 10")
+        print(f"--- {table} (latest {len(rows)}) ---")
+        for row in rows:
+            print({key: value for key, value in row.items() if key != "params"})
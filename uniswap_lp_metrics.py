@@ -0,0 +1,254 @@
+"""
+In-process metrics for the LP bot: counters, gauges and histograms, timed phases, and a Prometheus text endpoint.
+
+The bot records (see the metric definitions at the top of uniswap_lp_bot.py):
+    lpbot_phase_seconds{phase}              duration of each cycle phase (run_cycle, rebalance_lp, manage_delta_neutral,
+                                            get_current_lp_exposure, the Chainlink and pool price reads, receipt waits...)
+    lpbot_phase_errors_total{phase}         phases that raised
+    lpbot_rpc_request_seconds{method}       JSON-RPC latency per method, failover and hedging included
+    lpbot_rpc_errors_total{method,kind}     kind="transport" (every endpoint failed) or "rpc" (JSON-RPC error answer)
+    lpbot_tx_confirmation_seconds{kind}     first broadcast to receipt, per transaction kind (mint, collect, ...)
+    lpbot_tx_total{kind,outcome}            mined / reverted / cancelled / dropped
+    lpbot_tx_gas_used_total{kind}           gas used by mined transactions
+    lpbot_hedge_order_seconds{symbol}       order submission to the venue's acknowledgement
+    lpbot_hedge_orders_total{symbol,status}
+    lpbot_rpc_endpoint_requests_total{endpoint}, lpbot_rpc_endpoint_errors_total{endpoint},
+    lpbot_rpc_endpoint_latency_seconds{endpoint}   per endpoint (endpoint = its position in NODE_URLS, not the URL,
+                                            which usually carries an API key); latency is the moving average used for routing
+
+Recording is a dict lookup, a bisect over the buckets and an addition under a per-metric lock (about a
+microsecond), so it stays on in production. METRICS_PORT=0 (default) records without serving;
+METRICS_ENABLED=false turns recording off.
+
+Scrape with Prometheus, or look at it directly:
+    curl http://127.0.0.1:9464/metrics
+"""
+import functools
+import inspect
+import os
+import threading
+import time
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Seconds. RPC calls sit in the low buckets, receipt waits and confirmations in the high ones.
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+
+def _format_labels(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class _Metric:
+    TYPE = None
+
+    def __init__(self, registry: "MetricsRegistry", name: str, help_text: str, labelnames: tuple = ()):
+        self.registry = registry
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {} # label values tuple -> value (or bucket counts for histograms)
+
+    def _header(self) -> list:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.TYPE}"]
+
+    def values(self) -> dict:
+        """{label values tuple: value} of every label set recorded so far."""
+        with self._lock:
+            return dict(self._values)
+
+    def render(self) -> list:
+        with self._lock:
+            items = sorted(self._values.items())
+        return self._header() + [f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}"
+                                 for labels, value in items]
+
+
+class Counter(_Metric):
+    """Monotonic total per label set: `inc(amount, *label_values)`."""
+    TYPE = "counter"
+
+    def inc(self, amount: float = 1, *labels):
+        if not self.registry.enabled:
+            return
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+
+class Gauge(_Metric):
+    """Current value per label set: `set(value, *label_values)`."""
+    TYPE = "gauge"
+
+    def set(self, value: float, *labels):
+        if not self.registry.enabled:
+            return
+        with self._lock:
+            self._values[labels] = value
+
+
+class Histogram(_Metric):
+    """Bucketed observations per label set: `observe(value, *label_values)`. Buckets are upper bounds."""
+    TYPE = "histogram"
+
+    def __init__(self, registry, name: str, help_text: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        super().__init__(registry, name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, *labels):
+        if not self.registry.enabled:
+            return
+        index = bisect_left(self.buckets, value) # len(buckets) is the +Inf bucket
+        with self._lock:
+            state = self._values.get(labels)
+            if state is None:
+                # [per-bucket counts (+Inf last), sum]
+                state = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            state[0][index] += 1
+            state[1] += value
+
+    def values(self) -> dict:
+        """{label values tuple: observation count} of every label set recorded so far."""
+        with self._lock:
+            return {labels: sum(state[0]) for labels, state in self._values.items()}
+
+    def snapshot(self, *labels) -> dict:
+        """{"count", "sum", "buckets": {upper bound: cumulative count}} of one label set (empty if never observed)."""
+        with self._lock:
+            state = self._values.get(labels)
+            counts, total = (list(state[0]), state[1]) if state else ([0] * (len(self.buckets) + 1), 0.0)
+        cumulative, running = {}, 0
+        for bound, count in zip(self.buckets + (float("inf"),), counts):
+            running += count
+            cumulative[bound] = running
+        return {"count": running, "sum": total, "buckets": cumulative}
+
+    def render(self) -> list:
+        with self._lock:
+            items = sorted((labels, (list(state[0]), state[1])) for labels, state in self._values.items())
+        lines = self._header()
+        for labels, (counts, total) in items:
+            running = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                running += count
+                le = 'le="{}"'.format("+Inf" if bound == float("inf") else _format_value(bound))
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {running}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, labels)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, labels)} {running}")
+        return lines
+
+
+class _Span:
+    """Times one phase into the registry's phase histogram (and counts it as an error if it raises)."""
+    __slots__ = ("registry", "phase", "started")
+
+    def __init__(self, registry: "MetricsRegistry", phase: str):
+        self.registry = registry
+        self.phase = phase
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.registry.phase_seconds.observe(time.perf_counter() - self.started, self.phase)
+        if exc_type is not None:
+            self.registry.phase_errors.inc(1, self.phase)
+        return False
+
+
+class MetricsRegistry:
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self._metrics = {}
+        self._lock = threading.Lock()
+        self._server = None
+        self.phase_seconds = self.histogram("lpbot_phase_seconds", "Duration of bot phases.", ("phase",))
+        self.phase_errors = self.counter("lpbot_phase_errors_total", "Bot phases that raised.", ("phase",))
+
+    def _register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            # Registering the same name again returns the existing metric (e.g. a module imported twice).
+            return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name: str, help_text: str, labelnames: tuple = ()) -> Counter:
+        return self._register(Counter(self, name, help_text, labelnames))
+
+    def gauge(self, name: str, help_text: str, labelnames: tuple = ()) -> Gauge:
+        return self._register(Gauge(self, name, help_text, labelnames))
+
+    def histogram(self, name: str, help_text: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(self, name, help_text, labelnames, buckets))
+
+    def span(self, phase: str) -> _Span:
+        """`with METRICS.span("rebalance_lp"): ...` records the block's duration under lpbot_phase_seconds."""
+        return _Span(self, phase)
+
+    def timed(self, phase: str):
+        """Decorator form of `span` for functions and coroutine functions."""
+        def decorator(fn):
+            if inspect.iscoroutinefunction(fn):
+                @functools.wraps(fn)
+                async def async_wrapper(*args, **kwargs):
+                    with self.span(phase):
+                        return await fn(*args, **kwargs)
+                return async_wrapper
+
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                with self.span(phase):
+                    return fn(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format (version 0.0.4)."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def serve(self, port: int, host: str = "127.0.0.1"):
+        """Serves /metrics on a daemon thread. Only the first call starts a server."""
+        with self._lock:
+            if self._server is not None:
+                return self._server
+            registry = self
+
+            class Handler(BaseHTTPRequestHandler):
+                def do_GET(self):
+                    if self.path.split("?")[0] not in ("/metrics", "/"):
+                        self.send_error(404)
+                        return
+                    body = registry.render().encode()
+                    self.send_response(200)
+                    self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+
+                def log_message(self, *args):
+                    pass # Scrapes every few seconds would drown the bot's own output.
+
+            self._server = ThreadingHTTPServer((host, port), Handler)
+            self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, name="metrics-server", daemon=True).start()
+        print(f"Metrics served on http://{host}:{self._server.server_address[1]}/metrics")
+        return self._server
+
+
+# The process-wide registry the bot records into.
+METRICS = MetricsRegistry(enabled=os.getenv("METRICS_ENABLED", "true").lower() == "true")
@@ -0,0 +1,139 @@
+"""
+Cold start benchmark: how long a fresh bot process takes from launch to the end of its first management cycle.
+
+Each run is a new interpreter (`--child`), so module imports, ABI loading and connection setup are all paid again,
+as on a restart after a crash. A run reports, in milliseconds:
+    import          importing uniswap_lp_bot (web3 itself is most of it)
+    config          Config()
+    client          BlockchainClient (provider, connection/PoA probe, nonce and journal setup)
+    registry        PoolRegistry
+    derivatives     DerivativesManager (the venue connects in the background)
+    bot             LiquidityManagerBot over those components
+    first_cycle     loading the saved position ID and the first run_cycle()
+    time_to_first_cycle   launch (before the imports) to the end of the first cycle
+    process         the same seen from the parent, interpreter startup included
+plus the JSON-RPC requests sent before and during the first cycle. The parent prints the median of each over RUNS.
+
+It runs a REAL first cycle with the environment's configuration (NODE_URL, the abi/ folder, the state journal):
+if the position is out of range the cycle rebalances. Run it against a local fork or dev chain (anvil/hardhat)
+with DERIVATIVES_EXCHANGE=paper, and a journal path of its own (JOURNAL_PATH).
+
+Usage:
+    python uniswap_lp_startup.py [--runs 5] [--save startup_baseline.json] [--baseline startup_baseline.json] [--threshold 0.2]
+With --baseline, exits with status 1 when time_to_first_cycle (or the request count) regressed by more than
+THRESHOLD (relative) against the saved medians.
+"""
+import time
+
+_LAUNCHED = time.perf_counter() # Before any import: the child's time_to_first_cycle starts here.
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+RESULT_MARKER = "STARTUP_RESULT "
+PHASES = ("import", "config", "client", "registry", "derivatives", "bot", "first_cycle", "time_to_first_cycle", "process")
+
+
+def _rpc_requests(client) -> int:
+    return sum(endpoint["requests"] for endpoint in client.w3.provider.health())
+
+
+def run_child():
+    """One cold start in this process. Prints the result as a marker line for the parent."""
+    timings = {}
+    mark = time.perf_counter()
+
+    def lap(name: str):
+        nonlocal mark
+        now = time.perf_counter()
+        timings[name] = round((now - mark) * 1000, 2)
+        mark = now
+
+    import uniswap_lp_bot as bot_module
+    lap("import")
+    # As LiquidityManagerBot.__init__ does, before anything connects.
+    bot_module.preload_modules(bot_module.GREEKS_MODULES)
+    config = bot_module.Config()
+    lap("config")
+    client = bot_module.BlockchainClient(config)
+    lap("client")
+    registry = bot_module.PoolRegistry(client)
+    lap("registry")
+    derivatives = bot_module.DerivativesManager(config, client.journal)
+    lap("derivatives")
+    bot = bot_module.LiquidityManagerBot(config, client, registry, derivatives)
+    lap("bot")
+    requests_before = _rpc_requests(client)
+    bot.position_token_id = bot._load_position_id()
+    bot.run_cycle()
+    lap("first_cycle")
+    timings["time_to_first_cycle"] = round((time.perf_counter() - _LAUNCHED) * 1000, 2)
+    timings["rpc_requests_startup"] = requests_before
+    timings["rpc_requests_first_cycle"] = _rpc_requests(client) - requests_before
+    print(RESULT_MARKER + json.dumps(timings), flush=True)
+    # Don't wait for background threads (exchange session, provider pools).
+    os._exit(0)
+
+
+def run_once() -> dict:
+    started = time.perf_counter()
+    completed = subprocess.run([sys.executable, os.path.abspath(__file__), "--child"],
+                               capture_output=True, text=True)
+    process_ms = round((time.perf_counter() - started) * 1000, 2)
+    for line in completed.stdout.splitlines():
+        if line.startswith(RESULT_MARKER):
+            return dict(json.loads(line[len(RESULT_MARKER):]), process=process_ms)
+    raise RuntimeError(f"Startup run failed (exit code {completed.returncode}):\n{completed.stdout[-2000:]}{completed.stderr[-2000:]}")
+
+
+def summarize(runs: list) -> dict:
+    return {key: statistics.median(run[key] for run in runs) for key in runs[0]}
+
+
+def regressions(result: dict, baseline: dict, threshold: float) -> list:
+    """Metrics of `result` worse than `baseline` by more than `threshold` (relative)."""
+    regressed = []
+    for key in ("time_to_first_cycle", "rpc_requests_startup", "rpc_requests_first_cycle"):
+        if key in baseline and baseline[key] > 0 and result[key] > baseline[key] * (1 + threshold):
+            regressed.append(f"{key}: {result[key]} vs baseline {baseline[key]} (+{(result[key] / baseline[key] - 1) * 100:.0f}%)")
+    return regressed
+
+
+if __name__ == "__main__":
+    if "--child" in sys.argv:
+        run_child()
+
+    parser = argparse.ArgumentParser(description="Cold start benchmark of the LP bot (time to first cycle).")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--save", help="write the medians to this JSON file")
+    parser.add_argument("--baseline", help="compare against medians saved with --save")
+    parser.add_argument("--threshold", type=float, default=0.2, help="tolerated relative regression (default 0.2)")
+    args = parser.parse_args()
+
+    runs = []
+    for i in range(args.runs):
+        runs.append(run_once())
+        print(f"run {i + 1}/{args.runs}: time to first cycle {runs[-1]['time_to_first_cycle']:.0f} ms")
+    result = summarize(runs)
+
+    print(f"\nMedian of {len(runs)} cold starts:")
+    for phase in PHASES:
+        print(f"    {phase:<22}{result[phase]:>10.1f} ms")
+    print(f"    {'rpc requests':<22}{result['rpc_requests_startup']:>10.0f} before the first cycle, "
+          f"{result['rpc_requests_first_cycle']:.0f} during it")
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(result, f, indent=2)
+        print(f"Saved to {args.save}")
+    if args.baseline:
+        with open(args.baseline, "r") as f:
+            regressed = regressions(result, json.load(f), args.threshold)
+        if regressed:
+            print("Regressed against the baseline:\n    " + "\n    ".join(regressed))
+            sys.exit(1)
+        print(f"Within {args.threshold:.0%} of the baseline.")
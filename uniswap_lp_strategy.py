@@ -0,0 +1,121 @@
+"""
+Rebalance and hedge rules of the LP bot, as pure functions.
+
+`LiquidityManagerBot` and the backtester (uniswap_lp_backtest.py) both call these, so a backtest makes
+exactly the decisions the live bot would. Prices follow the bot's convention: `token0_per_token1`
+(see `UniswapLPManager.calculate_price_from_tick`).
+"""
+from decimal import Decimal
+from fractions import Fraction
+
+from uniswap_v3_math import price_to_tick, tick_to_price
+
+
+def range_prices(tick_lower: int, tick_upper: int, decimals0: int, decimals1: int) -> tuple[Decimal, Decimal]:
+    """
+    (low, high) `token0_per_token1` prices covered by [tick_lower, tick_upper].
+    A higher tick is a lower token0-per-token1 price, so the bounds are sorted rather than taken tick by tick.
+    """
+    price_a = Decimal("1") / tick_to_price(tick_lower, decimals0, decimals1)
+    price_b = Decimal("1") / tick_to_price(tick_upper, decimals0, decimals1)
+    return min(price_a, price_b), max(price_a, price_b)
+
+
+def rebalance_trigger_prices(tick_lower: int, tick_upper: int, decimals0: int, decimals1: int,
+                             trigger: Decimal) -> tuple[Decimal, Decimal]:
+    """
+    Prices outside of which the position is rebalanced: `trigger` (e.g. 1%) below the range's low price
+    or above its high price, so small excursions past the edge don't cost a rebalance.
+    """
+    low_price, high_price = range_prices(tick_lower, tick_upper, decimals0, decimals1)
+    return low_price * (1 - trigger), high_price * (1 + trigger)
+
+
+def needs_rebalance(price: Decimal, tick_lower: int, tick_upper: int, decimals0: int, decimals1: int,
+                    trigger: Decimal) -> bool:
+    """True when `price` (token0_per_token1) is out of the position's range by more than `trigger`."""
+    low_trigger, high_trigger = rebalance_trigger_prices(tick_lower, tick_upper, decimals0, decimals1, trigger)
+    return price < low_trigger or price > high_trigger
+
+
+def new_range_prices(price: Decimal, width: Decimal) -> tuple[Decimal, Decimal]:
+    """The new range after a rebalance: +/- `width` (e.g. 10%) around the current price."""
+    return price * (1 - width), price * (1 + width)
+
+
+def price_to_range_tick(price, decimals0: int, decimals1: int) -> int:
+    """Tick for a `token0_per_token1` price (same as `UniswapLPManager.calculate_tick_from_price`)."""
+    return price_to_tick(Fraction(1) / Fraction(price), decimals0, decimals1)
+
+
+def align_range_ticks(tick_a: int, tick_b: int, tick_spacing: int) -> tuple[int, int]:
+    """
+    Orders two ticks and rounds them down to multiples of the pool's tick spacing.
+    If both land on the same multiple, the range is widened to one tick spacing.
+    """
+    lower_tick, upper_tick = min(tick_a, tick_b), max(tick_a, tick_b)
+    lower_tick = (lower_tick // tick_spacing) * tick_spacing
+    upper_tick = (upper_tick // tick_spacing) * tick_spacing
+    if upper_tick <= lower_tick:
+        upper_tick = lower_tick + tick_spacing
+    return lower_tick, upper_tick
+
+
+def range_ticks_for_prices(lower_price: Decimal, upper_price: Decimal, decimals0: int, decimals1: int,
+                           tick_spacing: int) -> tuple[int, int]:
+    """The (tick_lower, tick_upper) that `provide_liquidity` mints for a price range."""
+    return align_range_ticks(
+        price_to_range_tick(lower_price, decimals0, decimals1),
+        price_to_range_tick(upper_price, decimals0, decimals1),
+        tick_spacing
+    )
+
+
+def min_amount(amount: int, slippage: Decimal) -> int:
+    """Minimum accepted amount for a mint/increase with `slippage` tolerance (e.g. 1%)."""
+    return int(amount * (1 - slippage))
+
+
+def swap_to_range(amount0: int, amount1: int, sqrt_price_x96: int, sqrt_lower_x96: int, sqrt_upper_x96: int,
+                  fee: int, min_share: Decimal) -> tuple[bool, int, int]:
+    """
+    The swap that turns raw (amount0, amount1) into the token ratio a range takes at the current price, so a
+    re-deposit isn't left one-sided (a position rebalanced out of range holds only one of the tokens, and a range
+    centred on the price takes both). Sized at the current price and the pool's fee (hundredths of a bip), without
+    the swap's own price impact.
+    Returns (zero_for_one, amount_in, expected_amount_out); amount_in is 0 when the value to swap is less than
+    `min_share` of the total (e.g. 1%), which isn't worth a transaction.
+    """
+    q96 = Fraction(2**96)
+    sqrt_price = Fraction(min(max(sqrt_price_x96, sqrt_lower_x96), sqrt_upper_x96))
+    # Amounts per unit of liquidity the range takes at this price, and the price in raw token1 per raw token0.
+    per_liquidity0 = (Fraction(sqrt_upper_x96) - sqrt_price) * q96 / (sqrt_price * sqrt_upper_x96)
+    per_liquidity1 = (sqrt_price - sqrt_lower_x96) / q96
+    price = Fraction(sqrt_price_x96) ** 2 / q96 ** 2
+    kept = 1 - Fraction(fee, 1_000_000)
+    total_value = amount0 * price + amount1
+    if total_value == 0:
+        return True, 0, 0
+    # Solve (amount0 - x) * per_liquidity1 == (amount1 + x * price * kept) * per_liquidity0 for the token0 sold,
+    # or the same with token1 sold when there is too little token0.
+    excess0 = amount0 * per_liquidity1 - amount1 * per_liquidity0
+    if excess0 > 0:
+        amount_in = excess0 / (per_liquidity1 + price * kept * per_liquidity0)
+        zero_for_one, amount_out, value_in = True, amount_in * price * kept, amount_in * price
+    else:
+        amount_in = -excess0 / (per_liquidity0 + per_liquidity1 * kept / price)
+        zero_for_one, amount_out, value_in = False, amount_in * kept / price, amount_in
+    if value_in < total_value * Fraction(min_share):
+        return zero_for_one, 0, 0
+    return zero_for_one, int(amount_in), int(amount_out)
+
+
+def hedge_adjustment(target_short: Decimal, current_short: Decimal, threshold: Decimal) -> Decimal:
+    """
+    How much to add to the short position (negative: reduce it) to reach `target_short`,
+    or 0 when the difference is within `threshold` and not worth a trade.
+    """
+    amount_to_adjust = target_short - current_short
+    if abs(amount_to_adjust) > threshold:
+        return amount_to_adjust
+    return Decimal("0")
@@ -0,0 +1,344 @@
+"""
+Exact integer Uniswap V3 math (Q64.96 fixed point).
+
+Bit-exact Python ports of the core contracts' TickMath, SqrtPriceMath, SwapMath and FullMath and of the
+periphery's LiquidityAmounts library. Everything works on plain Python ints, exactly like the EVM does, so results match
+what the pool and the NonfungiblePositionManager compute on-chain. No web3 import: the live bot, the
+backtester and the pool emulator all share this module.
+
+tests/test_v3_math.py checks it against the vectors of the contracts' own test suites.
+"""
+from decimal import Decimal
+from fractions import Fraction
+from math import isqrt
+
+# --- Constants (TickMath.sol / FixedPoint96.sol) ---
+MIN_TICK = -887272
+MAX_TICK = 887272
+# getSqrtRatioAtTick(MIN_TICK) and getSqrtRatioAtTick(MAX_TICK)
+MIN_SQRT_RATIO = 4295128739
+MAX_SQRT_RATIO = 1461446703485210103287273052203988822378723970342
+Q96 = 2**96
+Q128 = 2**128
+Q192 = 2**192
+MAX_UINT128 = 2**128 - 1
+MAX_UINT160 = 2**160 - 1
+MAX_UINT256 = 2**256 - 1
+
+
+# --- FullMath ---
+def mul_div(a: int, b: int, denominator: int) -> int:
+    """floor(a * b / denominator) with full precision; reverts (raises) like FullMath.mulDiv on overflow."""
+    if denominator <= 0:
+        raise ZeroDivisionError("mulDiv: denominator is zero")
+    result = (a * b) // denominator
+    if result > MAX_UINT256:
+        raise OverflowError("mulDiv: result overflows uint256")
+    return result
+
+
+def mul_div_rounding_up(a: int, b: int, denominator: int) -> int:
+    """ceil(a * b / denominator) with full precision (FullMath.mulDivRoundingUp)."""
+    result = mul_div(a, b, denominator)
+    if (a * b) % denominator > 0:
+        if result >= MAX_UINT256:
+            raise OverflowError("mulDivRoundingUp: result overflows uint256")
+        result += 1
+    return result
+
+
+def div_rounding_up(x: int, y: int) -> int:
+    """ceil(x / y) (UnsafeMath.divRoundingUp)."""
+    return x // y + (1 if x % y > 0 else 0)
+
+
+def _to_uint128(x: int) -> int:
+    if x > MAX_UINT128:
+        raise OverflowError("value does not fit in uint128")
+    return x
+
+
+# --- TickMath ---
+def get_sqrt_ratio_at_tick(tick: int) -> int:
+    """sqrt(1.0001^tick) * 2^96 as a Q64.96 number, rounded up exactly like TickMath.getSqrtRatioAtTick."""
+    abs_tick = -tick if tick < 0 else tick
+    if abs_tick > MAX_TICK:
+        raise ValueError(f"Tick {tick} out of range")
+
+    ratio = 0xfffcb933bd6fad37aa2d162d1a594001 if abs_tick & 0x1 else 0x100000000000000000000000000000000
+    if abs_tick & 0x2: ratio = (ratio * 0xfff97272373d413259a46990580e213a) >> 128
+    if abs_tick & 0x4: ratio = (ratio * 0xfff2e50f5f656932ef12357cf3c7fdcc) >> 128
+    if abs_tick & 0x8: ratio = (ratio * 0xffe5caca7e10e4e61c3624eaa0941cd0) >> 128
+    if abs_tick & 0x10: ratio = (ratio * 0xffcb9843d60f6159c9db58835c926644) >> 128
+    if abs_tick & 0x20: ratio = (ratio * 0xff973b41fa98c081472e6896dfb254c0) >> 128
+    if abs_tick & 0x40: ratio = (ratio * 0xff2ea16466c96a3843ec78b326b52861) >> 128
+    if abs_tick & 0x80: ratio = (ratio * 0xfe5dee046a99a2a811c461f1969c3053) >> 128
+    if abs_tick & 0x100: ratio = (ratio * 0xfcbe86c7900a88aedcffc83b479aa3a4) >> 128
+    if abs_tick & 0x200: ratio = (ratio * 0xf987a7253ac413176f2b074cf7815e54) >> 128
+    if abs_tick & 0x400: ratio = (ratio * 0xf3392b0822b70005940c7a398e4b70f3) >> 128
+    if abs_tick & 0x800: ratio = (ratio * 0xe7159475a2c29b7443b29c7fa6e889d9) >> 128
+    if abs_tick & 0x1000: ratio = (ratio * 0xd097f3bdfd2022b8845ad8f792aa5825) >> 128
+    if abs_tick & 0x2000: ratio = (ratio * 0xa9f746462d870fdf8a65dc1f90e061e5) >> 128
+    if abs_tick & 0x4000: ratio = (ratio * 0x70d869a156d2a1b890bb3df62baf32f7) >> 128
+    if abs_tick & 0x8000: ratio = (ratio * 0x31be135f97d08fd981231505542fcfa6) >> 128
+    if abs_tick & 0x10000: ratio = (ratio * 0x9aa508b5b7a84e1c677de54f3e99bc9) >> 128
+    if abs_tick & 0x20000: ratio = (ratio * 0x5d6af8dedb81196699c329225ee604) >> 128
+    if abs_tick & 0x40000: ratio = (ratio * 0x2216e584f5fa1ea926041bedfe98) >> 128
+    if abs_tick & 0x80000: ratio = (ratio * 0x48a170391f7dc42444e8fa2) >> 128
+
+    if tick > 0:
+        ratio = MAX_UINT256 // ratio
+
+    # Q128.128 -> Q64.96, rounding up so getTickAtSqrtRatio(getSqrtRatioAtTick(tick)) == tick
+    return (ratio >> 32) + (0 if ratio % (1 << 32) == 0 else 1)
+
+
+def get_tick_at_sqrt_ratio(sqrt_price_x96: int) -> int:
+    """The greatest tick whose sqrt ratio is <= sqrt_price_x96 (TickMath.getTickAtSqrtRatio)."""
+    if not (MIN_SQRT_RATIO <= sqrt_price_x96 < MAX_SQRT_RATIO):
+        raise ValueError(f"sqrtPriceX96 {sqrt_price_x96} out of range")
+    ratio = sqrt_price_x96 << 32
+
+    msb = ratio.bit_length() - 1
+    r = ratio >> (msb - 127) if msb >= 128 else ratio << (127 - msb)
+
+    # Integer part of log2 in Q64.64, then 14 bits of the fractional part by repeated squaring.
+    log_2 = (msb - 128) << 64
+    for shift in range(63, 49, -1):
+        r = (r * r) >> 127
+        f = r >> 128
+        log_2 |= f << shift
+        r >>= f
+
+    log_sqrt10001 = log_2 * 255738958999603826347141 # 128.128 number
+
+    tick_low = (log_sqrt10001 - 3402992956809132418596140100660247210) >> 128
+    tick_high = (log_sqrt10001 + 291339464771989622907027621153398088495) >> 128
+    if tick_low == tick_high:
+        return tick_low
+    return tick_high if get_sqrt_ratio_at_tick(tick_high) <= sqrt_price_x96 else tick_low
+
+
+# --- SqrtPriceMath ---
+def get_amount0_delta(sqrt_ratio_a_x96: int, sqrt_ratio_b_x96: int, liquidity: int, round_up: bool) -> int:
+    """Amount of token0 between two prices for `liquidity` (SqrtPriceMath.getAmount0Delta, unsigned)."""
+    if sqrt_ratio_a_x96 > sqrt_ratio_b_x96:
+        sqrt_ratio_a_x96, sqrt_ratio_b_x96 = sqrt_ratio_b_x96, sqrt_ratio_a_x96
+    if sqrt_ratio_a_x96 <= 0:
+        raise ValueError("sqrt ratio must be positive")
+    numerator1 = liquidity << 96
+    numerator2 = sqrt_ratio_b_x96 - sqrt_ratio_a_x96
+    if round_up:
+        return div_rounding_up(mul_div_rounding_up(numerator1, numerator2, sqrt_ratio_b_x96), sqrt_ratio_a_x96)
+    return mul_div(numerator1, numerator2, sqrt_ratio_b_x96) // sqrt_ratio_a_x96
+
+
+def get_amount1_delta(sqrt_ratio_a_x96: int, sqrt_ratio_b_x96: int, liquidity: int, round_up: bool) -> int:
+    """Amount of token1 between two prices for `liquidity` (SqrtPriceMath.getAmount1Delta, unsigned)."""
+    if sqrt_ratio_a_x96 > sqrt_ratio_b_x96:
+        sqrt_ratio_a_x96, sqrt_ratio_b_x96 = sqrt_ratio_b_x96, sqrt_ratio_a_x96
+    if round_up:
+        return mul_div_rounding_up(liquidity, sqrt_ratio_b_x96 - sqrt_ratio_a_x96, Q96)
+    return mul_div(liquidity, sqrt_ratio_b_x96 - sqrt_ratio_a_x96, Q96)
+
+
+def get_amount0_delta_signed(sqrt_ratio_a_x96: int, sqrt_ratio_b_x96: int, liquidity_delta: int) -> int:
+    """Signed token0 delta for a liquidity change: positive when adding (rounded up), negative when removing."""
+    if liquidity_delta < 0:
+        return -get_amount0_delta(sqrt_ratio_a_x96, sqrt_ratio_b_x96, -liquidity_delta, False)
+    return get_amount0_delta(sqrt_ratio_a_x96, sqrt_ratio_b_x96, liquidity_delta, True)
+
+
+def get_amount1_delta_signed(sqrt_ratio_a_x96: int, sqrt_ratio_b_x96: int, liquidity_delta: int) -> int:
+    """Signed token1 delta for a liquidity change: positive when adding (rounded up), negative when removing."""
+    if liquidity_delta < 0:
+        return -get_amount1_delta(sqrt_ratio_a_x96, sqrt_ratio_b_x96, -liquidity_delta, False)
+    return get_amount1_delta(sqrt_ratio_a_x96, sqrt_ratio_b_x96, liquidity_delta, True)
+
+
+def get_next_sqrt_price_from_amount0_rounding_up(sqrt_price_x96: int, liquidity: int, amount: int, add: bool) -> int:
+    """Price after adding (`add`) or removing `amount` of token0, rounded up (SqrtPriceMath)."""
+    if amount == 0:
+        return sqrt_price_x96
+    numerator1 = liquidity << 96
+    product = amount * sqrt_price_x96
+    if add:
+        if product <= MAX_UINT256 and numerator1 + product <= MAX_UINT256:
+            return mul_div_rounding_up(numerator1, sqrt_price_x96, numerator1 + product)
+        return div_rounding_up(numerator1, numerator1 // sqrt_price_x96 + amount)
+    if product > MAX_UINT256 or numerator1 <= product:
+        raise ValueError("getNextSqrtPriceFromAmount0RoundingUp: not enough liquidity")
+    result = mul_div_rounding_up(numerator1, sqrt_price_x96, numerator1 - product)
+    if result > MAX_UINT160:
+        raise OverflowError("sqrt price does not fit in uint160")
+    return result
+
+
+def get_next_sqrt_price_from_amount1_rounding_down(sqrt_price_x96: int, liquidity: int, amount: int, add: bool) -> int:
+    """Price after adding (`add`) or removing `amount` of token1, rounded down (SqrtPriceMath)."""
+    if add:
+        quotient = (amount << 96) // liquidity if amount <= MAX_UINT160 else mul_div(amount, Q96, liquidity)
+        result = sqrt_price_x96 + quotient
+        if result > MAX_UINT160:
+            raise OverflowError("sqrt price does not fit in uint160")
+        return result
+    quotient = div_rounding_up(amount << 96, liquidity) if amount <= MAX_UINT160 else mul_div_rounding_up(amount, Q96, liquidity)
+    if sqrt_price_x96 <= quotient:
+        raise ValueError("getNextSqrtPriceFromAmount1RoundingDown: not enough liquidity")
+    return sqrt_price_x96 - quotient
+
+
+def get_next_sqrt_price_from_input(sqrt_price_x96: int, liquidity: int, amount_in: int, zero_for_one: bool) -> int:
+    """Price after swapping `amount_in` into the pool (SqrtPriceMath.getNextSqrtPriceFromInput)."""
+    if sqrt_price_x96 <= 0 or liquidity <= 0:
+        raise ValueError("getNextSqrtPriceFromInput: price and liquidity must be positive")
+    if zero_for_one:
+        return get_next_sqrt_price_from_amount0_rounding_up(sqrt_price_x96, liquidity, amount_in, True)
+    return get_next_sqrt_price_from_amount1_rounding_down(sqrt_price_x96, liquidity, amount_in, True)
+
+
+def get_next_sqrt_price_from_output(sqrt_price_x96: int, liquidity: int, amount_out: int, zero_for_one: bool) -> int:
+    """Price after taking `amount_out` out of the pool (SqrtPriceMath.getNextSqrtPriceFromOutput)."""
+    if sqrt_price_x96 <= 0 or liquidity <= 0:
+        raise ValueError("getNextSqrtPriceFromOutput: price and liquidity must be positive")
+    if zero_for_one:
+        return get_next_sqrt_price_from_amount1_rounding_down(sqrt_price_x96, liquidity, amount_out, False)
+    return get_next_sqrt_price_from_amount0_rounding_up(sqrt_price_x96, liquidity, amount_out, False)
+
+
+# --- SwapMath ---
+def compute_swap_step(sqrt_ratio_current_x96: int, sqrt_ratio_target_x96: int, liquidity: int,
+                      amount_remaining: int, fee_pips: int) -> tuple:
+    """
+    One step of a swap within a single liquidity range (SwapMath.computeSwapStep).
+    `amount_remaining` > 0 is exact input, < 0 exact output. Returns (sqrt_ratio_next_x96, amount_in, amount_out, fee_amount).
+    """
+    zero_for_one = sqrt_ratio_current_x96 >= sqrt_ratio_target_x96
+    exact_in = amount_remaining >= 0
+    amount_in = amount_out = 0
+
+    if exact_in:
+        amount_remaining_less_fee = mul_div(amount_remaining, 10**6 - fee_pips, 10**6)
+        amount_in = (get_amount0_delta(sqrt_ratio_target_x96, sqrt_ratio_current_x96, liquidity, True) if zero_for_one
+                     else get_amount1_delta(sqrt_ratio_current_x96, sqrt_ratio_target_x96, liquidity, True))
+        if amount_remaining_less_fee >= amount_in:
+            sqrt_ratio_next_x96 = sqrt_ratio_target_x96
+        else:
+            sqrt_ratio_next_x96 = get_next_sqrt_price_from_input(sqrt_ratio_current_x96, liquidity, amount_remaining_less_fee, zero_for_one)
+    else:
+        amount_out = (get_amount1_delta(sqrt_ratio_target_x96, sqrt_ratio_current_x96, liquidity, False) if zero_for_one
+                      else get_amount0_delta(sqrt_ratio_current_x96, sqrt_ratio_target_x96, liquidity, False))
+        if -amount_remaining >= amount_out:
+            sqrt_ratio_next_x96 = sqrt_ratio_target_x96
+        else:
+            sqrt_ratio_next_x96 = get_next_sqrt_price_from_output(sqrt_ratio_current_x96, liquidity, -amount_remaining, zero_for_one)
+
+    reached_target = sqrt_ratio_target_x96 == sqrt_ratio_next_x96
+    if zero_for_one:
+        if not (reached_target and exact_in):
+            amount_in = get_amount0_delta(sqrt_ratio_next_x96, sqrt_ratio_current_x96, liquidity, True)
+        if not (reached_target and not exact_in):
+            amount_out = get_amount1_delta(sqrt_ratio_next_x96, sqrt_ratio_current_x96, liquidity, False)
+    else:
+        if not (reached_target and exact_in):
+            amount_in = get_amount1_delta(sqrt_ratio_current_x96, sqrt_ratio_next_x96, liquidity, True)
+        if not (reached_target and not exact_in):
+            amount_out = get_amount0_delta(sqrt_ratio_current_x96, sqrt_ratio_next_x96, liquidity, False)
+
+    # Cap the output amount to not exceed the remaining output amount.
+    if not exact_in and amount_out > -amount_remaining:
+        amount_out = -amount_remaining
+
+    if exact_in and sqrt_ratio_next_x96 != sqrt_ratio_target_x96:
+        # Didn't reach the target, so take the remainder of the maximum input as fee.
+        fee_amount = amount_remaining - amount_in
+    else:
+        fee_amount = mul_div_rounding_up(amount_in, fee_pips, 10**6 - fee_pips)
+    return sqrt_ratio_next_x96, amount_in, amount_out, fee_amount
+
+
+# --- LiquidityAmounts (periphery) ---
+def get_liquidity_for_amount0(sqrt_ratio_a_x96: int, sqrt_ratio_b_x96: int, amount0: int) -> int:
+    if sqrt_ratio_a_x96 > sqrt_ratio_b_x96:
+        sqrt_ratio_a_x96, sqrt_ratio_b_x96 = sqrt_ratio_b_x96, sqrt_ratio_a_x96
+    intermediate = mul_div(sqrt_ratio_a_x96, sqrt_ratio_b_x96, Q96)
+    return _to_uint128(mul_div(amount0, intermediate, sqrt_ratio_b_x96 - sqrt_ratio_a_x96))
+
+
+def get_liquidity_for_amount1(sqrt_ratio_a_x96: int, sqrt_ratio_b_x96: int, amount1: int) -> int:
+    if sqrt_ratio_a_x96 > sqrt_ratio_b_x96:
+        sqrt_ratio_a_x96, sqrt_ratio_b_x96 = sqrt_ratio_b_x96, sqrt_ratio_a_x96
+    return _to_uint128(mul_div(amount1, Q96, sqrt_ratio_b_x96 - sqrt_ratio_a_x96))
+
+
+def get_liquidity_for_amounts(sqrt_ratio_x96: int, sqrt_ratio_a_x96: int, sqrt_ratio_b_x96: int,
+                              amount0: int, amount1: int) -> int:
+    """Maximum liquidity mintable in [a, b] at the current price for the given amounts (LiquidityAmounts.getLiquidityForAmounts)."""
+    if sqrt_ratio_a_x96 > sqrt_ratio_b_x96:
+        sqrt_ratio_a_x96, sqrt_ratio_b_x96 = sqrt_ratio_b_x96, sqrt_ratio_a_x96
+    if sqrt_ratio_x96 <= sqrt_ratio_a_x96:
+        return get_liquidity_for_amount0(sqrt_ratio_a_x96, sqrt_ratio_b_x96, amount0)
+    if sqrt_ratio_x96 < sqrt_ratio_b_x96:
+        liquidity0 = get_liquidity_for_amount0(sqrt_ratio_x96, sqrt_ratio_b_x96, amount0)
+        liquidity1 = get_liquidity_for_amount1(sqrt_ratio_a_x96, sqrt_ratio_x96, amount1)
+        return min(liquidity0, liquidity1)
+    return get_liquidity_for_amount1(sqrt_ratio_a_x96, sqrt_ratio_b_x96, amount1)
+
+
+def get_amount0_for_liquidity(sqrt_ratio_a_x96: int, sqrt_ratio_b_x96: int, liquidity: int) -> int:
+    if sqrt_ratio_a_x96 > sqrt_ratio_b_x96:
+        sqrt_ratio_a_x96, sqrt_ratio_b_x96 = sqrt_ratio_b_x96, sqrt_ratio_a_x96
+    return mul_div(liquidity << 96, sqrt_ratio_b_x96 - sqrt_ratio_a_x96, sqrt_ratio_b_x96) // sqrt_ratio_a_x96
+
+
+def get_amount1_for_liquidity(sqrt_ratio_a_x96: int, sqrt_ratio_b_x96: int, liquidity: int) -> int:
+    if sqrt_ratio_a_x96 > sqrt_ratio_b_x96:
+        sqrt_ratio_a_x96, sqrt_ratio_b_x96 = sqrt_ratio_b_x96, sqrt_ratio_a_x96
+    return mul_div(liquidity, sqrt_ratio_b_x96 - sqrt_ratio_a_x96, Q96)
+
+
+def get_amounts_for_liquidity(sqrt_ratio_x96: int, sqrt_ratio_a_x96: int, sqrt_ratio_b_x96: int,
+                              liquidity: int) -> tuple[int, int]:
+    """Raw (amount0, amount1) held by `liquidity` in [a, b] at the current price (LiquidityAmounts.getAmountsForLiquidity)."""
+    if sqrt_ratio_a_x96 > sqrt_ratio_b_x96:
+        sqrt_ratio_a_x96, sqrt_ratio_b_x96 = sqrt_ratio_b_x96, sqrt_ratio_a_x96
+    amount0 = 0
+    amount1 = 0
+    if sqrt_ratio_x96 <= sqrt_ratio_a_x96:
+        amount0 = get_amount0_for_liquidity(sqrt_ratio_a_x96, sqrt_ratio_b_x96, liquidity)
+    elif sqrt_ratio_x96 < sqrt_ratio_b_x96:
+        amount0 = get_amount0_for_liquidity(sqrt_ratio_x96, sqrt_ratio_b_x96, liquidity)
+        amount1 = get_amount1_for_liquidity(sqrt_ratio_a_x96, sqrt_ratio_x96, liquidity)
+    else:
+        amount1 = get_amount1_for_liquidity(sqrt_ratio_a_x96, sqrt_ratio_b_x96, liquidity)
+    return amount0, amount1
+
+
+# --- Human-readable price conversions ---
+# "price" here is always the human-readable price of token0 in token1 (how many token1 for 1 token0),
+# i.e. (sqrtPriceX96 / 2^96)^2 * 10^(decimals0 - decimals1).
+def sqrt_price_x96_to_price(sqrt_price_x96: int, decimals0: int, decimals1: int) -> Decimal:
+    """Human-readable token1-per-token0 price for a sqrtPriceX96."""
+    scale = Fraction(10) ** (decimals0 - decimals1)
+    price = Fraction(sqrt_price_x96 * sqrt_price_x96, Q192) * scale
+    return Decimal(price.numerator) / Decimal(price.denominator)
+
+
+def price_to_sqrt_price_x96(price, decimals0: int, decimals1: int) -> int:
+    """floor(sqrt(price * 10^(decimals1 - decimals0)) * 2^96), using integer arithmetic only."""
+    ratio = Fraction(price) * Fraction(10) ** (decimals1 - decimals0)
+    if ratio <= 0:
+        raise ValueError(f"Price must be positive, got {price}")
+    return isqrt(ratio.numerator * Q192 // ratio.denominator)
+
+
+def price_to_tick(price, decimals0: int, decimals1: int) -> int:
+    """Greatest tick whose price is <= `price` (token1 per token0, human-readable)."""
+    sqrt_price_x96 = price_to_sqrt_price_x96(price, decimals0, decimals1)
+    sqrt_price_x96 = min(max(sqrt_price_x96, MIN_SQRT_RATIO), MAX_SQRT_RATIO - 1)
+    return get_tick_at_sqrt_ratio(sqrt_price_x96)
+
+
+def tick_to_price(tick: int, decimals0: int, decimals1: int) -> Decimal:
+    """Human-readable token1-per-token0 price at `tick`."""
+    return sqrt_price_x96_to_price(get_sqrt_ratio_at_tick(tick), decimals0, decimals1)